@@ -0,0 +1,283 @@
+# StealthShare v0.1 pre1
+# Copyright (c) 2025 IQUXAe
+# Released under the MIT License. See LICENSE file for details.
+
+import os
+import io
+import gzip
+import shutil
+import tarfile
+import zipfile
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import logger, get_file_extension, FILE_CATEGORIES
+from cancellation import check_cancelled
+
+ARCHIVE_EXTENSIONS = FILE_CATEGORIES["Archives"]
+# Минимальная дата, которую допускает формат ZIP
+SCRUBBED_ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+COPY_CHUNK_SIZE = 1024 * 1024
+# Члены архива больше этого размера не держим в памяти, а чистим через временный файл
+MAX_IN_MEMORY_MEMBER_SIZE = 32 * 1024 * 1024
+# Сколько данных одновременно может ждать очистки в памяти
+MAX_IN_FLIGHT_BYTES = 256 * 1024 * 1024
+
+
+def _get_cleanable_extensions():
+    return {ext for category, extensions in FILE_CATEGORIES.items()
+            if category != "Archives" for ext in extensions}
+
+def _normalized_mode(mode, is_dir=False):
+    if is_dir:
+        return 0o755
+    # Сохраняем только бит исполнения, остальное приводим к 644
+    return 0o755 if mode & 0o111 else 0o644
+
+
+class _ZipArchiveWriter:
+    def __init__(self, output_path):
+        self.zip_out = zipfile.ZipFile(output_path, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True)
+        self.zip_out.comment = b""
+
+    def _make_info(self, name, mode, is_dir=False, compress_type=zipfile.ZIP_DEFLATED):
+        info = zipfile.ZipInfo(name, date_time=SCRUBBED_ZIP_DATE_TIME)
+        info.create_system = 3
+        info.comment = b""
+        info.extra = b""
+        if is_dir:
+            info.external_attr = ((0o40000 | _normalized_mode(mode, True)) << 16) | 0x10
+            info.compress_type = zipfile.ZIP_STORED
+        else:
+            info.external_attr = (0o100000 | _normalized_mode(mode)) << 16
+            info.compress_type = compress_type
+        return info
+
+    def add_directory(self, name, mode):
+        self.zip_out.writestr(self._make_info(name.rstrip("/") + "/", mode, is_dir=True), b"")
+
+    def add_file(self, name, mode, data, compress_type=zipfile.ZIP_DEFLATED):
+        self.zip_out.writestr(self._make_info(name, mode, compress_type=compress_type), data)
+
+    def add_stream(self, name, mode, size, stream, compress_type=zipfile.ZIP_DEFLATED):
+        info = self._make_info(name, mode, compress_type=compress_type)
+        info.file_size = size
+        with self.zip_out.open(info, "w", force_zip64=size >= zipfile.ZIP64_LIMIT) as dest:
+            shutil.copyfileobj(stream, dest, COPY_CHUNK_SIZE)
+
+    def add_symlink(self, name, target):
+        info = self._make_info(name, 0o777)
+        info.external_attr = (0o120777 << 16)
+        self.zip_out.writestr(info, target.encode("utf-8"))
+
+    def close(self):
+        self.zip_out.close()
+
+
+class _TarArchiveWriter:
+    def __init__(self, output_path, compress):
+        self.raw_out = open(output_path, "wb")
+        self.gzip_out = None
+        target = self.raw_out
+        if compress:
+            # Пустое имя и нулевое время в заголовке gzip
+            self.gzip_out = gzip.GzipFile(filename="", mode="wb", fileobj=self.raw_out, mtime=0)
+            target = self.gzip_out
+        self.tar_out = tarfile.open(fileobj=target, mode="w", format=tarfile.PAX_FORMAT)
+
+    def _make_info(self, name, mode, member_type=tarfile.REGTYPE, size=0):
+        info = tarfile.TarInfo(name)
+        info.type = member_type
+        info.size = size
+        info.mtime = 0
+        info.uid = info.gid = 0
+        info.uname = info.gname = ""
+        info.mode = _normalized_mode(mode, is_dir=(member_type == tarfile.DIRTYPE))
+        info.pax_headers = {}
+        return info
+
+    def add_directory(self, name, mode):
+        self.tar_out.addfile(self._make_info(name.rstrip("/"), mode, tarfile.DIRTYPE))
+
+    def add_file(self, name, mode, data, compress_type=None):
+        self.tar_out.addfile(self._make_info(name, mode, size=len(data)), io.BytesIO(data))
+
+    def add_stream(self, name, mode, size, stream, compress_type=None):
+        self.tar_out.addfile(self._make_info(name, mode, size=size), stream)
+
+    def add_symlink(self, name, target):
+        info = self._make_info(name, 0o777, tarfile.SYMTYPE)
+        info.linkname = target
+        self.tar_out.addfile(info)
+
+    def add_special(self, member):
+        # Жесткая ссылка, устройство или FIFO: данных нет, переносятся только тип, цель ссылки и номера устройства
+        info = self._make_info(member.name, member.mode, member.type)
+        info.linkname = member.linkname
+        info.devmajor, info.devminor = member.devmajor, member.devminor
+        self.tar_out.addfile(info)
+
+    def close(self):
+        self.tar_out.close()
+        if self.gzip_out:
+            self.gzip_out.close()
+        self.raw_out.close()
+
+
+def _iter_zip_members(zip_in):
+    for info in zip_in.infolist():
+        mode = (info.external_attr >> 16) & 0o7777
+        if info.is_dir():
+            yield "dir", info.filename, mode, 0, None, None
+            continue
+        if info.flag_bits & 0x1:
+            raise ValueError(f"зашифрованный член архива '{info.filename}'")
+        file_type = (info.external_attr >> 16) & 0o170000
+        if file_type == 0o120000:
+            yield "symlink", info.filename, mode, 0, zip_in.read(info).decode("utf-8", "replace"), None
+            continue
+        yield "file", info.filename, mode, info.file_size, (lambda info=info: zip_in.open(info)), info.compress_type
+
+def _iter_tar_members(tar_in):
+    for member in tar_in:
+        if member.isdir():
+            yield "dir", member.name, member.mode, 0, None, None
+        elif member.issym():
+            yield "symlink", member.name, member.mode, 0, member.linkname, None
+        elif member.isfile():
+            yield "file", member.name, member.mode, member.size, (lambda member=member: tar_in.extractfile(member)), None
+        else:
+            # Жесткие ссылки, устройства и FIFO переносятся без владельца и времени изменения
+            yield "special", member.name, member.mode, 0, member, None
+
+
+def _clean_large_member(member_name, member_ext, open_stream, cleaning_options):
+    from metadata_cleaner import clean_metadata
+    temp_dir = tempfile.mkdtemp(prefix="stealthshare_archive_")
+    try:
+        input_path = os.path.join(temp_dir, f"member{member_ext}")
+        output_path = os.path.join(temp_dir, f"member_cleaned{member_ext}")
+        with open_stream() as src, open(input_path, "wb") as dst:
+            shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+        if clean_metadata(input_path, output_path, member_ext, cleaning_options):
+            return output_path, temp_dir, True
+        logger.error(f"АРХИВ: Очистка не удалась для члена '{member_name}', сохранен оригинал.")
+        return input_path, temp_dir, False
+    except BaseException:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+
+
+def clean_archive_metadata(filepath, output_path, cleaning_options_from_profile, max_workers=None):
+    from metadata_cleaner import clean_metadata_bytes
+
+    filename_base = os.path.basename(filepath)
+    archive_ext = get_file_extension(filepath)
+    cleanable_extensions = _get_cleanable_extensions()
+    max_workers = max_workers or max(1, (os.cpu_count() or 2))
+    logger.debug("archive.start file=%r format=%s threads=%d", filename_base, archive_ext, max_workers)
+
+    if os.path.abspath(filepath) == os.path.abspath(output_path):
+        logger.error(f"АРХИВ: Очистка архива '{filename_base}' на месте не поддерживается.")
+        return False
+
+    failed_members = []
+    stats = {'members': 0, 'cleaned': 0}
+    pending = deque()
+    in_flight = [0]
+
+    def _write_result(writer, name, mode, original, future, compress_type):
+        cleaned = future.result()
+        in_flight[0] -= len(original)
+        if cleaned is None:
+            failed_members.append(name)
+            cleaned = original
+        else:
+            stats['cleaned'] += 1
+        writer.add_file(name, mode, cleaned, compress_type=compress_type)
+
+    def _drain(writer, keep=0):
+        while len(pending) > keep:
+            _write_result(writer, *pending.popleft())
+
+    try:
+        if archive_ext == '.zip':
+            source = zipfile.ZipFile(filepath)
+            members = _iter_zip_members(source)
+            writer = _ZipArchiveWriter(output_path)
+        else:
+            source = tarfile.open(filepath, "r|*")
+            members = _iter_tar_members(source)
+            writer = _TarArchiveWriter(output_path, compress=archive_ext in ('.tgz', '.tar.gz'))
+    except Exception as e:
+        logger.error(f"АРХИВ: Не удалось открыть '{filename_base}': {e}", exc_info=True)
+        return False
+
+    try:
+        with source, ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for kind, name, mode, size, payload, compress_type in members:
+                check_cancelled()
+                stats['members'] += 1
+                if kind == "dir":
+                    _drain(writer)
+                    writer.add_directory(name, mode)
+                    continue
+                if kind == "symlink":
+                    _drain(writer)
+                    writer.add_symlink(name, payload)
+                    continue
+                if kind == "special":
+                    _drain(writer)
+                    writer.add_special(payload)
+                    continue
+
+                member_ext = get_file_extension(name)
+                if member_ext in cleanable_extensions and size <= MAX_IN_MEMORY_MEMBER_SIZE:
+                    while pending and in_flight[0] + size > MAX_IN_FLIGHT_BYTES:
+                        _write_result(writer, *pending.popleft())
+                    with payload() as src:
+                        data = src.read()
+                    in_flight[0] += len(data)
+                    future = executor.submit(clean_metadata_bytes, data, member_ext, cleaning_options_from_profile)
+                    pending.append((name, mode, data, future, compress_type))
+                    # Держим окно не больше удвоенного числа потоков, чтобы память была ограничена
+                    _drain(writer, keep=max_workers * 2)
+                    continue
+
+                # Большие или неподдерживаемые члены пишем по порядку, сначала досылая очередь
+                _drain(writer)
+                if member_ext in cleanable_extensions:
+                    cleaned_path, temp_dir, ok = _clean_large_member(name, member_ext, payload, cleaning_options_from_profile)
+                    try:
+                        if ok:
+                            stats['cleaned'] += 1
+                        else:
+                            failed_members.append(name)
+                        with open(cleaned_path, "rb") as src:
+                            writer.add_stream(name, mode, os.path.getsize(cleaned_path), src, compress_type=compress_type)
+                    finally:
+                        shutil.rmtree(temp_dir, ignore_errors=True)
+                else:
+                    with payload() as src:
+                        writer.add_stream(name, mode, size, src, compress_type=compress_type)
+            _drain(writer)
+        writer.close()
+    except Exception as e:
+        logger.error(f"АРХИВ: Ошибка при обработке '{filename_base}': {e}", exc_info=True)
+        try:
+            writer.close()
+        except Exception:
+            pass
+        try:
+            os.remove(output_path)
+        except OSError:
+            pass
+        return False
+
+    logger.info("archive.cleaned file=%r members=%d cleaned=%d failed=%d",
+                filename_base, stats['members'], stats['cleaned'], len(failed_members))
+    if failed_members:
+        logger.error(f"АРХИВ: Не удалось очистить члены '{filename_base}': {failed_members}")
+        return False
+    return True
@@ -0,0 +1,304 @@
+# StealthShare v0.1 pre1
+# Copyright (c) 2025 IQUXAe
+# Released under the MIT License. See LICENSE file for details.
+
+import zlib
+import struct
+
+from profiles import VideoPlan
+from isobmff import clean_mp4, read_mp4_metadata
+from cancellation import check_cancelled
+
+COPY_CHUNK_SIZE = 1024 * 1024
+ID3V1_SIZE = 128
+ID3V1_ENHANCED_SIZE = 227
+APE_FOOTER_SIZE = 32
+FLAC_SIGNATURE = b"fLaC"
+# Блоки FLAC, нужные для воспроизведения и перемотки; остальные (комментарии, обложки, cuesheet) удаляются
+FLAC_KEPT_BLOCKS = {0: "STREAMINFO", 3: "SEEKTABLE"}
+FLAC_BLOCK_NAMES = {1: "PADDING", 2: "APPLICATION", 4: "VORBIS_COMMENT", 5: "CUESHEET", 6: "PICTURE"}
+# Заголовки Ogg: пакет идентификации, комментарии, (у Vorbis) настройка декодера
+OGG_CODECS = {b"\x01vorbis": ("vorbis", 3), b"OpusHead": ("opus", 2)}
+OGG_MAX_HEADER_BYTES = 64 * 1024 * 1024
+# Для CRC Ogg (не отраженный CRC-32) используем zlib.crc32 над байтами с обратным порядком бит
+_BIT_REVERSE = bytes(int(f"{value:08b}"[::-1], 2) for value in range(256))
+
+
+def _read_exact(source, size):
+    data = source.read(size)
+    if len(data) != size:
+        raise ValueError("файл обрывается посреди блока")
+    return data
+
+def _read_at(source, offset, size):
+    source.seek(offset)
+    return source.read(size)
+
+def _copy_range(source, target, start, end):
+    source.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        check_cancelled()
+        piece = _read_exact(source, min(remaining, COPY_CHUNK_SIZE))
+        target.write(piece)
+        remaining -= len(piece)
+
+def _syncsafe(data):
+    return (data[0] & 0x7f) << 21 | (data[1] & 0x7f) << 14 | (data[2] & 0x7f) << 7 | (data[3] & 0x7f)
+
+def _id3v2_size(header):
+    if len(header) < 10 or header[:3] != b"ID3":
+        return 0
+    return 10 + _syncsafe(header[6:10]) + (10 if header[5] & 0x10 else 0)
+
+
+def _mp3_audio_range(source):
+    # Границы аудиоданных без тегов: ID3v2 в начале; ID3v1, APEv2, Lyrics3 и ID3v2 с футером в конце
+    file_size = source.seek(0, 2)
+    start, tags = 0, []
+    while True:
+        size = _id3v2_size(_read_at(source, start, 10))
+        if not size:
+            break
+        start += size
+        tags.append("ID3v2")
+    end = file_size
+    while end > start:
+        if end - ID3V1_SIZE >= start and _read_at(source, end - ID3V1_SIZE, 3) == b"TAG":
+            end -= ID3V1_SIZE
+            tags.append("ID3v1")
+            if end - ID3V1_ENHANCED_SIZE >= start and _read_at(source, end - ID3V1_ENHANCED_SIZE, 4) == b"TAG+":
+                end -= ID3V1_ENHANCED_SIZE
+            continue
+        footer = _read_at(source, end - APE_FOOTER_SIZE, APE_FOOTER_SIZE) if end - APE_FOOTER_SIZE >= start else b""
+        if footer[:8] == b"APETAGEX":
+            size, flags = struct.unpack_from("<I4xI", footer, 12)
+            end -= size + (APE_FOOTER_SIZE if flags & 0x80000000 else 0)
+            tags.append("APEv2")
+            continue
+        if end - 15 >= start and _read_at(source, end - 9, 9) == b"LYRICS200":
+            end -= int(_read_at(source, end - 15, 6)) + 15
+            tags.append("Lyrics3")
+            continue
+        if end - 10 >= start and _read_at(source, end - 10, 3) == b"3DI":
+            end -= 20 + _syncsafe(_read_at(source, end - 4, 4))
+            tags.append("ID3v2")
+            continue
+        break
+    if end < start:
+        raise ValueError("размеры тегов выходят за пределы файла")
+    return start, end, tags
+
+def clean_mp3(source, target, plan):
+    # Теги лежат только по краям файла - середина (кадры MPEG) копируется потоком как есть
+    start, end, tags = _mp3_audio_range(source)
+    _copy_range(source, target, start, end)
+    return tags
+
+
+def clean_flac(source, target, plan):
+    removed = []
+    start = _id3v2_size(_read_at(source, 0, 10))
+    if start:
+        removed.append("ID3v2")
+    source.seek(start)
+    if source.read(4) != FLAC_SIGNATURE:
+        raise ValueError("нет сигнатуры FLAC")
+    kept_blocks = []
+    while True:
+        header = _read_exact(source, 4)
+        is_last, block_type = header[0] & 0x80, header[0] & 0x7f
+        length = int.from_bytes(header[1:4], "big")
+        if block_type in FLAC_KEPT_BLOCKS:
+            kept_blocks.append((block_type, _read_exact(source, length)))
+        else:
+            source.seek(length, 1)
+            removed.append(FLAC_BLOCK_NAMES.get(block_type, f"BLOCK{block_type}"))
+        if is_last:
+            break
+    if not kept_blocks or kept_blocks[0][0] != 0:
+        raise ValueError("нет блока STREAMINFO")
+    frames_start = source.tell()
+    target.write(FLAC_SIGNATURE)
+    for index, (block_type, payload) in enumerate(kept_blocks):
+        last_flag = 0x80 if index == len(kept_blocks) - 1 else 0
+        target.write(bytes([last_flag | block_type]) + len(payload).to_bytes(3, "big") + payload)
+    # Таблица перемотки хранит смещения от первого кадра, поэтому после удаления блоков она остается верной
+    _copy_range(source, target, frames_start, source.seek(0, 2))
+    return removed
+
+
+def _ogg_crc(data):
+    raw = zlib.crc32(data.translate(_BIT_REVERSE), 0xFFFFFFFF) ^ 0xFFFFFFFF
+    return int(f"{raw:032b}"[::-1], 2)
+
+def _ogg_page(header_type, granule, serial, sequence, lacing, body):
+    page = bytearray(struct.pack("<4sBBqIIIB", b"OggS", 0, header_type, granule, serial, sequence, 0, len(lacing)))
+    page += bytes(lacing) + body
+    struct.pack_into("<I", page, 22, _ogg_crc(bytes(page)))
+    return bytes(page)
+
+def _read_ogg_page(source):
+    header = source.read(27)
+    if not header:
+        return None
+    if len(header) < 27 or header[:4] != b"OggS":
+        raise ValueError("нарушена структура страниц Ogg")
+    lacing = _read_exact(source, header[26])
+    body = _read_exact(source, sum(lacing))
+    return {
+        "type": header[5], "granule": struct.unpack_from("<q", header, 6)[0],
+        "serial": struct.unpack_from("<I", header, 14)[0], "sequence": struct.unpack_from("<I", header, 18)[0],
+        "lacing": lacing, "body": body, "raw": header + lacing + body,
+    }
+
+def _empty_comment_packet(codec, packet):
+    # Строка vendor (имя кодировщика) остается, список комментариев становится пустым
+    prefix = b"\x03vorbis" if codec == "vorbis" else b"OpusTags"
+    if not packet.startswith(prefix) or len(packet) < len(prefix) + 4:
+        raise ValueError("неверный заголовок комментариев Ogg")
+    vendor_length = struct.unpack_from("<I", packet, len(prefix))[0]
+    vendor_end = len(prefix) + 4 + vendor_length
+    if vendor_end > len(packet):
+        raise ValueError("неверная длина vendor в заголовке комментариев")
+    packet_out = packet[:vendor_end] + struct.pack("<I", 0)
+    return packet_out + b"\x01" if codec == "vorbis" else packet_out
+
+def _paginate_ogg_packets(packets, serial, first_sequence):
+    # Раскладывает пакеты по страницам (до 255 сегментов на страницу) с флагом продолжения
+    segments = []
+    for packet in packets:
+        for position in range(0, len(packet) // 255 * 255, 255):
+            segments.append((packet[position:position + 255], False))
+        segments.append((packet[len(packet) // 255 * 255:], True))
+    pages = []
+    continued = False
+    for page_start in range(0, len(segments), 255):
+        page_segments = segments[page_start:page_start + 255]
+        lacing = [len(data) for data, _ in page_segments]
+        granule = 0 if any(ends for _, ends in page_segments) else -1
+        pages.append(_ogg_page(0x01 if continued else 0, granule, serial, first_sequence + len(pages),
+                               lacing, b"".join(data for data, _ in page_segments)))
+        continued = not page_segments[-1][1]
+    return pages
+
+def clean_ogg(source, target, plan):
+    # Заголовок комментариев Vorbis/Opus переписывается пустым; если число страниц заголовка изменилось,
+    # у следующих страниц потока сдвигаются номера и пересчитывается CRC. Аудиопакеты не декодируются
+    removed = []
+    streams = {}
+    queue = []
+    collecting = set()
+    source.seek(0)
+    while True:
+        page = _read_ogg_page(source)
+        if page is None:
+            break
+        serial = page["serial"]
+        state = streams.get(serial)
+        if state is None or page["type"] & 0x02:
+            codec, header_count = next(((name, count) for prefix, (name, count) in OGG_CODECS.items()
+                                        if page["body"].startswith(prefix)), (None, 0))
+            state = streams[serial] = {"codec": codec, "needed": header_count - 1, "packets": [], "partial": b"",
+                                       "pages": 0, "first_sequence": None, "delta": 0, "size": 0}
+            if codec:
+                collecting.add(serial)
+            queue.append(page["raw"])
+        elif serial in collecting:
+            if state["first_sequence"] is None:
+                state["first_sequence"] = page["sequence"]
+                queue.append(("headers", serial))
+            state["pages"] += 1
+            state["size"] += len(page["body"])
+            if state["size"] > OGG_MAX_HEADER_BYTES:
+                raise ValueError("заголовки Ogg слишком большие")
+            position = 0
+            for index, segment_length in enumerate(page["lacing"]):
+                state["partial"] += page["body"][position:position + segment_length]
+                position += segment_length
+                if segment_length < 255:
+                    state["packets"].append(state["partial"])
+                    state["partial"] = b""
+                    if len(state["packets"]) == state["needed"] and index != len(page["lacing"]) - 1:
+                        raise ValueError("аудиоданные на одной странице с заголовками Ogg")
+            if len(state["packets"]) >= state["needed"]:
+                packets = [_empty_comment_packet(state["codec"], state["packets"][0])] + state["packets"][1:]
+                state["new_pages"] = _paginate_ogg_packets(packets, serial, state["first_sequence"])
+                state["delta"] = len(state["new_pages"]) - state["pages"]
+                collecting.discard(serial)
+                removed.append(f"{state['codec']}_comments")
+        elif state["delta"]:
+            queue.append(_ogg_page(page["type"], page["granule"], serial, page["sequence"] + state["delta"],
+                                   page["lacing"], page["body"]))
+        else:
+            queue.append(page["raw"])
+
+        if not collecting:
+            for item in queue:
+                target.write(b"".join(streams[item[1]]["new_pages"]) if isinstance(item, tuple) else item)
+            queue = []
+    if collecting:
+        raise ValueError("поток Ogg обрывается посреди заголовков")
+    for item in queue:
+        target.write(item)
+    return removed
+
+
+def clean_m4a(source, target, plan):
+    # M4A - тот же контейнер MP4: теги iTunes лежат в moov/udta/meta/ilst
+    return clean_mp4(source, target, VideoPlan(remove_metadata=True, clear_timestamps=True))
+
+AUDIO_CLEANERS = {
+    '.mp3': clean_mp3,
+    '.flac': clean_flac,
+    '.ogg': clean_ogg, '.oga': clean_ogg, '.opus': clean_ogg,
+    '.m4a': clean_m4a,
+}
+
+def clean_audio_stream(source, target, file_extension, plan):
+    if not plan.remove_tags:
+        _copy_range(source, target, 0, source.seek(0, 2))
+        return []
+    return AUDIO_CLEANERS[file_extension](source, target, plan)
+
+
+def has_audio_tags(source, file_extension):
+    # Для проверки: остались ли в файле теги, которые удаляет clean_audio_stream
+    if file_extension == '.mp3':
+        start, end, tags = _mp3_audio_range(source)
+        return bool(tags)
+    if file_extension == '.flac':
+        if _id3v2_size(_read_at(source, 0, 10)):
+            return True
+        source.seek(4)
+        while True:
+            header = source.read(4)
+            if len(header) < 4:
+                return False
+            if (header[0] & 0x7f) not in FLAC_KEPT_BLOCKS:
+                return True
+            if header[0] & 0x80:
+                return False
+            source.seek(int.from_bytes(header[1:4], "big"), 1)
+    if file_extension == '.m4a':
+        return "metadata" in read_mp4_metadata(source)
+    # Ogg: второй пакет каждого потока - комментарии; ищем в нем непустой список
+    source.seek(0)
+    first_pages = {}
+    while True:
+        page = _read_ogg_page(source)
+        if page is None:
+            return False
+        if page["type"] & 0x02:
+            first_pages[page["serial"]] = 0
+            continue
+        if first_pages.get(page["serial"]) == 0:
+            first_pages[page["serial"]] = 1
+            body = page["body"]
+            prefix_length = 7 if body.startswith(b"\x03vorbis") else 8 if body.startswith(b"OpusTags") else 0
+            if prefix_length and len(body) >= prefix_length + 4:
+                vendor_end = prefix_length + 4 + struct.unpack_from("<I", body, prefix_length)[0]
+                if vendor_end + 4 <= len(body) and struct.unpack_from("<I", body, vendor_end)[0]:
+                    return True
+        if first_pages and all(first_pages.values()):
+            return False
@@ -0,0 +1,74 @@
+# StealthShare v0.1 pre1
+# Copyright (c) 2025 IQUXAe
+# Released under the MIT License. See LICENSE file for details.
+
+import os
+import hashlib
+from collections import defaultdict
+
+from utils import logger, get_file_extension
+from cancellation import check_cancelled
+
+PARTIAL_HASH_SIZE = 64 * 1024
+FULL_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _partial_hash(filepath, file_size):
+    # Начало и конец файла: копии одного фото почти всегда совпадают, разные - расходятся уже здесь
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filepath, "rb") as f:
+        digest.update(f.read(PARTIAL_HASH_SIZE))
+        if file_size > 2 * PARTIAL_HASH_SIZE:
+            f.seek(-PARTIAL_HASH_SIZE, os.SEEK_END)
+            digest.update(f.read(PARTIAL_HASH_SIZE))
+    return digest.digest()
+
+def _full_hash(filepath):
+    digest = hashlib.blake2b(digest_size=32)
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(FULL_HASH_CHUNK_SIZE), b""):
+            check_cancelled()
+            digest.update(chunk)
+    return digest.digest()
+
+def _split_by(paths, key_func):
+    groups = defaultdict(list)
+    for path in paths:
+        check_cancelled()
+        try:
+            groups[key_func(path)].append(path)
+        except OSError as e:
+            logger.warning(f"ДУБЛИКАТЫ: Не удалось прочитать '{os.path.basename(path)}': {e}")
+    return [group for group in groups.values() if len(group) > 1]
+
+def find_duplicate_groups(filepaths):
+    sizes = {}
+    for path in filepaths:
+        try:
+            sizes[path] = os.path.getsize(path)
+        except OSError:
+            continue
+
+    # Одинаковое содержимое с разными расширениями чистится по-разному, поэтому расширение входит в ключ
+    candidates = _split_by(sizes, lambda path: (sizes[path], get_file_extension(path)))
+    candidates = [group for candidate in candidates
+                  for group in _split_by(candidate, lambda path: _partial_hash(path, sizes[path]))]
+    duplicate_groups = [group for candidate in candidates
+                        for group in _split_by(candidate, _full_hash)]
+
+    order = {path: index for index, path in enumerate(filepaths)}
+    for group in duplicate_groups:
+        group.sort(key=order.get)
+    duplicate_groups.sort(key=lambda group: order[group[0]])
+    return duplicate_groups
+
+def build_duplicate_map(filepaths):
+    # Для каждого дубликата - путь к первому файлу группы, который будет очищен на самом деле
+    duplicate_of = {}
+    for group in find_duplicate_groups(filepaths):
+        leader = group[0]
+        for path in group[1:]:
+            duplicate_of[path] = leader
+    if duplicate_of:
+        logger.info(f"ДУБЛИКАТЫ: Найдено {len(duplicate_of)} повторов среди {len(filepaths)} файлов.")
+    return duplicate_of
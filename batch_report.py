@@ -0,0 +1,148 @@
+# StealthShare v0.1 pre1
+# Copyright (c) 2025 IQUXAe
+# Released under the MIT License. See LICENSE file for details.
+
+import os
+import csv
+import json
+import time
+from datetime import datetime
+
+from utils import logger, get_file_extension
+from fileops import temp_output_path
+
+REPORT_BASENAME = "stealthshare_report"
+REPORT_FORMAT_VERSION = 1
+LATENCY_PERCENTILES = (50, 90, 99)
+CSV_FIELDS = ("input", "output", "extension", "status", "reason", "cleaner_path", "input_size", "output_size",
+              "bytes_removed", "removed_classes", "clean_ms", "latency_ms")
+
+# Путь очистки: lossless - файл переписан по структуре без перекодирования данных,
+# re-encode - изображение пересохранено Pillow, copy - неподдерживаемый тип скопирован, link - дубликат
+CLEANER_PATH_LOSSLESS = "lossless"
+CLEANER_PATH_REENCODE = "re-encode"
+CLEANER_PATH_COPY = "copy"
+CLEANER_PATH_LINK = "link"
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path) if path else None
+    except OSError:
+        return None
+
+def _percentile(sorted_values, percent):
+    # Метод ближайшего ранга: значение всегда одно из измеренных
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * percent // 100))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class BatchReport:
+    # Собирает по файлу: размеры, удаленные классы метаданных, путь очистки и время;
+    # по пакету: файлы/с, МБ/с, перцентили задержки и загрузку рабочих процессов
+    def __init__(self, workers=1, profile=None):
+        self.workers = workers
+        self.profile = profile
+        self.records = []
+        self.pool_stats = {}
+        self.started_at = datetime.now()
+        self._start = time.perf_counter()
+        self.wall_time = None
+
+    def add(self, input_path, output_path=None, status="ok", reason="", cleaner_path="",
+            clean_time=None, latency=None, removed_classes=(), current_output_path=None):
+        # current_output_path - где результат лежит сейчас, если он еще не переименован (групповая фиксация)
+        input_size = _file_size(input_path)
+        # cached - результат прошлого запуска той же очистки оставлен на месте
+        has_output = status in ("ok", "duplicate", "cached")
+        output_size = _file_size(current_output_path or output_path) if has_output else None
+        self.records.append({
+            "input": input_path,
+            "output": output_path if has_output else None,
+            "extension": get_file_extension(input_path),
+            "status": status,
+            "reason": reason,
+            "cleaner_path": cleaner_path,
+            "input_size": input_size,
+            "output_size": output_size,
+            "bytes_removed": input_size - output_size if input_size is not None and output_size is not None else None,
+            "removed_classes": sorted(removed_classes),
+            "clean_ms": round(clean_time * 1000, 3) if clean_time is not None else None,
+            "latency_ms": round(latency * 1000, 3) if latency is not None else None,
+        })
+
+    def finish(self, pool_stats=None):
+        self.wall_time = time.perf_counter() - self._start
+        self.pool_stats = dict(pool_stats or {})
+
+    def summary(self):
+        wall_time = self.wall_time if self.wall_time is not None else time.perf_counter() - self._start
+        cleaned = [record for record in self.records if record["status"] == "ok"]
+        written = [record for record in self.records if record["status"] in ("ok", "duplicate", "cached")]
+        input_bytes = sum(record["input_size"] or 0 for record in written)
+        output_bytes = sum(record["output_size"] or 0 for record in written)
+        latencies = sorted(record["latency_ms"] for record in cleaned if record["latency_ms"] is not None)
+        busy_time = sum(record["clean_ms"] or 0 for record in self.records) / 1000
+        cleaner_paths = {}
+        for record in self.records:
+            if record["cleaner_path"]:
+                cleaner_paths[record["cleaner_path"]] = cleaner_paths.get(record["cleaner_path"], 0) + 1
+        return {
+            "files_total": len(self.records),
+            "files_cleaned": len(cleaned),
+            "files_linked": sum(1 for record in self.records if record["status"] == "duplicate"),
+            "files_cached": sum(1 for record in self.records if record["status"] == "cached"),
+            "files_failed": sum(1 for record in self.records if record["status"] == "error"),
+            "files_cancelled": sum(1 for record in self.records if record["status"] == "cancelled"),
+            "input_bytes": input_bytes,
+            "output_bytes": output_bytes,
+            "bytes_removed": input_bytes - output_bytes,
+            "wall_time_s": round(wall_time, 3),
+            "files_per_s": round((len(self.records) - sum(1 for record in self.records if record["status"] == "cancelled")) / wall_time, 3) if wall_time > 0 else None,
+            "mb_per_s": round(input_bytes / (1024 * 1024) / wall_time, 3) if wall_time > 0 else None,
+            "latency_ms": {
+                **{f"p{percent}": _percentile(latencies, percent) for percent in LATENCY_PERCENTILES},
+                "max": latencies[-1] if latencies else None,
+            },
+            # Доля времени, которую рабочие процессы были заняты очисткой, а не ждали ввода-вывода и GUI
+            "worker_utilization": round(busy_time / (wall_time * self.workers), 4) if wall_time > 0 else None,
+            "workers": self.workers,
+            "cleaner_paths": cleaner_paths,
+            "pool": self.pool_stats,
+        }
+
+    def _write_atomic(self, path, write):
+        temp_path = temp_output_path(path)
+        try:
+            with open(temp_path, "w", encoding="utf-8", newline="") as f:
+                write(f)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def write(self, output_dir):
+        # Отчет пишется в JSON (сводка + файлы) и CSV (по строке на файл) рядом с результатами
+        os.makedirs(output_dir, exist_ok=True)
+        stamp = self.started_at.strftime("%Y%m%d_%H%M%S")
+        json_path = os.path.join(output_dir, f"{REPORT_BASENAME}_{stamp}.json")
+        csv_path = os.path.join(output_dir, f"{REPORT_BASENAME}_{stamp}.csv")
+        document = {
+            "format_version": REPORT_FORMAT_VERSION,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "profile": self.profile,
+            "summary": self.summary(),
+            "files": self.records,
+        }
+        self._write_atomic(json_path, lambda f: json.dump(document, f, ensure_ascii=False, indent=2))
+
+        def _write_csv(f):
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            for record in self.records:
+                writer.writerow({**record, "removed_classes": ";".join(record["removed_classes"])})
+        self._write_atomic(csv_path, _write_csv)
+        logger.info(f"ОТЧЕТ: Отчет о пакете записан: '{json_path}', '{csv_path}'.")
+        return json_path, csv_path
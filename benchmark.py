@@ -0,0 +1,705 @@
+# StealthShare v0.1 pre1
+# Copyright (c) 2025 IQUXAe
+# Released under the MIT License. See LICENSE file for details.
+
+import io
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import builtins
+import argparse
+import threading
+import tempfile
+import statistics
+import subprocess
+
+PROJECT_DIR = os.path.abspath(os.path.dirname(__file__))
+HEAVY_MODULES = ('PIL', 'piexif', 'pikepdf', 'docx', 'openpyxl', 'pptx')
+
+
+def _run_python(code, extra_args=()):
+    started_at = time.perf_counter()
+    result = subprocess.run([sys.executable, *extra_args, "-c", code], cwd=PROJECT_DIR,
+                            capture_output=True, text=True, check=True)
+    return result, time.perf_counter() - started_at
+
+def _parse_importtime(stderr_text):
+    # Формат строк: "import time: self [us] | cumulative | imported package"
+    cumulative = {}
+    for line in stderr_text.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        cumulative[parts[2].strip()] = int(parts[1].strip())
+    return cumulative
+
+def benchmark_startup(args=None, runs=5, max_import_ms=150.0):
+    probe = ("import sys, json, metadata_cleaner, utils; "
+             f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))")
+    wall_times = []
+    import_times = []
+    loaded_heavy = []
+    for _ in range(runs):
+        result, wall_time = _run_python(probe, extra_args=("-X", "importtime"))
+        wall_times.append(wall_time * 1000)
+        cumulative = _parse_importtime(result.stderr)
+        import_times.append((cumulative.get("metadata_cleaner", 0) + cumulative.get("utils", 0)) / 1000)
+        loaded_heavy = json.loads(result.stdout.strip().splitlines()[-1])
+
+    report = {
+        "suite": "startup",
+        "runs": runs,
+        "process_wall_ms_median": round(statistics.median(wall_times), 1),
+        "cleaner_import_ms_median": round(statistics.median(import_times), 1),
+        "heavy_modules_loaded_at_import": loaded_heavy,
+        "budget_ms": max_import_ms,
+    }
+    report["ok"] = not loaded_heavy and report["cleaner_import_ms_median"] <= max_import_ms
+    return report
+
+# (имя, расширение, параметры сохранения Pillow, режим, допуск)
+# допуск: "exact" - пиксели должны совпасть, число - минимальный PSNR в дБ
+PIXEL_CORPUS = [
+    ("photo_q90", ".jpg", {"quality": 90}, "RGB", "exact"),
+    ("photo_q75_420", ".jpg", {"quality": 75, "subsampling": 2}, "RGB", "exact"),
+    ("graphic", ".png", {}, "RGBA", "exact"),
+    ("graphic_palette", ".png", {}, "P", "exact"),
+    ("scan_lzw", ".tiff", {"compression": "tiff_lzw"}, "RGB", "exact"),
+    ("animation", ".gif", {}, "P", "exact"),
+    ("web_lossy", ".webp", {"quality": 85}, "RGB", 38.0),
+    ("web_lossless", ".webp", {"lossless": True}, "RGBA", "exact"),
+    ("bitmap", ".bmp", {}, "RGB", "exact"),
+]
+PIXEL_CORPUS_SIZE = (1600, 1200)
+MAX_SIZE_GROWTH = 0.10
+
+def _make_test_image(mode, size):
+    from PIL import Image, ImageDraw
+    width, height = size
+    base = Image.merge("RGB", (
+        Image.linear_gradient("L").resize(size),
+        Image.radial_gradient("L").resize(size),
+        Image.effect_noise(size, 48).convert("L"),
+    ))
+    draw = ImageDraw.Draw(base)
+    for index in range(0, width, 97):
+        draw.line((index, 0, width - index, height), fill=(index % 255, 40, 200), width=3)
+    draw.rectangle((width // 4, height // 4, width // 2, height // 2), fill=(250, 250, 250))
+    if mode == "RGBA":
+        base = base.convert("RGBA")
+        base.putalpha(Image.linear_gradient("L").rotate(90).resize(size))
+    elif mode == "P":
+        base = base.convert("P", palette=Image.ADAPTIVE, colors=128)
+    return base
+
+def _make_test_exif():
+    from PIL import Image
+    exif = Image.Exif()
+    exif[0x010F] = "StealthShare Test Camera"   # Make
+    exif[0x0110] = "Model 1"                    # Model
+    exif[0x0132] = "2024:01:01 12:00:00"        # DateTime
+    exif[0x0112] = 1                            # Orientation
+    return exif.tobytes()
+
+def _build_pixel_corpus(corpus_dir, size):
+    from PIL import Image, PngImagePlugin
+    exif_bytes = _make_test_exif()
+    corpus = []
+    for name, ext, save_params, mode, tolerance in PIXEL_CORPUS:
+        img = _make_test_image(mode, size)
+        params = dict(save_params)
+        if ext in (".jpg", ".webp", ".tiff"):
+            params["exif"] = exif_bytes
+        if ext == ".png":
+            text_info = PngImagePlugin.PngInfo()
+            text_info.add_text("Author", "StealthShare Test")
+            params["pnginfo"] = text_info
+        if ext == ".gif":
+            frames = [img, img.rotate(180)]
+            params.update(save_all=True, append_images=frames[1:], duration=100, loop=0)
+        path = os.path.join(corpus_dir, f"{name}{ext}")
+        img.save(path, **params)
+        corpus.append((name, ext, path, tolerance))
+    return corpus
+
+def _decoded_frames(path):
+    from PIL import Image, ImageSequence
+    with Image.open(path) as img:
+        return [frame.convert("RGBA") for frame in ImageSequence.Iterator(img)], img.size
+
+def _psnr(before, after):
+    from PIL import ImageChops, ImageStat
+    if before.size != after.size:
+        return 0.0
+    rms_per_band = ImageStat.Stat(ImageChops.difference(before, after)).rms
+    mse = sum(rms * rms for rms in rms_per_band) / len(rms_per_band)
+    return 10 * math.log10((255 * 255) / mse) if mse else math.inf
+
+def benchmark_pixels(args=None, size=PIXEL_CORPUS_SIZE):
+    from metadata_cleaner import clean_metadata
+    from utils import CLEANING_PROFILES, get_profile_cleaning_options
+
+    strict = bool(getattr(args, "strict", False))
+    corpus_dir = tempfile.mkdtemp(prefix="stealthshare_pixels_")
+    results = []
+    try:
+        corpus = _build_pixel_corpus(corpus_dir, size)
+        for profile_key in CLEANING_PROFILES:
+            options = get_profile_cleaning_options(profile_key)
+            for name, ext, path, tolerance in corpus:
+                output_path = os.path.join(corpus_dir, f"{name}_{profile_key}_cleaned{ext}")
+                started_at = time.perf_counter()
+                success = clean_metadata(path, output_path, ext, options)
+                elapsed = time.perf_counter() - started_at
+                entry = {"profile": profile_key, "file": f"{name}{ext}", "success": success}
+                if success:
+                    before_frames, image_size = _decoded_frames(path)
+                    after_frames, _ = _decoded_frames(output_path)
+                    identical = len(before_frames) == len(after_frames) and all(
+                        b.tobytes() == a.tobytes() for b, a in zip(before_frames, after_frames))
+                    psnr = math.inf if identical else min(
+                        (_psnr(b, a) for b, a in zip(before_frames, after_frames)), default=0.0)
+                    if len(before_frames) != len(after_frames):
+                        psnr = 0.0
+                    input_size = os.path.getsize(path)
+                    output_size = os.path.getsize(output_path)
+                    megapixels = image_size[0] * image_size[1] / 1_000_000
+                    # В строгом режиме любой формат должен пройти без изменения пикселей
+                    required = "exact" if strict else tolerance
+                    pixels_ok = identical if required == "exact" else psnr >= required
+                    size_growth = (output_size - input_size) / input_size
+                    entry.update({
+                        "identical": identical,
+                        "psnr_db": None if math.isinf(psnr) else round(psnr, 2),
+                        "required": required,
+                        "size_change_pct": round(size_growth * 100, 2),
+                        "ms_per_mp": round(elapsed * 1000 / megapixels, 2),
+                        "ok": pixels_ok and size_growth <= MAX_SIZE_GROWTH,
+                    })
+                else:
+                    entry["ok"] = False
+                results.append(entry)
+    finally:
+        shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    failures = [entry for entry in results if not entry["ok"]]
+    return {
+        "suite": "pixels",
+        "strict": strict,
+        "files": len(results),
+        "identical": sum(1 for entry in results if entry.get("identical")),
+        "median_ms_per_mp": round(statistics.median(entry["ms_per_mp"] for entry in results if "ms_per_mp" in entry), 2) if results else 0,
+        "failures": [f"{entry['profile']}/{entry['file']}" for entry in failures],
+        "details": results if getattr(args, "verbose", False) else None,
+        "ok": not failures,
+    }
+
+COPY_TEST_SIZE_MB = 256
+
+def benchmark_copy(args=None, size_mb=COPY_TEST_SIZE_MB, runs=3):
+    sys.path.insert(0, PROJECT_DIR)
+    from fileops import fast_copy
+
+    # Файл рядом с проектом, а не в /tmp: tmpfs не поддерживает reflink и исказит результат
+    work_dir = tempfile.mkdtemp(prefix=".stealthshare_bench_", dir=PROJECT_DIR)
+    try:
+        source = os.path.join(work_dir, "source.bin")
+        with open(source, "wb") as f:
+            for _ in range(size_mb):
+                f.write(os.urandom(1024 * 1024))
+        timings = {"fast_copy": [], "copy2": []}
+        method = None
+        for _ in range(runs):
+            for name in timings:
+                target = os.path.join(work_dir, f"{name}.bin")
+                started_at = time.perf_counter()
+                if name == "fast_copy":
+                    method = fast_copy(source, target)
+                else:
+                    shutil.copy2(source, target)
+                timings[name].append(time.perf_counter() - started_at)
+                os.remove(target)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    fast_ms = statistics.median(timings["fast_copy"]) * 1000
+    copy2_ms = statistics.median(timings["copy2"]) * 1000
+    return {
+        "suite": "copy",
+        "size_mb": size_mb,
+        "method": method,
+        "fast_copy_ms_median": round(fast_ms, 1),
+        "copy2_ms_median": round(copy2_ms, 1),
+        "speedup": round(copy2_ms / fast_ms, 2) if fast_ms else None,
+    }
+
+DURABILITY_TEST_FILES = 300
+DURABILITY_TEST_FILE_KB = 256
+
+def benchmark_durability(args=None, files=DURABILITY_TEST_FILES, file_kb=DURABILITY_TEST_FILE_KB):
+    sys.path.insert(0, PROJECT_DIR)
+    from fileops import OutputCommitter, DURABILITY_MODES
+    from metadata_cleaner import clean_metadata
+    from utils import logger
+    logger.setLevel("ERROR") # Предупреждения о каждом .bin файле заглушили бы результат
+
+    # Неподдерживаемое расширение: очистка сводится к копированию, и замер показывает стоимость записи и fsync
+    work_dir = tempfile.mkdtemp(prefix=".stealthshare_bench_", dir=PROJECT_DIR)
+    results = {}
+    try:
+        source_dir = os.path.join(work_dir, "source")
+        os.makedirs(source_dir)
+        sources = []
+        for index in range(files):
+            path = os.path.join(source_dir, f"file_{index:05d}.bin")
+            with open(path, "wb") as f:
+                f.write(os.urandom(file_kb * 1024))
+            sources.append(path)
+
+        for mode in DURABILITY_MODES:
+            output_dir = os.path.join(work_dir, mode)
+            os.makedirs(output_dir)
+            started_at = time.perf_counter()
+            with OutputCommitter(mode) as committer:
+                for path in sources:
+                    clean_metadata(path, os.path.join(output_dir, os.path.basename(path)), ".bin", {}, committer=committer)
+            elapsed = time.perf_counter() - started_at
+            results[mode] = {"files_per_s": round(files / elapsed, 1), "file_fsyncs": committer.stats["file_fsyncs"],
+                             "dir_fsyncs": committer.stats["dir_fsyncs"]}
+            leftovers = [name for name in os.listdir(output_dir) if name.startswith(".")]
+            results[mode]["ok"] = len(os.listdir(output_dir)) == files and not leftovers
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "suite": "durability",
+        "files": files,
+        "file_kb": file_kb,
+        **{f"{mode}_files_per_s": result["files_per_s"] for mode, result in results.items()},
+        **{f"{mode}_dir_fsyncs": result["dir_fsyncs"] for mode, result in results.items() if mode != "none"},
+        "ok": all(result["ok"] for result in results.values()),
+    }
+
+EMBEDDED_TEST_IMAGES = 40
+EMBEDDED_TEST_IMAGE_KB = 512
+
+def _make_test_jpeg(scan_size):
+    # JPEG собирается из сегментов вручную: для очистки по структуре декодируемые пиксели не нужны
+    def segment(marker, payload):
+        return bytes((0xFF, marker)) + len(payload + b"  ").to_bytes(2, "big") + payload
+    exif = b"Exif\0\0II*\0\x08\0\0\0\x01\0\x0f\x01\x02\0\x06\0\0\0\x1a\0\0\0\0\0\0\0Canon\0"
+    scan = os.urandom(scan_size).replace(b"\xff", b"\x00")
+    return (b"\xff\xd8" + segment(0xE1, exif) + segment(0xDB, b"\0" + bytes(64))
+            + segment(0xC0, b"\x08\0\x10\0\x10\x01\x01\x11\0") + segment(0xDA, b"\x01\x01\0\0\x3f\0") + scan + b"\xff\xd9")
+
+def benchmark_embedded(args=None, images=EMBEDDED_TEST_IMAGES, image_kb=EMBEDDED_TEST_IMAGE_KB, runs=3):
+    import zipfile
+    sys.path.insert(0, PROJECT_DIR)
+    from metadata_cleaner import _clean_ooxml_media
+    from profiles import compile_image_plan
+    from utils import logger
+    logger.setLevel("ERROR")
+
+    # DOCX-подобный контейнер: очистка встроенных JPEG сравнивается с простым копированием файла
+    work_dir = tempfile.mkdtemp(prefix=".stealthshare_bench_", dir=PROJECT_DIR)
+    timings = {"clean": [], "copy": []}
+    try:
+        source = os.path.join(work_dir, "source.docx")
+        with zipfile.ZipFile(source, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("word/document.xml", b"<w:p>text</w:p>" * 20000)
+            for index in range(images):
+                archive.writestr(f"word/media/image{index}.jpeg", _make_test_jpeg(image_kb * 1024))
+        target = os.path.join(work_dir, "target.docx")
+        plan = compile_image_plan(None)
+        for _ in range(runs):
+            started_at = time.perf_counter()
+            shutil.copyfile(source, target)
+            timings["copy"].append(time.perf_counter() - started_at)
+            started_at = time.perf_counter()
+            _clean_ooxml_media(target, plan, "DOCX", "source.docx")
+            timings["clean"].append(time.perf_counter() - started_at)
+        with zipfile.ZipFile(target) as archive:
+            ok = archive.testzip() is None and not any(b"Canon" in archive.read(name) for name in archive.namelist())
+        size_mb = os.path.getsize(source) / (1024 * 1024)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    clean_ms = statistics.median(timings["clean"]) * 1000
+    copy_ms = statistics.median(timings["copy"]) * 1000
+    return {
+        "suite": "embedded",
+        "images": images,
+        "size_mb": round(size_mb, 1),
+        "clean_ms_median": round(clean_ms, 1),
+        "copy_ms_median": round(copy_ms, 1),
+        "overhead": round(clean_ms / copy_ms, 2) if copy_ms else None,
+        "ok": ok,
+    }
+
+LOGGING_TEST_CALLS = 20000
+LOGGING_SLOW_SINK_CALLS = 1000
+# Медленный приемник лога (забитый терминал, сетевой диск): столько длится каждая запись
+LOGGING_SLOW_SINK_DELAY = 0.0005
+LOGGING_TEST_FILES = 300
+LOGGING_TEST_IMAGE_KB = 256
+# Предел цены записи INFO на файл (вместе с работой потока QueueListener): JPEG в памяти чистится
+# за десятки микросекунд, так что это сравнимо с самой очисткой, но на порядок меньше записи файла на диск
+MAX_LOGGING_OVERHEAD_US = 50
+
+class _SlowStream:
+    def write(self, text):
+        time.sleep(LOGGING_SLOW_SINK_DELAY)
+
+    def flush(self):
+        pass
+
+def _per_call_us(func, calls):
+    started_at = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - started_at) / calls * 1_000_000
+
+def benchmark_logging(args=None, calls=LOGGING_TEST_CALLS, files=LOGGING_TEST_FILES):
+    import logging
+    sys.path.insert(0, PROJECT_DIR)
+    from utils import logger
+    from profiles import compile_office_plan, compile_image_plan
+    from log_setup import configure_logging, stop_logging
+    from metadata_cleaner import clean_image_bytes
+
+    plan = compile_office_plan(None)
+    name = "report_final.docx"
+    log_call = lambda: logger.info("image.cleaned file=%r method=jpeg_segments removed=%s", name, "app1_exif")
+    devnull = open(os.devnull, "w")
+    try:
+        # Выключенный уровень: f-строка с планом форматируется всегда, %-стиль - никогда
+        logger.handlers.clear()
+        logger.setLevel(logging.WARNING)
+        fstring_us = _per_call_us(lambda: logger.info(f"DOCX: Очистка '{name}' с планом: {plan}"), calls)
+        lazy_us = _per_call_us(lambda: logger.debug("office.start doc=DOCX file=%r plan=%s", name, plan), calls)
+
+        # Медленный приемник: прямой обработчик ждет каждую запись, через очередь ждет только поток QueueListener
+        direct_handler = logging.StreamHandler(_SlowStream())
+        logger.addHandler(direct_handler)
+        logger.setLevel(logging.INFO)
+        direct_us = _per_call_us(log_call, LOGGING_SLOW_SINK_CALLS)
+        logger.removeHandler(direct_handler)
+        configure_logging(logging.INFO, stream=_SlowStream())
+        queue_us = _per_call_us(log_call, LOGGING_SLOW_SINK_CALLS)
+        stop_logging()
+
+        # Очистка JPEG в памяти: одна запись INFO на файл через очередь против выключенного лога
+        image_plan = compile_image_plan(None)
+        jpeg = _make_test_jpeg(LOGGING_TEST_IMAGE_KB * 1024)
+        clean = lambda: clean_image_bytes(jpeg, ".jpg", image_plan)
+        configure_logging(logging.INFO, stream=devnull)
+        timings = {logging.INFO: [], logging.WARNING: []}
+        # Замеры чередуются, чтобы прогрев и частота процессора не достались одному из вариантов
+        for _ in range(5):
+            for level in timings:
+                logger.setLevel(level)
+                timings[level].append(_per_call_us(clean, files))
+        clean_info_us, clean_quiet_us = min(timings[logging.INFO]), min(timings[logging.WARNING])
+        ok = clean_image_bytes(jpeg, ".jpg", image_plan) is not None
+    finally:
+        stop_logging()
+        logger.handlers.clear()
+        devnull.close()
+
+    overhead_us = clean_info_us - clean_quiet_us
+    return {
+        "suite": "logging",
+        "disabled_fstring_us": round(fstring_us, 2),
+        "disabled_lazy_us": round(lazy_us, 2),
+        "slow_sink_direct_us": round(direct_us, 1),
+        "slow_sink_queue_us": round(queue_us, 1),
+        "clean_quiet_us": round(clean_quiet_us, 1),
+        "clean_info_us": round(clean_info_us, 1),
+        "info_overhead_us": round(overhead_us, 1),
+        "ok": ok and lazy_us < fstring_us and queue_us < direct_us and overhead_us <= MAX_LOGGING_OVERHEAD_US,
+    }
+
+LANES_TEST_FILES = 40
+LANES_TEST_REENCODE_SHARE = 4 # Каждый четвертый файл - BMP, который чистится только перекодированием
+LANES_TEST_BMP_SIZE = (2000, 1500)
+LANES_TEST_JPEG_KB = 256
+LANES_TEST_GIF_FRAMES = 3
+
+def _lane_latencies(pools, pool_for, sources, plan, output_dir):
+    from worker_pool import clean_file_task, _ping
+
+    # Запуск процессов и импорт библиотек в замер не входят
+    for pool in pools:
+        for future in [pool.submit(_ping) for _ in range(pool.max_workers)]:
+            future.result()
+    started_at = time.perf_counter()
+    futures = []
+    latencies = {}
+    for path, ext in sources:
+        output_path = os.path.join(output_dir, "cleaned_" + os.path.basename(path))
+        future = pool_for(ext).submit(clean_file_task, path, output_path, ext, plan)
+        # Время готовности фиксируется в момент завершения, а не когда до файла дойдет цикл ниже
+        future.add_done_callback(lambda _, ext=ext: latencies.setdefault(ext, []).append(time.perf_counter() - started_at))
+        futures.append((ext, future))
+    for ext, future in futures:
+        success, _, _ = future.result()
+        if not success:
+            raise RuntimeError(f"cleaning failed for {ext}")
+    return latencies, time.perf_counter() - started_at
+
+def benchmark_lanes(args=None, files=LANES_TEST_FILES):
+    sys.path.insert(0, PROJECT_DIR)
+    from PIL import Image
+    from metadata_cleaner import REENCODE_EXTENSIONS
+    from profiles import compile_cleaning_plan
+    from worker_pool import SupervisedPool, get_default_worker_count
+    from utils import logger, get_profile_cleaning_options
+    logger.setLevel("ERROR")
+
+    # Смешанный пакет: JPEG чистится по структуре, BMP - только через Pillow. Сравниваем, когда готовы JPEG,
+    # если все файлы идут в одну очередь (как раньше) и если BMP уходят в отдельный пул
+    work_dir = tempfile.mkdtemp(prefix=".stealthshare_bench_", dir=PROJECT_DIR)
+    plan = compile_cleaning_plan(get_profile_cleaning_options("profile_standard"))
+    try:
+        bitmap = Image.effect_noise(LANES_TEST_BMP_SIZE, 60).convert("RGB")
+        # Анимированный GIF идет через пул перекодирования: все его кадры должны дойти до результата
+        frames = [Image.effect_noise((320, 240), 40 + 30 * index).convert("P", palette=Image.ADAPTIVE)
+                  for index in range(LANES_TEST_GIF_FRAMES)]
+        animation_path = os.path.join(work_dir, "animation.gif")
+        frames[0].save(animation_path, save_all=True, append_images=frames[1:], duration=80, loop=0)
+        sources = [(animation_path, ".gif")]
+        for index in range(files):
+            if index % LANES_TEST_REENCODE_SHARE == 0:
+                path = os.path.join(work_dir, f"image_{index:03d}.bmp")
+                bitmap.save(path)
+                sources.append((path, ".bmp"))
+            else:
+                path = os.path.join(work_dir, f"image_{index:03d}.jpg")
+                with open(path, "wb") as f:
+                    f.write(_make_test_jpeg(LANES_TEST_JPEG_KB * 1024))
+                sources.append((path, ".jpg"))
+        output_dir = os.path.join(work_dir, "out")
+        os.makedirs(output_dir)
+
+        # Быстрая очередь в обоих замерах такого же размера, как в пакетной очистке
+        with SupervisedPool(max_workers=get_default_worker_count()) as pool:
+            single, single_wall = _lane_latencies([pool], lambda ext: pool, sources, plan, output_dir)
+        with SupervisedPool(max_workers=get_default_worker_count()) as pool, \
+                SupervisedPool(max_workers=get_default_worker_count(), preload=("images",)) as cpu_pool:
+            split, split_wall = _lane_latencies([pool, cpu_pool], lambda ext: cpu_pool if ext in REENCODE_EXTENSIONS else pool,
+                                                sources, plan, output_dir)
+        with Image.open(os.path.join(output_dir, "cleaned_animation.gif")) as cleaned_animation:
+            animation_frames = cleaned_animation.n_frames
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    single_fast_ms = max(single[".jpg"]) * 1000
+    split_fast_ms = max(split[".jpg"]) * 1000
+    return {
+        "suite": "lanes",
+        "files": files,
+        "reencode_files": len(single[".bmp"]),
+        "cpu_workers": get_default_worker_count(),
+        "single_lane_lossless_done_ms": round(single_fast_ms, 1),
+        "split_lane_lossless_done_ms": round(split_fast_ms, 1),
+        "single_lane_wall_ms": round(single_wall * 1000, 1),
+        "split_lane_wall_ms": round(split_wall * 1000, 1),
+        "animation_frames": f"{animation_frames}/{LANES_TEST_GIF_FRAMES}",
+        "ok": split_fast_ms < single_fast_ms and animation_frames == LANES_TEST_GIF_FRAMES,
+    }
+
+REMOTE_TEST_FILES = 60
+REMOTE_TEST_JPEG_KB = 256
+REMOTE_TEST_LATENCY_MS = 2.0
+REMOTE_TEST_DEPTH = 8
+MIN_REMOTE_SPEEDUP = 3.0
+
+class _SlowRaw(io.RawIOBase):
+    # Файл "на сетевой ФС": каждое чтение и запись - один запрос с задержкой, как через tc netem
+    def __init__(self, raw, shim):
+        self._raw = raw
+        self._shim = shim
+        self.name = raw.name
+        self.mode = raw.mode
+
+    def readinto(self, buffer):
+        self._shim.round_trip()
+        return self._raw.readinto(buffer)
+
+    def write(self, data):
+        self._shim.round_trip()
+        return self._raw.write(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self._raw.seek(offset, whence)
+
+    def tell(self):
+        return self._raw.tell()
+
+    def truncate(self, size=None):
+        return self._raw.truncate(size)
+
+    def fileno(self):
+        return self._raw.fileno()
+
+    def readable(self):
+        return self._raw.readable()
+
+    def writable(self):
+        return self._raw.writable()
+
+    def seekable(self):
+        return self._raw.seekable()
+
+    def close(self):
+        self._raw.close()
+        super().close()
+
+class _LatencyShim:
+    # Имитация сетевой ФС без FUSE и прав root: open() для путей внутри root возвращает файл,
+    # у которого открытие и каждый системный вызов чтения/записи ждут latency. Работает в этом процессе
+    def __init__(self, root, latency):
+        self.root = os.path.abspath(root)
+        self.latency = latency
+        self.round_trips = 0
+        self._lock = threading.Lock()
+        self._original_open = None
+
+    def round_trip(self):
+        with self._lock:
+            self.round_trips += 1
+        time.sleep(self.latency)
+
+    def _open(self, file, mode="r", buffering=-1, *args, **kwargs):
+        if "b" not in mode or not isinstance(file, (str, os.PathLike)) or \
+                not os.path.abspath(file).startswith(self.root + os.sep):
+            return self._original_open(file, mode, buffering, *args, **kwargs)
+        self.round_trip()
+        raw = _SlowRaw(self._original_open(file, mode, 0), self)
+        if buffering == 0:
+            return raw
+        if "+" in mode:
+            return io.BufferedRandom(raw)
+        return io.BufferedWriter(raw) if any(flag in mode for flag in "wax") else io.BufferedReader(raw)
+
+    def __enter__(self):
+        self._original_open = builtins.open
+        builtins.open = self._open
+        return self
+
+    def __exit__(self, *exc_info):
+        builtins.open = self._original_open
+
+def benchmark_remote(args=None, files=REMOTE_TEST_FILES, latency_ms=REMOTE_TEST_LATENCY_MS):
+    from concurrent.futures import ThreadPoolExecutor
+    sys.path.insert(0, PROJECT_DIR)
+    from fileops import OutputCommitter
+    from metadata_cleaner import clean_metadata
+    from profiles import compile_cleaning_plan
+    from remote_io import InputSpool, REMOTE_PREFIXES_ENV
+    from worker_pool import clean_file_task
+    from utils import logger, get_profile_cleaning_options
+    logger.setLevel("ERROR")
+
+    # Входы и результаты лежат на "сетевой" папке с задержкой на каждый запрос. Сравниваем очистку
+    # напрямую и через локальный буфер входов с упреждающим чтением и промежуточную папку результатов
+    work_dir = tempfile.mkdtemp(prefix=".stealthshare_bench_", dir=PROJECT_DIR)
+    remote_dir = os.path.join(work_dir, "remote")
+    plan = compile_cleaning_plan(get_profile_cleaning_options("profile_standard"))
+    results = {}
+    previous_prefixes = os.environ.get(REMOTE_PREFIXES_ENV)
+    os.environ[REMOTE_PREFIXES_ENV] = remote_dir
+    try:
+        sources = []
+        os.makedirs(os.path.join(remote_dir, "out_direct"))
+        os.makedirs(os.path.join(remote_dir, "out_spooled"))
+        for index in range(files):
+            path = os.path.join(remote_dir, f"photo_{index:03d}.jpg")
+            with open(path, "wb") as f:
+                f.write(_make_test_jpeg(REMOTE_TEST_JPEG_KB * 1024))
+            sources.append(path)
+
+        with _LatencyShim(remote_dir, latency_ms / 1000) as shim:
+            started_at = time.perf_counter()
+            for path in sources:
+                clean_metadata(path, os.path.join(remote_dir, "out_direct", os.path.basename(path)), ".jpg", plan)
+            results["direct"] = (time.perf_counter() - started_at, shim.round_trips)
+
+            shim.round_trips = 0
+            staging_dir = os.path.join(work_dir, "staging")
+            os.makedirs(staging_dir)
+            started_at = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=1) as lane, InputSpool(sources, depth=REMOTE_TEST_DEPTH) as spool, \
+                    OutputCommitter("group", staging_dir=staging_dir) as committer:
+                for path in sources:
+                    final_path = os.path.join(remote_dir, "out_spooled", os.path.basename(path))
+                    temp_path = committer.reserve(final_path)
+                    if spool.submit(lane, clean_file_task, path, temp_path, ".jpg", plan, urgent=True).result()[0]:
+                        committer.commit(temp_path, final_path)
+            results["spooled"] = (time.perf_counter() - started_at, shim.round_trips)
+
+        outputs_match = all(
+            open(os.path.join(remote_dir, "out_direct", os.path.basename(path)), "rb").read()
+            == open(os.path.join(remote_dir, "out_spooled", os.path.basename(path)), "rb").read() for path in sources)
+        leftovers = [name for name in os.listdir(os.path.join(remote_dir, "out_spooled")) if name.startswith(".")]
+    finally:
+        if previous_prefixes is None:
+            os.environ.pop(REMOTE_PREFIXES_ENV, None)
+        else:
+            os.environ[REMOTE_PREFIXES_ENV] = previous_prefixes
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    direct_rate = files / results["direct"][0]
+    spooled_rate = files / results["spooled"][0]
+    return {
+        "suite": "remote",
+        "files": files,
+        "latency_ms": latency_ms,
+        "depth": REMOTE_TEST_DEPTH,
+        "direct_files_per_s": round(direct_rate, 1),
+        "spooled_files_per_s": round(spooled_rate, 1),
+        "direct_round_trips_per_file": round(results["direct"][1] / files, 1),
+        "spooled_round_trips_per_file": round(results["spooled"][1] / files, 1),
+        "speedup": round(spooled_rate / direct_rate, 2),
+        "ok": outputs_match and not leftovers and spooled_rate >= direct_rate * MIN_REMOTE_SPEEDUP,
+    }
+
+SUITES = {
+    "startup": benchmark_startup,
+    "pixels": benchmark_pixels,
+    "copy": benchmark_copy,
+    "durability": benchmark_durability,
+    "embedded": benchmark_embedded,
+    "logging": benchmark_logging,
+    "lanes": benchmark_lanes,
+    "remote": benchmark_remote,
+}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="StealthShare benchmarks and regression checks.")
+    parser.add_argument("suites", nargs="*", metavar="suite", help=f"Suites to run: {', '.join(SUITES)} (default: all)")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    parser.add_argument("--strict", action="store_true", help="pixels: require bit-exact pixels for every format")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Include per-file details")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.suites if name not in SUITES]
+    if unknown:
+        parser.error(f"unknown suite(s): {', '.join(unknown)}")
+
+    reports = [SUITES[name](args) for name in (args.suites or SUITES)]
+    if args.json:
+        print(json.dumps(reports, indent=2, ensure_ascii=False))
+    else:
+        for report in reports:
+            status = "OK" if report.get("ok", True) else "FAIL"
+            details = ", ".join(f"{key}={value}" for key, value in report.items() if key not in ("suite", "ok") and value is not None)
+            print(f"[{status}] {report['suite']}: {details}")
+    return 0 if all(report.get("ok", True) for report in reports) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,63 @@
+# StealthShare v0.1 pre1
+# Copyright (c) 2025 IQUXAe
+# Released under the MIT License. See LICENSE file for details.
+
+import multiprocessing
+
+
+class CancelledError(BaseException):
+    # Наследуется от BaseException, как asyncio.CancelledError: обработчики "except Exception"
+    # в очистителях не должны превращать отмену в обычную ошибку файла
+    pass
+
+
+class CancellationToken:
+    # Общий флаг отмены и паузы для GUI, пакетного движка и рабочих процессов.
+    # События multiprocessing передаются в рабочий процесс при его запуске
+    def __init__(self):
+        self._cancelled = multiprocessing.Event()
+        self._running = multiprocessing.Event()
+        self._running.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+        # Отмена будит всех, кто ждет на паузе
+        self._running.set()
+
+    def pause(self):
+        if not self.cancelled:
+            self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def wait_if_paused(self, timeout=None):
+        return self._running.wait(timeout)
+
+    def check(self):
+        if not self._running.is_set():
+            self._running.wait()
+        if self._cancelled.is_set():
+            raise CancelledError("операция отменена")
+
+
+# Токен текущего процесса: рабочий процесс пула получает его при запуске,
+# а долгие циклы очистителей проверяют его между блоками данных
+_current_token = None
+
+def set_current_token(token):
+    global _current_token
+    _current_token = token
+
+def check_cancelled():
+    token = _current_token
+    if token is not None:
+        token.check()
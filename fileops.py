@@ -0,0 +1,268 @@
+# StealthShare v0.1 pre1
+# Copyright (c) 2025 IQUXAe
+# Released under the MIT License. See LICENSE file for details.
+
+import os
+import errno
+import shutil
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import logger, split_extension
+from cancellation import check_cancelled
+
+# ioctl FICLONE из linux/fs.h: клонирование экстентов файла (btrfs, XFS, bcachefs)
+FICLONE = 0x40049409
+COPY_SYSCALL_CHUNK_SIZE = 1024 * 1024 * 1024
+BUFFERED_COPY_CHUNK_SIZE = 1024 * 1024
+# Ошибки, при которых системный вызов просто не поддерживается для этой пары файлов
+FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF, errno.EPERM, errno.ETXTBSY}
+
+
+def _temp_sibling_path(path):
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.{os.getpid()}.tmp")
+
+def _copy_with_reflink(src_file, dst_file):
+    import fcntl
+    fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+    return True
+
+def _copy_with_syscall(copy_func, src_file, dst_file, size):
+    # copy_file_range/sendfile двигают данные внутри ядра, без копирования в память процесса
+    src_fd, dst_fd = src_file.fileno(), dst_file.fileno()
+    offset = 0
+    while offset < size:
+        check_cancelled()
+        try:
+            copied = copy_func(src_fd, dst_fd, min(size - offset, COPY_SYSCALL_CHUNK_SIZE), offset)
+        except OSError as e:
+            if offset == 0 and e.errno in FALLBACK_ERRNOS:
+                return False
+            raise
+        if copied == 0:
+            break
+        offset += copied
+    return offset == size
+
+def _copy_file_range(src_fd, dst_fd, count, offset):
+    return os.copy_file_range(src_fd, dst_fd, count, offset, offset)
+
+def _sendfile(src_fd, dst_fd, count, offset):
+    return os.sendfile(dst_fd, src_fd, offset, count)
+
+def fast_copy(src, dst):
+    # Копирование без изменений: reflink -> copy_file_range -> sendfile -> обычный буферный
+    with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+        size = os.fstat(src_file.fileno()).st_size
+        method = "buffered"
+        attempts = [("reflink", lambda: _copy_with_reflink(src_file, dst_file))]
+        if hasattr(os, "copy_file_range"):
+            attempts.append(("copy_file_range", lambda: _copy_with_syscall(_copy_file_range, src_file, dst_file, size)))
+        if hasattr(os, "sendfile"):
+            attempts.append(("sendfile", lambda: _copy_with_syscall(_sendfile, src_file, dst_file, size)))
+        for name, attempt in attempts:
+            try:
+                if attempt():
+                    method = name
+                    break
+            except (OSError, ImportError):
+                pass
+            # Неудачная попытка могла записать часть данных - начинаем с чистого файла
+            dst_file.seek(0)
+            dst_file.truncate()
+        else:
+            src_file.seek(0)
+            shutil.copyfileobj(src_file, dst_file, BUFFERED_COPY_CHUNK_SIZE)
+    shutil.copystat(src, dst)
+    return method
+
+def link_or_copy(src, dst):
+    # Пишем во временное имя рядом и переименовываем, чтобы заменить старый результат атомарно
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        # rename() поверх того же inode ничего не делает и оставил бы временный файл
+        return "hardlink"
+    temp_path = _temp_sibling_path(dst)
+    method = None
+    try:
+        try:
+            os.link(src, temp_path)
+            method = "hardlink"
+        except (OSError, AttributeError, NotImplementedError):
+            method = fast_copy(src, temp_path)
+        os.replace(temp_path, dst)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    logger.debug("fileops.linked target=%r source=%r method=%s", os.path.basename(dst), os.path.basename(src), method)
+    return method
+
+
+DURABILITY_MODES = ("none", "fsync", "group")
+DEFAULT_GROUP_FILES = 64
+DEFAULT_GROUP_INTERVAL_MS = 500
+GROUP_FSYNC_THREADS = 8
+
+_temp_counter = itertools.count()
+
+def temp_output_path(final_path):
+    # Расширение оставляем в конце: Pillow и другие библиотеки выбирают формат по нему
+    directory, name = os.path.split(final_path)
+    return os.path.join(directory, f".{name}.{os.getpid()}.{next(_temp_counter)}.tmp{split_extension(name)[1]}")
+
+def fsync_file(path):
+    with open(path, "rb+") as f:
+        os.fsync(f.fileno())
+
+def fsync_directory(directory):
+    # На Windows каталог нельзя открыть для fsync - там запись каталога фиксирует сама ФС
+    if os.name == "nt":
+        return
+    fd = os.open(directory or ".", os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class OutputCommitter:
+    # none - атомарное переименование без fsync;
+    # fsync - fsync файла и каталога для каждого результата;
+    # group - результаты копятся и фиксируются пачкой каждые N файлов или T мс.
+    # on_commit(final_paths) вызывается, когда результаты уже лежат под итоговыми именами.
+    # staging_dir - локальная папка для результатов, которые пишутся на сетевую ФС: очистка пишет туда,
+    # а при фиксации файл одним последовательным копированием переносится во временное имя рядом с итоговым
+    def __init__(self, mode="none", group_files=DEFAULT_GROUP_FILES, group_interval_ms=DEFAULT_GROUP_INTERVAL_MS, on_commit=None,
+                 staging_dir=None):
+        if mode not in DURABILITY_MODES:
+            raise ValueError(f"Неизвестный режим надежности записи: {mode!r}")
+        self.mode = mode
+        self.group_files = max(1, group_files)
+        self.group_interval = group_interval_ms / 1000
+        self._pending = {}
+        self._lock = threading.RLock()
+        self._timer = None
+        self.on_commit = on_commit
+        self.staging_dir = staging_dir
+        self.stats = {'committed': 0, 'file_fsyncs': 0, 'dir_fsyncs': 0, 'groups': 0}
+
+    def reserve(self, final_path):
+        if self.staging_dir:
+            return temp_output_path(os.path.join(self.staging_dir, os.path.basename(final_path)))
+        return temp_output_path(final_path)
+
+    def _stage_out(self, temp_path, final_path):
+        # Без промежуточной папки временный файл уже лежит рядом с итоговым
+        if not self.staging_dir:
+            return temp_path
+        target_path = temp_output_path(final_path)
+        try:
+            fast_copy(temp_path, target_path)
+        except BaseException:
+            self.discard(target_path)
+            raise
+        self.discard(temp_path)
+        return target_path
+
+    def locate(self, final_path):
+        # Где сейчас лежит результат: в group-режиме он может еще ждать переименования
+        with self._lock:
+            return self._pending.get(final_path, final_path)
+
+    def discard(self, temp_path):
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+    def commit(self, temp_path, final_path):
+        if self.mode == "none":
+            os.replace(self._stage_out(temp_path, final_path), final_path)
+            self.stats['committed'] += 1
+            self._notify([final_path])
+        elif self.mode == "fsync":
+            temp_path = self._stage_out(temp_path, final_path)
+            fsync_file(temp_path)
+            os.replace(temp_path, final_path)
+            fsync_directory(os.path.dirname(final_path))
+            self.stats['file_fsyncs'] += 1
+            self.stats['dir_fsyncs'] += 1
+            self.stats['committed'] += 1
+            self._notify([final_path])
+        else:
+            with self._lock:
+                previous = self._pending.pop(final_path, None)
+                if previous and previous != temp_path:
+                    self.discard(previous)
+                self._pending[final_path] = temp_path
+                if len(self._pending) >= self.group_files:
+                    self._flush_locked()
+                elif self._timer is None:
+                    self._timer = threading.Timer(self.group_interval, self._flush_from_timer)
+                    self._timer.daemon = True
+                    self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        except OSError as e:
+            logger.error(f"ФАЙЛЫ: Не удалось зафиксировать группу результатов: {e}", exc_info=True)
+
+    def _flush_locked(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        # Данные всех файлов группы на диск до переименования, иначе после сбоя под
+        # итоговым именем мог бы оказаться пустой файл. fsync (и перенос из промежуточной папки)
+        # отпускают GIL, поэтому идут параллельно. staged - где сейчас лежит каждый еще не переименованный файл
+        staged = dict(pending)
+        def _prepare(item):
+            final_path, temp_path = item
+            staged[final_path] = temp_path = self._stage_out(temp_path, final_path)
+            fsync_file(temp_path)
+            return temp_path
+        directories = set()
+        try:
+            with ThreadPoolExecutor(max_workers=min(len(pending), GROUP_FSYNC_THREADS)) as executor:
+                prepared = list(executor.map(_prepare, pending.items()))
+            for final_path, temp_path in zip(pending, prepared):
+                os.replace(temp_path, final_path)
+                staged.pop(final_path)
+                directories.add(os.path.dirname(final_path))
+        except BaseException:
+            # Неподтвержденные временные файлы группы не должны остаться рядом с результатами
+            for temp_path in staged.values():
+                self.discard(temp_path)
+            raise
+        for directory in directories:
+            fsync_directory(directory)
+        self.stats['file_fsyncs'] += len(pending)
+        self.stats['dir_fsyncs'] += len(directories)
+        self.stats['committed'] += len(pending)
+        self.stats['groups'] += 1
+        logger.debug("fileops.group_committed files=%d directories=%d", len(pending), len(directories))
+        self._notify(list(pending))
+
+    def _notify(self, final_paths):
+        if self.on_commit is not None:
+            self.on_commit(final_paths)
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
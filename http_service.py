@@ -0,0 +1,253 @@
+# StealthShare v0.1 pre1
+# Copyright (c) 2025 IQUXAe
+# Released under the MIT License. See LICENSE file for details.
+
+import os
+import sys
+import json
+import shutil
+import signal
+import tempfile
+import argparse
+import threading
+import logging
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+from utils import (
+    logger,
+    get_file_extension,
+    get_profile_cleaning_options,
+    get_supported_extensions_list,
+    CLEANING_PROFILES
+)
+from worker_pool import create_warm_pool, clean_file_task, DEFAULT_TASK_TIMEOUT, DEFAULT_MEMORY_LIMIT
+from profiles import compile_cleaning_plan, load_user_profiles
+from log_setup import configure_logging, get_log_queue, LOG_LEVELS, LOG_FORMATS
+
+DEFAULT_PORT = 8765
+STREAM_CHUNK_SIZE = 64 * 1024
+DEFAULT_MAX_BODY_SIZE = 512 * 1024 * 1024
+
+
+class BadRequest(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class CleaningRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "StealthShare"
+    sys_version = ""
+    # Заголовки и тело отправляются отдельными write(), без этого Nagle добавляет ~40 мс на ответ
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        logger.debug("http.request client=%s " + format, self.address_string(), *args)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self, target):
+        # Тело пишется во временный файл блоками: в памяти потока не больше STREAM_CHUNK_SIZE байт
+        max_size = self.server.max_body_size
+        received = 0
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            while True:
+                size_line = self.rfile.readline(1024)
+                try:
+                    chunk_size = int(size_line.split(b";", 1)[0].strip(), 16)
+                except ValueError:
+                    raise BadRequest(400, "Malformed chunked body")
+                if chunk_size == 0:
+                    # Пропускаем trailer-заголовки до пустой строки
+                    while self.rfile.readline(1024) not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                if received + chunk_size > max_size:
+                    raise BadRequest(413, "Request body too large")
+                self._copy_body(target, chunk_size, "Truncated chunked body")
+                received += chunk_size
+                self.rfile.readline(1024)
+            return received
+
+        try:
+            content_length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            raise BadRequest(411, "Content-Length or chunked Transfer-Encoding required")
+        if content_length < 0:
+            raise BadRequest(400, "Invalid Content-Length")
+        if content_length > max_size:
+            raise BadRequest(413, "Request body too large")
+        self._copy_body(target, content_length, "Truncated request body")
+        return content_length
+
+    def _copy_body(self, target, size, truncated_message):
+        remaining = size
+        while remaining:
+            data = self.rfile.read(min(remaining, STREAM_CHUNK_SIZE))
+            if not data:
+                raise BadRequest(400, truncated_message)
+            target.write(data)
+            remaining -= len(data)
+
+    def _resolve_request_options(self, query):
+        profile_key = (query.get("profile") or [self.headers.get("X-StealthShare-Profile", self.server.default_profile)])[0]
+        if profile_key not in CLEANING_PROFILES:
+            raise BadRequest(400, f"Unknown profile '{profile_key}'")
+
+        filename = (query.get("filename") or [self.headers.get("X-Filename", "")])[0]
+        file_ext = (query.get("ext") or [get_file_extension(filename)])[0].lower()
+        if file_ext and not file_ext.startswith("."):
+            file_ext = "." + file_ext
+        if not file_ext:
+            raise BadRequest(400, "File type unknown: pass ?ext=.jpg or ?filename=...")
+        # Расширение становится частью имени временного файла - принимаются только известные типы
+        if file_ext not in self.server.supported_extensions:
+            raise BadRequest(400, f"Unsupported file type '{file_ext}'")
+
+        preserve_icc = (query.get("icc") or ["1"])[0] not in ("0", "false", "no")
+        return profile_key, file_ext, compile_cleaning_plan(get_profile_cleaning_options(profile_key, preserve_icc=preserve_icc))
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/health":
+            self._send_json(200, {"status": "ok"})
+        elif path == "/profiles":
+            self._send_json(200, {"profiles": list(CLEANING_PROFILES.keys()), "default": self.server.default_profile})
+        elif path == "/extensions":
+            self._send_json(200, {"extensions": get_supported_extensions_list()})
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/clean":
+            self.close_connection = True
+            self._send_json(404, {"error": "Not found"})
+            return
+        try:
+            profile_key, file_ext, cleaning_options = self._resolve_request_options(parse_qs(url.query))
+        except BadRequest as e:
+            # Тело запроса осталось непрочитанным - соединение нельзя переиспользовать
+            self.close_connection = True
+            self._send_json(e.status, {"error": e.message})
+            return
+
+        # Вход и результат лежат во временных файлах: рабочий процесс получает путь, а не весь файл через канал.
+        # Расширение нужно в имени - по нему очистители выбирают формат
+        request_dir = tempfile.mkdtemp(prefix="request_", dir=self.server.spool_dir)
+        try:
+            input_path = os.path.join(request_dir, "input" + file_ext)
+            output_path = os.path.join(request_dir, "output" + file_ext)
+            try:
+                with open(input_path, "wb") as body_file:
+                    self._read_body(body_file)
+            except BadRequest as e:
+                self.close_connection = True
+                self._send_json(e.status, {"error": e.message})
+                return
+
+            try:
+                success = self.server.pool.submit(clean_file_task, input_path, output_path, file_ext, cleaning_options).result()[0]
+            except Exception as e:
+                logger.error(f"HTTP: Рабочий процесс завершился с ошибкой: {e}")
+                success = False
+            if not success or not os.path.exists(output_path):
+                self._send_json(422, {"error": "Cleaning failed", "profile": profile_key, "ext": file_ext})
+                return
+
+            with open(output_path, "rb") as cleaned_file:
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(os.fstat(cleaned_file.fileno()).st_size))
+                self.send_header("X-StealthShare-Profile", profile_key)
+                self.end_headers()
+                shutil.copyfileobj(cleaned_file, self.wfile, STREAM_CHUNK_SIZE)
+        finally:
+            shutil.rmtree(request_dir, ignore_errors=True)
+
+
+class CleaningHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, server_address, pool, default_profile="profile_standard", max_body_size=DEFAULT_MAX_BODY_SIZE, spool_dir=None):
+        super().__init__(server_address, CleaningRequestHandler)
+        self.pool = pool
+        self.default_profile = default_profile
+        self.max_body_size = max_body_size
+        self.supported_extensions = {"." + ext for ext in get_supported_extensions_list()}
+        # Временные файлы запросов; удаляются вместе с папкой при остановке сервиса
+        self.spool_dir = tempfile.mkdtemp(prefix="stealthshare_http_", dir=spool_dir)
+
+    def server_close(self):
+        super().server_close()
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
+
+
+def create_server(host="127.0.0.1", port=DEFAULT_PORT, workers=None, default_profile="profile_standard",
+                  max_body_size=DEFAULT_MAX_BODY_SIZE, task_timeout=DEFAULT_TASK_TIMEOUT, memory_limit=DEFAULT_MEMORY_LIMIT,
+                  spool_dir=None):
+    pool = create_warm_pool(workers, task_timeout=task_timeout, memory_limit=memory_limit)
+    try:
+        return CleaningHTTPServer((host, port), pool, default_profile=default_profile, max_body_size=max_body_size,
+                                  spool_dir=spool_dir)
+    except Exception:
+        pool.shutdown(wait=False)
+        raise
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="StealthShare: local HTTP metadata cleaning service.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to bind (loopback by default)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("-p", "--profile", default="profile_standard", choices=list(CLEANING_PROFILES.keys()),
+                        help="Profile used when a request does not choose one")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Number of worker processes")
+    parser.add_argument("--max-body-mb", type=int, default=DEFAULT_MAX_BODY_SIZE // (1024 * 1024),
+                        help="Reject larger request bodies with 413 (MB)")
+    parser.add_argument("--spool-dir", default=None, help="Folder for request and response temp files (system temp by default)")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TASK_TIMEOUT, help="Kill a worker that spends longer than this on one request (s)")
+    parser.add_argument("--memory-mb", type=int, default=DEFAULT_MEMORY_LIMIT // (1024 * 1024),
+                        help="Address space limit of each worker process (MB, 0 = no limit)")
+    parser.add_argument("--log-level", default="INFO", choices=LOG_LEVELS, help="DEBUG adds per-request and per-step events")
+    parser.add_argument("--log-format", default="text", choices=LOG_FORMATS, help="json: one JSON object per line")
+    parser.add_argument("--log-file", default=None, help="Also write the log to this file")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    if not logger.hasHandlers():
+        configure_logging(logging.INFO)
+    # Пользовательские профили нужны до разбора аргументов: -p проверяется по списку профилей
+    load_user_profiles()
+    args = parse_args(argv)
+    if get_log_queue() is not None:
+        # Лог настраивали мы, а не приложение, в которое встроена служба - применяем параметры командной строки
+        configure_logging(args.log_level, log_file=args.log_file, json_lines=args.log_format == "json")
+
+    if args.host not in ("127.0.0.1", "::1", "localhost"):
+        logger.warning(f"HTTP: Сервис слушает не loopback-адрес '{args.host}' - файлы будут доступны по сети.")
+
+    server = create_server(args.host, args.port, workers=args.workers, default_profile=args.profile,
+                           max_body_size=args.max_body_mb * 1024 * 1024, task_timeout=args.timeout,
+                           memory_limit=args.memory_mb * 1024 * 1024, spool_dir=args.spool_dir)
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown, daemon=True).start())
+    logger.info(f"HTTP: Сервис очистки запущен на http://{args.host}:{server.server_address[1]}/clean (профиль по умолчанию: {args.profile})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.pool.shutdown(wait=True)
+        logger.info("HTTP: Сервис остановлен.")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,658 @@
+# StealthShare v0.1 pre1
+# Copyright (c) 2025 IQUXAe
+# Released under the MIT License. See LICENSE file for details.
+
+import zlib
+import shutil
+import struct
+
+from cancellation import check_cancelled
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_COPY_CHUNK_SIZE = 1024 * 1024
+# Текстовые чанки, в которые ImageMagick и другие программы прячут EXIF/IPTC/XMP
+PNG_EXIF_TEXT_KEYWORDS = {b"Raw profile type exif", b"Raw profile type APP1"}
+PNG_IPTC_TEXT_KEYWORDS = {b"Raw profile type iptc", b"Raw profile type 8bim"}
+PNG_XMP_TEXT_KEYWORDS = {b"XML:com.adobe.xmp", b"Raw profile type xmp"}
+
+
+def _png_chunk(chunk_type, data):
+    crc = zlib.crc32(chunk_type + data) & 0xffffffff
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", crc)
+
+def _read_exact(source, size):
+    data = source.read(size)
+    if len(data) != size:
+        raise ValueError("файл обрывается посреди блока")
+    return data
+
+def _rewrite_itxt_text(data, text_filter):
+    # iTXt: ключ\0 флаг_сжатия метод язык\0 переведенный_ключ\0 текст
+    keyword, rest = data.split(b"\x00", 1)
+    compressed, rest = rest[0], rest[2:]
+    language, rest = rest.split(b"\x00", 1)
+    translated, text = rest.split(b"\x00", 1)
+    if compressed:
+        text = zlib.decompress(text)
+    new_text = text_filter(text)
+    if new_text is None:
+        return None
+    return keyword + b"\x00\x00\x00" + language + b"\x00" + translated + b"\x00" + new_text
+
+def _filter_text_chunk(chunk_type, data, plan, xmp_filter):
+    keyword = data.split(b"\x00", 1)[0]
+    if keyword in PNG_EXIF_TEXT_KEYWORDS:
+        return data if plan.exif_action == "keep" else None
+    if keyword in PNG_IPTC_TEXT_KEYWORDS:
+        return None if plan.remove_iptc else data
+    if keyword in PNG_XMP_TEXT_KEYWORDS:
+        if plan.xmp_action == "strip":
+            return None
+        if plan.xmp_action == "filter" and chunk_type == b"iTXt" and xmp_filter:
+            return _rewrite_itxt_text(data, xmp_filter)
+    return data
+
+def filter_png_chunks(source, target, plan, exif_filter=None, xmp_filter=None):
+    # Копирует PNG по чанкам без перекодирования; решение по каждому чанку берется из плана профиля
+    if source.read(8) != PNG_SIGNATURE:
+        raise ValueError("нет сигнатуры PNG")
+    target.write(PNG_SIGNATURE)
+    removed = []
+    while True:
+        header = _read_exact(source, 8)
+        length, chunk_type = struct.unpack(">I4s", header)
+        type_name = chunk_type.decode("latin-1")
+
+        if not plan.keeps_png_chunk(type_name):
+            source.seek(length + 4, 1)
+            removed.append(type_name)
+            continue
+
+        if chunk_type == b"eXIf" and plan.exif_action == "filter" and exif_filter:
+            new_data = exif_filter(_read_exact(source, length))
+            source.seek(4, 1)
+            if new_data:
+                target.write(_png_chunk(chunk_type, new_data))
+            else:
+                removed.append(type_name)
+            continue
+
+        if chunk_type in (b"tEXt", b"zTXt", b"iTXt"):
+            data = _read_exact(source, length)
+            crc = _read_exact(source, 4)
+            new_data = _filter_text_chunk(chunk_type, data, plan, xmp_filter)
+            if new_data is None:
+                removed.append(type_name)
+            elif new_data is data:
+                target.write(header + data + crc)
+            else:
+                target.write(_png_chunk(chunk_type, new_data))
+            continue
+
+        # Остальные чанки (в том числе IDAT) переносятся байт в байт вместе с CRC
+        target.write(header)
+        remaining = length + 4
+        while remaining:
+            check_cancelled()
+            piece = _read_exact(source, min(remaining, PNG_COPY_CHUNK_SIZE))
+            target.write(piece)
+            remaining -= len(piece)
+        if chunk_type == b"IEND":
+            return removed
+
+
+WEBP_COPY_CHUNK_SIZE = 1024 * 1024
+# Флаги заголовка VP8X, которые говорят, что в файле есть соответствующий чанк
+WEBP_FLAG_ICC, WEBP_FLAG_EXIF, WEBP_FLAG_XMP = 0x20, 0x08, 0x04
+# Чанки, нужные для декодирования кадров; остальные неизвестные чанки удаляются
+WEBP_IMAGE_CHUNKS = {b"VP8X", b"VP8 ", b"VP8L", b"ALPH", b"ANIM", b"ANMF"}
+
+
+def _webp_chunk(chunk_type, data):
+    return chunk_type + struct.pack("<I", len(data)) + data + (b"\x00" if len(data) & 1 else b"")
+
+def filter_webp_chunks(source, target, plan, exif_filter=None, xmp_filter=None):
+    # Переписывает контейнер RIFF без перекодирования: VP8/VP8L и кадры анимации копируются байт в байт.
+    # Размер RIFF и флаги VP8X зависят от того, что осталось, поэтому сначала составляется список чанков
+    header = _read_exact(source, 12)
+    if header[:4] != b"RIFF" or header[8:12] != b"WEBP":
+        raise ValueError("нет заголовка RIFF/WEBP")
+    riff_end = 8 + struct.unpack("<I", header[4:8])[0]
+    parts = []
+    removed = []
+    position = 12
+    while position + 8 <= riff_end:
+        chunk_header = source.read(8)
+        if len(chunk_header) < 8:
+            break
+        chunk_type, length = chunk_header[:4], struct.unpack("<I", chunk_header[4:])[0]
+        padded = length + (length & 1)
+        type_name = chunk_type.decode("latin-1").strip()
+        new_data = None
+        if chunk_type in WEBP_IMAGE_CHUNKS:
+            new_data = _read_exact(source, length) if chunk_type == b"VP8X" else position + 8
+        elif chunk_type == b"ICCP" and plan.keep_icc:
+            new_data = position + 8
+        elif chunk_type == b"EXIF" and plan.exif_action != "strip":
+            new_data = _read_exact(source, length)
+            if plan.exif_action == "filter" and exif_filter:
+                new_data = exif_filter(new_data)
+        elif chunk_type == b"XMP " and plan.xmp_action != "strip":
+            new_data = _read_exact(source, length)
+            if plan.xmp_action == "filter" and xmp_filter:
+                new_data = xmp_filter(new_data)
+        # Для чанков, которые копируются как есть, в списке лежит их смещение в исходнике
+        if not new_data:
+            removed.append(type_name)
+        else:
+            parts.append((chunk_type, length, new_data))
+        position += 8 + padded
+        source.seek(position)
+    if not any(chunk_type in (b"VP8 ", b"VP8L", b"ANMF") for chunk_type, _, _ in parts):
+        raise ValueError("в WebP нет данных изображения")
+
+    kept = {chunk_type for chunk_type, _, _ in parts}
+    sizes = []
+    for index, (chunk_type, length, data) in enumerate(parts):
+        if chunk_type == b"VP8X":
+            flags = data[0]
+            for flag, flag_chunk in ((WEBP_FLAG_ICC, b"ICCP"), (WEBP_FLAG_EXIF, b"EXIF"), (WEBP_FLAG_XMP, b"XMP ")):
+                if flag_chunk not in kept:
+                    flags &= ~flag
+            data = bytes((flags,)) + data[1:]
+            parts[index] = (chunk_type, length, data)
+        size = length if isinstance(data, int) else len(data)
+        sizes.append(8 + size + (size & 1))
+    target.write(b"RIFF" + struct.pack("<I", 4 + sum(sizes)) + b"WEBP")
+    for chunk_type, length, data in parts:
+        if not isinstance(data, int):
+            target.write(_webp_chunk(chunk_type, data))
+            continue
+        target.write(chunk_type + struct.pack("<I", length))
+        source.seek(data)
+        remaining = length + (length & 1)
+        while remaining:
+            check_cancelled()
+            piece = _read_exact(source, min(remaining, WEBP_COPY_CHUNK_SIZE))
+            target.write(piece)
+            remaining -= len(piece)
+    return removed
+
+
+# Размеры типов значений TIFF в байтах (BYTE, ASCII, SHORT, LONG, RATIONAL, ..., IFD)
+TIFF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8, 13: 4}
+TIFF_TYPE_LONG = 4
+TIFF_TAG_EXIF_IFD = 34665
+TIFF_TAG_GPS_IFD = 34853
+TIFF_TAG_INTEROP_IFD = 40965
+TIFF_TAG_MAKERNOTE = 37500
+# Теги со смещениями внутрь файла: при пересборке блока EXIF они бы указывали в никуда
+TIFF_OFFSET_TAGS = {273, 279, 288, 289, 324, 325, 330, 513, 514, TIFF_TAG_EXIF_IFD, TIFF_TAG_GPS_IFD, TIFF_TAG_INTEROP_IFD}
+MAX_IFD_ENTRIES = 4096
+
+
+def _tiff_endian(data):
+    if len(data) < 8 or data[:2] not in (b"II", b"MM"):
+        raise ValueError("нет заголовка TIFF")
+    endian = "<" if data[:2] == b"II" else ">"
+    if struct.unpack_from(endian + "H", data, 2)[0] != 42:
+        raise ValueError("неверная сигнатура TIFF")
+    return endian
+
+def _read_ifd(data, offset, endian):
+    # Возвращает записи IFD как (тег, тип, количество, сырые байты значения) и смещение следующего IFD
+    if offset < 8 or offset + 2 > len(data):
+        raise ValueError(f"IFD за пределами блока (смещение {offset})")
+    count = struct.unpack_from(endian + "H", data, offset)[0]
+    if count > MAX_IFD_ENTRIES or offset + 2 + count * 12 > len(data):
+        raise ValueError("IFD обрезан")
+    entries = []
+    for index in range(count):
+        tag, value_type, value_count, value_field = struct.unpack_from(endian + "HHI4s", data, offset + 2 + index * 12)
+        type_size = TIFF_TYPE_SIZES.get(value_type)
+        if type_size is None:
+            continue
+        total_size = type_size * value_count
+        if total_size <= 4:
+            raw = value_field[:total_size]
+        else:
+            value_offset = struct.unpack(endian + "I", value_field)[0]
+            if value_offset + total_size > len(data):
+                # Битая запись: переносить нечего, просто пропускаем ее
+                continue
+            raw = bytes(data[value_offset:value_offset + total_size])
+        entries.append((tag, value_type, value_count, raw))
+    next_position = offset + 2 + count * 12
+    next_offset = struct.unpack_from(endian + "I", data, next_position)[0] if next_position + 4 <= len(data) else 0
+    return entries, next_offset
+
+def _pointer_value(entries, tag, endian):
+    for entry_tag, value_type, value_count, raw in entries:
+        if entry_tag == tag and value_type in (TIFF_TYPE_LONG, 13) and len(raw) == 4:
+            return struct.unpack(endian + "I", raw)[0]
+    return None
+
+def parse_exif_tiff(data):
+    # Разбирает блок EXIF (TIFF-структуру) на IFD0, Exif, GPS, Interop и IFD1 с миниатюрой
+    endian = _tiff_endian(data)
+    ifd0, ifd1_offset = _read_ifd(data, struct.unpack_from(endian + "I", data, 4)[0], endian)
+    parsed = {"endian": endian, "ifd0": ifd0, "exif": None, "gps": None, "interop": None, "ifd1": None, "thumbnail": None}
+
+    exif_offset = _pointer_value(ifd0, TIFF_TAG_EXIF_IFD, endian)
+    if exif_offset:
+        parsed["exif"], _ = _read_ifd(data, exif_offset, endian)
+        interop_offset = _pointer_value(parsed["exif"], TIFF_TAG_INTEROP_IFD, endian)
+        if interop_offset:
+            try:
+                parsed["interop"], _ = _read_ifd(data, interop_offset, endian)
+            except ValueError:
+                parsed["interop"] = None
+    gps_offset = _pointer_value(ifd0, TIFF_TAG_GPS_IFD, endian)
+    if gps_offset:
+        parsed["gps"], _ = _read_ifd(data, gps_offset, endian)
+    if ifd1_offset:
+        try:
+            parsed["ifd1"], _ = _read_ifd(data, ifd1_offset, endian)
+        except ValueError:
+            parsed["ifd1"] = None
+        if parsed["ifd1"]:
+            thumbnail_offset = _pointer_value(parsed["ifd1"], 513, endian)
+            thumbnail_length = _pointer_value(parsed["ifd1"], 514, endian)
+            if thumbnail_offset and thumbnail_length and thumbnail_offset + thumbnail_length <= len(data):
+                parsed["thumbnail"] = bytes(data[thumbnail_offset:thumbnail_offset + thumbnail_length])
+    return parsed
+
+
+class _TiffBuilder:
+    # Пишет IFD снизу вверх: сначала вложенные, затем IFD0, поэтому смещения известны сразу
+    def __init__(self, endian):
+        self.endian = endian
+        self.data = bytearray((b"II" if endian == "<" else b"MM") + struct.pack(endian + "HI", 42, 0))
+
+    def _align(self):
+        if len(self.data) % 2:
+            self.data.append(0)
+
+    def add_blob(self, blob):
+        self._align()
+        offset = len(self.data)
+        self.data += blob
+        return offset
+
+    def add_ifd(self, entries, pointers=None, next_offset=0):
+        entries = list(entries) + [(tag, TIFF_TYPE_LONG, 1, struct.pack(self.endian + "I", offset))
+                                   for tag, offset in (pointers or {}).items()]
+        entries.sort(key=lambda entry: entry[0])
+        self._align()
+        ifd_offset = len(self.data)
+        self.data += b"\x00" * (2 + 12 * len(entries) + 4)
+        struct.pack_into(self.endian + "H", self.data, ifd_offset, len(entries))
+        for index, (tag, value_type, value_count, raw) in enumerate(entries):
+            position = ifd_offset + 2 + index * 12
+            if len(raw) <= 4:
+                value_field = raw.ljust(4, b"\x00")
+            else:
+                value_field = struct.pack(self.endian + "I", self.add_blob(raw))
+            struct.pack_into(self.endian + "HHI4s", self.data, position, tag, value_type, value_count, value_field)
+        struct.pack_into(self.endian + "I", self.data, ifd_offset + 2 + 12 * len(entries), next_offset)
+        return ifd_offset
+
+    def finish(self, ifd0_offset):
+        struct.pack_into(self.endian + "I", self.data, 4, ifd0_offset)
+        return bytes(self.data)
+
+def build_exif_tiff(parsed):
+    builder = _TiffBuilder(parsed["endian"])
+    exif_pointers = {}
+    if parsed.get("interop"):
+        exif_pointers[TIFF_TAG_INTEROP_IFD] = builder.add_ifd(parsed["interop"])
+    ifd0_pointers = {}
+    if parsed.get("exif") or exif_pointers:
+        ifd0_pointers[TIFF_TAG_EXIF_IFD] = builder.add_ifd(parsed.get("exif") or [], exif_pointers)
+    if parsed.get("gps"):
+        ifd0_pointers[TIFF_TAG_GPS_IFD] = builder.add_ifd(parsed["gps"])
+    ifd1_offset = 0
+    if parsed.get("ifd1") and parsed.get("thumbnail"):
+        thumbnail_offset = builder.add_blob(parsed["thumbnail"])
+        ifd1_pointers = {513: thumbnail_offset}
+        ifd1_entries = [entry for entry in parsed["ifd1"] if entry[0] not in TIFF_OFFSET_TAGS]
+        ifd1_entries.append((514, TIFF_TYPE_LONG, 1, struct.pack(parsed["endian"] + "I", len(parsed["thumbnail"]))))
+        ifd1_offset = builder.add_ifd(ifd1_entries, ifd1_pointers)
+    return builder.finish(builder.add_ifd(parsed["ifd0"], ifd0_pointers, next_offset=ifd1_offset))
+
+def filter_exif_tiff(data, plan):
+    # Оставляет в блоке EXIF только разрешенные планом теги; GPS и Interop переносятся целиком или удаляются.
+    # Возвращает пустые байты, если от EXIF ничего не осталось
+    parsed = parse_exif_tiff(data)
+
+    def _keep(entries):
+        return [entry for entry in entries or [] if entry[0] not in TIFF_OFFSET_TAGS and plan.keeps_exif_tag(entry[0])]
+
+    filtered = {
+        "endian": parsed["endian"],
+        "ifd0": _keep(parsed["ifd0"]),
+        "exif": _keep(parsed["exif"]),
+        "gps": parsed["gps"] if plan.keeps_exif_tag(TIFF_TAG_GPS_IFD) else None,
+        "interop": parsed["interop"] if plan.keeps_exif_tag(TIFF_TAG_INTEROP_IFD) else None,
+        # Миниатюра - уменьшенная копия исходного кадра, она остается только по явному запрету в профиле
+        "ifd1": None if plan.remove_thumbnail else parsed["ifd1"],
+        "thumbnail": None if plan.remove_thumbnail else parsed["thumbnail"],
+    }
+    if not (filtered["ifd0"] or filtered["exif"] or filtered["gps"] or filtered["interop"]):
+        return b""
+    return build_exif_tiff(filtered)
+
+
+JPEG_EXIF_HEADER = b"Exif\x00\x00"
+JPEG_XMP_HEADER = b"http://ns.adobe.com/xap/1.0/\x00"
+JPEG_XMP_EXTENSION_HEADER = b"http://ns.adobe.com/xmp/extension/\x00"
+JPEG_ICC_HEADER = b"ICC_PROFILE\x00"
+JPEG_PHOTOSHOP_HEADER = b"Photoshop 3.0\x00"
+MAX_JPEG_SEGMENT_PAYLOAD = 65533
+MARKER_SOI, MARKER_EOI, MARKER_SOS, MARKER_COM = 0xD8, 0xD9, 0xDA, 0xFE
+MARKER_APP0, MARKER_APP1, MARKER_APP2, MARKER_APP13, MARKER_APP14 = 0xE0, 0xE1, 0xE2, 0xED, 0xEE
+
+
+def _jpeg_segment(marker, payload):
+    if len(payload) > MAX_JPEG_SEGMENT_PAYLOAD:
+        raise ValueError("сегмент JPEG больше 64 КБ")
+    return bytes((0xFF, marker)) + struct.pack(">H", len(payload) + 2) + payload
+
+def _jpeg_segment_decision(marker, payload, plan, exif_filter, xmp_filter):
+    # Возвращает новый payload сегмента или None, если сегмент удаляется.
+    # Неизвестные APPn (Ducky, FPXR, MPF, JFXX-миниатюры и т.п.) удаляются, как раньше при пересохранении Pillow
+    if marker == MARKER_APP0:
+        return payload if payload.startswith(b"JFIF\x00") else None
+    if marker == MARKER_APP1:
+        if payload.startswith(JPEG_EXIF_HEADER):
+            if plan.exif_action == "keep":
+                return payload
+            if plan.exif_action == "strip":
+                return None
+            filtered = exif_filter(payload[len(JPEG_EXIF_HEADER):])
+            return JPEG_EXIF_HEADER + filtered if filtered else None
+        if payload.startswith(JPEG_XMP_HEADER):
+            if plan.xmp_action == "keep":
+                return payload
+            if plan.xmp_action == "strip":
+                return None
+            filtered = xmp_filter(payload[len(JPEG_XMP_HEADER):])
+            return JPEG_XMP_HEADER + filtered if filtered else None
+        if payload.startswith(JPEG_XMP_EXTENSION_HEADER):
+            return None if plan.xmp_action == "strip" else payload
+        return None
+    if marker == MARKER_APP2:
+        if payload.startswith(JPEG_ICC_HEADER):
+            return payload if plan.keep_icc else None
+        return None
+    if marker == MARKER_APP13:
+        return None if plan.remove_iptc or not payload.startswith(JPEG_PHOTOSHOP_HEADER) else payload
+    if marker == MARKER_APP14:
+        # Adobe APP14 задает цветовое преобразование (CMYK/YCCK) - без него цвета изменятся
+        return payload if payload.startswith(b"Adobe") else None
+    if 0xE3 <= marker <= 0xEF:
+        return None
+    if marker == MARKER_COM:
+        return None if plan.remove_comments else payload
+    return payload
+
+def _find_jpeg_end(data, position):
+    # Проходит энтропийные данные и сегменты между сканами до EOI; данные после EOI отбрасываются
+    length = len(data)
+    while True:
+        position = data.find(b"\xff", position)
+        if position < 0 or position + 1 >= length:
+            return length
+        marker = data[position + 1]
+        if marker == 0x00 or marker == 0xFF or 0xD0 <= marker <= 0xD7:
+            position += 1
+            continue
+        if marker == MARKER_EOI:
+            return position + 2
+        if position + 4 > length:
+            return length
+        position += 2 + struct.unpack_from(">H", data, position + 2)[0]
+
+def rewrite_jpeg_segments(source, target, plan, exif_filter, xmp_filter):
+    # Переписывает заголовочные сегменты JPEG по плану, сжатые данные копируются как есть
+    if source.read(2) != b"\xff\xd8":
+        raise ValueError("нет маркера SOI")
+    target.write(b"\xff\xd8")
+    removed = []
+    while True:
+        prefix = source.read(1)
+        if not prefix:
+            raise ValueError("JPEG обрывается до начала изображения")
+        if prefix != b"\xff":
+            raise ValueError("нарушена структура сегментов JPEG")
+        marker = source.read(1)
+        while marker == b"\xff":
+            marker = source.read(1)
+        if not marker:
+            raise ValueError("JPEG обрывается до начала изображения")
+        marker = marker[0]
+        if marker == MARKER_EOI:
+            target.write(b"\xff\xd9")
+            return removed
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            target.write(bytes((0xFF, marker)))
+            continue
+        length = struct.unpack(">H", _read_exact(source, 2))[0]
+        if length < 2:
+            raise ValueError("неверная длина сегмента JPEG")
+        payload = _read_exact(source, length - 2)
+
+        if marker == MARKER_SOS:
+            rest = source.read()
+            target.write(_jpeg_segment(marker, payload))
+            end = _find_jpeg_end(rest, 0)
+            target.write(rest[:end])
+            if end < len(rest):
+                removed.append("trailer")
+            return removed
+
+        new_payload = _jpeg_segment_decision(marker, payload, plan, exif_filter, xmp_filter)
+        if new_payload is None:
+            removed.append(f"APP{marker - 0xE0}" if 0xE0 <= marker <= 0xEF else f"0x{marker:02X}")
+        elif new_payload is payload:
+            target.write(bytes((0xFF, marker)) + struct.pack(">H", length) + payload)
+        else:
+            target.write(_jpeg_segment(marker, new_payload))
+
+
+# Описательные теги IFD страницы TIFF; остальные теги страницы описывают само изображение и не трогаются
+TIFF_DESCRIPTIVE_TAGS = {269, 270, 271, 272, 285, 305, 306, 315, 316, 18246, 18249, 33432,
+                         40091, 40092, 40093, 40094, 40095, 50341}
+TIFF_TAG_XMP = 700
+TIFF_IPTC_TAGS = {33723, 34377}
+TIFF_TAG_ICC = 34675
+TIFF_TAG_NEW_SUBFILE_TYPE = 254
+MAX_TIFF_PAGES = 1024
+ZERO_FILL_CHUNK_SIZE = 1024 * 1024
+
+
+class _TiffPatcher:
+    # Чтение идет из исходника, правки пишутся поверх уже скопированного результата
+    def __init__(self, source, target, endian):
+        self.source = source
+        self.target = target
+        self.endian = endian
+        self.end = target.seek(0, 2)
+
+    def read_at(self, offset, size):
+        self.source.seek(offset)
+        return _read_exact(self.source, size)
+
+    def write_at(self, offset, data):
+        self.target.seek(offset)
+        self.target.write(data)
+
+    def zero(self, offset, size):
+        while size > 0:
+            piece = min(size, ZERO_FILL_CHUNK_SIZE)
+            self.write_at(offset, b"\x00" * piece)
+            offset += piece
+            size -= piece
+
+    def append(self, data):
+        if self.end % 2:
+            self.write_at(self.end, b"\x00")
+            self.end += 1
+        offset = self.end
+        self.write_at(offset, data)
+        self.end += len(data)
+        return offset
+
+    def read_ifd(self, offset):
+        # Записи как (тег, тип, количество, поле значения, смещение данных или None, размер данных)
+        count = struct.unpack(self.endian + "H", self.read_at(offset, 2))[0]
+        if count > MAX_IFD_ENTRIES:
+            raise ValueError("IFD слишком большой")
+        raw = self.read_at(offset + 2, count * 12 + 4)
+        entries = []
+        for index in range(count):
+            tag, value_type, value_count, value_field = struct.unpack_from(self.endian + "HHI4s", raw, index * 12)
+            total_size = TIFF_TYPE_SIZES.get(value_type, 0) * value_count
+            data_offset = struct.unpack(self.endian + "I", value_field)[0] if total_size > 4 else None
+            entries.append((tag, value_type, value_count, value_field, data_offset, total_size))
+        return entries, struct.unpack_from(self.endian + "I", raw, count * 12)[0]
+
+    def rewrite_ifd(self, offset, entries, original_count, next_offset):
+        # IFD переписывается на своем месте: он только уменьшается, освободившиеся байты обнуляются
+        data = bytearray(struct.pack(self.endian + "H", len(entries)))
+        for tag, value_type, value_count, value_field, _, _ in entries:
+            data += struct.pack(self.endian + "HHI4s", tag, value_type, value_count, value_field)
+        data += struct.pack(self.endian + "I", next_offset)
+        data += b"\x00" * ((original_count - len(entries)) * 12)
+        self.write_at(offset, bytes(data))
+        return offset + 2 + len(entries) * 12
+
+    def values(self, entry):
+        tag, value_type, value_count, value_field, data_offset, total_size = entry
+        raw = value_field[:total_size] if data_offset is None else self.read_at(data_offset, total_size)
+        code = {3: "H", 4: "I", 13: "I"}.get(value_type)
+        if code is None:
+            raise ValueError(f"неожиданный тип {value_type} у тега {tag}")
+        return struct.unpack(f"{self.endian}{value_count}{code}", raw)
+
+    def drop_value(self, entry):
+        if entry[4] is not None:
+            self.zero(entry[4], entry[5])
+
+    def drop_ifd(self, offset, depth=0):
+        entries, _ = self.read_ifd(offset)
+        for entry in entries:
+            if entry[0] in (TIFF_TAG_EXIF_IFD, TIFF_TAG_GPS_IFD, TIFF_TAG_INTEROP_IFD) and depth < 2:
+                self.drop_ifd(self.values(entry)[0], depth + 1)
+            else:
+                self.drop_value(entry)
+        self.zero(offset, 2 + len(entries) * 12 + 4)
+
+
+def _tiff_entry_value(patcher, entries, tag):
+    for entry in entries:
+        if entry[0] == tag:
+            values = patcher.values(entry)
+            return values[0] if values else None
+    return None
+
+def _scrub_tiff_exif_ifd(patcher, offset, plan, removed):
+    entries, next_offset = patcher.read_ifd(offset)
+    kept = []
+    for entry in entries:
+        tag = entry[0]
+        if tag == TIFF_TAG_INTEROP_IFD and not plan.keeps_exif_tag(tag):
+            patcher.drop_ifd(patcher.values(entry)[0])
+        elif tag == TIFF_TAG_INTEROP_IFD or plan.keeps_exif_tag(tag):
+            kept.append(entry)
+            continue
+        else:
+            patcher.drop_value(entry)
+        removed.append("MakerNote" if tag == TIFF_TAG_MAKERNOTE else f"EXIF:{tag}")
+    if len(kept) != len(entries):
+        patcher.rewrite_ifd(offset, kept, len(entries), next_offset)
+    return kept
+
+def _scrub_tiff_page(patcher, offset, plan, xmp_filter, removed):
+    entries, next_offset = patcher.read_ifd(offset)
+    kept = []
+    for entry in entries:
+        tag, value_type = entry[0], entry[1]
+        keep = True
+        if tag == TIFF_TAG_EXIF_IFD:
+            exif_offset = patcher.values(entry)[0]
+            if plan.exif_action == "strip":
+                patcher.drop_ifd(exif_offset)
+                keep = False
+            elif not _scrub_tiff_exif_ifd(patcher, exif_offset, plan, removed):
+                patcher.drop_ifd(exif_offset)
+                keep = False
+        elif tag == TIFF_TAG_GPS_IFD:
+            if not plan.keeps_exif_tag(tag):
+                patcher.drop_ifd(patcher.values(entry)[0])
+                keep = False
+        elif tag in TIFF_DESCRIPTIVE_TAGS:
+            keep = plan.keeps_exif_tag(tag)
+        elif tag == TIFF_TAG_XMP and plan.xmp_action != "keep":
+            keep = False
+            if plan.xmp_action == "filter" and xmp_filter and entry[4] is not None:
+                original = patcher.read_at(entry[4], entry[5])
+                filtered = xmp_filter(original)
+                if filtered == original:
+                    kept.append(entry)
+                    continue
+                if filtered:
+                    # Отфильтрованный пакет дописывается в конец файла, старый обнуляется
+                    patcher.drop_value(entry)
+                    new_offset = patcher.append(filtered)
+                    kept.append((tag, value_type, len(filtered), struct.pack(patcher.endian + "I", new_offset), new_offset, len(filtered)))
+                    continue
+        elif tag in TIFF_IPTC_TAGS:
+            keep = not plan.remove_iptc
+        elif tag == TIFF_TAG_ICC:
+            keep = plan.keep_icc
+        if keep:
+            kept.append(entry)
+        else:
+            if tag not in (TIFF_TAG_EXIF_IFD, TIFF_TAG_GPS_IFD):
+                patcher.drop_value(entry)
+            removed.append(f"TIFF:{tag}")
+    next_position = offset + 2 + len(entries) * 12
+    if len(kept) != len(entries) or any(entry is not original for entry, original in zip(kept, entries)):
+        next_position = patcher.rewrite_ifd(offset, kept, len(entries), next_offset)
+    return next_offset, next_position
+
+def _drop_tiff_image_data(patcher, entries):
+    for offsets_tag, counts_tag in ((273, 279), (324, 325)):
+        offsets = next((patcher.values(entry) for entry in entries if entry[0] == offsets_tag), ())
+        counts = next((patcher.values(entry) for entry in entries if entry[0] == counts_tag), ())
+        for data_offset, data_size in zip(offsets, counts):
+            patcher.zero(data_offset, data_size)
+
+def scrub_tiff(source, target, plan, xmp_filter=None):
+    # TIFF правится на месте: записи удаляются из IFD, их данные и миниатюры обнуляются,
+    # сжатые полосы и плитки изображения не читаются и не перекодируются
+    source.seek(0)
+    endian = _tiff_endian(source.read(8))
+    source.seek(0)
+    shutil.copyfileobj(source, target, PNG_COPY_CHUNK_SIZE)
+    patcher = _TiffPatcher(source, target, endian)
+    removed = []
+
+    offset = struct.unpack(endian + "I", patcher.read_at(4, 4))[0]
+    pointer_position = 4
+    seen = set()
+    while offset and offset not in seen and len(seen) < MAX_TIFF_PAGES:
+        seen.add(offset)
+        entries, next_offset = patcher.read_ifd(offset)
+        subfile_type = _tiff_entry_value(patcher, entries, TIFF_TAG_NEW_SUBFILE_TYPE) or 0
+        if pointer_position != 4 and plan.remove_thumbnail and subfile_type & 1:
+            # Уменьшенная копия страницы: исключаем из цепочки IFD и стираем ее пиксели
+            _drop_tiff_image_data(patcher, entries)
+            patcher.drop_ifd(offset)
+            patcher.write_at(pointer_position, struct.pack(endian + "I", next_offset))
+            removed.append("thumbnail")
+        else:
+            next_offset, pointer_position = _scrub_tiff_page(patcher, offset, plan, xmp_filter, removed)
+        offset = next_offset
+    return removed
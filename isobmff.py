@@ -0,0 +1,647 @@
+# StealthShare v0.1 pre1
+# Copyright (c) 2025 IQUXAe
+# Released under the MIT License. See LICENSE file for details.
+
+import struct
+
+from cancellation import check_cancelled
+
+COPY_CHUNK_SIZE = 1024 * 1024
+# meta и элементы метаданных читаются в память целиком - больше этого в нормальных файлах не бывает
+MAX_META_BOX_SIZE = 16 * 1024 * 1024
+MAX_METADATA_ITEM_SIZE = 16 * 1024 * 1024
+XMP_CONTENT_TYPES = {b"application/rdf+xml"}
+# uuid-бокс, в который некоторые программы кладут XMP вне meta
+XMP_UUID = bytes.fromhex("be7acfcb97a942e89c71999491e3afac")
+JXL_CODESTREAM_SIGNATURE = b"\xff\x0a"
+JXL_CONTAINER_SIGNATURE = b"\x00\x00\x00\x0cJXL \x0d\x0a\x87\x0a"
+
+
+def _read_exact(source, size):
+    data = source.read(size)
+    if len(data) != size:
+        raise ValueError("файл обрывается посреди бокса")
+    return data
+
+def _box(box_type, payload):
+    return struct.pack(">I4s", len(payload) + 8, box_type) + payload
+
+def _read_uint(data, position, size):
+    if size == 0:
+        return 0, position
+    if size not in (2, 4, 8):
+        raise ValueError(f"неподдерживаемая ширина поля: {size}")
+    return int.from_bytes(data[position:position + size], "big"), position + size
+
+def _write_uint(value, size):
+    if size == 0:
+        if value:
+            raise ValueError("значение не помещается в поле нулевой ширины")
+        return b""
+    if value < 0 or value >= 1 << (8 * size):
+        raise ValueError("смещение не помещается в поле iloc")
+    return value.to_bytes(size, "big")
+
+def _iter_boxes(data, start, end):
+    # (тип, начало бокса, начало содержимого, конец бокса) для боксов внутри буфера
+    position = start
+    while position + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, position)
+        payload_start = position + 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, position + 8)[0]
+            payload_start += 8
+        elif size == 0:
+            size = end - position
+        if size < payload_start - position or position + size > end:
+            raise ValueError(f"неверный размер бокса '{box_type.decode('latin-1')}'")
+        yield box_type, position, payload_start, position + size
+        position += size
+
+def _iter_file_boxes(source):
+    # Заголовки боксов верхнего уровня: (тип, начало, начало содержимого, конец, ширина поля размера)
+    file_size = source.seek(0, 2)
+    position = 0
+    while position < file_size:
+        source.seek(position)
+        header = _read_exact(source, 8)
+        size, box_type = struct.unpack(">I4s", header)
+        payload_start = position + 8
+        size_field = 4
+        if size == 1:
+            size = struct.unpack(">Q", _read_exact(source, 8))[0]
+            payload_start += 8
+            size_field = 8
+        elif size == 0:
+            size = file_size - position
+            size_field = 0
+        if size < payload_start - position or position + size > file_size:
+            raise ValueError(f"неверный размер бокса '{box_type.decode('latin-1')}'")
+        yield box_type, position, payload_start, position + size, size_field
+        position += size
+
+def _box_header(box_type, size, size_field):
+    if size_field == 8:
+        return struct.pack(">I4sQ", 1, box_type, size)
+    return struct.pack(">I4s", 0 if size_field == 0 else size, box_type)
+
+def _copy_range(source, target, start, end):
+    source.seek(start)
+    remaining = end - start
+    while remaining:
+        check_cancelled()
+        piece = _read_exact(source, min(remaining, COPY_CHUNK_SIZE))
+        target.write(piece)
+        remaining -= len(piece)
+
+
+def _parse_infe(data, start, end):
+    version = data[start]
+    position = start + 4
+    content_type = b""
+    if version >= 2:
+        if version == 2:
+            item_id = struct.unpack_from(">H", data, position)[0]
+            position += 2
+        else:
+            item_id = struct.unpack_from(">I", data, position)[0]
+            position += 4
+        item_type = data[position + 2:position + 6]
+        position += 6
+        name_end = data.index(b"\x00", position, end)
+        if item_type == b"mime":
+            content_end = data.find(b"\x00", name_end + 1, end)
+            content_type = data[name_end + 1:content_end if content_end >= 0 else end]
+    else:
+        item_id = struct.unpack_from(">H", data, position)[0]
+        item_type = b""
+        name_end = data.index(b"\x00", position + 4, end)
+        content_end = data.find(b"\x00", name_end + 1, end)
+        content_type = data[name_end + 1:content_end if content_end >= 0 else end]
+    return item_id, item_type, content_type
+
+def _parse_iinf(data, payload_start, end):
+    version = data[payload_start]
+    position = payload_start + 4 + (2 if version == 0 else 4)
+    items = []
+    for box_type, box_start, infe_start, box_end in _iter_boxes(data, position, end):
+        if box_type == b"infe":
+            items.append((_parse_infe(data, infe_start, box_end), data[box_start:box_end]))
+    return version, items
+
+def _build_iinf(version, flags, items):
+    count = struct.pack(">H" if version == 0 else ">I", len(items))
+    return _box(b"iinf", bytes([version]) + flags + count + b"".join(raw for _, raw in items))
+
+def _parse_iloc(data, payload_start, end):
+    version = data[payload_start]
+    offset_size, length_size = data[payload_start + 4] >> 4, data[payload_start + 4] & 15
+    base_offset_size = data[payload_start + 5] >> 4
+    index_size = data[payload_start + 5] & 15 if version in (1, 2) else 0
+    position = payload_start + 6
+    if version < 2:
+        item_count = struct.unpack_from(">H", data, position)[0]
+        position += 2
+    else:
+        item_count = struct.unpack_from(">I", data, position)[0]
+        position += 4
+    items = []
+    for _ in range(item_count):
+        item_id, position = _read_uint(data, position, 2 if version < 2 else 4)
+        construction_method = 0
+        if version in (1, 2):
+            construction_method = struct.unpack_from(">H", data, position)[0] & 15
+            position += 2
+        data_reference_index = struct.unpack_from(">H", data, position)[0]
+        base_offset, position = _read_uint(data, position + 2, base_offset_size)
+        extent_count = struct.unpack_from(">H", data, position)[0]
+        position += 2
+        extents = []
+        for _ in range(extent_count):
+            extent_index, position = _read_uint(data, position, index_size)
+            extent_offset, position = _read_uint(data, position, offset_size)
+            extent_length, position = _read_uint(data, position, length_size)
+            extents.append([extent_index, extent_offset, extent_length])
+        if position > end:
+            raise ValueError("iloc обрезан")
+        items.append({
+            "id": item_id, "method": construction_method, "data_ref": data_reference_index,
+            "base": base_offset, "extents": extents,
+        })
+    header = {
+        "version": version, "flags": data[payload_start + 1:payload_start + 4],
+        "offset_size": offset_size, "length_size": length_size,
+        "base_offset_size": base_offset_size, "index_size": index_size,
+    }
+    return header, items
+
+def _build_iloc(header, items):
+    version = header["version"]
+    payload = bytearray([version]) + header["flags"]
+    payload.append(header["offset_size"] << 4 | header["length_size"])
+    payload.append(header["base_offset_size"] << 4 | header["index_size"])
+    payload += struct.pack(">H" if version < 2 else ">I", len(items))
+    for item in items:
+        payload += _write_uint(item["id"], 2 if version < 2 else 4)
+        if version in (1, 2):
+            payload += struct.pack(">H", item["method"])
+        payload += struct.pack(">H", item["data_ref"])
+        payload += _write_uint(item["base"], header["base_offset_size"])
+        payload += struct.pack(">H", len(item["extents"]))
+        for extent_index, extent_offset, extent_length in item["extents"]:
+            payload += _write_uint(extent_index, header["index_size"])
+            payload += _write_uint(extent_offset, header["offset_size"])
+            payload += _write_uint(extent_length, header["length_size"])
+    return _box(b"iloc", bytes(payload))
+
+def _filter_iref(data, payload_start, end, removed_ids):
+    # Ссылки от удаленных элементов (cdsc: Exif -> изображение) убираются, на удаленные - вычеркиваются
+    version = data[payload_start]
+    id_format = ">H" if version == 0 else ">I"
+    id_size = struct.calcsize(id_format)
+    references = []
+    for box_type, box_start, position, box_end in _iter_boxes(data, payload_start + 4, end):
+        from_id = struct.unpack_from(id_format, data, position)[0]
+        count = struct.unpack_from(">H", data, position + id_size)[0]
+        to_ids = [struct.unpack_from(id_format, data, position + id_size + 2 + index * id_size)[0] for index in range(count)]
+        to_ids = [item_id for item_id in to_ids if item_id not in removed_ids]
+        if from_id in removed_ids or not to_ids:
+            continue
+        references.append(_box(box_type, struct.pack(id_format, from_id) + struct.pack(">H", len(to_ids))
+                               + b"".join(struct.pack(id_format, item_id) for item_id in to_ids)))
+    return _box(b"iref", data[payload_start:payload_start + 4] + b"".join(references))
+
+def _filter_ipma(data, payload_start, end, removed_ids):
+    version, flags = data[payload_start], data[payload_start + 1:payload_start + 4]
+    id_size = 2 if version < 1 else 4
+    association_size = 2 if flags[2] & 1 else 1
+    position = payload_start + 8
+    entries = []
+    for _ in range(struct.unpack_from(">I", data, payload_start + 4)[0]):
+        item_id, _ = _read_uint(data, position, id_size)
+        entry_end = position + id_size + 1 + data[position + id_size] * association_size
+        if entry_end > end:
+            raise ValueError("ipma обрезан")
+        if item_id not in removed_ids:
+            entries.append(data[position:entry_end])
+        position = entry_end
+    return _box(b"ipma", data[payload_start:payload_start + 4] + struct.pack(">I", len(entries)) + b"".join(entries))
+
+def _filter_iprp(data, payload_start, end, removed_ids):
+    children = []
+    for box_type, box_start, child_start, box_end in _iter_boxes(data, payload_start, end):
+        if box_type == b"ipma":
+            children.append(_filter_ipma(data, child_start, box_end, removed_ids))
+        else:
+            children.append(data[box_start:box_end])
+    return _box(b"iprp", b"".join(children))
+
+def _rebuild_meta(meta, removed_ids, iloc_items):
+    children = []
+    for box_type, box_start, payload_start, box_end in _iter_boxes(meta, 12, len(meta)):
+        if box_type == b"iinf":
+            version, items = _parse_iinf(meta, payload_start, box_end)
+            children.append(_build_iinf(version, meta[payload_start + 1:payload_start + 4],
+                                        [item for item in items if item[0][0] not in removed_ids]))
+        elif box_type == b"iloc":
+            header, _ = _parse_iloc(meta, payload_start, box_end)
+            children.append(_build_iloc(header, iloc_items))
+        elif box_type == b"iref":
+            children.append(_filter_iref(meta, payload_start, box_end, removed_ids))
+        elif box_type == b"iprp":
+            children.append(_filter_iprp(meta, payload_start, box_end, removed_ids))
+        else:
+            children.append(meta[box_start:box_end])
+    return _box(b"meta", meta[8:12] + b"".join(children))
+
+
+def _metadata_item_kind(item_type, content_type):
+    if item_type == b"Exif":
+        return "exif"
+    if content_type.rstrip(b"\x00") in XMP_CONTENT_TYPES:
+        return "xmp"
+    return None
+
+def _item_extents(item, idat_start):
+    # Абсолютные (смещение, длина) экстентов элемента в файле; метод 1 - внутри idat
+    base = idat_start if item["method"] == 1 else 0
+    return [(base + item["base"] + extent_offset, extent_length) for _, extent_offset, extent_length in item["extents"]]
+
+def _read_item(source, extents):
+    total = sum(length for _, length in extents)
+    if total > MAX_METADATA_ITEM_SIZE:
+        raise ValueError("элемент метаданных слишком большой")
+    data = b""
+    for offset, length in extents:
+        source.seek(offset)
+        data += _read_exact(source, length)
+    return data
+
+def _load_heif_meta(source):
+    boxes = list(_iter_file_boxes(source))
+    if not boxes or boxes[0][0] != b"ftyp":
+        raise ValueError("нет бокса ftyp")
+    meta_box = next((box for box in boxes if box[0] == b"meta"), None)
+    if meta_box is None:
+        return boxes, None, None, [], {}
+    _, meta_start, _, meta_end, _ = meta_box
+    if meta_end - meta_start > MAX_META_BOX_SIZE:
+        raise ValueError("бокс meta слишком большой")
+    source.seek(meta_start)
+    meta = _read_exact(source, meta_end - meta_start)
+    if meta[:4] == b"\x00\x00\x00\x01":
+        raise ValueError("64-битный размер meta не поддерживается")
+    item_kinds = {}
+    iloc_header, iloc_items, idat_start = None, [], None
+    for box_type, box_start, payload_start, box_end in _iter_boxes(meta, 12, len(meta)):
+        if box_type == b"iinf":
+            for (item_id, item_type, content_type), _ in _parse_iinf(meta, payload_start, box_end)[1]:
+                kind = _metadata_item_kind(item_type, content_type)
+                if kind:
+                    item_kinds[item_id] = kind
+        elif box_type == b"iloc":
+            iloc_header, iloc_items = _parse_iloc(meta, payload_start, box_end)
+        elif box_type == b"idat":
+            idat_start = meta_start + payload_start
+    return boxes, meta_box, meta, iloc_items, {"kinds": item_kinds, "idat_start": idat_start, "iloc": iloc_header}
+
+def read_heif_metadata(source):
+    # Для проверки: список (вид, данные) элементов Exif/XMP файла HEIF/AVIF
+    boxes, meta_box, meta, iloc_items, info = _load_heif_meta(source)
+    found = []
+    for item in iloc_items:
+        kind = info["kinds"].get(item["id"]) if meta_box else None
+        if kind and item["method"] in (0, 1) and item["data_ref"] == 0:
+            found.append((kind, _read_item(source, _item_extents(item, info["idat_start"]))))
+    for box_type, box_start, payload_start, box_end, _ in boxes:
+        if box_type == b"uuid":
+            source.seek(payload_start)
+            if source.read(16) == XMP_UUID:
+                found.append(("xmp", b""))
+    return found
+
+def _exif_item_tiff(data):
+    # Элемент Exif начинается со смещения до заголовка TIFF (обычно 6 - после "Exif\0\0")
+    if len(data) < 4:
+        raise ValueError("элемент Exif обрезан")
+    tiff_start = 4 + struct.unpack_from(">I", data, 0)[0]
+    if tiff_start > len(data):
+        raise ValueError("неверное смещение TIFF в элементе Exif")
+    return data[:tiff_start], data[tiff_start:]
+
+def _planned_item_data(kind, data, plan, exif_filter, xmp_filter):
+    # None - элемент удаляется, иначе новые данные (не длиннее старых)
+    if kind == "exif":
+        if plan.exif_action == "keep":
+            return data
+        if plan.exif_action == "strip" or exif_filter is None:
+            return None
+        prefix, tiff = _exif_item_tiff(data)
+        filtered = exif_filter(tiff)
+        return prefix + filtered if filtered else None
+    if plan.xmp_action == "keep":
+        return data
+    if plan.xmp_action == "strip" or xmp_filter is None:
+        return None
+    return xmp_filter(data) or None
+
+def clean_heif(source, target, plan, exif_filter=None, xmp_filter=None):
+    # HEIC/AVIF: элементы Exif/XMP удаляются из iinf/iloc/iref/ipma, их данные вырезаются из mdat,
+    # смещения остальных элементов в iloc пересчитываются. Сжатые данные изображения копируются потоком
+    boxes, meta_box, meta, iloc_items, info = _load_heif_meta(source)
+    if any(box[0] == b"moov" for box in boxes):
+        raise ValueError("последовательности HEIF/AVIF (moov) не поддерживаются")
+    removed = []
+    removed_ids = set()
+    removed_ranges = []
+    replacements = {}
+    kept_items = []
+    for item in iloc_items:
+        kind = info["kinds"].get(item["id"])
+        if kind is None:
+            kept_items.append(item)
+            continue
+        if item["data_ref"] != 0 or item["method"] not in (0, 1):
+            raise ValueError("элемент метаданных во внешнем файле или в другом элементе")
+        extents = _item_extents(item, info["idat_start"])
+        data = _read_item(source, extents)
+        new_data = _planned_item_data(kind, data, plan, exif_filter, xmp_filter)
+        if new_data is not None and len(extents) == 1 and len(new_data) <= len(data):
+            if new_data != data:
+                # Укороченные данные пишутся на старое место, хвост обнуляется - смещения не меняются
+                replacements[extents[0][0]] = new_data.ljust(len(data), b"\x00")
+                item["extents"][0][2] = len(new_data)
+                removed.append(f"{kind}:filtered")
+            kept_items.append(item)
+            continue
+        removed_ids.add(item["id"])
+        removed.append(kind)
+        if item["method"] == 1:
+            for offset, length in extents:
+                replacements[offset] = b"\x00" * length
+        else:
+            removed_ranges.extend(extents)
+
+    skipped_boxes = set()
+    for box_type, box_start, payload_start, box_end, _ in boxes:
+        if box_type == b"uuid" and plan.xmp_action != "keep":
+            source.seek(payload_start)
+            if source.read(16) == XMP_UUID:
+                skipped_boxes.add(box_start)
+                removed_ranges.append((box_start, box_end - box_start))
+                removed.append("xmp")
+
+    new_meta = None
+    meta_shift = 0
+    if meta_box is not None:
+        meta_start, meta_end = meta_box[1], meta_box[3]
+        # Замены внутри idat применяются к копии meta в памяти - она пишется заново целиком
+        meta = bytearray(meta)
+        for offset in [offset for offset in replacements if meta_start <= offset < meta_end]:
+            replacement = replacements.pop(offset)
+            meta[offset - meta_start:offset - meta_start + len(replacement)] = replacement
+        new_meta = _rebuild_meta(meta, removed_ids, kept_items)
+        meta_shift = len(new_meta) - len(meta)
+        removed_ranges.sort()
+
+        def new_position(offset):
+            shift = sum(length for start, length in removed_ranges if start + length <= offset)
+            if any(start < offset < start + length for start, length in removed_ranges):
+                raise ValueError("данные элемента пересекаются с удаляемыми метаданными")
+            return offset - shift + (meta_shift if offset >= meta_end else 0)
+
+        for item in kept_items:
+            if item["method"] != 0 or item["data_ref"] != 0 or not item["extents"]:
+                continue
+            absolute = [item["base"] + extent_offset for _, extent_offset, _ in item["extents"]]
+            new_base = new_position(item["base"]) if item["base"] else 0
+            for extent, old_offset in zip(item["extents"], absolute):
+                extent[1] = new_position(old_offset) - new_base
+            item["base"] = new_base
+        new_meta = _rebuild_meta(meta, removed_ids, kept_items)
+
+    for box_type, box_start, payload_start, box_end, size_field in boxes:
+        if box_start in skipped_boxes:
+            continue
+        if meta_box is not None and box_start == meta_box[1]:
+            target.write(new_meta)
+            continue
+        inside = sorted((start, length) for start, length in removed_ranges
+                        if payload_start <= start and start + length <= box_end)
+        inside_replacements = sorted(offset for offset in replacements if payload_start <= offset < box_end)
+        if not inside and not inside_replacements:
+            _copy_range(source, target, box_start, box_end)
+            continue
+        target.write(_box_header(box_type, box_end - box_start - sum(length for _, length in inside), size_field))
+        # Содержимое копируется кусками между вырезаемыми и заменяемыми участками
+        cuts = [(start, length, None) for start, length in inside]
+        cuts += [(offset, len(replacements[offset]), replacements[offset]) for offset in inside_replacements]
+        position = payload_start
+        for start, length, replacement in sorted(cuts):
+            _copy_range(source, target, position, start)
+            if replacement is not None:
+                target.write(replacement)
+            position = start + length
+        _copy_range(source, target, position, box_end)
+    return removed
+
+
+def _jxl_box_kind(box_type, inner_type=None):
+    box_type = inner_type or box_type
+    if box_type == b"Exif":
+        return "exif"
+    if box_type in (b"xml ", b"jumb"):
+        return "xmp"
+    return None
+
+def clean_jxl(source, target, plan, exif_filter=None, xmp_filter=None):
+    # JPEG XL в контейнере: боксы Exif/xml /jumb (в том числе сжатые brob) удаляются или фильтруются,
+    # jbrd (данные для восстановления исходного JPEG) хранит его сегменты APP и удаляется вместе с ними
+    source.seek(0)
+    signature = source.read(12)
+    source.seek(0)
+    if signature[:2] == JXL_CODESTREAM_SIGNATURE:
+        # Голый кодовый поток: метаданным там негде храниться
+        _copy_range(source, target, 0, source.seek(0, 2))
+        return []
+    if signature != JXL_CONTAINER_SIGNATURE:
+        raise ValueError("нет сигнатуры JPEG XL")
+    removed = []
+    for box_type, box_start, payload_start, box_end, _ in _iter_file_boxes(source):
+        inner_type = None
+        if box_type == b"brob":
+            source.seek(payload_start)
+            inner_type = source.read(4)
+        kind = _jxl_box_kind(box_type, inner_type)
+        if box_type == b"jbrd" and (plan.exif_action != "keep" or plan.xmp_action != "keep"):
+            removed.append("jbrd")
+            continue
+        action = plan.exif_action if kind == "exif" else plan.xmp_action
+        if kind is None or action == "keep":
+            _copy_range(source, target, box_start, box_end)
+            continue
+        if action == "filter" and box_type != b"brob" and not (kind == "xmp" and box_type == b"jumb"):
+            if box_end - payload_start > MAX_METADATA_ITEM_SIZE:
+                raise ValueError("бокс метаданных слишком большой")
+            source.seek(payload_start)
+            new_data = _planned_item_data(kind, _read_exact(source, box_end - payload_start), plan, exif_filter, xmp_filter)
+            if new_data:
+                target.write(_box(box_type, new_data))
+                removed.append(f"{kind}:filtered")
+                continue
+        # Сжатые brotli боксы без распаковки не отфильтровать - при частичной очистке они удаляются целиком
+        removed.append((inner_type or box_type).decode("latin-1").strip())
+    return removed
+
+def read_jxl_metadata(source):
+    found = []
+    source.seek(0)
+    if source.read(12) != JXL_CONTAINER_SIGNATURE:
+        return found
+    for box_type, box_start, payload_start, box_end, _ in _iter_file_boxes(source):
+        inner_type = None
+        if box_type == b"brob":
+            source.seek(payload_start)
+            inner_type = source.read(4)
+        kind = _jxl_box_kind(box_type, inner_type)
+        if box_type in (b"Exif", b"xml ") and box_end - payload_start <= MAX_METADATA_ITEM_SIZE:
+            source.seek(payload_start)
+            found.append((kind, source.read(box_end - payload_start)))
+        elif kind:
+            found.append((kind, b""))
+    return found
+
+
+# MP4/QuickTime: moov читается в память (таблицы сэмплов), mdat только копируется потоком
+MAX_MOOV_SIZE = 256 * 1024 * 1024
+MP4_CONTAINER_ATOMS = {b"moov", b"trak", b"mdia", b"minf", b"stbl", b"edts", b"dinf", b"mvex"}
+# udta: ©xyz (GPS), ©mak/©mod, ©swr; meta/keys/ilst: com.apple.quicktime.location.ISO6709, creationdate и т.п.
+MP4_METADATA_ATOMS = {b"udta", b"meta"}
+MP4_TIMESTAMP_ATOMS = {b"mvhd", b"tkhd", b"mdhd"}
+# При фрагментированном MP4 смещения есть в moof/tfhd/sidx/mfra - там размеры не меняем, а заменяем атомы на free
+MP4_FRAGMENT_ATOMS = {b"moof", b"sidx", b"mfra"}
+
+
+def _is_mp4_metadata_atom(data, atom_type, payload_start):
+    return atom_type in MP4_METADATA_ATOMS or (atom_type == b"uuid" and bytes(data[payload_start:payload_start + 16]) == XMP_UUID)
+
+def _free_atom(size):
+    return struct.pack(">I4s", size, b"free") + b"\x00" * (size - 8)
+
+def _rewrite_mp4_atoms(data, start, end, plan, removed, offset_map, keep_sizes):
+    output = bytearray()
+    for atom_type, atom_start, payload_start, atom_end in _iter_boxes(data, start, end):
+        if plan.remove_metadata and _is_mp4_metadata_atom(data, atom_type, payload_start):
+            removed.append(atom_type.decode("latin-1"))
+            if keep_sizes:
+                output += _free_atom(atom_end - atom_start)
+            continue
+        if atom_type in MP4_CONTAINER_ATOMS:
+            payload = _rewrite_mp4_atoms(data, payload_start, atom_end, plan, removed, offset_map, keep_sizes)
+            if keep_sizes:
+                output += data[atom_start:payload_start] + payload
+            else:
+                output += _box(atom_type, bytes(payload))
+            continue
+        atom = bytearray(data[atom_start:atom_end])
+        payload_offset = payload_start - atom_start
+        if atom_type in MP4_TIMESTAMP_ATOMS and plan.clear_timestamps and len(atom) >= payload_offset + 20:
+            # creation_time и modification_time: 32 бита в версии 0, 64 бита в версии 1
+            time_size = 8 if atom[payload_offset] == 1 else 4
+            atom[payload_offset + 4:payload_offset + 4 + 2 * time_size] = b"\x00" * (2 * time_size)
+            removed.append(f"{atom_type.decode('latin-1')}:time")
+        elif atom_type in (b"stco", b"co64") and offset_map is not None:
+            entry_format = ">I" if atom_type == b"stco" else ">Q"
+            entry_size = struct.calcsize(entry_format)
+            count = struct.unpack_from(">I", atom, payload_offset + 4)[0]
+            if payload_offset + 8 + count * entry_size > len(atom):
+                raise ValueError(f"таблица {atom_type.decode('latin-1')} обрезана")
+            for index in range(count):
+                position = payload_offset + 8 + index * entry_size
+                struct.pack_into(entry_format, atom, position, offset_map(struct.unpack_from(entry_format, atom, position)[0]))
+        output += atom
+    return output
+
+def clean_mp4(source, target, plan):
+    # Атомы метаданных (udta, meta, XMP uuid) удаляются, время создания в mvhd/tkhd/mdhd обнуляется.
+    # Если moov уменьшился, смещения чанков в stco/co64 пересчитываются; mdat копируется потоком без изменений
+    boxes = list(_iter_file_boxes(source))
+    moov_box = next((box for box in boxes if box[0] == b"moov"), None)
+    if moov_box is None:
+        raise ValueError("нет атома moov")
+    _, moov_start, _, moov_end, _ = moov_box
+    if moov_end - moov_start > MAX_MOOV_SIZE:
+        raise ValueError("атом moov слишком большой")
+    keep_sizes = any(box[0] in MP4_FRAGMENT_ATOMS for box in boxes)
+    source.seek(moov_start)
+    moov = _read_exact(source, moov_end - moov_start)
+
+    removed = []
+    removed_ranges = []
+    for atom_type, atom_start, payload_start, atom_end, _ in boxes:
+        if atom_type != b"moov" and plan.remove_metadata:
+            header = b""
+            if atom_type == b"uuid":
+                source.seek(payload_start)
+                header = source.read(16)
+            if _is_mp4_metadata_atom(header, atom_type, 0):
+                removed_ranges.append((atom_start, atom_end))
+                removed.append(atom_type.decode("latin-1"))
+
+    moov_payload_start = 16 if moov[:4] == b"\x00\x00\x00\x01" else 8
+
+    def rebuild_moov(offset_map, removed_atoms):
+        payload = bytes(_rewrite_mp4_atoms(moov, moov_payload_start, len(moov), plan, removed_atoms, offset_map, keep_sizes))
+        return moov[:moov_payload_start] + payload if keep_sizes else _box(b"moov", payload)
+
+    if keep_sizes:
+        new_moov = rebuild_moov(None, removed)
+    else:
+        # Первый проход нужен только для нового размера moov: таблицы stco/co64 свой размер не меняют
+        moov_shift = len(rebuild_moov(None, [])) - len(moov)
+
+        def offset_map(offset):
+            shift = sum(end - start for start, end in removed_ranges if end <= offset)
+            return offset - shift + (moov_shift if offset >= moov_end else 0)
+
+        new_moov = rebuild_moov(offset_map, removed)
+
+    for atom_type, atom_start, payload_start, atom_end, _ in boxes:
+        if atom_start == moov_start:
+            target.write(new_moov)
+        elif any(start == atom_start for start, _ in removed_ranges):
+            if keep_sizes:
+                target.write(_free_atom(atom_end - atom_start))
+        else:
+            _copy_range(source, target, atom_start, atom_end)
+    return removed
+
+def read_mp4_metadata(source):
+    # Для проверки: {"metadata", "timestamps"} - что из этого осталось в файле
+    found = set()
+    boxes = list(_iter_file_boxes(source))
+    for atom_type, atom_start, payload_start, atom_end, _ in boxes:
+        header = b""
+        if atom_type == b"uuid":
+            source.seek(payload_start)
+            header = source.read(16)
+        if atom_type != b"moov" and _is_mp4_metadata_atom(header, atom_type, 0):
+            found.add("metadata")
+        if atom_type == b"moov" and atom_end - atom_start <= MAX_MOOV_SIZE:
+            source.seek(atom_start)
+            moov = _read_exact(source, atom_end - atom_start)
+            found.update(_scan_mp4_atoms(moov, payload_start - atom_start, len(moov)))
+    return found
+
+def _scan_mp4_atoms(data, start, end):
+    found = set()
+    for atom_type, atom_start, payload_start, atom_end in _iter_boxes(data, start, end):
+        if _is_mp4_metadata_atom(data, atom_type, payload_start):
+            found.add("metadata")
+        elif atom_type in MP4_CONTAINER_ATOMS:
+            found.update(_scan_mp4_atoms(data, payload_start, atom_end))
+        elif atom_type in MP4_TIMESTAMP_ATOMS and atom_end - payload_start >= 20:
+            time_size = 8 if data[payload_start] == 1 else 4
+            if any(data[payload_start + 4:payload_start + 4 + 2 * time_size]):
+                found.add("timestamps")
+    return found
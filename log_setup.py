@@ -0,0 +1,109 @@
+# StealthShare v0.1 pre1
+# Copyright (c) 2025 IQUXAe
+# Released under the MIT License. See LICENSE file for details.
+
+import re
+import json
+import queue
+import atexit
+import logging
+import multiprocessing
+from logging.handlers import QueueHandler, QueueListener
+
+from utils import logger
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(module)s - %(message)s'
+LOG_DATE_FORMAT = '%H:%M:%S'
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+LOG_FORMATS = ("text", "json")
+# Код события: "image.cleaned", "pool.worker_replaced"
+EVENT_PATTERN = re.compile(r"^[a-z][a-z0-9_]*(?:\.[a-z0-9_]+)+$")
+
+_listeners = []
+_worker_log_queue = None
+
+
+class JsonLinesFormatter(logging.Formatter):
+    # Одна JSON-строка на запись. Сообщения горячего пути начинаются с кода события
+    # ("image.cleaned file=... removed=..."), он выносится в отдельное поле
+    def format(self, record):
+        message = record.getMessage()
+        event, _, _ = message.partition(" ")
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "process": record.process,
+            "module": record.module,
+            "event": event if EVENT_PATTERN.match(event) else None,
+            "message": message,
+        }
+        if record.exc_info or record.exc_text:
+            entry["exception"] = record.exc_text or self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _QueueHandler(QueueHandler):
+    # Стандартный QueueHandler копирует запись и кладет в нее текст, уже прошедший через форматтер, -
+    # для JSON-вывода он был бы отформатирован дважды. Этот обработчик у логгера единственный,
+    # поэтому запись не копируется, в ней только подставляются аргументы
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure_logging(level=logging.INFO, log_file=None, json_lines=False, stream=None):
+    # Записи идут через очередь: вызывающий поток только кладет запись в очередь, а в stderr и файл
+    # пишет отдельный поток QueueListener. Своему процессу хватает SimpleQueue без pickle;
+    # рабочие процессы пула пишут в отдельную multiprocessing.Queue с тем же выводом
+    global _worker_log_queue
+    stop_logging()
+    # Имена потока и процесса в формат не входят, а их сбор - заметная часть стоимости каждой записи
+    logging.logThreads = False
+    logging.logMultiprocessing = False
+    formatter = JsonLinesFormatter() if json_lines else logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
+    handlers = [logging.StreamHandler(stream)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    local_queue = queue.SimpleQueue()
+    _worker_log_queue = multiprocessing.Queue()
+    logger.handlers.clear()
+    logger.addHandler(_QueueHandler(local_queue))
+    logger.setLevel(level)
+    logger.propagate = False
+    for log_queue in (local_queue, _worker_log_queue):
+        listener = QueueListener(log_queue, *handlers)
+        listener.start()
+        _listeners.append(listener)
+
+def stop_logging():
+    # Дописывает все, что осталось в очередях; вызывается и при выходе из процесса
+    global _worker_log_queue
+    if not _listeners:
+        return
+    for listener in _listeners:
+        listener.stop()
+    for handler in _listeners[0].handlers:
+        handler.close()
+    _listeners.clear()
+    _worker_log_queue = None
+
+def get_log_queue():
+    # Очередь для рабочих процессов пула; None - лог не настроен через configure_logging
+    return _worker_log_queue
+
+def install_worker_logging(log_queue, level):
+    # В рабочем процессе пула: записи уходят в очередь родителя, процесс не ждет stderr
+    if log_queue is None:
+        return
+    logger.handlers.clear()
+    logger.addHandler(_QueueHandler(log_queue))
+    logger.setLevel(level)
+    logger.propagate = False
+
+atexit.register(stop_logging)
@@ -2,12 +2,18 @@
 # Copyright (c) 2025 IQUXAe
 # Released under the MIT License. See LICENSE file for details.
 
+import time
+_startup_started_at = time.perf_counter() # Отсчет холодного старта до первых тяжелых импортов
+
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk, simpledialog
 import os
 import sys 
+import shutil
+import tempfile
 import threading
 import logging
+from collections import deque
 from datetime import datetime
 
 from utils import (
@@ -19,22 +25,26 @@ from utils import (
     LANGUAGES,
     determine_initial_language,
     get_profile_display_names,
-    get_profile_description
+    get_profile_description,
+    get_profile_cleaning_options
 )
-from metadata_cleaner import clean_metadata
+from worker_pool import SupervisedPool, WorkerTimeoutError, WorkerCrashedError, clean_file_task, get_default_worker_count, merge_pool_stats
+from metadata_verifier import verify_cleaned_file, removed_metadata_classes
+from batch_report import BatchReport, CLEANER_PATH_LINK
+from cancellation import CancellationToken, CancelledError, set_current_token
+from batch_dedup import build_duplicate_map
+from fileops import link_or_copy, OutputCommitter
+from profiles import compile_cleaning_plan, load_user_profiles
+from log_setup import configure_logging
+from settings_store import SettingsStore, options_digest
+from remote_io import InputSpool, find_remote_paths, is_remote_path
 
 logger = logging.getLogger("StealthShareApp")
-logger.setLevel(logging.INFO) 
-
-if logger.hasHandlers():
-    logger.handlers.clear()
-
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(module)s - %(message)s', datefmt='%H:%M:%S')
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(formatter)
-logger.addHandler(console_handler)
 
+# Файл языка из прежних версий: читается один раз, если в settings.toml язык еще не сохранен
 CONFIG_LANG_FILE = "stealthshare_lang.cfg"
+# Режим надежности записи результатов: none, fsync или group (см. fileops.OutputCommitter)
+OUTPUT_DURABILITY_MODE = "group"
 
 def get_resource_path(relative_path):
     try:
@@ -49,6 +59,9 @@ class StealthShareApp:
         self.app_version = "v0.1 pre1"
         self.root = root_window 
         
+        # Настройки окна и состояние (кэш результатов, журнал пакета) читаются один раз при запуске
+        self.settings = SettingsStore()
+        self.settings.load()
         self.current_lang_code = self.load_language_preference()
         if not self.current_lang_code:
             self.current_lang_code = determine_initial_language()
@@ -76,18 +89,20 @@ class StealthShareApp:
         self.output_dir = tk.StringVar()
         
         default_output_dir = os.path.join(os.path.expanduser("~"), "Documents", "StealthShare_Cleaned")
-        self.output_dir.set(default_output_dir)
+        self.output_dir.set(self.settings.get("output_dir") or default_output_dir)
 
         self.author_credit_text = self.strings.get('author_credit', "Developed by IQUXAe")
         self.default_status_text = f"{self.author_credit_text}  |  StealthShare {self.app_version}"
         self.status_message = tk.StringVar()
         self.status_message.set(self.default_status_text)
         
-        self.preserve_icc_var = tk.BooleanVar(value=True)
-        self.sort_output_by_type_var = tk.BooleanVar(value=False)
+        self.preserve_icc_var = tk.BooleanVar(value=self.settings.get("preserve_icc"))
+        self.sort_output_by_type_var = tk.BooleanVar(value=self.settings.get("sort_output"))
         
+        load_user_profiles() # Профили из TOML/JSON появляются в списке рядом со встроенными
         profile_keys = list(get_profile_display_names(self.strings).keys())
-        self.current_profile_key = tk.StringVar(value=profile_keys[0] if profile_keys else "")
+        saved_profile = self.settings.get("profile")
+        self.current_profile_key = tk.StringVar(value=saved_profile if saved_profile in profile_keys else (profile_keys[0] if profile_keys else ""))
 
 
         self.setup_styles()
@@ -116,6 +131,14 @@ class StealthShareApp:
 
         self.start_button = ttk.Button(action_frame, command=self.start_cleaning_thread, style="Accent.TButton", padding=(10,10))
         self.start_button.pack(pady=(5,5)) 
+
+        # Пауза и отмена видны только во время обработки
+        self.cancel_token = None
+        self.batch_controls_frame = ttk.Frame(action_frame, style="Action.TFrame")
+        self.pause_button = ttk.Button(self.batch_controls_frame, command=self.toggle_pause_batch, padding=(6,4))
+        self.pause_button.pack(side=tk.LEFT, padx=5)
+        self.cancel_button = ttk.Button(self.batch_controls_frame, command=self.cancel_batch, padding=(6,4))
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
         
         self.progress_var = tk.DoubleVar()
         self.progressbar = ttk.Progressbar(action_frame, variable=self.progress_var, maximum=100, length=300)
@@ -126,10 +149,18 @@ class StealthShareApp:
         self.status_label.pack(fill=tk.X, padx=10, pady=3)
 
         self.update_ui_text() # Первоначальная установка текстов
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after_idle(self.log_startup_time)
+        self.root.after_idle(self.offer_batch_resume)
         logger.info(self.strings.get("app_run_log", "StealthShare {app_version} started. Language: {lang}. Theme: {theme}").format(
             app_version=self.app_version, lang=self.current_lang_code, theme=self.style.theme_use()
         ))
 
+    def log_startup_time(self):
+        startup_ms = (time.perf_counter() - _startup_started_at) * 1000
+        heavy_modules = [name for name in ('PIL', 'piexif', 'pikepdf', 'docx', 'openpyxl', 'pptx') if name in sys.modules]
+        logger.info(f"Холодный старт: окно готово через {startup_ms:.0f} мс. Загруженные библиотеки форматов: {heavy_modules or 'нет'}")
+
     def prompt_language_selection(self):
         # Простой диалог для выбора языка, если он не определен
         # В будущем можно сделать красивее
@@ -158,26 +189,60 @@ class StealthShareApp:
 
 
     def load_language_preference(self):
+        lang_code = self.settings.get("language")
+        if lang_code in LANGUAGES:
+            logger.info(f"Загружен язык из настроек: {lang_code}")
+            return lang_code
         try:
             config_path = get_resource_path(CONFIG_LANG_FILE)
             if os.path.exists(config_path):
                 with open(config_path, "r", encoding="utf-8") as f:
                     lang_code = f.read().strip()
                     if lang_code in LANGUAGES:
-                        logger.info(f"Загружен язык из настроек: {lang_code}")
+                        logger.info(f"Язык перенесен из '{CONFIG_LANG_FILE}': {lang_code}")
                         return lang_code
         except Exception as e:
             logger.error(f"Ошибка загрузки настроек языка: {e}")
         return None
 
     def save_language_preference(self):
-        try:
-            config_path = get_resource_path(CONFIG_LANG_FILE)
-            with open(config_path, "w", encoding="utf-8") as f:
-                f.write(self.current_lang_code)
+        self.settings.update(language=self.current_lang_code)
+        if self.settings.save():
             logger.info(f"Настройки языка сохранены: {self.current_lang_code}")
-        except Exception as e:
-            logger.error(f"Ошибка сохранения настроек языка: {e}")
+
+    def save_settings(self):
+        self.settings.update(
+            language=self.current_lang_code,
+            output_dir=self.output_dir.get(),
+            profile=self.current_profile_key.get(),
+            preserve_icc=self.preserve_icc_var.get(),
+            sort_output=self.sort_output_by_type_var.get(),
+        )
+        self.settings.save()
+
+    def on_close(self):
+        self.save_settings()
+        self.root.destroy()
+
+    def offer_batch_resume(self):
+        # Пакет, прерванный закрытием окна или сбоем, можно продолжить: уже готовые файлы возьмутся из кэша результатов
+        unfinished = self.settings.unfinished_batch()
+        if not unfinished:
+            return
+        batch_id, remaining_files, output_dir, profile_key, sort_output = unfinished
+        resume = messagebox.askyesno(self.strings.get("dialog_resume_batch_title", "Unfinished Batch"),
+                                     self.strings.get("dialog_resume_batch_message", "The last batch was interrupted with {count} file(s) left (output folder: {folder}).\nAdd them to the list?").format(count=len(remaining_files), folder=output_dir))
+        self.settings.finish_batch(batch_id) # Повторно не предлагаем, даже если пользователь отказался
+        if not resume:
+            return
+        self.output_dir.set(output_dir)
+        self.sort_output_by_type_var.set(sort_output)
+        profile_display_name = get_profile_display_names(self.strings).get(profile_key)
+        if profile_display_name:
+            self.profile_combobox_var.set(profile_display_name)
+            self.on_profile_change()
+        self.add_files_to_list(remaining_files)
+        logger.info(f"ДИСПЕТЧЕР: Восстановлен прерванный пакет: {len(remaining_files)} файл(ов).")
 
 
     def set_app_icon(self):
@@ -334,9 +399,9 @@ class StealthShareApp:
         self.style.configure("Secondary.TLabel", foreground="#a0a0a0", background=labelframe_bg) 
         self.profile_description_label.pack(fill=tk.X, padx=5, pady=(0,10))
 
-        self.preserve_icc_checkbutton = ttk.Checkbutton(self.options_frame_widget, variable=self.preserve_icc_var)
+        self.preserve_icc_checkbutton = ttk.Checkbutton(self.options_frame_widget, variable=self.preserve_icc_var, command=self.save_settings)
         self.preserve_icc_checkbutton.pack(anchor=tk.W, padx=5, pady=3)
-        self.sort_output_checkbutton = ttk.Checkbutton(self.options_frame_widget, variable=self.sort_output_by_type_var)
+        self.sort_output_checkbutton = ttk.Checkbutton(self.options_frame_widget, variable=self.sort_output_by_type_var, command=self.save_settings)
         self.sort_output_checkbutton.pack(anchor=tk.W, padx=5, pady=3)
         
         def _update_profile_desc_wrap(event):
@@ -357,6 +422,7 @@ class StealthShareApp:
         
         description = get_profile_description(self.current_profile_key.get(), self.strings)
         self.profile_description_label.config(text=description)
+        self.save_settings()
         logger.info(self.strings.get("profile_change_log", "Selected cleaning profile: {profile_name}").format(profile_name=selected_display_name))
 
 
@@ -416,6 +482,8 @@ class StealthShareApp:
             self.browse_output_dir_button_widget.config(text=self.strings.get("browse_button", "Browse..."))
         
         self.start_button.config(text=self.strings.get("start_button", "🚀 Start Cleaning"))
+        self.pause_button.config(text=self.strings.get("resume_button" if self.cancel_token and self.cancel_token.paused else "pause_button", "⏸ Pause"))
+        self.cancel_button.config(text=self.strings.get("cancel_button", "⏹ Cancel"))
 
 
     def create_info_panel(self, parent):
@@ -520,14 +588,23 @@ class StealthShareApp:
 
     def browse_files(self):
         try:
-            image_ext_list = "*.jpg *.jpeg *.png *.tiff *.tif *.gif *.webp *.bmp"
-            supported_files_desc = self.strings.get("filedialog_supported_all", "Supported Files") + f" ({image_ext_list} *.pdf *.docx *.xlsx *.pptx)"
+            image_ext_list = "*.jpg *.jpeg *.png *.tiff *.tif *.gif *.webp *.bmp *.heic *.heif *.avif *.jxl"
+            archive_ext_list = "*.zip *.tar *.tgz *.tar.gz"
+            video_ext_list = "*.mp4 *.mov *.m4v"
+            audio_ext_list = "*.mp3 *.flac *.ogg *.oga *.opus *.m4a"
+            office_ext_list = "*.odt *.ods *.odp *.doc *.xls *.ppt"
+            supported_files_desc = self.strings.get("filedialog_supported_all", "Supported Files") + f" ({image_ext_list} {video_ext_list} {audio_ext_list} *.pdf *.docx *.xlsx *.pptx {office_ext_list} {archive_ext_list})"
             all_files_desc = self.strings.get("filedialog_all_files", "All Files") + " (*.*)"
-            filetypes = [(supported_files_desc, f"{image_ext_list} *.pdf *.docx *.xlsx *.pptx"), (all_files_desc, "*.*")]
+            filetypes = [(supported_files_desc, f"{image_ext_list} {video_ext_list} {audio_ext_list} *.pdf *.docx *.xlsx *.pptx {office_ext_list} {archive_ext_list}"), (all_files_desc, "*.*")]
             
             dialog_title = self.strings.get("filedialog_select_files_title", "Select files to clean (multiple)")
-            filenames = filedialog.askopenfilenames(title=dialog_title, filetypes=filetypes)
+            # Диалог открывается в последней папке, из которой добавлялись файлы
+            recent_folders = [folder for folder in self.settings.get("recent_folders") if os.path.isdir(folder)]
+            filenames = filedialog.askopenfilenames(title=dialog_title, filetypes=filetypes,
+                                                    initialdir=recent_folders[0] if recent_folders else None)
             if filenames:
+                self.settings.add_recent_folder(os.path.dirname(filenames[0]))
+                self.save_settings()
                 self.add_files_to_list(list(filenames))
         except Exception as e: 
             messagebox.showerror(self.strings.get("error_browse_files_title", "File Selection Error"), 
@@ -547,6 +624,7 @@ class StealthShareApp:
             dirname = filedialog.askdirectory(title=dialog_title, initialdir=initial_dir)
             if dirname:
                 self.output_dir.set(dirname)
+                self.save_settings()
                 msg = self.strings.get("status_output_dir_selected", "Output folder selected: {folder}").format(folder=dirname)
                 logger.info(msg)
                 self._update_status_message(msg)
@@ -556,23 +634,8 @@ class StealthShareApp:
 
 
     def get_current_cleaning_options_from_profile(self):
-        profile_key = self.current_profile_key.get()
-        profile_data = CLEANING_PROFILES.get(profile_key)
-        if not profile_data: # Fallback to first profile if key is somehow invalid
-            profile_key = list(CLEANING_PROFILES.keys())[0]
-            profile_data = CLEANING_PROFILES[profile_key]
-            
-        profile_options = profile_data['options']
-        
-        final_options = {
-            'images': profile_options.get('images', {}).copy(),
-            'pdf': profile_options.get('pdf', {}).copy(),
-            'office': profile_options.get('office', {}).copy()
-        }
-        if 'images' in final_options: # Глобальная опция ICC перезаписывает профиль
-            final_options['images']['preserve_icc'] = self.preserve_icc_var.get()
-        
-        return final_options
+        # План профиля строится один раз на пакет, а не для каждого файла
+        return compile_cleaning_plan(get_profile_cleaning_options(self.current_profile_key.get(), preserve_icc=self.preserve_icc_var.get()))
 
     def start_cleaning_thread(self):
         if not self.selected_files:
@@ -593,7 +656,12 @@ class StealthShareApp:
                                      self.strings.get("dialog_output_dir_error_message", "Folder '{folder}' does not exist and cannot be created: {error}").format(folder=output_dir, error=e))
                 return
 
+        self.save_settings()
         self.start_button.config(state=tk.DISABLED, text=self.strings.get("processing_button", "⏳ Processing..."))
+        self.cancel_token = CancellationToken()
+        self.pause_button.config(state=tk.NORMAL, text=self.strings.get("pause_button", "⏸ Pause"))
+        self.cancel_button.config(state=tk.NORMAL, text=self.strings.get("cancel_button", "⏹ Cancel"))
+        self.batch_controls_frame.pack(pady=(0,5))
         self.progressbar.pack(pady=(10,5), fill=tk.X, padx=20, expand=True) 
         self.progress_var.set(0)
         
@@ -604,16 +672,140 @@ class StealthShareApp:
         status_msg = self.strings.get("status_processing_start", "Started processing {count} file(s)...").format(count=len(files_to_process))
         self._update_status_message(status_msg, temp_fg_color="#75baff", is_temporary=False) 
         
-        thread = threading.Thread(target=self.perform_batch_cleaning, args=(files_to_process, output_dir, current_cleaning_options, sort_output), daemon=True)
+        thread = threading.Thread(target=self.perform_batch_cleaning, args=(files_to_process, output_dir, current_cleaning_options, sort_output, self.current_profile_key.get(), self.cancel_token), daemon=True)
         thread.start()
 
-    def perform_batch_cleaning(self, files_to_process, base_output_dir, cleaning_options, sort_output):
+    def toggle_pause_batch(self):
+        token = self.cancel_token
+        if token is None or token.cancelled:
+            return
+        if token.paused:
+            token.resume()
+            self.pause_button.config(text=self.strings.get("pause_button", "⏸ Pause"))
+            self._update_status_message(self.strings.get("status_resumed", "Processing resumed."), temp_fg_color="#75baff", is_temporary=False)
+            logger.info("ДИСПЕТЧЕР: Обработка продолжена.")
+        else:
+            token.pause()
+            self.pause_button.config(text=self.strings.get("resume_button", "▶ Resume"))
+            self._update_status_message(self.strings.get("status_paused", "Paused."), temp_fg_color="#ffcc66", is_temporary=False)
+            logger.info("ДИСПЕТЧЕР: Обработка приостановлена.")
+
+    def cancel_batch(self):
+        token = self.cancel_token
+        if token is None or token.cancelled:
+            return
+        token.cancel()
+        self.pause_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.DISABLED)
+        self._update_status_message(self.strings.get("status_cancelling", "Cancelling..."), temp_fg_color="#ffcc66", is_temporary=False)
+        logger.info("ДИСПЕТЧЕР: Запрошена отмена обработки.")
+
+    def perform_batch_cleaning(self, files_to_process, base_output_dir, cleaning_options, sort_output, profile_key=None, token=None):
         total_files = len(files_to_process)
         processed_count = 0
         success_count = 0
         error_list = [] 
+        # Токен проверяется между файлами здесь и между блоками данных в рабочем процессе
+        token = token or CancellationToken()
+        set_current_token(token)
+        cancelled_at = None
+
+        def _cleaned_path(filepath):
+            return get_cleaned_filename(filepath, base_output_dir, sort_into_subdirs=sort_output,
+                                        file_category=get_file_category(get_file_extension(filepath)) if sort_output else None)
+
+        # Файлы, которые не менялись с прошлой очистки теми же опциями и чей результат лежит на месте нетронутым,
+        # не чистятся и не хэшируются повторно - при продолжении прерванного пакета готовая часть пропускается сразу
+        digest = options_digest(cleaning_options)
+        cached_results = {}
+        for filepath, (output_path, cleaner_path) in self.settings.cached_results(files_to_process, digest).items():
+            expected_output = _cleaned_path(filepath)
+            if expected_output and os.path.abspath(expected_output) == output_path:
+                cached_results[filepath] = cleaner_path
+        batch_id = self.settings.start_batch(files_to_process, base_output_dir, profile_key, sort_output)
+        try:
+            # Одинаковые файлы чистим один раз
+            duplicate_of = build_duplicate_map([path for path in files_to_process if path not in cached_results])
+        except CancelledError:
+            duplicate_of, cancelled_at = {}, 0
+        cleaned_outputs = {}
+
+        # Журнал и кэш результатов обновляются, только когда результат уже лежит под итоговым именем
+        # (в режиме group - после фиксации группы). Файл, не прошедший проверку, из них убирается
+        journal_lock = threading.Lock()
+        committed_sources = {} # итоговый путь -> (входной файл, путь очистки)
+        def _record_committed(final_paths):
+            with journal_lock:
+                results = []
+                for path in final_paths:
+                    if path in committed_sources:
+                        source, cleaner_path = committed_sources.pop(path)
+                        results.append((source, path, cleaner_path))
+                self.settings.record_results(results, digest, batch_id)
+        # Результаты для сетевой папки пишутся в локальную промежуточную и переносятся туда группой при фиксации
+        staging_dir = tempfile.mkdtemp(prefix="stealthshare_staging_") if is_remote_path(base_output_dir) else None
+        committer = OutputCommitter(OUTPUT_DURABILITY_MODE, on_commit=_record_committed, staging_dir=staging_dir)
+        # План очистки компилируется один раз на пакет, рабочие процессы получают его готовым
+        cleaning_plan = compile_cleaning_plan(cleaning_options)
+        # Каждый файл чистится в отдельном процессе: зависший или упавший на нем процесс заменяется,
+        # а файл попадает в список ошибок, не останавливая пакет. Быстрая очередь занимает столько же процессов,
+        # сколько пул по умолчанию: структурная очистка идет на всех ядрах, а не по одному файлу
+        pool = SupervisedPool(max_workers=get_default_worker_count(), token=token)
+
+        # BMP/GIF/WebP всегда декодируются и кодируются заново Pillow - это в разы дольше очистки по структуре.
+        # Они уходят в отдельный пул на остальные ядра и чистятся параллельно, пока быстрая очередь идет по
+        # остальным файлам; их результаты забираются после быстрой очереди, дубликаты - в самом конце
+        from metadata_cleaner import REENCODE_EXTENSIONS
+        reencode_files = [path for path in files_to_process if path not in duplicate_of and path not in cached_results
+                          and get_file_extension(path) in REENCODE_EXTENSIONS]
+        if reencode_files and cancelled_at is None:
+            duplicate_files = [path for path in files_to_process if path in duplicate_of]
+            reencode_set = set(reencode_files) | set(duplicate_files)
+            files_to_process = [path for path in files_to_process if path not in reencode_set] + reencode_files + duplicate_files
+            cpu_pool = SupervisedPool(max_workers=min(len(reencode_files), get_default_worker_count()), token=token, preload=("images",))
+        else:
+            cpu_pool = None
+        report = BatchReport(workers=pool.max_workers + (cpu_pool.max_workers if cpu_pool else 0), profile=profile_key)
+
+        # Входы с сетевых ФС заранее и параллельно копируются в локальный буфер большими последовательными
+        # чтениями: очистка и проверка читают локальную копию, а не платят задержку сети за каждое мелкое чтение.
+        # Сначала входы для пула перекодирования (он начинает сразу), затем быстрой очереди
+        reencode_paths = set(reencode_files)
+        fetch_order = reencode_files + [path for path in files_to_process
+                                        if path not in duplicate_of and path not in cached_results and path not in reencode_paths]
+        spool = InputSpool(fetch_order) if cancelled_at is None and find_remote_paths(fetch_order) else None
+
+        def _submit(lane, filepath, temp_filepath, urgent=False):
+            if spool is not None:
+                return spool.submit(lane, clean_file_task, filepath, temp_filepath, get_file_extension(filepath), cleaning_plan, urgent=urgent)
+            return lane.submit(clean_file_task, filepath, temp_filepath, get_file_extension(filepath), cleaning_plan)
+
+        reencode_tasks = {}
+        for filepath in (reencode_files if cpu_pool else []):
+            cleaned_filepath = _cleaned_path(filepath)
+            if cleaned_filepath and os.path.exists(filepath):
+                temp_filepath = committer.reserve(cleaned_filepath)
+                reencode_tasks[filepath] = (temp_filepath, time.perf_counter(), _submit(cpu_pool, filepath, temp_filepath))
+
+        # Файлы быстрой очереди отправляются в пул заранее, окном не больше числа его процессов; результаты
+        # по-прежнему забираются по порядку, поэтому проверка, фиксация и отчет идут в порядке пакета
+        fast_tasks = {}
+        fast_queue = deque(path for path in files_to_process
+                           if path not in duplicate_of and path not in cached_results and path not in reencode_tasks)
+        def _fill_fast_lane():
+            while fast_queue and len(fast_tasks) < pool.max_workers:
+                filepath = fast_queue.popleft()
+                cleaned_filepath = _cleaned_path(filepath)
+                if cleaned_filepath and os.path.exists(filepath):
+                    temp_filepath = committer.reserve(cleaned_filepath)
+                    fast_tasks[filepath] = (temp_filepath, time.perf_counter(), _submit(pool, filepath, temp_filepath, urgent=True))
 
         for i, filepath in enumerate(files_to_process):
+            token.wait_if_paused()
+            if cancelled_at is not None or token.cancelled:
+                cancelled_at = i if cancelled_at is None else cancelled_at
+                break
+            _fill_fast_lane()
             current_filename_base = os.path.basename(filepath)
             
             status_msg_file = self.strings.get("status_processing_file", "Processing ({current}/{total}): {filename}...").format(current=i+1, total=total_files, filename=current_filename_base)
@@ -622,6 +814,7 @@ class StealthShareApp:
             if not os.path.exists(filepath): 
                 logger.warning(self.strings.get("file_skipped_not_found_log", "File '{filename}' skipped (not found).").format(filename=current_filename_base))
                 error_list.append((current_filename_base, "не найден"))
+                report.add(filepath, status="error", reason="не найден")
                 processed_count +=1
                 self.root.after(0, self.update_progress_gui, processed_count, total_files)
                 continue
@@ -635,26 +828,140 @@ class StealthShareApp:
             if not cleaned_filepath: 
                 logger.error(self.strings.get("cleaned_name_error_log", "Could not generate cleaned filename for: {filename}").format(filename=current_filename_base))
                 error_list.append((current_filename_base, "ошибка имени вых. файла"))
+                report.add(filepath, status="error", reason="ошибка имени вых. файла")
                 processed_count +=1
                 self.root.after(0, self.update_progress_gui, processed_count, total_files)
                 continue
             
             try:
-                success_op = clean_metadata(filepath, cleaned_filepath, file_ext, cleaning_options)
-                if success_op:
+                if filepath in cached_results:
+                    success_count += 1
+                    cleaned_outputs[filepath] = cleaned_filepath
+                    report.add(filepath, cleaned_filepath, status="cached", cleaner_path=cached_results[filepath])
+                    self.settings.record_results([(filepath, cleaned_filepath, cached_results[filepath])], digest, batch_id)
+                    logger.info("batch.cached file=%r output=%r", current_filename_base, os.path.basename(cleaned_filepath))
+                    processed_count += 1
+                    self.root.after(0, self.update_progress_gui, processed_count, total_files)
+                    continue
+
+                leader_filepath = duplicate_of.get(filepath)
+                if leader_filepath is not None:
+                    leader_output = cleaned_outputs.get(leader_filepath)
+                    if leader_output:
+                        duplicate_temp_path = committer.reserve(cleaned_filepath)
+                        link_method = link_or_copy(committer.locate(leader_output), duplicate_temp_path)
+                        with journal_lock:
+                            committed_sources[cleaned_filepath] = (filepath, CLEANER_PATH_LINK)
+                        committer.commit(duplicate_temp_path, cleaned_filepath)
+                        success_count += 1
+                        report.add(filepath, cleaned_filepath, status="duplicate", cleaner_path=CLEANER_PATH_LINK,
+                                   reason=os.path.basename(leader_filepath), current_output_path=committer.locate(cleaned_filepath))
+                        logger.info("batch.duplicate_linked file=%r original=%r output=%r method=%s", current_filename_base,
+                                    os.path.basename(leader_filepath), os.path.basename(cleaned_filepath), link_method)
+                    else:
+                        error_list.append((current_filename_base, self.strings.get("duplicate_source_failed_reason", "duplicate of a file that failed: {original}").format(original=os.path.basename(leader_filepath))))
+                        report.add(filepath, status="error", reason=error_list[-1][1])
+                    processed_count += 1
+                    self.root.after(0, self.update_progress_gui, processed_count, total_files)
+                    continue
+
+                if filepath in reencode_tasks:
+                    temp_filepath, submitted_at, future = reencode_tasks.pop(filepath)
+                elif filepath in fast_tasks:
+                    temp_filepath, submitted_at, future = fast_tasks.pop(filepath)
+                else:
+                    temp_filepath = committer.reserve(cleaned_filepath)
+                    submitted_at = time.perf_counter()
+                    future = _submit(pool, filepath, temp_filepath, urgent=True)
+                try:
+                    success_op, clean_time, cleaner_path = future.result()
+                except CancelledError:
+                    # Недописанный результат удаляется: после отмены в папке остаются только готовые файлы
+                    committer.discard(temp_filepath)
+                    cancelled_at = i
+                    break
+                except (WorkerTimeoutError, WorkerCrashedError) as e:
+                    logger.error(self.strings.get("file_worker_failed_log", "Cleaning of '{filename}' was stopped: {error}").format(filename=current_filename_base, error=e))
+                    committer.discard(temp_filepath)
+                    error_list.append((current_filename_base, self.strings.get("worker_timeout_reason", "cleaning timed out") if isinstance(e, WorkerTimeoutError) else self.strings.get("worker_crashed_reason", "cleaner process crashed")))
+                    report.add(filepath, status="error", reason=error_list[-1][1], latency=time.perf_counter() - submitted_at)
+                    processed_count += 1
+                    self.root.after(0, self.update_progress_gui, processed_count, total_files)
+                    continue
+                # Проверяется временный файл: результат с оставшимися метаданными не получает имя "_cleaned"
+                remaining_metadata = verify_cleaned_file(temp_filepath, file_ext, cleaning_options) if success_op else []
+                if success_op and not remaining_metadata:
+                    with journal_lock:
+                        committed_sources[cleaned_filepath] = (filepath, cleaner_path)
+                    committer.commit(temp_filepath, cleaned_filepath)
+                else:
+                    committer.discard(temp_filepath)
+                latency = time.perf_counter() - submitted_at
+                if remaining_metadata:
+                    # Запись о прошлой очистке этого файла тоже больше не считается готовым результатом
+                    self.settings.forget_result(filepath, digest, batch_id)
+                    logger.error(self.strings.get("file_verification_failed_log", "Metadata still present in '{filename}': {classes}").format(filename=os.path.basename(cleaned_filepath), classes=", ".join(remaining_metadata)))
+                    error_list.append((current_filename_base, self.strings.get("verification_failed_reason", "metadata remains: {classes}").format(classes=", ".join(remaining_metadata))))
+                    report.add(filepath, status="error", reason=error_list[-1][1], cleaner_path=cleaner_path, clean_time=clean_time, latency=latency)
+                elif success_op:
                     success_count += 1
-                    logger.info(self.strings.get("file_processed_success_log", "Successfully processed: {filename_in} -> {filename_out}").format(filename_in=current_filename_base, filename_out=os.path.basename(cleaned_filepath)))
+                    cleaned_outputs[filepath] = cleaned_filepath
+                    report.add(filepath, cleaned_filepath, cleaner_path=cleaner_path, clean_time=clean_time, latency=latency,
+                               removed_classes=removed_metadata_classes(filepath, committer.locate(cleaned_filepath), file_ext),
+                               current_output_path=committer.locate(cleaned_filepath))
+                    logger.info("batch.cleaned file=%r output=%r path=%s clean_ms=%.1f", current_filename_base,
+                                os.path.basename(cleaned_filepath), cleaner_path, clean_time * 1000)
                 else: 
                     logger.error(self.strings.get("file_processed_error_log", "Error processing: {filename}").format(filename=current_filename_base))
                     error_list.append((current_filename_base, "ошибка очистки"))
+                    report.add(filepath, status="error", reason="ошибка очистки", cleaner_path=cleaner_path, clean_time=clean_time, latency=latency)
+            except CancelledError:
+                cancelled_at = i
+                break
             except Exception as e: 
                 logger.critical(self.strings.get("file_critical_error_log", "Critical error cleaning '{filename}': {error}").format(filename=current_filename_base, error=e), exc_info=True)
                 error_list.append((current_filename_base, f"критическая ошибка ({type(e).__name__})"))
+                report.add(filepath, status="error", reason=error_list[-1][1])
             
             processed_count += 1
             self.root.after(0, self.update_progress_gui, processed_count, total_files)
+
+        if cancelled_at is not None:
+            logger.warning(self.strings.get("batch_cancelled_log", "Batch cancelled: {remaining} file(s) not processed.").format(remaining=total_files - cancelled_at))
+            for filepath in files_to_process[cancelled_at:]:
+                report.add(filepath, status="cancelled")
+        if spool is not None:
+            spool.close()
+        # Задачи обоих пулов, до которых пакет не дошел, после отмены завершаются сразу
+        for temp_filepath, _, future in list(reencode_tasks.values()) + list(fast_tasks.values()):
+            try:
+                future.result()
+            except BaseException:
+                pass
+            committer.discard(temp_filepath)
+        set_current_token(None)
+        pool.shutdown(wait=False)
+        if cpu_pool:
+            cpu_pool.shutdown(wait=False)
+        try:
+            committer.close() # Фиксируем последнюю группу результатов на диске
+        except OSError as e:
+            logger.critical(self.strings.get("output_commit_error_log", "Could not commit cleaned files to disk: {error}").format(error=e), exc_info=True)
+            error_list.append(("*", self.strings.get("output_commit_failed_reason", "disk write error ({error})").format(error=type(e).__name__)))
+        if staging_dir:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        # Пакет дошел до конца или отменен пользователем - предлагать продолжить его при запуске не нужно
+        self.settings.finish_batch(batch_id)
+
+        report.finish(merge_pool_stats(pool, cpu_pool))
+        report_path = None
+        if total_files:
+            try:
+                report_path = report.write(base_output_dir)[0]
+            except (OSError, ValueError) as e:
+                logger.error(self.strings.get("report_write_error_log", "Could not write the batch report: {error}").format(error=e))
             
-        self.root.after(0, self.finalize_batch_cleaning, total_files, success_count, error_list)
+        self.root.after(0, self.finalize_batch_cleaning, total_files, success_count, error_list, report_path, cancelled_at is not None)
 
     def update_progress_gui(self, processed_count, total_files):
         if total_files > 0:
@@ -705,23 +1012,34 @@ class StealthShareApp:
         
         ttk.Button(report_dialog, text=self.strings.get("dialog_button_ok", "OK"), command=report_dialog.destroy, style="Accent.TButton").grid(row=2, column=0, pady=10)
 
-    def finalize_batch_cleaning(self, total_files, success_count, error_list):
+    def finalize_batch_cleaning(self, total_files, success_count, error_list, report_path=None, cancelled=False):
         self.start_button.config(state=tk.NORMAL, text=self.strings.get("start_button", "🚀 Start Cleaning"))
+        self.batch_controls_frame.pack_forget()
         self.progressbar.pack_forget() 
+        self.cancel_token = None
         
         status_key = "status_completed_summary"
         title_key = "dialog_report_title_success"
         status_fg_color = "#77cc77" 
+        if cancelled:
+            status_key = "status_cancelled_summary"
+            title_key = "dialog_report_title_cancelled"
+            status_fg_color = "#ffcc66"
 
         if error_list: 
-            status_key = "status_completed_with_errors"
-            title_key = "dialog_report_title_errors"
+            if not cancelled:
+                status_key = "status_completed_with_errors"
+                title_key = "dialog_report_title_errors"
             status_fg_color = "#ffcc66" 
             logger.warning(f"Файлы с ошибками: {error_list}")
             summary_msg_for_dialog = self.strings.get(status_key, "").format(success_count=success_count, total_files=total_files, error_count=len(error_list))
+            if report_path:
+                summary_msg_for_dialog += "\n" + self.strings.get("report_saved_message", "Report: {path}").format(path=report_path)
             self.show_report_dialog(self.strings.get(title_key, "Report"), summary_msg_for_dialog, error_list)
         elif total_files > 0 : 
             summary_msg_for_dialog = self.strings.get(status_key, "").format(success_count=success_count, total_files=total_files)
+            if report_path:
+                summary_msg_for_dialog += "\n" + self.strings.get("report_saved_message", "Report: {path}").format(path=report_path)
             messagebox.showinfo(self.strings.get(title_key, "Success"), summary_msg_for_dialog) 
         else: 
             summary_msg_for_dialog = self.strings.get("status_no_files_to_process", "No files were selected for processing.")
@@ -736,6 +1054,8 @@ class StealthShareApp:
         logger.info(self.strings.get("batch_finish_log", "--- BATCH CLEANING FINISHED --- {summary}").format(summary=final_status_text))
 
 if __name__ == '__main__': 
+    # Вывод лога идет через очередь в отдельном потоке: ни окно, ни рабочие процессы не ждут stderr
+    configure_logging(logging.INFO)
     root = tk.Tk() 
     app = StealthShareApp(root) 
     root.mainloop()
@@ -3,121 +3,402 @@
 # Released under the MIT License. See LICENSE file for details.
 
 import os
+import io
+import re
 import shutil
-from PIL import Image, UnidentifiedImageError, PngImagePlugin, ExifTags
-import piexif
-import pikepdf
-from docx import Document as DocxDocument
-from openpyxl import load_workbook
-from pptx import Presentation
+import zipfile
+import importlib
+import threading
 from datetime import datetime, timezone
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
-from utils import logger
+from utils import logger, LogList, FILE_CATEGORIES, get_file_extension
+from fileops import fast_copy, temp_output_path, OutputCommitter
+from profiles import compile_cleaning_plan, compile_image_plan, compile_pdf_plan, compile_office_plan, compile_video_plan, compile_audio_plan
+from image_segments import filter_png_chunks, filter_webp_chunks, filter_exif_tiff, rewrite_jpeg_segments, scrub_tiff
+from isobmff import clean_heif, clean_jxl, clean_mp4
+from audio_cleaner import clean_audio_stream
+from odf_cleaner import clean_odf, ODF_EXTENSIONS
+from ole2_cleaner import clean_ole2, OLE2_EXTENSIONS
+from zip_stream import rewrite_zip
+from cancellation import check_cancelled
+from batch_report import CLEANER_PATH_LOSSLESS, CLEANER_PATH_REENCODE, CLEANER_PATH_COPY
 
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.tiff', '.tif', '.png', '.gif', '.webp', '.bmp', '.heic', '.heif', '.avif', '.jxl']
+ARCHIVE_EXTENSIONS = FILE_CATEGORIES["Archives"]
+VIDEO_EXTENSIONS = FILE_CATEGORIES["Videos"]
+AUDIO_EXTENSIONS = FILE_CATEGORIES["Audio"]
+# Без явного режима результат просто атомарно переименовывается, без fsync
+_default_committer = OutputCommitter("none")
+OFFICE_PROPERTY_ALIASES = {'creator': 'author', 'description': 'comments'}
+# python-docx и python-pptx не принимают None для дат, такие элементы удаляем из core.xml напрямую
+OFFICE_DATE_ELEMENTS = {'last_printed': 'lastPrinted'}
+# Папки, где OOXML и ODF хранят вставленные картинки
+EMBEDDED_MEDIA_PATTERN = re.compile(r"^(?:word|ppt|xl)/media/|^Pictures/")
+EMBEDDED_MEDIA_WORKERS = min(4, os.cpu_count() or 1)
+# Каким путем был очищен последний файл в этом потоке - для отчета о пакете
+_cleaner_path = threading.local()
 
-def clean_image_metadata(filepath, output_path, options=None):
-    filename_base = os.path.basename(filepath)
-    if options is None: options = {}
-    
-    should_clean_exif = options.get('exif', True)
-    should_try_clean_xmp_iptc = options.get('xmp_iptc', False) 
-    should_aggressively_clean_png = options.get('png_chunks', True)
-    should_preserve_icc = options.get('preserve_icc', True)
+# Библиотеки форматов импортируются внутри функций очистки при первом файле нужного типа,
+# чтобы запуск окна и CLI не платили за Pillow/pikepdf/docx/openpyxl/pptx заранее
+FORMAT_BACKEND_MODULES = {
+    'images': ['PIL.Image', 'PIL.PngImagePlugin', 'piexif'],
+    'pdf': ['pikepdf'],
+    'office': ['docx', 'openpyxl', 'pptx'],
+}
+
+
+def _set_cleaner_path(path):
+    _cleaner_path.value = path
+
+def get_last_cleaner_path():
+    return getattr(_cleaner_path, "value", "")
+
+def preload_backends(groups=None):
+    for group in (groups or FORMAT_BACKEND_MODULES.keys()):
+        for module_name in FORMAT_BACKEND_MODULES.get(group, []):
+            try:
+                importlib.import_module(module_name)
+            except ImportError as e:
+                logger.warning(f"ЗАГРУЗКА: Не удалось импортировать '{module_name}': {e}")
+
+
+def _source_name(source):
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.basename(source)
+    return "<в памяти>"
+
+def _copy_through(source, target):
+    # Передает данные без изменений: путь -> путь через fast_copy (reflink, copy_file_range), иначе через потоки
+    if isinstance(source, (str, os.PathLike)) and isinstance(target, (str, os.PathLike)):
+        if source != target:
+            fast_copy(source, target)
+        return
+    source.seek(0)
+    shutil.copyfileobj(source, target)
+
+def _detect_webp_lossless(source):
+    # Pillow не сообщает, был ли WebP без потерь - смотрим на тип чанка кодека (VP8L)
+    try:
+        stream = open(source, 'rb') if isinstance(source, (str, os.PathLike)) else io.BytesIO(source)
+        with stream:
+            header = stream.read(12)
+            if header[:4] != b'RIFF' or header[8:12] != b'WEBP':
+                return False
+            while True:
+                chunk_header = stream.read(8)
+                if len(chunk_header) < 8:
+                    return False
+                chunk_type = chunk_header[:4]
+                if chunk_type == b'VP8L':
+                    return True
+                if chunk_type == b'VP8 ':
+                    return False
+                chunk_size = int.from_bytes(chunk_header[4:], 'little')
+                stream.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+    except OSError:
+        return False
+
+def _filter_exif_bytes(exif_data, plan):
+    # Блок EXIF пересобирается на уровне IFD: значения оставшихся тегов копируются байт в байт
+    prefix = b"Exif\x00\x00" if exif_data.startswith(b"Exif\x00\x00") else b""
+    filtered = filter_exif_tiff(exif_data[len(prefix):], plan)
+    return prefix + filtered if filtered else b""
+
+def _is_removed_xmp_name(name, namespaces, properties):
+    return name.startswith("{") and (name[1:].split("}", 1)[0] in namespaces or name in properties)
 
-    logger.info(f"ИЗОБРАЖЕНИЕ: Очистка '{filename_base}', EXIF:{should_clean_exif}, XMP/IPTC:{should_try_clean_xmp_iptc}, PNG_Chunks:{should_aggressively_clean_png}, ICC сохранен:{should_preserve_icc}")
+def _filter_xmp_packet(xmp_data, namespaces, properties=frozenset()):
+    # Удаляет из пакета XMP свойства указанных пространств имен и отдельные свойства (в нотации Кларка),
+    # обертку <?xpacket?> сохраняет
+    import xml.etree.ElementTree as ET
+    text = xmp_data.decode("utf-8") if isinstance(xmp_data, (bytes, bytearray)) else xmp_data
+    start = text.find("<x:xmpmeta")
+    end_tag = "</x:xmpmeta>"
+    if start < 0:
+        start, end_tag = text.find("<rdf:RDF"), "</rdf:RDF>"
+    end = text.find(end_tag, start)
+    if start < 0 or end < 0:
+        raise ValueError("в пакете XMP не найден корневой элемент")
+    end += len(end_tag)
+    body = text[start:end]
+
+    for _, (prefix, uri) in ET.iterparse(io.StringIO(body), events=("start-ns",)):
+        if prefix:
+            try:
+                ET.register_namespace(prefix, uri)
+            except ValueError:
+                pass
+    root = ET.fromstring(body)
+    removed = 0
+    for element in root.iter():
+        for attribute in [name for name in element.attrib if _is_removed_xmp_name(name, namespaces, properties)]:
+            del element.attrib[attribute]
+            removed += 1
+        for child in [child for child in element if isinstance(child.tag, str) and _is_removed_xmp_name(child.tag, namespaces, properties)]:
+            element.remove(child)
+            removed += 1
+    if not removed:
+        return xmp_data
+    filtered = text[:start] + ET.tostring(root, encoding="unicode") + text[end:]
+    return filtered.encode("utf-8") if isinstance(xmp_data, (bytes, bytearray)) else filtered
+
+def _planned_exif(exif_data, plan, filename_base):
+    # None - не передавать EXIF в save(), b'' - записать пустой, иначе - отфильтрованные байты
+    if plan.exif_action == "keep":
+        return exif_data
+    if plan.exif_action == "strip":
+        return b''
+    if not exif_data:
+        return None
+    try:
+        return _filter_exif_bytes(exif_data, plan)
+    except Exception as e:
+        logger.warning(f"ИЗОБРАЖЕНИЕ: Не удалось отфильтровать EXIF '{filename_base}' ({e}), EXIF удален целиком.")
+        return b''
+
+def _planned_xmp(xmp_data, plan, filename_base):
+    if plan.xmp_action == "keep":
+        return xmp_data
+    if plan.xmp_action == "strip" or not xmp_data:
+        return b''
+    try:
+        return _filter_xmp_packet(xmp_data, plan.xmp_remove_namespaces, plan.xmp_remove_properties)
+    except Exception as e:
+        logger.warning(f"ИЗОБРАЖЕНИЕ: Не удалось отфильтровать XMP '{filename_base}' ({e}), XMP удален целиком.")
+        return b''
+
+def _clean_png_chunks(source, target, plan, filename_base):
+    # PNG чистится по чанкам без перекодирования: пиксели и сжатие остаются исходными
+    removed = filter_png_chunks(source, target, plan,
+                                exif_filter=lambda data: _planned_exif(data, plan, filename_base),
+                                xmp_filter=lambda data: _planned_xmp(data, plan, filename_base))
+    logger.info("image.cleaned file=%r method=png_chunks removed=%s", filename_base, LogList(removed))
+
+def _clean_jpeg_segments(source, target, plan, filename_base):
+    # JPEG чистится по сегментам: сжатые данные сканов копируются байт в байт, повторного кодирования нет
+    removed = rewrite_jpeg_segments(source, target, plan,
+                                    exif_filter=lambda data: _planned_exif(data, plan, filename_base),
+                                    xmp_filter=lambda data: _planned_xmp(data, plan, filename_base))
+    logger.info("image.cleaned file=%r method=jpeg_segments removed=%s", filename_base, LogList(removed))
+
+def _clean_webp_chunks(source, target, plan, filename_base):
+    # WebP чистится по чанкам RIFF: сжатые кадры с потерями не декодируются и не теряют качество повторно
+    removed = filter_webp_chunks(source, target, plan,
+                                 exif_filter=lambda data: _planned_exif(data, plan, filename_base),
+                                 xmp_filter=lambda data: _planned_xmp(data, plan, filename_base))
+    logger.info("image.cleaned file=%r method=webp_chunks removed=%s", filename_base, LogList(removed))
+
+def _clean_tiff_tags(source, target, plan, filename_base):
+    # TIFF правится на месте по тегам: миниатюры, MakerNote и лишние теги убираются без декодирования полос
+    removed = scrub_tiff(source, target, plan,
+                         xmp_filter=lambda data: _planned_xmp(data, plan, filename_base))
+    logger.info("image.cleaned file=%r method=tiff_tags removed=%s", filename_base, LogList(removed))
+
+def _clean_heif_items(source, target, plan, filename_base):
+    # HEIC/AVIF/JXL Pillow не открывает вовсе, поэтому для них запасного пути нет
+    removed = clean_heif(source, target, plan,
+                         exif_filter=lambda data: _planned_exif(data, plan, filename_base),
+                         xmp_filter=lambda data: _planned_xmp(data, plan, filename_base))
+    logger.info("image.cleaned file=%r method=heif_boxes removed=%s", filename_base, LogList(removed))
+
+def _clean_jxl_boxes(source, target, plan, filename_base):
+    removed = clean_jxl(source, target, plan,
+                        exif_filter=lambda data: _planned_exif(data, plan, filename_base),
+                        xmp_filter=lambda data: _planned_xmp(data, plan, filename_base))
+    logger.info("image.cleaned file=%r method=jxl_boxes removed=%s", filename_base, LogList(removed))
+
+# Форматы, которые чистятся по структуре файла; Pillow для них - только запасной путь
+STRUCTURE_CLEANERS = {
+    '.png': _clean_png_chunks,
+    '.jpg': _clean_jpeg_segments, '.jpeg': _clean_jpeg_segments,
+    '.tif': _clean_tiff_tags, '.tiff': _clean_tiff_tags,
+    '.webp': _clean_webp_chunks,
+    '.heic': _clean_heif_items, '.heif': _clean_heif_items, '.avif': _clean_heif_items,
+    '.jxl': _clean_jxl_boxes,
+}
+# Форматы без запасного пути через Pillow
+STRUCTURE_ONLY_EXTENSIONS = {'.heic', '.heif', '.avif', '.jxl'}
+# Форматы, которые всегда декодируются и пересохраняются Pillow: пакет чистит их в отдельном пуле процессов
+REENCODE_EXTENSIONS = {ext for ext in IMAGE_EXTENSIONS if ext not in STRUCTURE_CLEANERS}
+
+def _clean_image_structure(filepath, output_path, cleaner, plan, filename_base):
+    if filepath == output_path:
+        # На месте: собираем результат в памяти, чтобы ошибка разбора не испортила исходник
+        with open(filepath, 'rb') as src:
+            cleaned_buffer = io.BytesIO()
+            cleaner(src, cleaned_buffer, plan, filename_base)
+        with open(output_path, 'wb') as dst:
+            dst.write(cleaned_buffer.getvalue())
+    else:
+        with open(filepath, 'rb') as src, open(output_path, 'wb') as dst:
+            cleaner(src, dst, plan, filename_base)
+
+def _clean_embedded_image(data, file_ext_lower, plan, part_name):
+    # Встроенные картинки чистятся только по структуре: перекодировать их внутри документа незачем
+    try:
+        output_buffer = io.BytesIO()
+        STRUCTURE_CLEANERS[file_ext_lower](io.BytesIO(data), output_buffer, plan, part_name)
+        return output_buffer.getvalue()
+    except ValueError as e:
+        logger.warning(f"ИЗОБРАЖЕНИЕ: Встроенное изображение '{part_name}' не разобрано ({e}), оставлено как есть.")
+        return None
+
+def _embedded_image_transform(image_plan):
+    def _transform(info):
+        file_ext_lower = get_file_extension(info.filename)
+        if file_ext_lower not in STRUCTURE_CLEANERS or not EMBEDDED_MEDIA_PATTERN.match(info.filename):
+            return None
+        return lambda data: _clean_embedded_image(data, file_ext_lower, image_plan, info.filename)
+    return _transform
+
+def _resave_image(img, target, file_ext_lower, plan, filename_base, save_format=None, resave_other=True, webp_lossless=False):
+    from PIL import PngImagePlugin, ImageSequence
+
+    # Для путей формат берется из расширения, для потоков его нужно передать явно
+    format_params = {'format': save_format} if save_format else {}
+
+    save_params = {}
+    icc_profile_data = img.info.get('icc_profile')
+    if plan.keep_icc and icc_profile_data:
+        save_params['icc_profile'] = icc_profile_data
+    elif not plan.keep_icc: 
+         save_params['icc_profile'] = b''
+
+    exif_data = _planned_exif(img.info.get('exif'), plan, filename_base)
+
+    if file_ext_lower in ['.jpg', '.jpeg', '.tif', '.tiff']:
+        if exif_data is not None:
+            save_params['exif'] = exif_data
+        
+        if plan.xmp_action != "keep":
+            logger.debug("image.xmp file=%r action=%s backend=pillow", filename_base, plan.xmp_action)
+            save_params['xmp'] = _planned_xmp(img.info.get('xmp'), plan, filename_base)
+        # Pillow переносит IPTC/Photoshop/XMP теги исходного TIFF в новый файл
+        if hasattr(img, 'tag_v2'):
+            if plan.remove_iptc:
+                for iptc_tag in (33723, 34377):
+                    img.tag_v2.pop(iptc_tag, None)
+            if plan.xmp_action == "strip":
+                img.tag_v2.pop(700, None)
+            elif plan.xmp_action == "filter" and 700 in img.tag_v2:
+                img.tag_v2[700] = _planned_xmp(img.tag_v2[700], plan, filename_base)
+        
+        quality_val = 95
+        if img.format == 'JPEG': 
+            # 'keep' берет таблицы квантования и субдискретизацию исходника - без повторных потерь качества
+            quality_val = 'keep'
+        
+        img.save(target, format=img.format, quality=quality_val, **save_params)
+        logger.info("image.resaved file=%r format=%s backend=pillow", filename_base, img.format)
+
+    elif file_ext_lower == '.png':
+        # Запасной путь, если PNG не удалось разобрать по чанкам
+        save_params['pnginfo'] = PngImagePlugin.PngInfo()
+        img.save(target, **format_params, **save_params)
+        logger.info("image.resaved file=%r format=PNG backend=pillow", filename_base)
+
+    elif file_ext_lower == '.webp':
+        if exif_data is not None: save_params['exif'] = exif_data
+        if plan.xmp_action != "keep": save_params['xmp'] = _planned_xmp(img.info.get('xmp'), plan, filename_base)
+        
+        # Запасной путь для WebP, не разобранного по чанкам: качество исходника неизвестно, поэтому высокое
+        save_params['quality'] = img.info.get('quality', 95)
+        save_params['lossless'] = img.info.get('lossless', webp_lossless)
+        try:
+            img.save(target, **format_params, **save_params)
+        except TypeError: 
+             save_params.pop('exif', None); save_params.pop('xmp', None)
+             img.save(target, **format_params, **save_params)
+        logger.info("image.resaved file=%r format=WEBP backend=pillow lossless=%s", filename_base, save_params['lossless'])
     
+    elif file_ext_lower in ['.gif', '.bmp']:
+        # Pillow записывает комментарий GIF из img.info, если его не убрать
+        img.info.pop('comment', None)
+        if file_ext_lower == '.gif' and getattr(img, 'n_frames', 1) > 1:
+            # Все кадры анимации с их задержкой и способом очистки
+            frames, durations, disposals = [], [], []
+            for frame in ImageSequence.Iterator(img):
+                durations.append(frame.info.get('duration', 0))
+                disposals.append(getattr(frame, 'disposal_method', 0))
+                frame.info.pop('comment', None)
+                frames.append(frame.copy())
+            save_params.update(save_all=True, append_images=frames[1:], duration=durations, disposal=disposals)
+            if 'loop' in img.info: save_params['loop'] = img.info['loop']
+            frames[0].save(target, **format_params, **save_params)
+        else:
+            img.save(target, **format_params, **save_params)
+        logger.info("image.resaved file=%r format=%s backend=pillow", filename_base, img.format)
+    elif resave_other:
+        img.save(target, **format_params, **save_params)
+        logger.info("image.resaved file=%r format=%s backend=pillow", filename_base, img.format)
+
+def clean_image_metadata(filepath, output_path, options=None):
+    filename_base = os.path.basename(filepath)
+    plan = compile_image_plan(options)
     file_ext_lower = os.path.splitext(filepath)[1].lower()
 
+    logger.debug("image.start file=%r exif=%s xmp=%s iptc=%s keep_icc=%s",
+                 filename_base, plan.exif_action, plan.xmp_action, plan.remove_iptc, plan.keep_icc)
+
+    structure_cleaner = STRUCTURE_CLEANERS.get(file_ext_lower)
+    if structure_cleaner:
+        # PNG и JPEG чистятся по структуре без Pillow; Pillow нужен, только если файл не удалось разобрать
+        try:
+            _clean_image_structure(filepath, output_path, structure_cleaner, plan, filename_base)
+            return True
+        except ValueError as e_structure:
+            if file_ext_lower in STRUCTURE_ONLY_EXTENSIONS:
+                logger.error(f"ИЗОБРАЖЕНИЕ: '{filename_base}' не разобран по структуре: {e_structure}")
+                return False
+            logger.warning(f"ИЗОБРАЖЕНИЕ: '{filename_base}' не разобран по структуре ({e_structure}), пересохраняем через Pillow.")
+        except OSError as e:
+            logger.error(f"ИЗОБРАЖЕНИЕ: Ошибка чтения/записи '{filename_base}': {e}")
+            return False
+
+    from PIL import Image, UnidentifiedImageError
+    import piexif
+
+    # piexif.remove вырезает EXIF без перекодирования - подходит, только когда EXIF удаляется целиком
+    strip_exif_with_piexif = plan.exif_action == "strip"
+    _set_cleaner_path(CLEANER_PATH_REENCODE)
+
     try:
         if filepath != output_path:
-            if not (file_ext_lower in ['.jpg', '.jpeg', '.tif', '.tiff'] and should_clean_exif):
-                shutil.copy2(filepath, output_path)
+            if not (file_ext_lower in ['.jpg', '.jpeg', '.tif', '.tiff'] and strip_exif_with_piexif):
+                fast_copy(filepath, output_path)
             current_process_path = output_path 
         else:
             current_process_path = filepath 
-            if file_ext_lower in ['.jpg', '.jpeg', '.tif', '.tiff'] and should_clean_exif:
+            if file_ext_lower in ['.jpg', '.jpeg', '.tif', '.tiff'] and strip_exif_with_piexif:
                  logger.warning(f"ИЗОБРАЖЕНИЕ: piexif.remove не может работать 'на месте' для '{filename_base}'. EXIF будет удален через Pillow.")
 
-        if file_ext_lower in ['.jpg', '.jpeg', '.tif', '.tiff'] and should_clean_exif:
+        if file_ext_lower in ['.jpg', '.jpeg', '.tif', '.tiff'] and strip_exif_with_piexif:
             if filepath == output_path: 
                 temp_fd, temp_name = tempfile.mkstemp(suffix=file_ext_lower)
                 os.close(temp_fd)
                 try:
                     piexif.remove(filepath, temp_name)
                     shutil.move(temp_name, output_path) 
-                    logger.info(f"ИЗОБРАЖЕНИЕ: EXIF удален (piexif, через temp) для '{filename_base}'.")
+                    logger.debug("image.exif_stripped file=%r backend=piexif", filename_base)
                     current_process_path = output_path 
                 except Exception as e_piexif_inplace:
                     logger.warning(f"ИЗОБРАЖЕНИЕ: Ошибка piexif при удалении EXIF (inplace) для '{filename_base}': {e_piexif_inplace}. Продолжаем с Pillow.")
             else: 
                 try:
                     piexif.remove(filepath, output_path)
-                    logger.info(f"ИЗОБРАЖЕНИЕ: EXIF удален (piexif) для '{filename_base}'.")
+                    logger.debug("image.exif_stripped file=%r backend=piexif", filename_base)
                     current_process_path = output_path
                 except Exception as e_piexif:
                     logger.warning(f"ИЗОБРАЖЕНИЕ: Ошибка piexif при удалении EXIF для '{filename_base}': {e_piexif}. Копируем и продолжаем с Pillow.")
-                    shutil.copy2(filepath, output_path) 
+                    fast_copy(filepath, output_path) 
                     current_process_path = output_path
         
         img = Image.open(current_process_path)
-        
-        save_params = {}
-        icc_profile_data = img.info.get('icc_profile')
-        if should_preserve_icc and icc_profile_data:
-            save_params['icc_profile'] = icc_profile_data
-        elif not should_preserve_icc: 
-             save_params['icc_profile'] = b''
-
-        if file_ext_lower in ['.jpg', '.jpeg', '.tif', '.tiff']:
-            if should_clean_exif: 
-                save_params['exif'] = b''
-            elif 'exif' in img.info and not should_clean_exif: 
-                 save_params['exif'] = img.info['exif']
-            
-            if should_try_clean_xmp_iptc:
-                logger.info(f"ИЗОБРАЖЕНИЕ: Попытка удаления XMP/IPTC для '{filename_base}' (Pillow).")
-            
-            quality_val = 95
-            if img.format == 'JPEG': 
-                quality_val = img.info.get('quality', 95) if hasattr(img, 'info') and 'quality' in img.info else getattr(img, 'quality', 95)
-            
-            img.save(output_path, format=img.format, quality=quality_val, **save_params)
-            logger.info(f"ИЗОБРАЖЕНИЕ: '{filename_base}' пересохранен Pillow.")
-
-        elif file_ext_lower == '.png':
-            if should_aggressively_clean_png:
-                new_png_info = PngImagePlugin.PngInfo()
-                save_params['pnginfo'] = new_png_info 
-                logger.info(f"ИЗОБРАЖЕНИЕ: PNG '{filename_base}' агрессивно очищен.")
-            else: 
-                logger.info(f"ИЗОБРАЖЕНИЕ: PNG '{filename_base}' пересохранен (стандартно).")
-            img.save(output_path, **save_params)
-
-        elif file_ext_lower == '.webp':
-            if should_clean_exif: save_params['exif'] = b''
-            if should_try_clean_xmp_iptc: save_params['xmp'] = b''
-            
-            save_params['quality'] = img.info.get('quality', 80)
-            save_params['lossless'] = img.info.get('lossless', False)
-            try:
-                img.save(output_path, **save_params)
-            except TypeError: 
-                 save_params.pop('exif', None); save_params.pop('xmp', None)
-                 img.save(output_path, **save_params)
-            logger.info(f"ИЗОБРАЖЕНИЕ: WebP '{filename_base}' очищен.")
-        
-        elif file_ext_lower in ['.gif', '.bmp']:
-            if file_ext_lower == '.gif':
-                save_params['save_all'] = True
-                if 'duration' in img.info: save_params['duration'] = img.info['duration']
-                if 'loop' in img.info: save_params['loop'] = img.info.get('loop', 0)
-            img.save(output_path, **save_params)
-            logger.info(f"ИЗОБРАЖЕНИЕ: '{filename_base}' (GIF/BMP) пересохранен.")
-        else: 
-            if current_process_path == output_path:
-                 img.save(output_path, **save_params) 
-                 logger.info(f"ИЗОБРАЖЕНИЕ: Файл '{filename_base}' (тип {file_ext_lower}) пересохранен Pillow.")
+        _resave_image(img, output_path, file_ext_lower, plan, filename_base,
+                      resave_other=(current_process_path == output_path),
+                      webp_lossless=(file_ext_lower == '.webp' and _detect_webp_lossless(current_process_path)))
         return True
             
     except FileNotFoundError:
@@ -130,40 +411,92 @@ def clean_image_metadata(filepath, output_path, options=None):
         logger.error(f"ИЗОБРАЖЕНИЕ: Общая ошибка при очистке '{filename_base}': {e}", exc_info=True)
         return False
 
-def clean_pdf_metadata(filepath, output_path, options=None):
-    filename_base = os.path.basename(filepath)
-    if options is None: options = {}
-    should_clean_info_dict = options.get('info_dict', True)
-    should_clean_xmp = options.get('xmp', True)
-    logger.info(f"PDF: Очистка '{filename_base}', Info:{should_clean_info_dict}, XMP:{should_clean_xmp} (pikepdf)")
+def _is_jpeg_image_stream(obj):
+    import pikepdf
+
+    if not isinstance(obj, pikepdf.Stream) or obj.get('/Subtype') != pikepdf.Name.Image:
+        return False
+    filters = obj.get('/Filter')
+    if isinstance(filters, pikepdf.Array):
+        return len(filters) == 1 and filters[0] == pikepdf.Name.DCTDecode
+    return filters == pikepdf.Name.DCTDecode
+
+def _clean_pdf_images(pdf, image_plan, filename_base):
+    # Потоки /DCTDecode - это готовые JPEG-файлы: чистим их сегменты и записываем обратно без перекодирования.
+    # Разбор идет пачками в потоках, запись в pikepdf - только из основного потока
+    streams = [obj for obj in pdf.objects if _is_jpeg_image_stream(obj)]
+    cleaned_count = 0
+    with ThreadPoolExecutor(max_workers=EMBEDDED_MEDIA_WORKERS) as executor:
+        for batch_start in range(0, len(streams), EMBEDDED_MEDIA_WORKERS * 4):
+            check_cancelled()
+            batch = streams[batch_start:batch_start + EMBEDDED_MEDIA_WORKERS * 4]
+            originals = [stream.read_raw_bytes() for stream in batch]
+            results = executor.map(lambda data: _clean_embedded_image(data, '.jpg', image_plan, f"{filename_base}: JPEG"), originals)
+            for stream, original, cleaned in zip(batch, originals, results):
+                if cleaned is not None and cleaned != original:
+                    stream.write(cleaned, filter=stream.Filter, decode_parms=stream.get('/DecodeParms'))
+                    cleaned_count += 1
+    return cleaned_count
+
+def clean_pdf_metadata(filepath, output_path, options=None, image_options=None):
+    import pikepdf
+
+    filename_base = _source_name(filepath)
+    plan = compile_pdf_plan(options)
+    image_plan = compile_image_plan(image_options)
+    logger.debug("pdf.start file=%r info=%s xmp=%s", filename_base, plan.info_action, plan.xmp_action)
     
     try:
         with pikepdf.open(filepath) as pdf:
             was_modified = False
-            if should_clean_info_dict:
+            if plan.info_action == "strip":
                 if pdf.docinfo:
                     del pdf.docinfo 
                     was_modified = True
-                    logger.info(f"PDF: Info-словарь удален для '{filename_base}'.")
+                    logger.debug("pdf.info_removed file=%r", filename_base)
+            elif plan.info_action == "filter" and pdf.docinfo:
+                removed_keys = [key for key in list(pdf.docinfo.keys()) if not plan.keeps_info_key(str(key))]
+                for key in removed_keys:
+                    del pdf.docinfo[key]
+                if removed_keys:
+                    was_modified = True
+                    logger.debug("pdf.info_filtered file=%r keys=%s", filename_base, LogList(removed_keys))
             
-            if should_clean_xmp:
-                if pdf.Root.get("/Metadata"):
+            metadata_stream = pdf.Root.get("/Metadata")
+            if plan.xmp_action == "filter" and metadata_stream is not None:
+                try:
+                    original_xmp = metadata_stream.read_bytes()
+                    filtered_xmp = _filter_xmp_packet(original_xmp, plan.xmp_remove_namespaces)
+                    if filtered_xmp != original_xmp:
+                        metadata_stream.write(filtered_xmp)
+                        was_modified = True
+                        logger.debug("pdf.xmp_filtered file=%r", filename_base)
+                except Exception as e_xmp:
+                    logger.warning(f"PDF: Не удалось отфильтровать XMP '{filename_base}' ({e_xmp}), XMP удален целиком.")
                     del pdf.Root.Metadata
                     was_modified = True
-                    logger.info(f"PDF: XMP метаданные удалены для '{filename_base}'.")
+            elif plan.xmp_action == "strip" and metadata_stream is not None:
+                del pdf.Root.Metadata
+                was_modified = True
+                logger.debug("pdf.xmp_removed file=%r", filename_base)
+
+            images_cleaned = _clean_pdf_images(pdf, image_plan, filename_base)
+            if images_cleaned:
+                was_modified = True
+                logger.debug("pdf.images_cleaned file=%r count=%d", filename_base, images_cleaned)
 
             if was_modified:
                 pdf.save(output_path, fix_metadata_version=False) 
-                logger.info(f"PDF: '{filename_base}' сохранен после очистки.")
+                logger.info("pdf.cleaned file=%r result=saved", filename_base)
             elif filepath != output_path: 
-                shutil.copy2(filepath, output_path)
-                logger.info(f"PDF: '{filename_base}' скопирован (изменений не требовалось).")
+                _copy_through(filepath, output_path)
+                logger.info("pdf.cleaned file=%r result=copied", filename_base)
             else:
-                 logger.info(f"PDF: '{filename_base}' не изменен (метаданных для удаления не было).")
+                 logger.info("pdf.cleaned file=%r result=unchanged", filename_base)
         return True
     except pikepdf.PasswordError:
         logger.error(f"PDF: Файл '{filename_base}' защищен паролем.")
-        if filepath != output_path: shutil.copy2(filepath, output_path)
+        if filepath != output_path: _copy_through(filepath, output_path)
         return False 
     except FileNotFoundError:
         logger.error(f"PDF: Файл не найден: '{filepath}'")
@@ -171,13 +504,13 @@ def clean_pdf_metadata(filepath, output_path, options=None):
     except Exception as e:
         logger.error(f"PDF: Ошибка при очистке '{filename_base}': {e}", exc_info=True)
         try:
-            if filepath != output_path: shutil.copy2(filepath, output_path)
+            if filepath != output_path: _copy_through(filepath, output_path)
         except Exception: pass
         return False
 
-def _clear_office_core_properties(props_obj, options, doc_type=""):
-    if options.get('core_properties', True):
-        logger.info(f"OFFICE ({doc_type}): Очистка основных свойств.")
+def _clear_office_core_properties(props_obj, plan, doc_type=""):
+    if plan.clear_core_properties:
+        logger.debug("office.core_properties doc=%s action=clear", doc_type)
         now_utc = datetime.now(timezone.utc)
         
         attrs_to_clear = {
@@ -194,19 +527,28 @@ def _clear_office_core_properties(props_obj, options, doc_type=""):
             attrs_to_clear.pop('comments', None)
 
         for attr, value in attrs_to_clear.items():
+            # В openpyxl автор и комментарии называются creator/description
+            if OFFICE_PROPERTY_ALIASES.get(attr, attr) not in plan.clear_core_properties:
+                continue
             if hasattr(props_obj, attr):
                 try:
                     setattr(props_obj, attr, value)
+                except ValueError:
+                    remove_element = getattr(getattr(props_obj, '_element', None), f"_remove_{OFFICE_DATE_ELEMENTS.get(attr, attr)}", None)
+                    if value is None and remove_element:
+                        remove_element()
+                    else:
+                        logger.warning(f"OFFICE ({doc_type}): Не удалось установить свойство '{attr}'.")
                 except AttributeError: 
                     logger.warning(f"OFFICE ({doc_type}): Не удалось установить свойство '{attr}'.")
         return True
     else:
-        logger.info(f"OFFICE ({doc_type}): Очистка основных свойств пропущена.")
+        logger.debug("office.core_properties doc=%s action=skip", doc_type)
         return False
         
-def _clear_office_custom_properties(doc_obj, options, doc_type=""):
-    if options.get('custom_properties', False): 
-        logger.info(f"OFFICE ({doc_type}): Попытка очистки пользовательских свойств.")
+def _clear_office_custom_properties(doc_obj, plan, doc_type=""):
+    if plan.custom_properties: 
+        logger.debug("office.custom_properties doc=%s action=clear", doc_type)
         try:
             if doc_type == "DOCX" and hasattr(doc_obj, 'part') and hasattr(doc_obj.part, 'custom_props_part') and doc_obj.part.custom_props_part is not None:
                 logger.warning(f"DOCX: Глубокая очистка custom_properties для '{doc_type}' требует сложной XML-манипуляции и пока не реализована.")
@@ -223,77 +565,141 @@ def _clear_office_custom_properties(doc_obj, options, doc_type=""):
             return False
     return True 
 
-def clean_docx_metadata(filepath, output_path, options=None):
-    filename_base = os.path.basename(filepath)
-    if options is None: options = {}
-    logger.info(f"DOCX: Очистка '{filename_base}' с опциями: {options}")
+def _clean_ooxml_media(output, image_plan, doc_type, filename_base):
+    # Второй проход по сохраненному документу: картинки из media/ чистятся по структуре,
+    # остальные части копируются в сжатом виде, без распаковки
+    transform = _embedded_image_transform(image_plan)
+    is_path = isinstance(output, (str, os.PathLike))
+    if not is_path:
+        output.seek(0)
+        source = io.BytesIO(output.read())
+    with zipfile.ZipFile(output if is_path else source) as archive:
+        media_count = sum(1 for info in archive.infolist() if transform(info))
+    if not media_count:
+        return True
+    logger.debug("office.media doc=%s file=%r count=%d", doc_type, filename_base, media_count)
+    try:
+        with ThreadPoolExecutor(max_workers=EMBEDDED_MEDIA_WORKERS) as executor:
+            if is_path:
+                temp_path = temp_output_path(output)
+                try:
+                    with open(output, 'rb') as src, open(temp_path, 'wb') as dst:
+                        rewrite_zip(src, dst, transform, executor=executor)
+                    os.replace(temp_path, output)
+                finally:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+            else:
+                output.seek(0)
+                output.truncate()
+                rewrite_zip(source, output, transform, executor=executor)
+        return True
+    except (ValueError, zipfile.BadZipFile) as e:
+        logger.error(f"OFFICE ({doc_type}): Встроенные изображения '{filename_base}' не очищены: {e}")
+        return False
+
+def clean_docx_metadata(filepath, output_path, options=None, image_options=None):
+    from docx import Document as DocxDocument
+
+    filename_base = _source_name(filepath)
+    plan = compile_office_plan(options)
+    logger.debug("office.start doc=DOCX file=%r plan=%s", filename_base, plan)
     try:
         doc = DocxDocument(filepath)
-        core_cleaned = _clear_office_core_properties(doc.core_properties, options, "DOCX")
-        custom_cleaned_attempt = _clear_office_custom_properties(doc, options, "DOCX")
+        core_cleaned = _clear_office_core_properties(doc.core_properties, plan, "DOCX")
+        custom_cleaned_attempt = _clear_office_custom_properties(doc, plan, "DOCX")
         doc.save(output_path)
-        return core_cleaned 
+        media_cleaned = _clean_ooxml_media(output_path, compile_image_plan(image_options), "DOCX", filename_base)
+        return core_cleaned and media_cleaned 
     except Exception as e:
         logger.error(f"DOCX: Ошибка '{filename_base}': {e}", exc_info=True)
         return False
 
-def clean_xlsx_metadata(filepath, output_path, options=None):
-    filename_base = os.path.basename(filepath)
-    if options is None: options = {}
-    logger.info(f"XLSX: Очистка '{filename_base}' с опциями: {options}")
+def clean_xlsx_metadata(filepath, output_path, options=None, image_options=None):
+    from openpyxl import load_workbook
+
+    filename_base = _source_name(filepath)
+    plan = compile_office_plan(options)
+    logger.debug("office.start doc=XLSX file=%r plan=%s", filename_base, plan)
     try:
         workbook = load_workbook(filepath)
-        core_cleaned = _clear_office_core_properties(workbook.properties, options, "XLSX")
-        custom_cleaned_attempt = _clear_office_custom_properties(workbook, options, "XLSX")
+        core_cleaned = _clear_office_core_properties(workbook.properties, plan, "XLSX")
+        custom_cleaned_attempt = _clear_office_custom_properties(workbook, plan, "XLSX")
         workbook.save(output_path)
-        return core_cleaned
+        media_cleaned = _clean_ooxml_media(output_path, compile_image_plan(image_options), "XLSX", filename_base)
+        return core_cleaned and media_cleaned
     except Exception as e:
         logger.error(f"XLSX: Ошибка '{filename_base}': {e}", exc_info=True)
         return False
 
-def clean_pptx_metadata(filepath, output_path, options=None):
-    filename_base = os.path.basename(filepath)
-    if options is None: options = {}
-    logger.info(f"PPTX: Очистка '{filename_base}' с опциями: {options}")
+def clean_pptx_metadata(filepath, output_path, options=None, image_options=None):
+    from pptx import Presentation
+
+    filename_base = _source_name(filepath)
+    plan = compile_office_plan(options)
+    logger.debug("office.start doc=PPTX file=%r plan=%s", filename_base, plan)
     try:
         prs = Presentation(filepath)
-        core_cleaned = _clear_office_core_properties(prs.core_properties, options, "PPTX")
-        custom_cleaned_attempt = _clear_office_custom_properties(prs, options, "PPTX")
+        core_cleaned = _clear_office_core_properties(prs.core_properties, plan, "PPTX")
+        custom_cleaned_attempt = _clear_office_custom_properties(prs, plan, "PPTX")
         prs.save(output_path)
-        return core_cleaned
+        media_cleaned = _clean_ooxml_media(output_path, compile_image_plan(image_options), "PPTX", filename_base)
+        return core_cleaned and media_cleaned
     except Exception as e:
         logger.error(f"PPTX: Ошибка '{filename_base}': {e}", exc_info=True)
         return False
 
-def clean_metadata(filepath, output_path, file_extension, cleaning_options_from_profile):
+def clean_metadata(filepath, output_path, file_extension, cleaning_options_from_profile, committer=None, atomic=True):
+    # atomic=False - output_path уже временный файл вызывающего, который сам его зафиксирует или удалит:
+    # так убитый на таймауте или отмене рабочий процесс не оставляет второго временного файла
+    if not atomic or os.path.abspath(filepath) == os.path.abspath(output_path):
+        return _clean_metadata_to_path(filepath, output_path, file_extension, cleaning_options_from_profile)
+
+    # Пишем во временное имя рядом с результатом: недописанный файл никогда не виден под итоговым именем
+    committer = committer or _default_committer
+    temp_path = committer.reserve(output_path)
+    try:
+        processed = _clean_metadata_to_path(filepath, temp_path, file_extension, cleaning_options_from_profile)
+        if processed:
+            committer.commit(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path) and committer.locate(output_path) != temp_path:
+            committer.discard(temp_path)
+    return processed
+
+def _clean_metadata_to_path(filepath, output_path, file_extension, cleaning_options_from_profile):
     filename_base = os.path.basename(filepath)
-    logger.debug(f"ДИСПЕТЧЕР: Обработка '{filename_base}', расширение: '{file_extension}'. Используются опции из профиля.")
+    logger.debug("dispatch.file file=%r ext=%s", filename_base, file_extension)
     
     processed = False
-    image_extensions = ['.jpg', '.jpeg', '.tiff', '.tif', '.png', '.gif', '.webp', '.bmp']
-    
-    options_for_type = {} 
+    plan = compile_cleaning_plan(cleaning_options_from_profile)
+    _set_cleaner_path(CLEANER_PATH_LOSSLESS)
 
-    if file_extension in image_extensions:
-        options_for_type = cleaning_options_from_profile.get('images', {}).copy() 
-        processed = clean_image_metadata(filepath, output_path, options=options_for_type)
+    if file_extension in IMAGE_EXTENSIONS:
+        processed = clean_image_metadata(filepath, output_path, options=plan.images)
     elif file_extension == '.pdf':
-        options_for_type = cleaning_options_from_profile.get('pdf', {})
-        processed = clean_pdf_metadata(filepath, output_path, options=options_for_type)
+        processed = clean_pdf_metadata(filepath, output_path, options=plan.pdf, image_options=plan.images)
     elif file_extension == '.docx':
-        options_for_type = cleaning_options_from_profile.get('office', {})
-        processed = clean_docx_metadata(filepath, output_path, options=options_for_type)
+        processed = clean_docx_metadata(filepath, output_path, options=plan.office, image_options=plan.images)
     elif file_extension == '.xlsx':
-        options_for_type = cleaning_options_from_profile.get('office', {})
-        processed = clean_xlsx_metadata(filepath, output_path, options=options_for_type)
+        processed = clean_xlsx_metadata(filepath, output_path, options=plan.office, image_options=plan.images)
     elif file_extension == '.pptx':
-        options_for_type = cleaning_options_from_profile.get('office', {})
-        processed = clean_pptx_metadata(filepath, output_path, options=options_for_type)
+        processed = clean_pptx_metadata(filepath, output_path, options=plan.office, image_options=plan.images)
+    elif file_extension in ODF_EXTENSIONS or file_extension in OLE2_EXTENSIONS:
+        processed = clean_document_container(filepath, output_path, file_extension, options=plan.office, image_options=plan.images)
+    elif file_extension in VIDEO_EXTENSIONS:
+        processed = clean_video_metadata(filepath, output_path, options=plan.video)
+    elif file_extension in AUDIO_EXTENSIONS:
+        processed = clean_audio_metadata(filepath, output_path, file_extension, options=plan.audio)
+    elif file_extension in ARCHIVE_EXTENSIONS:
+        from archive_cleaner import clean_archive_metadata
+        processed = clean_archive_metadata(filepath, output_path, plan)
     else:
         logger.warning(f"ДИСПЕТЧЕР: Неподдерживаемый тип '{file_extension}'. Файл '{filename_base}' будет скопирован.")
+        _set_cleaner_path(CLEANER_PATH_COPY)
         try:
-            if filepath != output_path: shutil.copy2(filepath, output_path)
-            else: logger.info(f"ДИСПЕТЧЕР: Исходный и целевой пути совпадают для '{filename_base}'.")
+            if filepath != output_path: fast_copy(filepath, output_path)
+            else: logger.debug("dispatch.same_path file=%r", filename_base)
             return True 
         except Exception as e:
             logger.error(f"ДИСПЕТЧЕР: Ошибка копирования '{filename_base}': {e}", exc_info=True)
@@ -302,3 +708,161 @@ def clean_metadata(filepath, output_path, file_extension, cleaning_options_from_
     if not processed:
         logger.error(f"ДИСПЕТЧЕР: Очистка не удалась для '{filename_base}'.")
     return processed
+
+def _clean_streamed(source, target, cleaner, category, filename_base, event):
+    # Потоковая очистка (видео, аудио): память не зависит от размера файла
+    try:
+        if isinstance(source, (str, os.PathLike)):
+            # На месте файл не держим в памяти: пишем рядом и подменяем исходник переименованием
+            output_path = temp_output_path(target) if source == target else target
+            try:
+                with open(source, 'rb') as src, open(output_path, 'wb') as dst:
+                    removed = cleaner(src, dst)
+                if output_path != target:
+                    os.replace(output_path, target)
+            except BaseException:
+                if output_path != target and os.path.exists(output_path):
+                    os.remove(output_path)
+                raise
+        else:
+            removed = cleaner(source, target)
+        logger.info("%s.cleaned file=%r removed=%s", event, filename_base, LogList(removed))
+        return True
+    except ValueError as e:
+        logger.error(f"{category}: '{filename_base}' не разобран: {e}")
+        return False
+    except OSError as e:
+        logger.error(f"{category}: Ошибка чтения/записи '{filename_base}': {e}")
+        return False
+
+def clean_video_metadata(source, target, options=None):
+    # MP4/MOV переписываются по атомам: без перекодирования и без чтения mdat в память
+    filename_base = _source_name(source)
+    plan = compile_video_plan(options)
+    logger.debug("video.start file=%r metadata=%s timestamps=%s", filename_base, plan.remove_metadata, plan.clear_timestamps)
+    return _clean_streamed(source, target, lambda src, dst: clean_mp4(src, dst, plan), "ВИДЕО", filename_base, "video")
+
+def clean_document_container(source, target, file_extension, options=None, image_options=None):
+    # ODF и старые форматы Office чистятся без разбора документа: в ODF переписывается только meta.xml
+    # (и картинки из Pictures/), в OLE2 - потоки SummaryInformation/DocumentSummaryInformation поверх своих же секторов
+    filename_base = _source_name(source)
+    plan = compile_office_plan(options)
+    doc_type = file_extension.lstrip('.').upper()
+    logger.debug("office.start doc=%s file=%r method=container", doc_type, filename_base)
+    if file_extension in OLE2_EXTENSIONS:
+        return _clean_streamed(source, target, lambda src, dst: clean_ole2(src, dst, plan), f"OFFICE ({doc_type})", filename_base, "office")
+    media_transform = _embedded_image_transform(compile_image_plan(image_options))
+    with ThreadPoolExecutor(max_workers=EMBEDDED_MEDIA_WORKERS) as executor:
+        return _clean_streamed(source, target, lambda src, dst: clean_odf(src, dst, plan, media_transform, executor),
+                               f"OFFICE ({doc_type})", filename_base, "office")
+
+def clean_audio_metadata(source, target, file_extension, options=None):
+    # Теги снимаются на уровне кадров/блоков/страниц контейнера, звук не декодируется
+    filename_base = _source_name(source)
+    plan = compile_audio_plan(options)
+    logger.debug("audio.start file=%r tags=%s", filename_base, plan.remove_tags)
+    return _clean_streamed(source, target, lambda src, dst: clean_audio_stream(src, dst, file_extension, plan),
+                           "АУДИО", filename_base, "audio")
+
+def _as_bytes(data):
+    if isinstance(data, bytes):
+        return data
+    if isinstance(data, (bytearray, memoryview)):
+        return bytes(data)
+    if hasattr(data, 'read'):
+        return data.read()
+    raise TypeError(f"Ожидались bytes, memoryview или бинарный поток, получено {type(data).__name__}")
+
+def clean_image_bytes(data, file_extension, options=None):
+    plan = compile_image_plan(options)
+    file_ext_lower = file_extension.lower()
+    filename_base = _source_name(data)
+    try:
+        source_bytes = _as_bytes(data)
+    except Exception as e:
+        logger.error(f"ИЗОБРАЖЕНИЕ: Не удалось прочитать входные данные ({file_ext_lower}): {e}", exc_info=True)
+        return None
+
+    structure_cleaner = STRUCTURE_CLEANERS.get(file_ext_lower)
+    if structure_cleaner:
+        try:
+            output_buffer = io.BytesIO()
+            structure_cleaner(io.BytesIO(source_bytes), output_buffer, plan, filename_base)
+            return output_buffer.getvalue()
+        except ValueError as e_structure:
+            if file_ext_lower in STRUCTURE_ONLY_EXTENSIONS:
+                logger.error(f"ИЗОБРАЖЕНИЕ: Данные {file_ext_lower} не разобраны по структуре: {e_structure}")
+                return None
+            logger.warning(f"ИЗОБРАЖЕНИЕ: Данные {file_ext_lower} не разобраны по структуре ({e_structure}), пересохраняем через Pillow.")
+
+    from PIL import Image, UnidentifiedImageError
+    import piexif
+
+    try:
+        stage_bytes = source_bytes
+        if file_ext_lower in ['.jpg', '.jpeg'] and plan.exif_action == "strip":
+            try:
+                stage_buffer = io.BytesIO()
+                piexif.remove(source_bytes, stage_buffer)
+                stage_bytes = stage_buffer.getvalue()
+                logger.debug("image.exif_stripped file=%r backend=piexif", filename_base)
+            except Exception as e_piexif:
+                logger.warning(f"ИЗОБРАЖЕНИЕ: Ошибка piexif при удалении EXIF (в памяти): {e_piexif}. Продолжаем с Pillow.")
+
+        img = Image.open(io.BytesIO(stage_bytes))
+        output_buffer = io.BytesIO()
+        save_format = Image.registered_extensions().get(file_ext_lower, img.format)
+        _resave_image(img, output_buffer, file_ext_lower, plan, filename_base, save_format=save_format,
+                      webp_lossless=(file_ext_lower == '.webp' and _detect_webp_lossless(stage_bytes)))
+        return output_buffer.getvalue()
+    except UnidentifiedImageError:
+        logger.error(f"ИЗОБРАЖЕНИЕ: Не удалось распознать данные как изображение ({file_ext_lower}).")
+        return None
+    except Exception as e:
+        logger.error(f"ИЗОБРАЖЕНИЕ: Ошибка при очистке в памяти ({file_ext_lower}): {e}", exc_info=True)
+        return None
+
+def clean_metadata_bytes(data, file_extension, cleaning_options_from_profile):
+    file_extension = file_extension.lower()
+    logger.debug("dispatch.bytes ext=%s", file_extension)
+
+    plan = compile_cleaning_plan(cleaning_options_from_profile)
+    if file_extension in IMAGE_EXTENSIONS:
+        return clean_image_bytes(data, file_extension, options=plan.images)
+
+    try:
+        source_buffer = io.BytesIO(_as_bytes(data))
+    except Exception as e:
+        logger.error(f"ДИСПЕТЧЕР: Не удалось прочитать входные данные: {e}", exc_info=True)
+        return None
+
+    output_buffer = io.BytesIO()
+    if file_extension == '.pdf':
+        processed = clean_pdf_metadata(source_buffer, output_buffer, options=plan.pdf, image_options=plan.images)
+    elif file_extension == '.docx':
+        processed = clean_docx_metadata(source_buffer, output_buffer, options=plan.office, image_options=plan.images)
+    elif file_extension == '.xlsx':
+        processed = clean_xlsx_metadata(source_buffer, output_buffer, options=plan.office, image_options=plan.images)
+    elif file_extension == '.pptx':
+        processed = clean_pptx_metadata(source_buffer, output_buffer, options=plan.office, image_options=plan.images)
+    elif file_extension in ODF_EXTENSIONS or file_extension in OLE2_EXTENSIONS:
+        processed = clean_document_container(source_buffer, output_buffer, file_extension, options=plan.office, image_options=plan.images)
+    elif file_extension in VIDEO_EXTENSIONS:
+        processed = clean_video_metadata(source_buffer, output_buffer, options=plan.video)
+    elif file_extension in AUDIO_EXTENSIONS:
+        processed = clean_audio_metadata(source_buffer, output_buffer, file_extension, options=plan.audio)
+    else:
+        logger.warning(f"ДИСПЕТЧЕР: Неподдерживаемый тип '{file_extension}'. Данные возвращены без изменений.")
+        return source_buffer.getvalue()
+
+    if not processed:
+        logger.error(f"ДИСПЕТЧЕР: Очистка в памяти не удалась ({file_extension}).")
+        return None
+    return output_buffer.getvalue()
+
+def clean_metadata_to_stream(data, output_stream, file_extension, cleaning_options_from_profile):
+    cleaned = clean_metadata_bytes(data, file_extension, cleaning_options_from_profile)
+    if cleaned is None:
+        return False
+    output_stream.write(cleaned)
+    return True
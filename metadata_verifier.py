@@ -0,0 +1,485 @@
+# StealthShare v0.1 pre1
+# Copyright (c) 2025 IQUXAe
+# Released under the MIT License. See LICENSE file for details.
+
+import os
+import re
+import zlib
+import struct
+import zipfile
+
+from utils import logger, FILE_CATEGORIES
+from profiles import compile_cleaning_plan, PNG_TEXT_CHUNKS, XMP_NAMESPACE_PREFIXES
+from isobmff import read_heif_metadata, read_jxl_metadata, read_mp4_metadata
+from audio_cleaner import has_audio_tags
+from odf_cleaner import ODF_EXTENSIONS, read_odf_meta, odf_meta_elements, find_odf_meta_elements, ODF_CUSTOM_ELEMENTS
+from ole2_cleaner import OLE2_EXTENSIONS, find_ole2_properties
+
+# Классы метаданных, которые может найти проверка
+META_EXIF = "exif"
+META_GPS = "gps"
+META_XMP = "xmp"
+META_IPTC = "iptc"
+# Автор и правообладатель: XMP dc:creator, IPTC By-line (2:80) и Copyright Notice (2:116)
+META_AUTHOR = "author"
+META_PNG_TEXT = "png_text"
+META_THUMBNAIL = "thumbnail"
+META_VIDEO = "video_metadata"
+META_VIDEO_TIME = "video_timestamps"
+META_AUDIO_TAGS = "audio_tags"
+META_PDF_INFO = "pdf_info"
+META_PDF_XMP = "pdf_xmp"
+META_OOXML_CORE = "ooxml_core"
+META_OOXML_CUSTOM = "ooxml_custom"
+
+SCAN_CHUNK_SIZE = 1024 * 1024
+
+TIFF_TAG_EXIF_IFD = 34665
+TIFF_TAG_GPS_IFD = 34853
+TIFF_TAG_XMP = 700
+TIFF_TAG_IPTC = 33723
+TIFF_TAG_PHOTOSHOP = 34377
+TIFF_TAG_NEW_SUBFILE_TYPE = 254
+
+XMP_APP1_HEADER = b"http://ns.adobe.com/xap/1.0/\x00"
+XMP_EXTENSION_APP1_HEADER = b"http://ns.adobe.com/xmp/extension/\x00"
+XMP_BODY_PATTERN = re.compile(rb"<x:xmpmeta.*?</x:xmpmeta>|<rdf:RDF.*?</rdf:RDF>", re.S)
+XMP_GPS_PREFIX = "{" + XMP_NAMESPACE_PREFIXES["exif"] + "}GPS"
+XMP_GPS_PROPERTIES = (XMP_GPS_PREFIX + "Latitude", XMP_GPS_PREFIX + "Longitude")
+XMP_CREATOR_PROPERTY = "{" + XMP_NAMESPACE_PREFIXES["dc"] + "}creator"
+IPTC_AUTHOR_DATASETS = {(2, 80), (2, 116)}
+PHOTOSHOP_IPTC_RESOURCE = 0x0404
+PNG_XMP_KEYWORD = b"XML:com.adobe.xmp"
+PNG_IPTC_KEYWORD = b"Raw profile type iptc"
+TIFF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 7: 1}
+
+# Значения, которые StealthShare сам записывает в core.xml вместо данных пользователя
+OOXML_PLACEHOLDER_VALUES = {"", "StealthShare User", "StealthShare", "1"}
+OOXML_PERSONAL_CORE_ELEMENTS = (
+    "dc:creator", "cp:lastModifiedBy", "dc:title", "dc:subject", "dc:description",
+    "cp:keywords", "cp:category", "cp:contentStatus", "dc:identifier", "dc:language",
+    "cp:version", "cp:lastPrinted", "cp:revision"
+)
+
+
+def get_forbidden_classes(file_extension, cleaning_options_from_profile):
+    plan = compile_cleaning_plan(cleaning_options_from_profile)
+    forbidden = set()
+    if file_extension in ('.jpg', '.jpeg', '.tif', '.tiff', '.png', '.webp', '.gif', '.bmp', '.heic', '.heif', '.avif', '.jxl'):
+        images = plan.images
+        if images.exif_action == "strip":
+            forbidden.add(META_EXIF)
+        # GPS и автор хранятся и в EXIF/IPTC, и в XMP - запрещены, только если профиль удаляет все копии
+        if not images.keeps_exif_tag(TIFF_TAG_GPS_IFD) and all(map(images.removes_xmp_property, XMP_GPS_PROPERTIES)):
+            forbidden.add(META_GPS)
+        if images.remove_iptc and images.removes_xmp_property(XMP_CREATOR_PROPERTY):
+            forbidden.add(META_AUTHOR)
+        if images.xmp_action == "strip":
+            forbidden.add(META_XMP)
+        if images.remove_iptc:
+            forbidden.add(META_IPTC)
+        if images.remove_thumbnail:
+            forbidden.add(META_THUMBNAIL)
+        if file_extension == '.png' and not any(images.keeps_png_chunk(chunk) for chunk in PNG_TEXT_CHUNKS):
+            forbidden.add(META_PNG_TEXT)
+    elif file_extension == '.pdf':
+        if plan.pdf.info_action == "strip":
+            forbidden.add(META_PDF_INFO)
+        if plan.pdf.xmp_action == "strip":
+            forbidden.add(META_PDF_XMP)
+    elif file_extension in ('.mp4', '.mov', '.m4v'):
+        if plan.video.remove_metadata:
+            forbidden.add(META_VIDEO)
+        if plan.video.clear_timestamps:
+            forbidden.add(META_VIDEO_TIME)
+    elif file_extension in FILE_CATEGORIES["Audio"]:
+        if plan.audio.remove_tags:
+            forbidden.add(META_AUDIO_TAGS)
+    elif file_extension in ('.docx', '.xlsx', '.pptx', *ODF_EXTENSIONS, *OLE2_EXTENSIONS):
+        # Частично сохраненные свойства проверка не отличит от личных, поэтому проверяем только полную очистку
+        if plan.office.clears_all_core_properties:
+            forbidden.add(META_OOXML_CORE)
+        if plan.office.custom_properties:
+            forbidden.add(META_OOXML_CUSTOM)
+    return forbidden
+
+
+def _tiff_ifd_has_gps(tiff_data):
+    # tiff_data - содержимое EXIF (TIFF-структура), ищем указатель на GPS IFD в IFD0
+    if len(tiff_data) < 8 or tiff_data[:2] not in (b"II", b"MM"):
+        return False
+    endian = "<" if tiff_data[:2] == b"II" else ">"
+    ifd_offset = struct.unpack_from(endian + "I", tiff_data, 4)[0]
+    if ifd_offset + 2 > len(tiff_data):
+        return False
+    entry_count = struct.unpack_from(endian + "H", tiff_data, ifd_offset)[0]
+    for index in range(entry_count):
+        entry_offset = ifd_offset + 2 + index * 12
+        if entry_offset + 2 > len(tiff_data):
+            break
+        if struct.unpack_from(endian + "H", tiff_data, entry_offset)[0] == TIFF_TAG_GPS_IFD:
+            return True
+    return False
+
+def _tiff_has_thumbnail(tiff_data):
+    # Миниатюра EXIF живет в IFD1 - на него указывает поле "следующий IFD" в конце IFD0
+    if len(tiff_data) < 8 or tiff_data[:2] not in (b"II", b"MM"):
+        return False
+    endian = "<" if tiff_data[:2] == b"II" else ">"
+    ifd_offset = struct.unpack_from(endian + "I", tiff_data, 4)[0]
+    if ifd_offset + 2 > len(tiff_data):
+        return False
+    next_position = ifd_offset + 2 + struct.unpack_from(endian + "H", tiff_data, ifd_offset)[0] * 12
+    return next_position + 4 <= len(tiff_data) and struct.unpack_from(endian + "I", tiff_data, next_position)[0] != 0
+
+def _exif_classes(tiff_data):
+    found = {META_EXIF}
+    if _tiff_ifd_has_gps(tiff_data):
+        found.add(META_GPS)
+    if _tiff_has_thumbnail(tiff_data):
+        found.add(META_THUMBNAIL)
+    return found
+
+def _xmp_property_names(packet):
+    import xml.etree.ElementTree as ET
+    match = XMP_BODY_PATTERN.search(packet)
+    if not match:
+        raise ValueError("в пакете XMP не найден корневой элемент")
+    names = set()
+    for element in ET.fromstring(match.group(0)).iter():
+        if isinstance(element.tag, str):
+            names.add(element.tag)
+        names.update(element.attrib)
+    return names
+
+def _xmp_classes(packet):
+    found = {META_XMP}
+    try:
+        names = _xmp_property_names(packet)
+    except Exception:
+        # Неразборчивый пакет (например, кусок расширенного XMP) проверяем по обычным префиксам
+        if b"exif:GPS" in packet:
+            found.add(META_GPS)
+        if b"dc:creator" in packet:
+            found.add(META_AUTHOR)
+        return found
+    if any(name.startswith(XMP_GPS_PREFIX) for name in names):
+        found.add(META_GPS)
+    if XMP_CREATOR_PROPERTY in names:
+        found.add(META_AUTHOR)
+    return found
+
+def _iptc_classes(iim_data):
+    # Наборы данных IIM: 0x1C, запись, номер, длина (старший бит - длина записана в следующих байтах)
+    found = {META_IPTC}
+    position = 0
+    while position + 5 <= len(iim_data) and iim_data[position] == 0x1C:
+        record, dataset, length = struct.unpack_from(">BBH", iim_data, position + 1)
+        header = 5
+        if length & 0x8000:
+            header += length & 0x7FFF
+            length = int.from_bytes(iim_data[position + 5:position + header], "big")
+        if (record, dataset) in IPTC_AUTHOR_DATASETS:
+            found.add(META_AUTHOR)
+        position += header + length
+    return found
+
+def _photoshop_classes(irb_data):
+    # Ресурсы Photoshop: "8BIM", номер, имя (Pascal-строка, выровнена до четной длины), размер, данные
+    found = set()
+    position = 0
+    while position + 12 <= len(irb_data) and irb_data[position:position + 4] == b"8BIM":
+        resource_id, name_length = struct.unpack_from(">HB", irb_data, position + 4)
+        position += 6 + name_length + 1 + ((name_length + 1) & 1)
+        if position + 4 > len(irb_data):
+            break
+        size = struct.unpack_from(">I", irb_data, position)[0]
+        position += 4
+        if resource_id == PHOTOSHOP_IPTC_RESOURCE:
+            found.update(_iptc_classes(irb_data[position:position + size]))
+        position += size + (size & 1)
+    if not found and b"8BIM\x04\x04" in irb_data:
+        found.add(META_IPTC)
+    return found
+
+def _scan_jpeg(f):
+    found = set()
+    if f.read(2) != b"\xff\xd8":
+        return found
+    while True:
+        marker_prefix = f.read(1)
+        if not marker_prefix:
+            break
+        if marker_prefix != b"\xff":
+            continue
+        marker = f.read(1)
+        while marker == b"\xff":
+            marker = f.read(1)
+        if not marker or marker in (b"\xd9", b"\xda"):
+            # Дошли до данных изображения - дальше заголовочных сегментов нет
+            break
+        if b"\xd0" <= marker <= b"\xd7" or marker == b"\x01":
+            continue
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            break
+        segment = f.read(struct.unpack(">H", length_bytes)[0] - 2)
+        if marker == b"\xe1":
+            if segment.startswith(b"Exif\x00\x00"):
+                found.update(_exif_classes(segment[6:]))
+            elif segment.startswith(XMP_APP1_HEADER) or segment.startswith(XMP_EXTENSION_APP1_HEADER):
+                found.update(_xmp_classes(segment))
+        elif marker == b"\xed" and segment.startswith(b"Photoshop 3.0\x00"):
+            found.update(_photoshop_classes(segment[14:]))
+    return found
+
+def _png_text(chunk_type, data):
+    # tEXt: ключ\0 текст; zTXt: ключ\0 метод сжатый_текст; iTXt: ключ\0 флаг метод язык\0 перевод\0 текст
+    keyword, rest = data.split(b"\x00", 1)
+    if chunk_type == b"tEXt":
+        return rest
+    if chunk_type == b"zTXt":
+        return zlib.decompress(rest[1:])
+    compressed, rest = rest[0], rest[2:]
+    text = rest.split(b"\x00", 2)[-1]
+    return zlib.decompress(text) if compressed else text
+
+def _png_iptc_classes(text):
+    # Формат ImageMagick: \nимя\n длина\n шестнадцатеричные строки; внутри - ресурсы Photoshop или IIM
+    try:
+        data = bytes.fromhex(b"".join(text.strip().split(b"\n")[2:]).decode("ascii"))
+    except ValueError:
+        return {META_IPTC}
+    return (_photoshop_classes(data) if data.startswith(b"8BIM") else _iptc_classes(data)) or {META_IPTC}
+
+def _scan_png(f):
+    found = set()
+    if f.read(8) != b"\x89PNG\r\n\x1a\n":
+        return found
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            break
+        length, chunk_type = struct.unpack(">I4s", header)
+        if chunk_type == b"IEND":
+            break
+        if chunk_type == b"eXIf":
+            found.update(_exif_classes(f.read(length)))
+            f.seek(4, os.SEEK_CUR)
+            continue
+        if chunk_type in (b"tEXt", b"zTXt", b"iTXt"):
+            keyword = f.read(min(length, 80)).split(b"\x00", 1)[0]
+            if keyword in (PNG_XMP_KEYWORD, PNG_IPTC_KEYWORD):
+                f.seek(-min(length, 80), os.SEEK_CUR)
+                text = _png_text(chunk_type, f.read(length))
+                found.update(_xmp_classes(text) if keyword == PNG_XMP_KEYWORD else _png_iptc_classes(text))
+                f.seek(4, os.SEEK_CUR)
+                continue
+            found.add(META_EXIF if keyword == b"Raw profile type exif" else META_PNG_TEXT)
+            f.seek(length - min(length, 80) + 4, os.SEEK_CUR)
+            continue
+        if chunk_type == b"tIME":
+            found.add(META_PNG_TEXT)
+        f.seek(length + 4, os.SEEK_CUR)
+    return found
+
+def _scan_webp(f):
+    found = set()
+    header = f.read(12)
+    if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WEBP":
+        return found
+    while True:
+        chunk_header = f.read(8)
+        if len(chunk_header) < 8:
+            break
+        chunk_type, length = struct.unpack("<4sI", chunk_header)
+        if chunk_type == b"EXIF":
+            exif_data = f.read(length)
+            if exif_data.startswith(b"Exif\x00\x00"):
+                exif_data = exif_data[6:]
+            found.update(_exif_classes(exif_data))
+            f.seek(length & 1, os.SEEK_CUR)
+            continue
+        if chunk_type == b"XMP ":
+            found.update(_xmp_classes(f.read(length)))
+            f.seek(length & 1, os.SEEK_CUR)
+            continue
+        f.seek(length + (length & 1), os.SEEK_CUR)
+    return found
+
+def _scan_tiff(f):
+    found = set()
+    header = f.read(8)
+    if len(header) < 8 or header[:2] not in (b"II", b"MM"):
+        return found
+    endian = "<" if header[:2] == b"II" else ">"
+    if struct.unpack_from(endian + "H", header, 2)[0] != 42:
+        return found
+    ifd_offset = struct.unpack_from(endian + "I", header, 4)[0]
+    visited = set()
+    tag_classes = {TIFF_TAG_EXIF_IFD: (META_EXIF,), TIFF_TAG_GPS_IFD: (META_EXIF, META_GPS)}
+    # Содержимое этих тегов разбирается, чтобы найти GPS и автора
+    tag_parsers = {TIFF_TAG_XMP: _xmp_classes, TIFF_TAG_IPTC: _iptc_classes, TIFF_TAG_PHOTOSHOP: _photoshop_classes}
+    # Проходим по цепочке IFD (страницы многостраничного TIFF)
+    while ifd_offset and ifd_offset not in visited and len(visited) < 1024:
+        visited.add(ifd_offset)
+        f.seek(ifd_offset)
+        count_bytes = f.read(2)
+        if len(count_bytes) < 2:
+            break
+        entry_count = struct.unpack(endian + "H", count_bytes)[0]
+        entries = f.read(entry_count * 12 + 4)
+        for index in range(min(entry_count, len(entries) // 12)):
+            tag, value_type, count = struct.unpack_from(endian + "HHI", entries, index * 12)
+            if tag in tag_classes:
+                found.update(tag_classes[tag])
+            elif tag in tag_parsers:
+                size = count * TIFF_TYPE_SIZES.get(value_type, 1)
+                if size <= 4:
+                    value = entries[index * 12 + 8:index * 12 + 8 + size]
+                else:
+                    f.seek(struct.unpack_from(endian + "I", entries, index * 12 + 8)[0])
+                    value = f.read(size)
+                found.update(tag_parsers[tag](value))
+            elif tag == TIFF_TAG_NEW_SUBFILE_TYPE and len(visited) > 1:
+                # Бит 0 - уменьшенная копия предыдущей страницы, то есть миниатюра
+                value_format = endian + ("H" if value_type == 3 else "I")
+                if struct.unpack_from(value_format, entries, index * 12 + 8)[0] & 1:
+                    found.add(META_THUMBNAIL)
+        if len(entries) < entry_count * 12 + 4:
+            break
+        ifd_offset = struct.unpack_from(endian + "I", entries, entry_count * 12)[0]
+    return found
+
+def _scan_box_metadata(items):
+    found = set()
+    for kind, data in items:
+        if kind == "xmp":
+            found.update(_xmp_classes(data))
+            continue
+        found.add(META_EXIF)
+        # Элемент/бокс Exif: 4 байта смещения до заголовка TIFF, затем сам блок
+        if len(data) >= 4:
+            found.update(_exif_classes(data[4 + struct.unpack_from(">I", data, 0)[0]:]))
+    return found
+
+def _scan_heif(f):
+    return _scan_box_metadata(read_heif_metadata(f))
+
+def _scan_jxl(f):
+    return _scan_box_metadata(read_jxl_metadata(f))
+
+def _scan_mp4(f):
+    classes = {"metadata": META_VIDEO, "timestamps": META_VIDEO_TIME}
+    return {classes[kind] for kind in read_mp4_metadata(f)}
+
+def _audio_scanner(file_extension):
+    return lambda f: {META_AUDIO_TAGS} if has_audio_tags(f, file_extension) else set()
+
+def _scan_for_markers(f, markers):
+    # Последовательное чтение блоками с перекрытием, чтобы маркер не разрезался границей блока
+    found_markers = set()
+    overlap = max(len(marker) for marker in markers) - 1
+    tail = b""
+    while True:
+        chunk = f.read(SCAN_CHUNK_SIZE)
+        if not chunk:
+            break
+        window = tail + chunk
+        for marker in markers:
+            if marker not in found_markers and marker in window:
+                found_markers.add(marker)
+        tail = window[-overlap:]
+    return found_markers
+
+def _scan_gif(f):
+    if f.read(6) not in (b"GIF87a", b"GIF89a"):
+        return set()
+    return {META_XMP} if _scan_for_markers(f, [b"XMP DataXMP"]) else set()
+
+def _scan_pdf(f):
+    # Смотрим туда же, откуда метаданные удаляет очистка: /Info в трейлере и /Metadata каталога.
+    # Поиск по байтам не видит сжатый XMP и находит пакеты XMP внутри картинок
+    import pikepdf
+    found = set()
+    with pikepdf.open(f) as pdf:
+        info = pdf.trailer.get("/Info")
+        if isinstance(info, pikepdf.Dictionary) and len(info.keys()):
+            found.add(META_PDF_INFO)
+        metadata = pdf.Root.get("/Metadata")
+        if isinstance(metadata, pikepdf.Stream) and metadata.read_bytes().strip():
+            found.add(META_PDF_XMP)
+    return found
+
+def _scan_ooxml(filepath):
+    found = set()
+    with zipfile.ZipFile(filepath) as archive:
+        names = set(archive.namelist())
+        if "docProps/core.xml" in names:
+            core_xml = archive.read("docProps/core.xml").decode("utf-8", "replace")
+            for element in OOXML_PERSONAL_CORE_ELEMENTS:
+                match = re.search(rf"<{element}(?:\s[^>]*)?>(.*?)</{element}>", core_xml, re.S)
+                if match and match.group(1).strip() not in OOXML_PLACEHOLDER_VALUES:
+                    found.add(META_OOXML_CORE)
+                    break
+        if "docProps/custom.xml" in names and b"<property" in archive.read("docProps/custom.xml"):
+            found.add(META_OOXML_CUSTOM)
+    return found
+
+def _scan_odf(f):
+    # Ищем все элементы meta.xml, которые умеет удалять очистка
+    meta_xml = read_odf_meta(f)
+    every_property = compile_cleaning_plan({'office': {'core_properties': True, 'custom_properties': True}}).office
+    found_elements = set(find_odf_meta_elements(meta_xml, odf_meta_elements(every_property)))
+    found = {META_OOXML_CUSTOM} if found_elements & set(ODF_CUSTOM_ELEMENTS) else set()
+    return found | ({META_OOXML_CORE} if found_elements - set(ODF_CUSTOM_ELEMENTS) else set())
+
+def _scan_ole2(f):
+    every_property = compile_cleaning_plan({'office': {'core_properties': True, 'custom_properties': True}}).office
+    properties = set(find_ole2_properties(f, every_property))
+    found = {META_OOXML_CUSTOM} if "custom_properties" in properties else set()
+    return found | ({META_OOXML_CORE} if properties - {"custom_properties"} else set())
+
+def scan_metadata_classes(filepath, file_extension):
+    if file_extension in ('.docx', '.xlsx', '.pptx'):
+        return _scan_ooxml(filepath)
+    scanners = {
+        '.jpg': _scan_jpeg, '.jpeg': _scan_jpeg,
+        '.png': _scan_png,
+        '.webp': _scan_webp,
+        '.tif': _scan_tiff, '.tiff': _scan_tiff,
+        '.heic': _scan_heif, '.heif': _scan_heif, '.avif': _scan_heif,
+        '.jxl': _scan_jxl,
+        '.mp4': _scan_mp4, '.mov': _scan_mp4, '.m4v': _scan_mp4,
+        '.gif': _scan_gif,
+        '.pdf': _scan_pdf,
+        **{extension: _scan_odf for extension in ODF_EXTENSIONS},
+        **{extension: _scan_ole2 for extension in OLE2_EXTENSIONS},
+        **{extension: _audio_scanner(extension) for extension in FILE_CATEGORIES["Audio"]},
+    }
+    scanner = scanners.get(file_extension)
+    if scanner is None:
+        return set()
+    with open(filepath, "rb", buffering=SCAN_CHUNK_SIZE) as f:
+        return scanner(f)
+
+def removed_metadata_classes(input_path, output_path, file_extension):
+    # Для отчета: какие классы метаданных были в исходнике и исчезли после очистки
+    try:
+        return sorted(scan_metadata_classes(input_path, file_extension) - scan_metadata_classes(output_path, file_extension))
+    except Exception as e:
+        logger.warning(f"ПРОВЕРКА: Не удалось сравнить метаданные '{os.path.basename(input_path)}': {e}")
+        return []
+
+def verify_cleaned_file(output_path, file_extension, cleaning_options_from_profile):
+    forbidden = get_forbidden_classes(file_extension, cleaning_options_from_profile)
+    if not forbidden:
+        return []
+    try:
+        remaining = scan_metadata_classes(output_path, file_extension) & forbidden
+    except Exception as e:
+        logger.error(f"ПРОВЕРКА: Не удалось проверить '{os.path.basename(output_path)}': {e}")
+        return ["unreadable"]
+    if remaining:
+        logger.warning(f"ПРОВЕРКА: В '{os.path.basename(output_path)}' остались метаданные: {sorted(remaining)}")
+    return sorted(remaining)
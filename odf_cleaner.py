@@ -0,0 +1,84 @@
+# StealthShare v0.1 pre1
+# Copyright (c) 2025 IQUXAe
+# Released under the MIT License. See LICENSE file for details.
+
+import re
+import zipfile
+
+from zip_stream import rewrite_zip
+
+ODF_EXTENSIONS = ['.odt', '.ods', '.odp']
+ODF_META_MEMBER = "meta.xml"
+
+# Элементы meta.xml по свойствам документа из плана Office.
+# meta:template хранит путь к шаблону (часто с именем пользователя), поэтому идет вместе с автором
+ODF_META_ELEMENTS = {
+    "author": ("meta:initial-creator", "meta:template"),
+    "last_modified_by": ("dc:creator", "meta:printed-by"),
+    "title": ("dc:title",),
+    "subject": ("dc:subject",),
+    "comments": ("dc:description",),
+    "keywords": ("meta:keyword",),
+    "language": ("dc:language",),
+    "created": ("meta:creation-date",),
+    "modified": ("dc:date",),
+    "last_printed": ("meta:print-date",),
+    "revision": ("meta:editing-cycles", "meta:editing-duration"),
+    "version": ("meta:generator",),
+}
+ODF_CUSTOM_ELEMENTS = ("meta:user-defined",)
+
+
+def _element_pattern(element):
+    name = re.escape(element)
+    return re.compile(rf"\s*<{name}(?:\s[^>]*)?/>|\s*<{name}(?:\s[^>]*)?>.*?</{name}>".encode(), re.S)
+
+_ELEMENT_PATTERNS = {element: _element_pattern(element)
+                     for elements in (*ODF_META_ELEMENTS.values(), ODF_CUSTOM_ELEMENTS) for element in elements}
+
+def odf_meta_elements(plan):
+    elements = [element for name in sorted(plan.clear_core_properties) for element in ODF_META_ELEMENTS.get(name, ())]
+    if plan.custom_properties:
+        elements.extend(ODF_CUSTOM_ELEMENTS)
+    return elements
+
+def find_odf_meta_elements(meta_xml, elements):
+    return [element for element in elements if _ELEMENT_PATTERNS[element].search(meta_xml)]
+
+def clean_meta_xml(meta_xml, plan):
+    # Текст правится на месте: порядок элементов, префиксы и пространства имен остаются как были
+    removed = []
+    for element in odf_meta_elements(plan):
+        meta_xml, count = _ELEMENT_PATTERNS[element].subn(b"", meta_xml)
+        if count:
+            removed.append(element)
+    return meta_xml, removed
+
+
+def clean_odf(source, target, plan, media_transform=None, executor=None):
+    # ZIP переписывается член за членом: сжатые данные всех файлов кроме meta.xml (и картинок,
+    # если передан media_transform) копируются как есть, поэтому mimetype остается первым и несжатым
+    removed = []
+
+    def _clean_meta(data):
+        meta_xml, removed_elements = clean_meta_xml(data, plan)
+        removed.extend(removed_elements)
+        return meta_xml
+
+    def _transform(info):
+        if info.filename == ODF_META_MEMBER:
+            return _clean_meta
+        return media_transform(info) if media_transform else None
+
+    with zipfile.ZipFile(source) as archive:
+        names = set(archive.namelist())
+    if ODF_META_MEMBER not in names and "mimetype" not in names:
+        raise ValueError("не похоже на документ OpenDocument")
+    rewrite_zip(source, target, _transform, scrub_dates="modified" in plan.clear_core_properties, executor=executor)
+    return removed
+
+def read_odf_meta(source):
+    with zipfile.ZipFile(source) as archive:
+        if ODF_META_MEMBER not in archive.namelist():
+            return b""
+        return archive.read(ODF_META_MEMBER)
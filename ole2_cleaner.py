@@ -0,0 +1,235 @@
+# StealthShare v0.1 pre1
+# Copyright (c) 2025 IQUXAe
+# Released under the MIT License. See LICENSE file for details.
+
+import uuid
+import struct
+
+from cancellation import check_cancelled
+
+OLE2_EXTENSIONS = ['.doc', '.xls', '.ppt']
+OLE2_SIGNATURE = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+COPY_CHUNK_SIZE = 1024 * 1024
+MAX_REGULAR_SECTOR = 0xFFFFFFFA
+FREE_SECTOR = 0xFFFFFFFF
+HEADER_DIFAT_ENTRIES = 109
+DIRECTORY_ENTRY_SIZE = 128
+DIRECTORY_STREAM = 2
+DIRECTORY_ROOT = 5
+PROPERTY_STREAMS = ("\x05SummaryInformation", "\x05DocumentSummaryInformation")
+
+FMTID_SUMMARY = uuid.UUID("f29f85e0-4ff9-1068-ab91-08002b27b3d9").bytes_le
+FMTID_DOC_SUMMARY = uuid.UUID("d5cdd502-2e9c-101b-9397-08002b2cf9ae").bytes_le
+FMTID_USER_DEFINED = uuid.UUID("d5cdd505-2e9c-101b-9397-08002b2cf9ae").bytes_le
+# Идентификаторы свойств по свойствам документа из плана Office (codepage, статистика и словарь не трогаем).
+# Шаблон хранит путь (часто с именем пользователя), организация и руководитель - тоже данные об авторе
+OLE2_PROPERTY_IDS = {
+    FMTID_SUMMARY: {
+        2: "title", 3: "subject", 4: "author", 5: "keywords", 6: "comments", 7: "author",
+        8: "last_modified_by", 9: "revision", 10: "revision", 11: "last_printed", 12: "created",
+        13: "modified", 18: "version",
+    },
+    FMTID_DOC_SUMMARY: {2: "category", 14: "author", 15: "author", 27: "content_status", 28: "language", 29: "version"},
+}
+
+
+class _CompoundFile:
+    # Читает только заголовок, DIFAT и каталог; записи FAT ищутся по одной, без загрузки всей таблицы
+    def __init__(self, source):
+        self.source = source
+        self.file_size = source.seek(0, 2)
+        header = self.read_at(0, 512)
+        if len(header) < 512 or header[:8] != OLE2_SIGNATURE:
+            raise ValueError("нет сигнатуры OLE2")
+        sector_shift, mini_shift = struct.unpack_from("<HH", header, 0x1E)
+        if sector_shift not in (9, 12) or mini_shift != 6:
+            raise ValueError("неверный размер сектора OLE2")
+        self.sector_size = 1 << sector_shift
+        self.mini_sector_size = 1 << mini_shift
+        self.first_directory, = struct.unpack_from("<I", header, 0x30)
+        self.mini_cutoff, self.first_minifat = struct.unpack_from("<II", header, 0x38)
+        first_difat, difat_count = struct.unpack_from("<II", header, 0x44)
+        self.fat_sectors = list(struct.unpack_from(f"<{HEADER_DIFAT_ENTRIES}I", header, 0x4C))
+        per_sector = self.sector_size // 4
+        for sector in self.chain(first_difat, next_of=lambda s: self.read_uint(self.sector_offset(s) + self.sector_size - 4),
+                                 limit=difat_count):
+            self.fat_sectors.extend(struct.unpack(f"<{per_sector - 1}I", self.read_at(self.sector_offset(sector), self.sector_size - 4)))
+        self.fat_sectors = [sector for sector in self.fat_sectors if sector < MAX_REGULAR_SECTOR]
+        self.root = None
+        self.minifat_sectors = None
+        self.mini_stream_sectors = None
+
+    def read_at(self, offset, size):
+        self.source.seek(offset)
+        return self.source.read(size)
+
+    def read_uint(self, offset):
+        data = self.read_at(offset, 4)
+        if len(data) != 4:
+            raise ValueError("ссылка за пределы файла OLE2")
+        return struct.unpack("<I", data)[0]
+
+    def sector_offset(self, sector):
+        return (sector + 1) * self.sector_size
+
+    def next_sector(self, sector):
+        per_sector = self.sector_size // 4
+        if sector // per_sector >= len(self.fat_sectors):
+            raise ValueError("сектор вне таблицы FAT")
+        return self.read_uint(self.sector_offset(self.fat_sectors[sector // per_sector]) + sector % per_sector * 4)
+
+    def chain(self, start, next_of=None, limit=None):
+        next_of = next_of or self.next_sector
+        limit = limit if limit is not None else self.file_size // self.sector_size + 1
+        sector = start
+        for _ in range(limit):
+            if sector >= MAX_REGULAR_SECTOR:
+                return
+            yield sector
+            sector = next_of(sector)
+        if sector < MAX_REGULAR_SECTOR and sector != FREE_SECTOR:
+            raise ValueError("зацикленная цепочка секторов OLE2")
+
+    def entries(self):
+        for sector in self.chain(self.first_directory):
+            block = self.read_at(self.sector_offset(sector), self.sector_size)
+            for position in range(0, len(block) - DIRECTORY_ENTRY_SIZE + 1, DIRECTORY_ENTRY_SIZE):
+                entry = block[position:position + DIRECTORY_ENTRY_SIZE]
+                name_length, entry_type = struct.unpack_from("<HB", entry, 64)
+                if not entry_type:
+                    continue
+                name = entry[:max(0, min(name_length, 64) - 2)].decode("utf-16-le", "replace")
+                start, size = struct.unpack_from("<IQ", entry, 116)
+                if self.sector_size == 512:
+                    size &= 0xFFFFFFFF
+                yield name, entry_type, start, size
+
+    def stream_spans(self, start, size):
+        # Участки файла, из которых состоит поток: (смещение, длина)
+        spans = []
+        if size >= self.mini_cutoff:
+            for sector in self.chain(start):
+                if size <= 0:
+                    break
+                spans.append((self.sector_offset(sector), min(size, self.sector_size)))
+                size -= self.sector_size
+        else:
+            if self.mini_stream_sectors is None:
+                self.minifat_sectors = list(self.chain(self.first_minifat))
+                self.mini_stream_sectors = list(self.chain(self.root[2]))
+            for mini_sector in self.chain(start, next_of=self.next_mini_sector):
+                if size <= 0:
+                    break
+                position = mini_sector * self.mini_sector_size
+                if position // self.sector_size >= len(self.mini_stream_sectors):
+                    raise ValueError("мини-сектор вне мини-потока")
+                offset = self.sector_offset(self.mini_stream_sectors[position // self.sector_size]) + position % self.sector_size
+                spans.append((offset, min(size, self.mini_sector_size)))
+                size -= self.mini_sector_size
+        if size > 0:
+            raise ValueError("цепочка секторов короче размера потока")
+        return spans
+
+    def next_mini_sector(self, mini_sector):
+        position = mini_sector * 4
+        if position // self.sector_size >= len(self.minifat_sectors):
+            raise ValueError("мини-сектор вне таблицы MiniFAT")
+        return self.read_uint(self.sector_offset(self.minifat_sectors[position // self.sector_size]) + position % self.sector_size)
+
+    def property_streams(self):
+        entries = list(self.entries())
+        self.root = next((entry for entry in entries if entry[1] == DIRECTORY_ROOT), None)
+        if self.root is None:
+            raise ValueError("нет корневой записи каталога OLE2")
+        for name, entry_type, start, size in entries:
+            if entry_type == DIRECTORY_STREAM and name in PROPERTY_STREAMS:
+                spans = self.stream_spans(start, size)
+                yield name, spans, b"".join(self.read_at(offset, length) for offset, length in spans)
+
+
+def _filter_section(section, removable_ids):
+    if len(section) < 8:
+        raise ValueError("обрезанная секция свойств")
+    size, count = struct.unpack_from("<II", section, 0)
+    if size > len(section) or 8 + count * 8 > size:
+        raise ValueError("неверный размер секции свойств")
+    entries = [struct.unpack_from("<II", section, 8 + index * 8) for index in range(count)]
+    # Значение свойства занимает место до начала следующего значения, типы разбирать не нужно
+    boundaries = sorted({offset for _, offset in entries} | {size})
+    kept, removed = [], []
+    for property_id, offset in entries:
+        if property_id in removable_ids:
+            removed.append(property_id)
+            continue
+        end = boundaries[boundaries.index(offset) + 1] if offset in boundaries[:-1] else offset
+        if end <= offset:
+            raise ValueError("неверное смещение свойства")
+        kept.append((property_id, section[offset:end]))
+    if not removed:
+        return section[:size], removed
+    values_start = 8 + len(kept) * 8
+    table, values = b"", b""
+    for property_id, value in kept:
+        table += struct.pack("<II", property_id, values_start + len(values))
+        values += value + b"\x00" * (-len(value) % 4)
+    return struct.pack("<II", values_start + len(values), len(kept)) + table + values, removed
+
+def clean_property_set(data, plan):
+    # Возвращает новый поток свойств и список удаленных свойств (имена из плана)
+    if len(data) < 28 or data[:2] != b"\xfe\xff":
+        raise ValueError("неверный заголовок набора свойств")
+    set_count, = struct.unpack_from("<I", data, 24)
+    if 28 + set_count * 20 > len(data):
+        raise ValueError("неверное число секций свойств")
+    sections, removed = [], []
+    for index in range(set_count):
+        fmtid = data[28 + index * 20:44 + index * 20]
+        offset, = struct.unpack_from("<I", data, 44 + index * 20)
+        if fmtid == FMTID_USER_DEFINED and plan.custom_properties:
+            removed.append("custom_properties")
+            continue
+        names = OLE2_PROPERTY_IDS.get(fmtid, {})
+        removable_ids = {property_id for property_id, name in names.items() if name in plan.clear_core_properties}
+        section, removed_ids = _filter_section(data[offset:], removable_ids)
+        removed.extend(names[property_id] for property_id in removed_ids)
+        sections.append((fmtid, section))
+    header = bytearray(data[:24] + struct.pack("<I", len(sections)))
+    offset = 28 + len(sections) * 20
+    for fmtid, section in sections:
+        header += fmtid + struct.pack("<I", offset)
+        offset += len(section)
+    return bytes(header) + b"".join(section for _, section in sections), removed
+
+def find_ole2_properties(source, plan):
+    # Для проверки: какие свойства из плана еще остались в потоках свойств
+    found = []
+    for name, spans, data in _CompoundFile(source).property_streams():
+        found.extend(clean_property_set(data, plan)[1])
+    return found
+
+def clean_ole2(source, target, plan):
+    # Файл копируется целиком, затем потоки свойств перезаписываются поверх своих же секторов:
+    # новый поток не длиннее старого и дополняется нулями, поэтому FAT и каталог не меняются
+    patches, removed = [], []
+    for name, spans, data in _CompoundFile(source).property_streams():
+        cleaned, removed_properties = clean_property_set(data, plan)
+        if not removed_properties:
+            continue
+        removed.extend(removed_properties)
+        cleaned += b"\x00" * (len(data) - len(cleaned))
+        position = 0
+        for offset, length in spans:
+            patches.append((offset, cleaned[position:position + length]))
+            position += length
+    source.seek(0)
+    while True:
+        check_cancelled()
+        piece = source.read(COPY_CHUNK_SIZE)
+        if not piece:
+            break
+        target.write(piece)
+    for offset, data in patches:
+        target.seek(offset)
+        target.write(data)
+    target.seek(0, 2)
+    return removed
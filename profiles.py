@@ -0,0 +1,432 @@
+# StealthShare v0.1 pre1
+# Copyright (c) 2025 IQUXAe
+# Released under the MIT License. See LICENSE file for details.
+
+import os
+import sys
+import json
+from dataclasses import dataclass
+from functools import lru_cache
+
+from utils import logger, CLEANING_PROFILES
+from settings_store import get_config_dir
+
+PROFILE_FILE_EXTENSIONS = ('.toml', '.json')
+
+# Имена тегов EXIF/TIFF, которые можно писать в профилях вместо номеров
+EXIF_TAG_NAMES = {
+    "ImageDescription": 270, "Make": 271, "Model": 272, "Orientation": 274,
+    "XResolution": 282, "YResolution": 283, "ResolutionUnit": 296, "Software": 305,
+    "DateTime": 306, "Artist": 315, "HostComputer": 316, "WhitePoint": 318,
+    "PrimaryChromaticities": 319, "YCbCrCoefficients": 529, "YCbCrPositioning": 531,
+    "ReferenceBlackWhite": 532, "Copyright": 33432, "ExposureTime": 33434, "FNumber": 33437,
+    "ExifIFD": 34665, "ExposureProgram": 34850, "GPSInfo": 34853, "ISOSpeedRatings": 34855,
+    "ExifVersion": 36864, "DateTimeOriginal": 36867, "DateTimeDigitized": 36868,
+    "OffsetTime": 36880, "OffsetTimeOriginal": 36881, "OffsetTimeDigitized": 36882,
+    "ComponentsConfiguration": 37121, "ShutterSpeedValue": 37377, "ApertureValue": 37378,
+    "BrightnessValue": 37379, "ExposureBiasValue": 37380, "MaxApertureValue": 37381,
+    "SubjectDistance": 37382, "MeteringMode": 37383, "LightSource": 37384, "Flash": 37385,
+    "FocalLength": 37386, "MakerNote": 37500, "UserComment": 37510, "SubSecTime": 37520,
+    "SubSecTimeOriginal": 37521, "SubSecTimeDigitized": 37522, "FlashpixVersion": 40960,
+    "ColorSpace": 40961, "PixelXDimension": 40962, "PixelYDimension": 40963,
+    "InteropIFD": 40965, "FocalPlaneXResolution": 41486, "FocalPlaneYResolution": 41487,
+    "FocalPlaneResolutionUnit": 41488, "SensingMethod": 41495, "FileSource": 41728,
+    "SceneType": 41729, "CustomRendered": 41985, "ExposureMode": 41986, "WhiteBalance": 41987,
+    "DigitalZoomRatio": 41988, "FocalLengthIn35mmFilm": 41989, "SceneCaptureType": 41990,
+    "GainControl": 41991, "Contrast": 41992, "Saturation": 41993, "Sharpness": 41994,
+    "SubjectDistanceRange": 41996, "ImageUniqueID": 42016, "CameraOwnerName": 42032,
+    "BodySerialNumber": 42033, "LensSpecification": 42034, "LensMake": 42035,
+    "LensModel": 42036, "LensSerialNumber": 42037, "Gamma": 42240,
+}
+
+# Короткие префиксы XMP, которые можно писать вместо полного URI пространства имен
+XMP_NAMESPACE_PREFIXES = {
+    "dc": "http://purl.org/dc/elements/1.1/",
+    "xmp": "http://ns.adobe.com/xap/1.0/",
+    "xmpMM": "http://ns.adobe.com/xap/1.0/mm/",
+    "xmpRights": "http://ns.adobe.com/xap/1.0/rights/",
+    "photoshop": "http://ns.adobe.com/photoshop/1.0/",
+    "exif": "http://ns.adobe.com/exif/1.0/",
+    "exifEX": "http://cipa.jp/exif/1.0/",
+    "tiff": "http://ns.adobe.com/tiff/1.0/",
+    "aux": "http://ns.adobe.com/exif/1.0/aux/",
+    "crs": "http://ns.adobe.com/camera-raw-settings/1.0/",
+    "lr": "http://ns.adobe.com/lightroom/1.0/",
+    "pdf": "http://ns.adobe.com/pdf/1.3/",
+    "Iptc4xmpCore": "http://iptc.org/std/Iptc4xmpCore/1.0/xmlns/",
+    "Iptc4xmpExt": "http://iptc.org/std/Iptc4xmpExt/2008-02-29/",
+    "GPano": "http://ns.google.com/photos/1.0/panorama/",
+}
+# Что удаляется из XMP, если профиль не задает свои списки: копии EXIF (в том числе GPS), данные камеры,
+# IPTC-поля с автором и местом съемки. Пересохранение через Pillow раньше удаляло XMP целиком
+DEFAULT_XMP_REMOVE_NAMESPACES = ("exif", "exifEX", "aux", "tiff", "photoshop", "Iptc4xmpCore", "Iptc4xmpExt")
+DEFAULT_XMP_REMOVE_PROPERTIES = ("dc:creator", "xmpRights:Owner")
+# Без этих пространств имен пакет XMP перестает быть XMP - удалять их фильтром нельзя
+XMP_STRUCTURAL_NAMESPACES = {"adobe:ns:meta/", "http://www.w3.org/1999/02/22-rdf-syntax-ns#"}
+
+# Вспомогательные чанки PNG, которые нужны для правильного отображения, а не описывают файл
+PNG_RENDERING_CHUNKS = {"tRNS", "gAMA", "cHRM", "sRGB", "iCCP", "sBIT", "bKGD", "cICP", "mDCv", "cLLi",
+                        "acTL", "fcTL", "fdAT"}
+PNG_TEXT_CHUNKS = {"tEXt", "zTXt", "iTXt", "tIME"}
+
+OFFICE_CORE_PROPERTIES = (
+    "author", "category", "comments", "content_status", "created", "identifier", "keywords",
+    "language", "last_modified_by", "last_printed", "modified", "revision", "subject", "title", "version"
+)
+
+
+@dataclass(frozen=True)
+class ImagePlan:
+    # exif_action / xmp_action: "keep" - не трогать, "strip" - удалить целиком, "filter" - удалить часть
+    exif_action: str = "strip"
+    exif_keep_tags: frozenset = frozenset()
+    exif_remove_tags: frozenset = frozenset()
+    xmp_action: str = "keep"
+    xmp_remove_namespaces: frozenset = frozenset()
+    # Отдельные свойства XMP в нотации Кларка: "{http://purl.org/dc/elements/1.1/}creator"
+    xmp_remove_properties: frozenset = frozenset()
+    remove_iptc: bool = False
+    # Комментарии JPEG (COM) - свободный текст, часто с именем программы или автора
+    remove_comments: bool = True
+    # Миниатюра EXIF (IFD1) или уменьшенная страница TIFF - отдельная копия кадра, которую не видно в просмотрщике
+    remove_thumbnail: bool = True
+    # png_keep_chunks задан - режим белого списка; иначе удаляются чанки из png_remove_chunks
+    png_keep_chunks: frozenset = None
+    png_remove_chunks: frozenset = frozenset()
+    keep_icc: bool = True
+
+    def keeps_exif_tag(self, tag):
+        if self.exif_action == "keep":
+            return True
+        if self.exif_action == "strip":
+            return False
+        if self.exif_keep_tags:
+            return tag in self.exif_keep_tags
+        return tag not in self.exif_remove_tags
+
+    def removes_xmp_property(self, name):
+        # name - свойство XMP в нотации Кларка
+        if self.xmp_action != "filter":
+            return self.xmp_action == "strip"
+        return name[1:].split("}", 1)[0] in self.xmp_remove_namespaces or name in self.xmp_remove_properties
+
+    def keeps_png_chunk(self, chunk_type):
+        # Критические чанки (заглавная первая буква) нужны для декодирования и остаются всегда
+        if chunk_type[:1].isupper():
+            return True
+        if self.png_keep_chunks is not None:
+            return chunk_type in self.png_keep_chunks
+        return chunk_type not in self.png_remove_chunks
+
+
+@dataclass(frozen=True)
+class PdfPlan:
+    info_action: str = "strip"
+    info_keep_keys: frozenset = frozenset()
+    info_remove_keys: frozenset = frozenset()
+    xmp_action: str = "strip"
+    xmp_remove_namespaces: frozenset = frozenset()
+
+    def keeps_info_key(self, key):
+        if self.info_action == "keep":
+            return True
+        if self.info_action == "strip":
+            return False
+        if self.info_keep_keys:
+            return key in self.info_keep_keys
+        return key not in self.info_remove_keys
+
+
+@dataclass(frozen=True)
+class OfficePlan:
+    clear_core_properties: frozenset = frozenset(OFFICE_CORE_PROPERTIES)
+    custom_properties: bool = False
+
+    @property
+    def clears_all_core_properties(self):
+        return self.clear_core_properties >= set(OFFICE_CORE_PROPERTIES)
+
+
+@dataclass(frozen=True)
+class VideoPlan:
+    # udta/meta/XMP: GPS (©xyz), производитель и модель, программа; время - creation/modification в заголовках
+    remove_metadata: bool = True
+    clear_timestamps: bool = True
+
+
+@dataclass(frozen=True)
+class AudioPlan:
+    # ID3v1/ID3v2/APE, блоки FLAC кроме STREAMINFO/SEEKTABLE, комментарии Vorbis/Opus, теги iTunes в M4A
+    remove_tags: bool = True
+
+
+@dataclass(frozen=True)
+class CleaningPlan:
+    images: ImagePlan
+    pdf: PdfPlan
+    office: OfficePlan
+    video: VideoPlan = VideoPlan()
+    audio: AudioPlan = AudioPlan()
+
+
+def _as_name_list(value, field_name):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]
+    if not isinstance(value, (list, tuple, set, frozenset)):
+        raise ValueError(f"поле '{field_name}' должно быть списком")
+    return list(value)
+
+def _parse_exif_tags(value, field_name):
+    tags = set()
+    for item in _as_name_list(value, field_name):
+        if isinstance(item, int):
+            tags.add(item)
+        elif isinstance(item, str) and item in EXIF_TAG_NAMES:
+            tags.add(EXIF_TAG_NAMES[item])
+        elif isinstance(item, str) and item.lower().startswith("0x"):
+            tags.add(int(item, 16))
+        elif isinstance(item, str) and item.isdigit():
+            tags.add(int(item))
+        else:
+            raise ValueError(f"неизвестный тег EXIF '{item}' в поле '{field_name}'")
+    return frozenset(tags)
+
+def _parse_xmp_namespaces(value, field_name):
+    namespaces = set()
+    for item in _as_name_list(value, field_name):
+        uri = XMP_NAMESPACE_PREFIXES.get(item, item)
+        if "/" not in uri and ":" not in uri:
+            raise ValueError(f"неизвестное пространство имен XMP '{item}' в поле '{field_name}'")
+        if uri in XMP_STRUCTURAL_NAMESPACES:
+            raise ValueError(f"пространство имен '{item}' нельзя удалить из XMP (поле '{field_name}')")
+        namespaces.add(uri)
+    return frozenset(namespaces)
+
+def _parse_xmp_properties(value, field_name):
+    properties = set()
+    for item in _as_name_list(value, field_name):
+        if not isinstance(item, str):
+            raise ValueError(f"неверное свойство XMP '{item}' в поле '{field_name}'")
+        if item.startswith("{") and "}" in item:
+            properties.add(item)
+            continue
+        prefix, _, name = item.partition(":")
+        if prefix not in XMP_NAMESPACE_PREFIXES or not name:
+            raise ValueError(f"неизвестное свойство XMP '{item}' в поле '{field_name}' (ожидается 'префикс:Имя')")
+        properties.add("{" + XMP_NAMESPACE_PREFIXES[prefix] + "}" + name)
+    return frozenset(properties)
+
+def _parse_png_chunks(value, field_name):
+    chunks = set()
+    for item in _as_name_list(value, field_name):
+        if not isinstance(item, str) or len(item) != 4 or not item.isascii() or not item.isalpha():
+            raise ValueError(f"неверный тип чанка PNG '{item}' в поле '{field_name}'")
+        chunks.add(item)
+    return chunks
+
+def _parse_pdf_keys(value, field_name):
+    return frozenset(key if key.startswith("/") else f"/{key}" for key in _as_name_list(value, field_name))
+
+def _parse_office_properties(value, field_name):
+    names = set(_as_name_list(value, field_name))
+    unknown = names - set(OFFICE_CORE_PROPERTIES)
+    if unknown:
+        raise ValueError(f"неизвестные свойства документа {sorted(unknown)} в поле '{field_name}'")
+    return names
+
+def _filter_action(remove_all, keep_list, remove_list):
+    if remove_all:
+        return "filter" if keep_list else "strip"
+    return "filter" if remove_list else "keep"
+
+
+def compile_image_plan(options):
+    if isinstance(options, ImagePlan):
+        return options
+    options = options or {}
+    exif_keep = _parse_exif_tags(options.get('exif_keep'), 'images.exif_keep')
+    exif_remove = _parse_exif_tags(options.get('exif_remove'), 'images.exif_remove')
+    # Списки XMP по умолчанию действуют, пока профиль не задал свои (пустой список - ничего не удалять)
+    xmp_remove_namespaces = _parse_xmp_namespaces(options.get('xmp_remove_namespaces', DEFAULT_XMP_REMOVE_NAMESPACES),
+                                                  'images.xmp_remove_namespaces')
+    xmp_remove_properties = _parse_xmp_properties(options.get('xmp_remove_properties', DEFAULT_XMP_REMOVE_PROPERTIES),
+                                                  'images.xmp_remove_properties')
+    if options.get('makernote', True):
+        # MakerNote - закрытый блок производителя, в нем обычно серийный номер камеры и объектива
+        makernote_tag = EXIF_TAG_NAMES["MakerNote"]
+        exif_remove = exif_remove | {makernote_tag}
+        exif_keep = exif_keep - {makernote_tag}
+    exif_action = _filter_action(options.get('exif', True), exif_keep, exif_remove)
+    remove_thumbnail = bool(options.get('thumbnail', True))
+    if exif_action == "keep" and remove_thumbnail:
+        exif_action = "filter"
+    remove_xmp_iptc = options.get('xmp_iptc', False)
+    xmp_action = "strip" if remove_xmp_iptc else ("filter" if xmp_remove_namespaces or xmp_remove_properties else "keep")
+    keep_icc = options.get('preserve_icc', True)
+
+    png_keep = _parse_png_chunks(options.get('png_keep_chunks'), 'images.png_keep_chunks')
+    png_remove = _parse_png_chunks(options.get('png_remove_chunks'), 'images.png_remove_chunks')
+    if options.get('png_chunks', True):
+        # Агрессивная очистка PNG: белый список из чанков отображения плюс явно разрешенные
+        png_keep = (PNG_RENDERING_CHUNKS | png_keep) - png_remove
+    elif png_keep:
+        png_keep = png_keep - png_remove
+    else:
+        # Без явного списка - как раньше: уходят текстовые чанки и время изменения
+        png_keep = None
+        png_remove = png_remove or set(PNG_TEXT_CHUNKS)
+    # Решения по EXIF и ICC должны действовать и на соответствующие чанки PNG
+    chunk_overrides = set()
+    if exif_action == "strip":
+        chunk_overrides.add("eXIf")
+    if not keep_icc:
+        chunk_overrides.add("iCCP")
+    if png_keep is not None:
+        if exif_action != "strip" and "eXIf" not in png_remove:
+            # Оставшиеся теги EXIF живут в чанке eXIf - в белом списке он нужен, чтобы их не потерять
+            png_keep = png_keep | {"eXIf"}
+        png_keep = frozenset(png_keep - chunk_overrides)
+    else:
+        png_remove = png_remove | chunk_overrides
+
+    return ImagePlan(
+        exif_action=exif_action,
+        exif_keep_tags=exif_keep,
+        exif_remove_tags=exif_remove,
+        xmp_action=xmp_action,
+        xmp_remove_namespaces=xmp_remove_namespaces,
+        xmp_remove_properties=xmp_remove_properties,
+        # IPTC (APP13, теги TIFF, текстовые чанки PNG) хранит автора и место съемки - удаляется, если профиль не разрешил
+        remove_iptc=bool(remove_xmp_iptc or options.get('iptc', True)),
+        remove_comments=bool(options.get('comments', True)),
+        remove_thumbnail=remove_thumbnail,
+        png_keep_chunks=png_keep,
+        png_remove_chunks=frozenset(png_remove),
+        keep_icc=keep_icc,
+    )
+
+def compile_pdf_plan(options):
+    if isinstance(options, PdfPlan):
+        return options
+    options = options or {}
+    info_keep = _parse_pdf_keys(options.get('info_keep'), 'pdf.info_keep')
+    info_remove = _parse_pdf_keys(options.get('info_remove'), 'pdf.info_remove')
+    xmp_remove_namespaces = _parse_xmp_namespaces(options.get('xmp_remove_namespaces'), 'pdf.xmp_remove_namespaces')
+    return PdfPlan(
+        info_action=_filter_action(options.get('info_dict', True), info_keep, info_remove),
+        info_keep_keys=info_keep,
+        info_remove_keys=info_remove,
+        xmp_action="strip" if options.get('xmp', True) else ("filter" if xmp_remove_namespaces else "keep"),
+        xmp_remove_namespaces=xmp_remove_namespaces,
+    )
+
+def compile_office_plan(options):
+    if isinstance(options, OfficePlan):
+        return options
+    options = options or {}
+    core_keep = _parse_office_properties(options.get('core_keep'), 'office.core_keep')
+    core_remove = _parse_office_properties(options.get('core_remove'), 'office.core_remove')
+    if options.get('core_properties', True):
+        clear_core = set(OFFICE_CORE_PROPERTIES) - core_keep
+    else:
+        clear_core = core_remove
+    return OfficePlan(
+        clear_core_properties=frozenset(clear_core),
+        custom_properties=bool(options.get('custom_properties', False)),
+    )
+
+def compile_video_plan(options):
+    if isinstance(options, VideoPlan):
+        return options
+    options = options or {}
+    return VideoPlan(
+        remove_metadata=bool(options.get('metadata', True)),
+        clear_timestamps=bool(options.get('timestamps', True)),
+    )
+
+def compile_audio_plan(options):
+    if isinstance(options, AudioPlan):
+        return options
+    options = options or {}
+    return AudioPlan(remove_tags=bool(options.get('tags', True)))
+
+@lru_cache(maxsize=64)
+def _compile_cached(options_key):
+    options = json.loads(options_key)
+    return CleaningPlan(
+        images=compile_image_plan(options.get('images')),
+        pdf=compile_pdf_plan(options.get('pdf')),
+        office=compile_office_plan(options.get('office')),
+        video=compile_video_plan(options.get('video')),
+        audio=compile_audio_plan(options.get('audio')),
+    )
+
+def compile_cleaning_plan(cleaning_options):
+    # План строится один раз на набор опций: повторные вызовы с теми же опциями берут его из кэша
+    if isinstance(cleaning_options, CleaningPlan):
+        return cleaning_options
+    options_key = json.dumps(cleaning_options or {}, sort_keys=True, default=sorted)
+    return _compile_cached(options_key)
+
+
+def _read_profile_file(path):
+    with open(path, "rb") as f:
+        if path.lower().endswith('.toml'):
+            import tomllib
+            return tomllib.load(f)
+        return json.load(f)
+
+def load_profile_file(path):
+    data = _read_profile_file(path)
+    if not isinstance(data, dict):
+        raise ValueError("файл профиля должен содержать таблицу/объект верхнего уровня")
+    profile_key = data.get('key') or os.path.splitext(os.path.basename(path))[0]
+
+    base_key = data.get('base')
+    if base_key and base_key not in CLEANING_PROFILES:
+        raise ValueError(f"базовый профиль '{base_key}' не найден")
+    base_options = CLEANING_PROFILES[base_key]['options'] if base_key else {}
+    options = {}
+    for section in ('images', 'pdf', 'office', 'video', 'audio'):
+        section_data = data.get(section, {})
+        if not isinstance(section_data, dict):
+            raise ValueError(f"раздел '{section}' должен быть таблицей")
+        options[section] = {**base_options.get(section, {}), **section_data}
+
+    # Ошибки в списках тегов и чанков должны всплыть при загрузке, а не на первом файле
+    compile_cleaning_plan(options)
+    return profile_key, {
+        "options": options,
+        "name": data.get('name', profile_key),
+        "description": data.get('description', ""),
+        "source": os.path.abspath(path),
+    }
+
+def get_user_profile_dirs():
+    app_dir = os.path.dirname(os.path.abspath(sys.argv[0] if getattr(sys, 'frozen', False) else __file__))
+    return [os.path.join(app_dir, "profiles"), os.path.join(get_config_dir(), "profiles")]
+
+def load_user_profiles(directories=None):
+    loaded = []
+    for directory in (directories or get_user_profile_dirs()):
+        if not os.path.isdir(directory):
+            continue
+        for name in sorted(os.listdir(directory)):
+            if not name.lower().endswith(PROFILE_FILE_EXTENSIONS):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                profile_key, profile_data = load_profile_file(path)
+            except Exception as e:
+                logger.error(f"ПРОФИЛИ: Не удалось загрузить '{path}': {e}")
+                continue
+            if profile_key in CLEANING_PROFILES and 'source' not in CLEANING_PROFILES[profile_key]:
+                logger.warning(f"ПРОФИЛИ: '{path}' пропущен - встроенный профиль '{profile_key}' переопределить нельзя.")
+                continue
+            CLEANING_PROFILES[profile_key] = profile_data
+            loaded.append(profile_key)
+    if loaded:
+        logger.info(f"ПРОФИЛИ: Загружены пользовательские профили: {loaded}")
+    return loaded
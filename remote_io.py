@@ -0,0 +1,241 @@
+# StealthShare v0.1 pre1
+# Copyright (c) 2025 IQUXAe
+# Released under the MIT License. See LICENSE file for details.
+
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from utils import logger
+from cancellation import CancelledError, check_cancelled
+
+# Файловые системы, где каждое чтение - сетевой запрос к серверу
+REMOTE_FILESYSTEMS = {"nfs", "nfs4", "cifs", "smb3", "smbfs", "9p", "afs", "ceph", "glusterfs", "davfs",
+                      "fuse.sshfs", "fuse.rclone", "fuse.s3fs", "fuse.gcsfuse"}
+# Дополнительные префиксы путей, которые считаются сетевыми (через os.pathsep): для монтирований,
+# которые не распознаются по типу ФС, и для замеров с имитацией задержки
+REMOTE_PREFIXES_ENV = "STEALTHSHARE_REMOTE_PREFIXES"
+# Вход читается блоками такого размера: на сетевой ФС время определяется числом запросов, а не байтами
+READ_AHEAD_CHUNK_SIZE = 8 * 1024 * 1024
+# Сколько входов копируется в локальный буфер одновременно
+DEFAULT_PREFETCH_DEPTH = 4
+# Сколько байт скопированных, но еще не очищенных входов может лежать в буфере (мягкий предел)
+DEFAULT_SPOOL_LIMIT = 512 * 1024 * 1024
+WINDOWS_DRIVE_REMOTE = 4
+
+
+def _unescape_mount_path(path):
+    # В /proc/self/mounts пробелы и табуляции в путях записаны как \040 и \011
+    return path.replace("\\040", " ").replace("\\011", "\t").replace("\\012", "\n").replace("\\134", "\\")
+
+def _read_remote_mounts():
+    try:
+        with open("/proc/self/mounts", "r", encoding="utf-8", errors="replace") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return []
+    mounts = []
+    for line in lines:
+        fields = line.split()
+        if len(fields) >= 3:
+            mounts.append((_unescape_mount_path(fields[1]), fields[2] in REMOTE_FILESYSTEMS))
+    # Самая длинная точка монтирования, содержащая путь, - та, на которой он лежит
+    mounts.sort(key=lambda mount: len(mount[0]), reverse=True)
+    return mounts
+
+def _is_under(path, directory):
+    return path == directory or path.startswith(directory.rstrip(os.sep) + os.sep)
+
+def is_remote_path(path, mounts=None):
+    path = os.path.abspath(path)
+    for prefix in filter(None, os.environ.get(REMOTE_PREFIXES_ENV, "").split(os.pathsep)):
+        if _is_under(path, os.path.abspath(prefix)):
+            return True
+    if os.name == "nt":
+        if path.startswith("\\\\"):
+            return True
+        try:
+            import ctypes
+            return ctypes.windll.kernel32.GetDriveTypeW(os.path.splitdrive(path)[0] + "\\") == WINDOWS_DRIVE_REMOTE
+        except (ImportError, AttributeError, OSError):
+            return False
+    path = os.path.realpath(path)
+    for mount_point, remote in (mounts if mounts is not None else _read_remote_mounts()):
+        if _is_under(path, mount_point):
+            return remote
+    return False
+
+def find_remote_paths(paths):
+    # Таблица монтирований читается один раз на весь список
+    mounts = _read_remote_mounts()
+    return [path for path in paths if is_remote_path(path, mounts)]
+
+def spool_copy(source, target, chunk_size=READ_AHEAD_CHUNK_SIZE):
+    # Последовательное чтение большими блоками: ядро и клиент сетевой ФС читают с упреждением,
+    # и на файл уходит несколько запросов вместо сотни мелких чтений заголовков
+    with open(source, "rb", buffering=0) as src, open(target, "wb", buffering=0) as dst:
+        if hasattr(os, "posix_fadvise"):
+            try:
+                os.posix_fadvise(src.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            except OSError:
+                pass
+        buffer = bytearray(chunk_size)
+        view = memoryview(buffer)
+        copied = 0
+        while True:
+            check_cancelled()
+            read = src.readinto(buffer)
+            if not read:
+                break
+            dst.write(view[:read])
+            copied += read
+    return copied
+
+
+class _SpoolEntry:
+    __slots__ = ("path", "local_path", "size", "fetched", "scheduled", "released", "urgent")
+
+    def __init__(self, path, local_path):
+        self.path = path
+        self.local_path = local_path
+        self.size = 0
+        self.fetched = Future()
+        self.scheduled = False
+        self.released = False
+        self.urgent = False
+
+
+class InputSpool:
+    # Локальный буфер для входов с сетевых ФС. Входы копируются заранее, в порядке paths, не больше
+    # depth одновременно и пока в буфере меньше spool_limit байт; очистка затем читает локальную копию.
+    # Задача пула отправляется, когда ее вход скопирован, а копия удаляется, когда задача завершилась
+    def __init__(self, paths, depth=DEFAULT_PREFETCH_DEPTH, spool_limit=DEFAULT_SPOOL_LIMIT, spool_dir=None):
+        self.depth = max(1, depth)
+        self.spool_limit = spool_limit
+        self.spool_dir = tempfile.mkdtemp(prefix="stealthshare_spool_", dir=spool_dir)
+        self.stats = {'fetched': 0, 'bytes': 0, 'fallbacks': 0}
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._waiting = []
+        self._running = 0
+        self._spooled_bytes = 0
+        self._closed = False
+        self._executor = ThreadPoolExecutor(max_workers=self.depth, thread_name_prefix="stealthshare-prefetch")
+        for path in find_remote_paths(dict.fromkeys(paths)):
+            # Имя файла сохраняется: по нему очистители выбирают формат и подписывают записи лога
+            local_path = os.path.join(self.spool_dir, str(len(self._entries)), os.path.basename(path))
+            self._entries[path] = _SpoolEntry(path, local_path)
+            self._waiting.append(self._entries[path])
+        with self._lock:
+            self._fill_locked()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _fill_locked(self):
+        # Вход, которого уже ждут, отправляется даже сверх предела; иначе следующий по порядку -
+        # пока буфер не заполнен. Один файл всегда копируется, даже если он больше предела
+        while self._waiting and self._running < self.depth and not self._closed:
+            if self._spooled_bytes >= self.spool_limit and self._running and not self._waiting[0].urgent:
+                break
+            entry = self._waiting.pop(0)
+            entry.scheduled = True
+            self._running += 1
+            self._executor.submit(self._fetch, entry)
+
+    def _fetch(self, entry):
+        try:
+            entry.size = os.path.getsize(entry.path)
+            with self._lock:
+                self._spooled_bytes += entry.size
+            os.makedirs(os.path.dirname(entry.local_path), exist_ok=True)
+            copied = spool_copy(entry.path, entry.local_path)
+            with self._lock:
+                self.stats['fetched'] += 1
+                self.stats['bytes'] += copied
+            entry.fetched.set_result(entry.local_path)
+        except BaseException as e:
+            entry.fetched.set_exception(e)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._fill_locked()
+
+    def _prioritize(self, entry):
+        # Вызывающий ждет именно этот файл: он идет первым, и предел буфера для него не действует
+        with self._lock:
+            if not entry.scheduled and entry in self._waiting:
+                entry.urgent = True
+                self._waiting.remove(entry)
+                self._waiting.insert(0, entry)
+                self._fill_locked()
+
+    def release(self, path):
+        entry = self._entries.get(path)
+        if entry is None:
+            return
+        with self._lock:
+            if entry.released:
+                return
+            entry.released = True
+            self._spooled_bytes -= entry.size
+            self._fill_locked()
+        shutil.rmtree(os.path.dirname(entry.local_path), ignore_errors=True)
+
+    def submit(self, pool, fn, path, *args, urgent=False):
+        # fn(локальный путь, *args) в пуле, как только вход скопирован. urgent - результат ждут сейчас,
+        # вход копируется вне очереди. Если копирование не удалось, задача читает исходный путь
+        entry = self._entries.get(path)
+        if entry is None:
+            return pool.submit(fn, path, *args)
+        if urgent:
+            self._prioritize(entry)
+        result = Future()
+
+        def _finish(task):
+            self.release(path)
+            if task.cancelled():
+                result.cancel()
+            elif task.exception() is not None:
+                result.set_exception(task.exception())
+            else:
+                result.set_result(task.result())
+
+        def _start(fetched):
+            try:
+                error = fetched.exception()
+                if isinstance(error, CancelledError):
+                    raise error
+                if error is not None:
+                    with self._lock:
+                        self.stats['fallbacks'] += 1
+                    logger.warning(f"СЕТЬ: '{os.path.basename(path)}' не скопирован в локальный буфер ({error}), читаем напрямую.")
+                task = pool.submit(fn, path if error is not None else fetched.result(), *args)
+            except BaseException as e:
+                self.release(path)
+                result.set_exception(e)
+                return
+            task.add_done_callback(_finish)
+
+        entry.fetched.add_done_callback(_start)
+        return result
+
+    def close(self):
+        # Входы, до которых очередь не дошла (после отмены), завершаются с CancelledError
+        with self._lock:
+            self._closed = True
+            waiting, self._waiting = self._waiting, []
+        for entry in waiting:
+            entry.fetched.set_exception(CancelledError("копирование входа отменено"))
+        self._executor.shutdown(wait=True)
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
+        logger.debug("remote.spool_closed files=%d bytes=%d fallbacks=%d",
+                     self.stats['fetched'], self.stats['bytes'], self.stats['fallbacks'])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,303 @@
+# StealthShare v0.1 pre1
+# Copyright (c) 2025 IQUXAe
+# Released under the MIT License. See LICENSE file for details.
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+import dataclasses
+
+from utils import logger
+
+SETTINGS_FILE = "settings.toml"
+STATE_DB_FILE = "state.sqlite3"
+RECENT_FOLDERS_LIMIT = 10
+# Сколько последних пакетов хранится в журнале
+JOURNAL_KEEP_BATCHES = 5
+
+DEFAULT_SETTINGS = {
+    "language": "",
+    "output_dir": "",
+    "profile": "",
+    "preserve_icc": True,
+    "sort_output": False,
+    "recent_folders": [],
+}
+
+JOURNAL_PENDING = "pending"
+JOURNAL_DONE = "done"
+
+STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS result_cache (
+    input_path TEXT NOT NULL,
+    options_digest TEXT NOT NULL,
+    input_size INTEGER NOT NULL,
+    input_mtime_ns INTEGER NOT NULL,
+    output_path TEXT NOT NULL,
+    output_size INTEGER NOT NULL,
+    output_mtime_ns INTEGER NOT NULL,
+    cleaner_path TEXT NOT NULL,
+    cleaned_at REAL NOT NULL,
+    PRIMARY KEY (input_path, options_digest)
+);
+CREATE TABLE IF NOT EXISTS batches (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    output_dir TEXT NOT NULL,
+    profile TEXT NOT NULL,
+    sort_output INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS batch_files (
+    batch_id INTEGER NOT NULL REFERENCES batches(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    input_path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    PRIMARY KEY (batch_id, position)
+);
+CREATE INDEX IF NOT EXISTS batch_files_by_path ON batch_files (batch_id, input_path);
+"""
+
+
+def _app_dir(environment_key, windows_key, fallback):
+    if os.name == "nt":
+        return os.path.join(os.environ.get(windows_key) or os.path.expanduser("~"), "StealthShare")
+    return os.path.join(os.environ.get(environment_key) or os.path.join(os.path.expanduser("~"), *fallback), "stealthshare")
+
+def get_config_dir():
+    # $XDG_CONFIG_HOME/stealthshare (~/.config/stealthshare), на Windows %APPDATA%\StealthShare
+    return _app_dir("XDG_CONFIG_HOME", "APPDATA", (".config",))
+
+def get_state_dir():
+    # $XDG_STATE_HOME/stealthshare (~/.local/state/stealthshare), на Windows %LOCALAPPDATA%\StealthShare
+    return _app_dir("XDG_STATE_HOME", "LOCALAPPDATA", (".local", "state"))
+
+def options_digest(cleaning_options):
+    # Кэш результатов привязан к содержимому опций, а не к имени профиля: правка профиля делает кэш недействительным.
+    # Множества в плане сортируются - порядок их обхода меняется от запуска к запуску
+    if dataclasses.is_dataclass(cleaning_options):
+        cleaning_options = dataclasses.asdict(cleaning_options)
+    options_key = json.dumps(cleaning_options or {}, sort_keys=True, default=sorted)
+    return hashlib.sha256(options_key.encode("utf-8")).hexdigest()[:32]
+
+def _toml_value(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, (list, tuple)):
+        return "[" + ", ".join(_toml_value(item) for item in value) + "]"
+    # Экранирование строк JSON - подмножество базовых строк TOML
+    return json.dumps(str(value), ensure_ascii=False)
+
+def _file_signature(path):
+    try:
+        stat_result = os.stat(path)
+    except OSError:
+        return None
+    return stat_result.st_size, stat_result.st_mtime_ns
+
+
+class SettingsStore:
+    # Настройки окна в settings.toml (каталог конфигурации) и состояние в SQLite (каталог состояния):
+    # индекс кэша результатов и журнал последних пакетов. Настройки читаются один раз при запуске
+    def __init__(self, config_dir=None, state_dir=None):
+        self.config_dir = config_dir or get_config_dir()
+        self.state_dir = state_dir or get_state_dir()
+        self.settings_path = os.path.join(self.config_dir, SETTINGS_FILE)
+        self.db_path = os.path.join(self.state_dir, STATE_DB_FILE)
+        self.values = dict(DEFAULT_SETTINGS)
+        self.loaded_from_file = False
+        self._db = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        try:
+            with open(self.settings_path, "rb") as f:
+                import tomllib
+                data = tomllib.load(f)
+        except FileNotFoundError:
+            return self.values
+        except (OSError, ValueError) as e:
+            logger.error(f"НАСТРОЙКИ: Не удалось прочитать '{self.settings_path}': {e}")
+            return self.values
+        for key, default in DEFAULT_SETTINGS.items():
+            value = data.get(key)
+            if value is None:
+                continue
+            if type(value) is not type(default):
+                logger.warning(f"НАСТРОЙКИ: Значение '{key}' в '{self.settings_path}' имеет неверный тип и пропущено.")
+                continue
+            self.values[key] = value
+        self.values["recent_folders"] = [str(folder) for folder in self.values["recent_folders"]][:RECENT_FOLDERS_LIMIT]
+        self.loaded_from_file = True
+        return self.values
+
+    def get(self, key):
+        return self.values.get(key, DEFAULT_SETTINGS.get(key))
+
+    def update(self, **values):
+        unknown = [key for key in values if key not in DEFAULT_SETTINGS]
+        if unknown:
+            raise KeyError(f"неизвестные настройки: {unknown}")
+        self.values.update(values)
+
+    def add_recent_folder(self, folder):
+        if not folder:
+            return
+        folder = os.path.abspath(folder)
+        recent = [item for item in self.values["recent_folders"] if item != folder]
+        self.values["recent_folders"] = [folder] + recent[:RECENT_FOLDERS_LIMIT - 1]
+
+    def save(self):
+        from fileops import temp_output_path
+        lines = [f"{key} = {_toml_value(self.values[key])}" for key in DEFAULT_SETTINGS]
+        try:
+            os.makedirs(self.config_dir, exist_ok=True)
+            temp_path = temp_output_path(self.settings_path)
+            try:
+                with open(temp_path, "w", encoding="utf-8", newline="\n") as f:
+                    f.write("# StealthShare settings\n" + "\n".join(lines) + "\n")
+                os.replace(temp_path, self.settings_path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+        except OSError as e:
+            logger.error(f"НАСТРОЙКИ: Не удалось сохранить '{self.settings_path}': {e}")
+            return False
+        return True
+
+    def _connection(self):
+        # Вызывается под self._lock. Соединение одно на процесс: пакет пишет из своего потока, окно читает из главного
+        if self._db is None:
+            os.makedirs(self.state_dir, exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            # WAL без fsync на каждую транзакцию: журнал может отстать на несколько файлов после сбоя ОС,
+            # но не разрушится - это дешевле, чем синхронная запись после каждого файла
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("PRAGMA foreign_keys=ON")
+            self._db.executescript(STATE_SCHEMA)
+        return self._db
+
+    def _execute(self, sql, parameters=()):
+        try:
+            with self._lock:
+                return self._connection().execute(sql, parameters).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"НАСТРОЙКИ: Ошибка базы состояния '{self.db_path}': {e}")
+            return None
+
+    def _execute_many(self, statements):
+        try:
+            with self._lock:
+                db = self._connection()
+                db.execute("BEGIN")
+                try:
+                    for sql, parameters in statements:
+                        db.execute(sql, parameters)
+                    db.execute("COMMIT")
+                except BaseException:
+                    db.execute("ROLLBACK")
+                    raise
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"НАСТРОЙКИ: Ошибка базы состояния '{self.db_path}': {e}")
+            return False
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    # Кэш результатов: файл, который не менялся с прошлой очистки теми же опциями, чей результат лежит
+    # на месте нетронутым, не чистится повторно
+
+    def cached_results(self, input_paths, digest):
+        # {входной путь: (выходной путь, путь очистки)} для файлов, у которых вход и результат не изменились
+        rows = self._execute("SELECT input_path, input_size, input_mtime_ns, output_path, output_size, output_mtime_ns, cleaner_path "
+                             "FROM result_cache WHERE options_digest = ?", (digest,))
+        known = {row[0]: row[1:] for row in rows or ()}
+        cached = {}
+        for input_path in input_paths:
+            entry = known.get(os.path.abspath(input_path))
+            if entry is None:
+                continue
+            input_size, input_mtime_ns, output_path, output_size, output_mtime_ns, cleaner_path = entry
+            if (_file_signature(input_path) == (input_size, input_mtime_ns)
+                    and _file_signature(output_path) == (output_size, output_mtime_ns)):
+                cached[input_path] = (output_path, cleaner_path)
+        return cached
+
+    def record_results(self, results, digest, batch_id=None):
+        # results - [(входной путь, выходной путь, путь очистки)] уже зафиксированных на диске файлов
+        statements = []
+        now = time.time()
+        for input_path, output_path, cleaner_path in results:
+            input_signature = _file_signature(input_path)
+            output_signature = _file_signature(output_path)
+            if input_signature and output_signature:
+                statements.append(("INSERT OR REPLACE INTO result_cache VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                   (os.path.abspath(input_path), digest, *input_signature,
+                                    os.path.abspath(output_path), *output_signature, cleaner_path, now)))
+            if batch_id is not None:
+                statements.append(("UPDATE batch_files SET status = ? WHERE batch_id = ? AND input_path = ?",
+                                   (JOURNAL_DONE, batch_id, input_path)))
+        if statements:
+            self._execute_many(statements)
+
+    # Журнал пакета: список файлов пишется при старте, статусы - по мере фиксации результатов.
+    # Пакет без отметки о завершении (окно закрыли, процесс упал) можно продолжить при следующем запуске
+
+    def start_batch(self, input_paths, output_dir, profile, sort_output):
+        try:
+            with self._lock:
+                db = self._connection()
+                db.execute("BEGIN")
+                try:
+                    cursor = db.execute("INSERT INTO batches (started_at, output_dir, profile, sort_output) VALUES (?, ?, ?, ?)",
+                                        (time.time(), output_dir, profile or "", int(bool(sort_output))))
+                    batch_id = cursor.lastrowid
+                    db.executemany("INSERT INTO batch_files VALUES (?, ?, ?, ?)",
+                                   ((batch_id, position, path, JOURNAL_PENDING) for position, path in enumerate(input_paths)))
+                    db.execute("DELETE FROM batches WHERE id NOT IN (SELECT id FROM batches ORDER BY id DESC LIMIT ?)",
+                               (JOURNAL_KEEP_BATCHES,))
+                    db.execute("COMMIT")
+                except BaseException:
+                    db.execute("ROLLBACK")
+                    raise
+            return batch_id
+        except sqlite3.Error as e:
+            logger.error(f"НАСТРОЙКИ: Журнал пакета не создан: {e}")
+            return None
+
+    def forget_result(self, input_path, digest, batch_id=None):
+        # Результат не прошел проверку: он не должен попасть в кэш и считаться готовым при продолжении пакета
+        statements = [("DELETE FROM result_cache WHERE input_path = ? AND options_digest = ?", (os.path.abspath(input_path), digest))]
+        if batch_id is not None:
+            statements.append(("UPDATE batch_files SET status = ? WHERE batch_id = ? AND input_path = ?",
+                               (JOURNAL_PENDING, batch_id, input_path)))
+        self._execute_many(statements)
+
+    def finish_batch(self, batch_id):
+        if batch_id is not None:
+            self._execute("UPDATE batches SET finished_at = ? WHERE id = ?", (time.time(), batch_id))
+
+    def unfinished_batch(self):
+        # Последний прерванный пакет: (id, необработанные файлы, выходная папка, профиль, сортировка) или None
+        rows = self._execute("SELECT id, output_dir, profile, sort_output FROM batches "
+                             "WHERE id = (SELECT MAX(id) FROM batches) AND finished_at IS NULL")
+        if not rows:
+            return None
+        batch_id, output_dir, profile, sort_output = rows[0]
+        remaining = [row[0] for row in self._execute(
+            "SELECT input_path FROM batch_files WHERE batch_id = ? AND status != ? ORDER BY position",
+            (batch_id, JOURNAL_DONE)) or () if os.path.exists(row[0])]
+        if not remaining:
+            self.finish_batch(batch_id)
+            return None
+        return batch_id, remaining, output_dir, profile, bool(sort_output)
@@ -0,0 +1,72 @@
+# StealthShare v0.1 pre1
+# Copyright (c) 2025 IQUXAe
+# Released under the MIT License. See LICENSE file for details.
+
+# Небольшие файлы с известными метаданными для тестов очистителей
+
+import io
+import struct
+
+SECRET_NAME = b"Jane Secret"
+SECRET_GPS = b"55,45.123N"
+
+XMP_PACKET = (
+    b'<?xpacket begin="\xef\xbb\xbf" id="W5M0MpCehiHzreSzNTczkc9d"?>'
+    b'<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">'
+    b'<rdf:Description rdf:about="" xmlns:exif="http://ns.adobe.com/exif/1.0/"'
+    b' xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:xmp="http://ns.adobe.com/xap/1.0/"'
+    b' exif:GPSLatitude="' + SECRET_GPS + b'" exif:GPSLongitude="37,37.456E" xmp:Rating="3">'
+    b'<dc:creator><rdf:Seq><rdf:li>' + SECRET_NAME + b'</rdf:li></rdf:Seq></dc:creator>'
+    b'<dc:title><rdf:Alt><rdf:li xml:lang="x-default">Holiday</rdf:li></rdf:Alt></dc:title>'
+    b'</rdf:Description></rdf:RDF></x:xmpmeta><?xpacket end="w"?>'
+)
+
+
+def iptc_dataset(record, dataset, value):
+    return struct.pack(">BBBH", 0x1C, record, dataset, len(value)) + value
+
+def iptc_block():
+    # IIM: 2:80 By-line и 2:116 Copyright Notice
+    return iptc_dataset(2, 80, SECRET_NAME) + iptc_dataset(2, 116, b"(c) " + SECRET_NAME)
+
+def photoshop_iptc_resource():
+    data = iptc_block()
+    resource = b"8BIM" + struct.pack(">H", 0x0404) + b"\x00\x00" + struct.pack(">I", len(data)) + data
+    return resource + (b"\x00" if len(data) & 1 else b"")
+
+def exif_with_gps():
+    from PIL import Image
+    exif = Image.Exif()
+    exif[0x010F] = "Secret Camera"      # Make
+    exif[0x0112] = 6                    # Orientation
+    exif[0x0132] = "2024:01:01 12:00:00"
+    gps = exif.get_ifd(0x8825)
+    gps[1] = "N"
+    gps[2] = (55.0, 45.0, 7.0)
+    return exif.tobytes()
+
+def _jpeg_segment(marker, payload):
+    return bytes((0xFF, marker)) + struct.pack(">H", len(payload) + 2) + payload
+
+def jpeg_with_private_metadata(size=(64, 48)):
+    # JPEG с EXIF (GPS), XMP (exif:GPSLatitude, dc:creator) и IPTC By-line в APP13
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (120, 60, 200)).save(buffer, "JPEG", quality=90, exif=exif_with_gps())
+    data = buffer.getvalue()
+    extra = (_jpeg_segment(0xE1, b"http://ns.adobe.com/xap/1.0/\x00" + XMP_PACKET)
+             + _jpeg_segment(0xED, b"Photoshop 3.0\x00" + photoshop_iptc_resource()))
+    return data[:2] + extra + data[2:]
+
+JXL_CODESTREAM = b"\xff\x0a" + bytes(range(64))
+
+def _box(box_type, payload):
+    return struct.pack(">I4s", len(payload) + 8, box_type) + payload
+
+def jxl_with_private_metadata():
+    # Контейнер JPEG XL: сигнатура, ftyp, Exif (4 байта смещения до TIFF), XMP в xml и кодовый поток
+    return (b"\x00\x00\x00\x0cJXL \x0d\x0a\x87\x0a"
+            + _box(b"ftyp", b"jxl \x00\x00\x00\x00jxl ")
+            + _box(b"Exif", b"\x00\x00\x00\x00" + exif_with_gps()[6:])
+            + _box(b"xml ", XMP_PACKET)
+            + _box(b"jxlc", JXL_CODESTREAM))
@@ -0,0 +1,41 @@
+# StealthShare v0.1 pre1
+# Copyright (c) 2025 IQUXAe
+# Released under the MIT License. See LICENSE file for details.
+
+import io
+import tarfile
+
+from archive_cleaner import clean_archive_metadata
+from utils import get_profile_cleaning_options
+
+
+def _tar_member(name, member_type=tarfile.REGTYPE, data=b"", **fields):
+    info = tarfile.TarInfo(name)
+    info.type = member_type
+    info.size = len(data)
+    info.uid, info.uname, info.mtime = 1234, "jane", 1700000000
+    for key, value in fields.items():
+        setattr(info, key, value)
+    return info, io.BytesIO(data) if data else None
+
+def test_tar_keeps_special_members(tmp_path):
+    source = tmp_path / "bundle.tar"
+    with tarfile.open(source, "w") as tar:
+        tar.addfile(*_tar_member("notes.txt", data=b"hello"))
+        tar.addfile(*_tar_member("notes_link.txt", tarfile.LNKTYPE, linkname="notes.txt"))
+        tar.addfile(*_tar_member("pipe", tarfile.FIFOTYPE))
+        tar.addfile(*_tar_member("null", tarfile.CHRTYPE, devmajor=1, devminor=3))
+
+    output = tmp_path / "bundle_cleaned.tar"
+    assert clean_archive_metadata(str(source), str(output), get_profile_cleaning_options("profile_standard"))
+
+    with tarfile.open(output) as tar:
+        members = {member.name: member for member in tar}
+        assert [member.name for member in members.values()] == ["notes.txt", "notes_link.txt", "pipe", "null"]
+        for member in members.values():
+            assert (member.uid, member.uname, member.mtime) == (0, "", 0)
+        assert members["notes_link.txt"].islnk() and members["notes_link.txt"].linkname == "notes.txt"
+        assert members["pipe"].isfifo()
+        assert (members["null"].devmajor, members["null"].devminor) == (1, 3)
+        tar.extractall(tmp_path / "out", members=[members["notes.txt"], members["notes_link.txt"]], filter="data")
+    assert (tmp_path / "out" / "notes_link.txt").read_bytes() == b"hello"
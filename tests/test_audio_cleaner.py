@@ -0,0 +1,164 @@
+# StealthShare v0.1 pre1
+# Copyright (c) 2025 IQUXAe
+# Released under the MIT License. See LICENSE file for details.
+
+import io
+import struct
+
+import pytest
+
+from metadata_cleaner import clean_metadata
+from metadata_verifier import verify_cleaned_file
+from utils import get_profile_cleaning_options
+from metadata_fixtures import SECRET_NAME
+
+mutagen = pytest.importorskip("mutagen")
+
+# MPEG-1 Layer III, 128 кбит/с, 44,1 кГц: кадр 417 байт
+MP3_FRAME = b"\xff\xfb\x90\x64" + bytes(413)
+# Полезная нагрузка, которую очистка должна перенести байт в байт
+AUDIO_PAYLOAD = bytes(range(256)) * 4
+# Картинка в тегах больше страницы Ogg - заголовок комментариев занимает несколько страниц
+LARGE_TAG = "x" * 100000
+
+
+def _clean(tmp_path, data, ext, profile_key="profile_standard"):
+    source = tmp_path / f"source{ext}"
+    source.write_bytes(data)
+    output = tmp_path / f"cleaned{ext}"
+    options = get_profile_cleaning_options(profile_key)
+    assert verify_cleaned_file(str(source), ext, options) == ["audio_tags"]
+    assert clean_metadata(str(source), str(output), ext, options)
+    assert verify_cleaned_file(str(output), ext, options) == []
+    return output
+
+def _mp3_with_tags(tmp_path):
+    from mutagen.apev2 import APEv2
+    from mutagen.id3 import ID3, TPE1, TXXX
+    path = tmp_path / "tagged.mp3"
+    path.write_bytes(MP3_FRAME * 20)
+    # После аудио APEv2, за ним ID3v1 в самом конце, ID3v2 в начале
+    ape = APEv2()
+    ape["Artist"] = SECRET_NAME.decode()
+    ape.save(str(path))
+    tags = ID3()
+    tags.add(TPE1(encoding=3, text=[SECRET_NAME.decode()]))
+    tags.add(TXXX(encoding=3, desc="GPS", text=["55.7512,37.6184"]))
+    tags.save(str(path), v1=2)
+    return path.read_bytes()
+
+def test_mp3_id3_and_ape_tags_removed(tmp_path):
+    from mutagen.apev2 import APEv2, APENoHeaderError
+    from mutagen.mp3 import MP3
+    data = _mp3_with_tags(tmp_path)
+    assert data.startswith(b"ID3") and b"APETAGEX" in data and data[-128:-125] == b"TAG"
+    output = _clean(tmp_path, data, ".mp3")
+    assert output.read_bytes() == MP3_FRAME * 20
+    cleaned = MP3(str(output))
+    assert cleaned.tags is None
+    assert (cleaned.info.sample_rate, cleaned.info.bitrate) == (44100, 128000)
+    assert cleaned.info.length == pytest.approx(20 * 1152 / 44100, abs=0.01)
+    with pytest.raises(APENoHeaderError):
+        APEv2(str(output))
+
+def _flac_streaminfo():
+    # 4096 сэмплов в блоке, 44,1 кГц, стерео, 16 бит, 44100 сэмплов
+    packed = (44100 << 44) | (1 << 41) | (15 << 36) | 44100
+    return struct.pack(">HHII", 4096, 4096, 0, 0)[:10] + packed.to_bytes(8, "big") + bytes(16)
+
+def _flac_with_tags(tmp_path):
+    from mutagen.flac import FLAC, Picture
+    from mutagen.id3 import ID3, TPE1
+    seektable = struct.pack(">QQH", 0, 0, 4096)
+    data = (b"fLaC" + bytes([0]) + (34).to_bytes(3, "big") + _flac_streaminfo()
+            + bytes([0x80 | 3]) + len(seektable).to_bytes(3, "big") + seektable + AUDIO_PAYLOAD)
+    path = tmp_path / "tagged.flac"
+    path.write_bytes(data)
+    flac = FLAC(str(path))
+    flac["artist"] = SECRET_NAME.decode()
+    picture = Picture()
+    picture.type, picture.mime, picture.data = 3, "image/jpeg", SECRET_NAME * 10
+    flac.add_picture(picture)
+    flac.save()
+    # ID3v2 перед fLaC пишут некоторые программы; mutagen его пропускает
+    id3 = ID3()
+    id3.add(TPE1(encoding=3, text=[SECRET_NAME.decode()]))
+    id3_buffer = io.BytesIO()
+    id3.save(id3_buffer)
+    return id3_buffer.getvalue() + path.read_bytes()
+
+def test_flac_metadata_blocks_removed(tmp_path):
+    from mutagen.flac import FLAC
+    data = _flac_with_tags(tmp_path)
+    output = _clean(tmp_path, data, ".flac")
+    cleaned_data = output.read_bytes()
+    assert SECRET_NAME not in cleaned_data
+    assert cleaned_data.endswith(AUDIO_PAYLOAD)
+    cleaned = FLAC(str(output))
+    assert not cleaned.tags and cleaned.pictures == []
+    assert (cleaned.info.sample_rate, cleaned.info.channels, cleaned.info.total_samples) == (44100, 2, 44100)
+    assert cleaned.seektable is not None and cleaned.seektable.seekpoints[0][2] == 4096
+    # Остались только STREAMINFO и SEEKTABLE, флаг последнего блока стоит на SEEKTABLE
+    assert [block.code for block in cleaned.metadata_blocks] == [0, 3]
+
+def _ogg_headers(codec):
+    if codec == "vorbis":
+        identification = b"\x01vorbis" + struct.pack("<IBIiiiBB", 0, 2, 44100, 0, 128000, 0, 0xB8, 1)
+        comments = b"\x03vorbis" + struct.pack("<I", 6) + b"tester" + struct.pack("<I", 0) + b"\x01"
+        return [identification], [comments, b"\x05vorbis" + bytes(40)]
+    identification = b"OpusHead" + struct.pack("<BBHIhB", 1, 2, 312, 48000, 0, 0)
+    return [identification], [b"OpusTags" + struct.pack("<I", 6) + b"tester" + struct.pack("<I", 0)]
+
+def _ogg_with_tags(tmp_path, codec):
+    from mutagen.ogg import OggPage
+    from mutagen.oggopus import OggOpus
+    from mutagen.oggvorbis import OggVorbis
+    first, headers = _ogg_headers(codec)
+    pages = []
+    for sequence, packets in enumerate([first, headers, [AUDIO_PAYLOAD[:500]], [AUDIO_PAYLOAD[500:]]]):
+        page = OggPage()
+        page.serial, page.sequence, page.packets = 0x1234, sequence, packets
+        page.first = sequence == 0
+        page.last = sequence == 3
+        page.position = 0 if sequence < 2 else 48000 * (sequence - 1)
+        pages.append(page.write())
+    path = tmp_path / f"tagged.{codec}"
+    path.write_bytes(b"".join(pages))
+    tagged = (OggVorbis if codec == "vorbis" else OggOpus)(str(path))
+    tagged["artist"] = SECRET_NAME.decode()
+    tagged["metadata_block_picture"] = LARGE_TAG
+    tagged.save()
+    return path.read_bytes()
+
+def _ogg_pages(data):
+    from mutagen.ogg import OggPage
+    stream = io.BytesIO(data)
+    pages = []
+    while stream.tell() < len(data):
+        start = stream.tell()
+        page = OggPage(stream)
+        pages.append((page, data[start:stream.tell()]))
+    return pages
+
+@pytest.mark.parametrize("codec, ext", [("vorbis", ".ogg"), ("opus", ".opus")])
+def test_ogg_comments_removed_and_pages_renumbered(tmp_path, codec, ext):
+    from mutagen.oggopus import OggOpus
+    from mutagen.oggvorbis import OggVorbis
+    data = _ogg_with_tags(tmp_path, codec)
+    original_pages = _ogg_pages(data)
+    assert len(original_pages) > 4
+    output = _clean(tmp_path, data, ext)
+    cleaned_data = output.read_bytes()
+    assert SECRET_NAME not in cleaned_data and len(cleaned_data) < len(data) - len(LARGE_TAG)
+    pages = _ogg_pages(cleaned_data)
+    # Заголовок комментариев уместился на одной странице: номера идут подряд, CRC пересчитан
+    assert len(pages) == 4
+    assert [page.sequence for page, _ in pages] == [0, 1, 2, 3]
+    for page, raw in pages:
+        assert page.write() == raw
+    assert [page.packets for page, _ in pages[2:]] == [[AUDIO_PAYLOAD[:500]], [AUDIO_PAYLOAD[500:]]]
+    assert pages[-1][0].last and pages[-1][0].position == original_pages[-1][0].position
+    cleaned = (OggVorbis if codec == "vorbis" else OggOpus)(str(output))
+    assert list(cleaned.tags) == []
+    assert cleaned.tags.vendor == "tester"
+    assert cleaned.info.length == (OggVorbis if codec == "vorbis" else OggOpus)(str(tmp_path / f"tagged.{codec}")).info.length
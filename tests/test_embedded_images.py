@@ -0,0 +1,98 @@
+# StealthShare v0.1 pre1
+# Copyright (c) 2025 IQUXAe
+# Released under the MIT License. See LICENSE file for details.
+
+import io
+import zipfile
+from datetime import datetime
+
+import pytest
+
+from metadata_cleaner import clean_metadata
+from utils import get_profile_cleaning_options
+from metadata_fixtures import SECRET_NAME, SECRET_GPS, jpeg_with_private_metadata
+
+Image = pytest.importorskip("PIL.Image")
+
+ODT_MIMETYPE = b"application/vnd.oasis.opendocument.text"
+
+
+def _assert_clean_jpeg(data):
+    for secret in (SECRET_NAME, SECRET_GPS, b"Secret Camera"):
+        assert secret not in data
+    with Image.open(io.BytesIO(data)) as img:
+        img.load()
+        assert img.size == (64, 48)
+        assert 0x8825 not in img.getexif()
+        assert img.getexif().get(0x0112) == 6
+
+def _clean(tmp_path, source, ext, profile_key="profile_standard"):
+    output = tmp_path / f"cleaned{ext}"
+    assert clean_metadata(str(source), str(output), ext, get_profile_cleaning_options(profile_key))
+    return output
+
+def _replace_members(path, replacements):
+    with zipfile.ZipFile(path) as archive:
+        members = [(info, archive.read(info)) for info in archive.infolist()]
+    with zipfile.ZipFile(path, "w") as archive:
+        for info, data in members:
+            archive.writestr(info, replacements.get(info.filename, data))
+
+def test_docx_media_cleaned(tmp_path):
+    docx = pytest.importorskip("docx")
+    plain = io.BytesIO()
+    Image.new("RGB", (64, 48)).save(plain, "JPEG")
+    document = docx.Document()
+    document.add_paragraph("Report")
+    document.add_picture(plain)
+    document.core_properties.last_printed = datetime(2024, 5, 1, 12, 0)
+    source = tmp_path / "source.docx"
+    document.save(str(source))
+    # python-docx не распознает JPEG, если первым идет APP1 с XMP, поэтому подменяем картинку в архиве
+    with zipfile.ZipFile(source) as archive:
+        media_name = next(name for name in archive.namelist() if name.startswith("word/media/"))
+    _replace_members(source, {media_name: jpeg_with_private_metadata()})
+    output = _clean(tmp_path, source, ".docx")
+    with zipfile.ZipFile(output) as archive:
+        assert archive.testzip() is None
+        media = [name for name in archive.namelist() if name.startswith("word/media/")]
+        assert len(media) == 1
+        _assert_clean_jpeg(archive.read(media[0]))
+    # Документ после второго прохода по ZIP по-прежнему открывается python-docx
+    reopened = docx.Document(str(output))
+    assert reopened.paragraphs[0].text == "Report" and len(reopened.inline_shapes) == 1
+    assert reopened.core_properties.last_printed is None
+
+def test_odf_pictures_cleaned(tmp_path):
+    source = tmp_path / "source.odt"
+    with zipfile.ZipFile(source, "w") as archive:
+        archive.writestr("mimetype", ODT_MIMETYPE, zipfile.ZIP_STORED)
+        archive.writestr("content.xml", b"<office:document-content/>", zipfile.ZIP_DEFLATED)
+        archive.writestr("Pictures/photo.jpg", jpeg_with_private_metadata(), zipfile.ZIP_DEFLATED)
+        archive.writestr("Thumbnails/thumbnail.png", b"not a picture folder", zipfile.ZIP_DEFLATED)
+    output = _clean(tmp_path, source, ".odt")
+    with zipfile.ZipFile(source) as original, zipfile.ZipFile(output) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == original.namelist()
+        _assert_clean_jpeg(archive.read("Pictures/photo.jpg"))
+        # Папки вне Pictures/ не считаются картинками и копируются как есть
+        assert archive.read("Thumbnails/thumbnail.png") == b"not a picture folder"
+
+def test_pdf_jpeg_images_cleaned(tmp_path):
+    pikepdf = pytest.importorskip("pikepdf")
+    pdf = pikepdf.new()
+    pdf.add_blank_page(page_size=(64, 48))
+    image = pikepdf.Stream(pdf, b"")
+    image.write(jpeg_with_private_metadata(), filter=pikepdf.Name.DCTDecode)
+    image.Type, image.Subtype = pikepdf.Name.XObject, pikepdf.Name.Image
+    image.Width, image.Height, image.BitsPerComponent = 64, 48, 8
+    image.ColorSpace = pikepdf.Name.DeviceRGB
+    pdf.pages[0].Resources = pikepdf.Dictionary(XObject=pikepdf.Dictionary(Im0=image))
+    source = tmp_path / "source.pdf"
+    pdf.save(str(source))
+    output = _clean(tmp_path, source, ".pdf")
+    assert SECRET_NAME not in output.read_bytes()
+    with pikepdf.open(str(output)) as cleaned:
+        stream = cleaned.pages[0].Resources.XObject.Im0
+        assert stream.Filter == pikepdf.Name.DCTDecode
+        _assert_clean_jpeg(stream.read_raw_bytes())
@@ -0,0 +1,53 @@
+# StealthShare v0.1 pre1
+# Copyright (c) 2025 IQUXAe
+# Released under the MIT License. See LICENSE file for details.
+
+import os
+
+import pytest
+
+import fileops
+from fileops import OutputCommitter
+
+
+def _fill_group(committer, directory, count):
+    finals = []
+    for index in range(count):
+        final_path = str(directory / f"file{index}.jpg")
+        temp_path = committer.reserve(final_path)
+        with open(temp_path, "wb") as f:
+            f.write(b"data%d" % index)
+        committer.commit(temp_path, final_path)
+        finals.append(final_path)
+    return finals
+
+@pytest.mark.parametrize("use_staging", [False, True])
+def test_group_flush_failure_removes_uncommitted_temp_files(tmp_path, monkeypatch, use_staging):
+    output_dir = tmp_path / "out"
+    staging_dir = tmp_path / "staging"
+    output_dir.mkdir()
+    staging_dir.mkdir()
+    real_fsync = fileops.fsync_file
+
+    def _failing_fsync(path):
+        if "file2" in os.path.basename(path):
+            raise OSError("disk full")
+        real_fsync(path)
+
+    monkeypatch.setattr(fileops, "fsync_file", _failing_fsync)
+    committer = OutputCommitter("group", group_files=100, group_interval_ms=60000,
+                                staging_dir=str(staging_dir) if use_staging else None)
+    _fill_group(committer, output_dir, 5)
+    with pytest.raises(OSError, match="disk full"):
+        committer.flush()
+    assert os.listdir(output_dir) == []
+    assert os.listdir(staging_dir) == []
+    assert committer.stats['committed'] == 0
+
+def test_group_flush_commits_all_files(tmp_path):
+    committed = []
+    with OutputCommitter("group", group_files=100, group_interval_ms=60000, on_commit=committed.extend) as committer:
+        finals = _fill_group(committer, tmp_path, 3)
+        assert os.listdir(tmp_path) != [] and not any(os.path.exists(path) for path in finals)
+    assert sorted(os.listdir(tmp_path)) == ["file0.jpg", "file1.jpg", "file2.jpg"]
+    assert committed == finals
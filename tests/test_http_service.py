@@ -0,0 +1,85 @@
+# StealthShare v0.1 pre1
+# Copyright (c) 2025 IQUXAe
+# Released under the MIT License. See LICENSE file for details.
+
+import io
+import json
+import threading
+import http.client
+
+import pytest
+
+from http_service import create_server
+
+Image = pytest.importorskip("PIL.Image")
+
+MAX_BODY_SIZE = 256 * 1024
+
+
+@pytest.fixture(scope="module")
+def server():
+    server = create_server("127.0.0.1", 0, workers=1, max_body_size=MAX_BODY_SIZE)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    server.pool.shutdown(wait=True)
+
+def _connection(server):
+    return http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=30)
+
+def _jpeg_with_exif():
+    exif = Image.Exif()
+    exif[0x010F] = "Secret Camera"
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48), (200, 30, 30)).save(buffer, "JPEG", exif=exif.tobytes())
+    return buffer.getvalue()
+
+def test_health(server):
+    conn = _connection(server)
+    conn.request("GET", "/health")
+    response = conn.getresponse()
+    assert response.status == 200
+    assert json.loads(response.read()) == {"status": "ok"}
+
+def test_clean_jpeg(server):
+    payload = _jpeg_with_exif()
+    conn = _connection(server)
+    conn.request("POST", "/clean?ext=.jpg", body=payload)
+    response = conn.getresponse()
+    cleaned = response.read()
+    assert response.status == 200
+    assert response.getheader("X-StealthShare-Profile") == "profile_standard"
+    assert b"Secret Camera" in payload and b"Secret Camera" not in cleaned
+    with Image.open(io.BytesIO(cleaned)) as img:
+        img.load()
+        assert img.size == (64, 48)
+
+def test_chunked_body(server):
+    payload = _jpeg_with_exif()
+    conn = _connection(server)
+    conn.request("POST", "/clean?filename=photo.jpg", body=iter([payload[:100], payload[100:]]),
+                 headers={"Transfer-Encoding": "chunked"}, encode_chunked=True)
+    response = conn.getresponse()
+    cleaned = response.read()
+    assert response.status == 200
+    assert b"Secret Camera" not in cleaned
+    # Соединение переиспользуется для следующего запроса
+    conn.request("GET", "/health")
+    assert conn.getresponse().status == 200
+
+def test_oversized_body(server):
+    conn = _connection(server)
+    conn.request("POST", "/clean?ext=.jpg", body=b"\0" * (MAX_BODY_SIZE + 1))
+    response = conn.getresponse()
+    assert response.status == 413
+    assert json.loads(response.read())["error"] == "Request body too large"
+
+@pytest.mark.parametrize("ext", ["./../x", "a/b", ".exe", "..\\x"])
+def test_bad_extension(server, ext):
+    conn = _connection(server)
+    conn.request("POST", "/clean?ext=" + ext, body=b"data")
+    response = conn.getresponse()
+    assert response.status == 400
+    assert "error" in json.loads(response.read())
@@ -0,0 +1,121 @@
+# StealthShare v0.1 pre1
+# Copyright (c) 2025 IQUXAe
+# Released under the MIT License. See LICENSE file for details.
+
+import io
+
+import pytest
+
+from metadata_cleaner import clean_metadata
+from utils import get_profile_cleaning_options
+from metadata_fixtures import SECRET_NAME, SECRET_GPS, jpeg_with_private_metadata
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def _clean(tmp_path, data, ext, options):
+    source = tmp_path / f"source{ext}"
+    source.write_bytes(data)
+    output = tmp_path / f"cleaned{ext}"
+    assert clean_metadata(str(source), str(output), ext, options)
+    return output.read_bytes()
+
+@pytest.mark.parametrize("profile_key", ["profile_standard", "profile_exif_only", "profile_aggressive"])
+def test_jpeg_private_xmp_and_iptc_removed(tmp_path, profile_key):
+    cleaned = _clean(tmp_path, jpeg_with_private_metadata(), ".jpg", get_profile_cleaning_options(profile_key))
+    assert SECRET_NAME not in cleaned
+    assert SECRET_GPS not in cleaned
+    assert b"Secret Camera" not in cleaned
+    assert b"Photoshop 3.0" not in cleaned
+    with Image.open(io.BytesIO(cleaned)) as img:
+        img.load()
+        assert img.size == (64, 48)
+        assert 0x8825 not in img.getexif()
+        assert img.getexif().get(0x0112) == 6
+
+def test_jpeg_standard_keeps_harmless_xmp(tmp_path):
+    cleaned = _clean(tmp_path, jpeg_with_private_metadata(), ".jpg", get_profile_cleaning_options("profile_standard"))
+    with Image.open(io.BytesIO(cleaned)) as img:
+        xmp = img.info["xmp"]
+    assert b"Holiday" in xmp and b'Rating="3"' in xmp
+
+def test_jpeg_profile_can_keep_xmp_and_iptc(tmp_path):
+    options = get_profile_cleaning_options("profile_standard")
+    options["images"].update(xmp_remove_namespaces=[], xmp_remove_properties=[], iptc=False)
+    cleaned = _clean(tmp_path, jpeg_with_private_metadata(), ".jpg", options)
+    assert SECRET_GPS in cleaned
+    assert b"Photoshop 3.0" in cleaned
+
+def _jpeg_with_thumbnail_and_makernote():
+    piexif = pytest.importorskip("piexif")
+    thumbnail = io.BytesIO()
+    Image.new("RGB", (16, 12), (200, 10, 30)).save(thumbnail, "JPEG")
+    exif = piexif.dump({
+        "0th": {piexif.ImageIFD.Make: b"Secret Camera", piexif.ImageIFD.Orientation: 6},
+        "Exif": {piexif.ExifIFD.DateTimeOriginal: b"2024:01:01 12:00:00", piexif.ExifIFD.MakerNote: b"SECRET-MAKERNOTE"},
+        "GPS": {piexif.GPSIFD.GPSLatitudeRef: b"N", piexif.GPSIFD.GPSLatitude: ((55, 1), (45, 1), (7, 1))},
+        "1st": {piexif.ImageIFD.Compression: 6},
+        "thumbnail": thumbnail.getvalue(),
+    })
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48), (120, 60, 200)).save(buffer, "JPEG", quality=90, exif=exif)
+    return buffer.getvalue(), len(thumbnail.getvalue())
+
+def test_jpeg_thumbnail_and_makernote_removed_when_exif_kept(tmp_path):
+    import piexif
+    data, thumbnail_size = _jpeg_with_thumbnail_and_makernote()
+    cleaned = _clean(tmp_path, data, ".jpg", {'images': {'exif': False}})
+    assert b"SECRET-MAKERNOTE" not in cleaned
+    assert len(cleaned) <= len(data) - thumbnail_size
+    exif = piexif.load(cleaned)
+    assert exif["thumbnail"] is None and not exif["1st"]
+    assert piexif.ExifIFD.MakerNote not in exif["Exif"]
+    assert exif["Exif"][piexif.ExifIFD.DateTimeOriginal] == b"2024:01:01 12:00:00"
+    assert exif["0th"][piexif.ImageIFD.Make] == b"Secret Camera"
+    assert exif["GPS"][piexif.GPSIFD.GPSLatitude] == ((55, 1), (45, 1), (7, 1))
+    with Image.open(io.BytesIO(cleaned)) as img:
+        img.load()
+        assert img.size == (64, 48)
+
+def test_jpeg_thumbnail_and_makernote_kept_on_request(tmp_path):
+    import piexif
+    data, _ = _jpeg_with_thumbnail_and_makernote()
+    cleaned = _clean(tmp_path, data, ".jpg", {'images': {'exif': False, 'thumbnail': False, 'makernote': False}})
+    exif = piexif.load(cleaned)
+    assert exif["thumbnail"] and exif["Exif"][piexif.ExifIFD.MakerNote] == b"SECRET-MAKERNOTE"
+
+def _tiff_with_private_metadata(thumbnail_page=False):
+    from metadata_fixtures import XMP_PACKET, iptc_block
+    tags = {270: "Jane Secret at home", 271: "Secret Camera", 274: 6, 315: "Jane Secret", 700: XMP_PACKET, 33723: iptc_block()}
+    buffer = io.BytesIO()
+    page = Image.new("RGB", (32, 24), (10, 200, 30))
+    if thumbnail_page:
+        # Вторая страница - уменьшенная копия (NewSubfileType = 1), на первой странице флаг не учитывается.
+        # Вложенные IFD Pillow пишет верно только для одной страницы, поэтому EXIF и GPS здесь не добавляются
+        page.save(buffer, "TIFF", save_all=True, tiffinfo={254: 1, **tags}, append_images=[Image.new("RGB", (8, 6), (200, 10, 30))])
+    else:
+        tags.update({34665: {0x9003: "2024:01:01 12:00:00", 0x927C: b"SECRET-MAKERNOTE"}, 34853: {1: "N", 2: (55.0, 45.0, 7.0)}})
+        page.save(buffer, "TIFF", tiffinfo=tags)
+    return buffer.getvalue()
+
+@pytest.mark.parametrize("thumbnail_page", [False, True])
+@pytest.mark.parametrize("profile_key", ["profile_standard", "profile_aggressive"])
+def test_tiff_tags_and_thumbnail_page_removed_in_place(tmp_path, profile_key, thumbnail_page):
+    data = _tiff_with_private_metadata(thumbnail_page)
+    assert data.count(SECRET_NAME) > 1
+    cleaned = _clean(tmp_path, data, ".tif", get_profile_cleaning_options(profile_key))
+    for secret in (SECRET_NAME, SECRET_GPS, b"Secret Camera", b"SECRET-MAKERNOTE"):
+        assert secret not in cleaned
+    with Image.open(io.BytesIO(cleaned)) as img:
+        tags = dict(img.tag_v2)
+        assert img.n_frames == 1
+        assert img.getpixel((0, 0)) == (10, 200, 30)
+        assert 270 not in tags and 271 not in tags and 315 not in tags and 33723 not in tags
+        assert 34853 not in tags and 34665 not in tags
+        assert tags[274] == 6
+        if profile_key == "profile_standard":
+            assert b"Holiday" in tags[700]
+        else:
+            assert 700 not in tags
+            # Данные удаляются обнулением на месте, размер файла не меняется
+            assert len(cleaned) == len(data)
@@ -0,0 +1,171 @@
+# StealthShare v0.1 pre1
+# Copyright (c) 2025 IQUXAe
+# Released under the MIT License. See LICENSE file for details.
+
+import io
+import struct
+
+import pytest
+
+from isobmff import clean_jxl
+from metadata_cleaner import clean_metadata
+from utils import get_profile_cleaning_options
+from metadata_fixtures import (SECRET_NAME, SECRET_GPS, XMP_PACKET, JXL_CODESTREAM, exif_with_gps,
+                               jxl_with_private_metadata)
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def _clean(tmp_path, data, ext, profile_key):
+    source = tmp_path / f"source{ext}"
+    source.write_bytes(data)
+    output = tmp_path / f"cleaned{ext}"
+    assert clean_metadata(str(source), str(output), ext, get_profile_cleaning_options(profile_key))
+    return output.read_bytes()
+
+def _boxes(data, start=0, end=None):
+    boxes = []
+    end = len(data) if end is None else end
+    while start < end:
+        size, box_type = struct.unpack_from(">I4s", data, start)
+        boxes.append((box_type, data[start + 8:start + size]))
+        start += size
+    return boxes
+
+def _find_box(data, *path):
+    for box_type in path:
+        data = dict(_boxes(data))[box_type]
+    return data
+
+def _box(box_type, payload):
+    return struct.pack(">I4s", len(payload) + 8, box_type) + payload
+
+def _full_box(box_type, payload):
+    return _box(box_type, b"\x00\x00\x00\x00" + payload)
+
+def _avif_with_private_metadata():
+    from PIL import features
+    if not features.check("avif"):
+        pytest.skip("Pillow собран без AVIF")
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48), (120, 60, 200)).save(buffer, "AVIF", exif=exif_with_gps(), xmp=XMP_PACKET, quality=90)
+    return buffer.getvalue()
+
+@pytest.mark.parametrize("profile_key", ["profile_standard", "profile_aggressive"])
+def test_avif_metadata_items_removed_without_reencoding(tmp_path, profile_key):
+    data = _avif_with_private_metadata()
+    cleaned = _clean(tmp_path, data, ".avif", profile_key)
+    for secret in (SECRET_NAME, SECRET_GPS, b"Secret Camera"):
+        assert secret not in cleaned
+    assert len(cleaned) < len(data)
+    with Image.open(io.BytesIO(data)) as original, Image.open(io.BytesIO(cleaned)) as img:
+        # Пиксели совпадают с исходником: данные изображения в mdat только сдвинуты, смещения в iloc пересчитаны
+        assert img.tobytes() == original.tobytes()
+        assert dict(img.getexif()) == {0x0112: 6}
+        if profile_key == "profile_standard":
+            assert b"Holiday" in img.info["xmp"]
+        else:
+            assert "xmp" not in img.info
+
+@pytest.mark.parametrize("profile_key", ["profile_standard", "profile_aggressive"])
+def test_jxl_container_boxes_removed(tmp_path, profile_key):
+    data = jxl_with_private_metadata() + struct.pack(">I4s", 16, b"jbrd") + b"\xff\xe1" + SECRET_NAME[:6]
+    cleaned = _clean(tmp_path, data, ".jxl", profile_key)
+    for secret in (SECRET_NAME, SECRET_GPS, b"Secret Camera"):
+        assert secret not in cleaned
+    boxes = dict(_boxes(cleaned))
+    assert boxes[b"jxlc"] == JXL_CODESTREAM
+    assert b"jbrd" not in boxes
+    # Оба профиля оставляют ориентацию, поэтому Exif переписывается, а не удаляется
+    exif = Image.Exif()
+    exif.load(b"Exif\x00\x00" + boxes[b"Exif"][4:])
+    assert dict(exif) == {0x0112: 6} and not exif.get_ifd(0x8825)
+    if profile_key == "profile_standard":
+        assert list(boxes) == [b"JXL ", b"ftyp", b"Exif", b"xml ", b"jxlc"]
+        assert b"Holiday" in boxes[b"xml "]
+    else:
+        assert list(boxes) == [b"JXL ", b"ftyp", b"Exif", b"jxlc"]
+
+def test_bare_jxl_codestream_is_copied(tmp_path):
+    target = io.BytesIO()
+    assert clean_jxl(io.BytesIO(JXL_CODESTREAM), target, None) == []
+    assert target.getvalue() == JXL_CODESTREAM
+
+
+MP4_CHUNKS = (b"CHUNK-ONE-DATA", b"CHUNK-TWO-DATA-LONGER")
+MP4_TIME = struct.pack(">II", 3000000000, 3000000001)
+MP4_STBL_PATH = (b"moov", b"trak", b"mdia", b"minf", b"stbl")
+
+
+def _mp4_parts(offsets, co64):
+    matrix = struct.pack(">9I", 0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000)
+    mvhd = _full_box(b"mvhd", MP4_TIME + struct.pack(">IIIH", 1000, 2000, 0x10000, 0x100) + bytes(10) + matrix + bytes(24) + struct.pack(">I", 2))
+    tkhd = _full_box(b"tkhd", MP4_TIME + struct.pack(">III", 1, 0, 2000) + bytes(8) + struct.pack(">HHHH", 0, 0, 0x100, 0) + matrix + bytes(8))
+    mdhd = _full_box(b"mdhd", MP4_TIME + struct.pack(">IIHH", 1000, 2000, 0x55C4, 0))
+    hdlr = _full_box(b"hdlr", bytes(4) + b"soun" + bytes(13))
+    entry_format = ">Q" if co64 else ">I"
+    table = _full_box(b"co64" if co64 else b"stco",
+                      struct.pack(">I", len(offsets)) + b"".join(struct.pack(entry_format, offset) for offset in offsets))
+    stbl = _box(b"stbl", _full_box(b"stsd", bytes(4)) + _full_box(b"stts", bytes(4))
+                + _full_box(b"stsc", struct.pack(">IIII", 1, 1, 1, 1))
+                + _full_box(b"stsz", struct.pack(">II", 0, len(MP4_CHUNKS)) + b"".join(struct.pack(">I", len(c)) for c in MP4_CHUNKS))
+                + table)
+    trak = _box(b"trak", tkhd + _box(b"mdia", mdhd + hdlr + _box(b"minf", stbl)))
+    # Координаты в udta (©xyz) и XMP в uuid-боксе перед mdat: при удалении mdat сдвигается дважды
+    udta = _box(b"udta", _box(b"\xa9xyz", struct.pack(">HH", 18, 0x15C7) + b"+55.7512+037.6184/"))
+    xmp_uuid = _box(b"uuid", bytes.fromhex("be7acfcb97a942e89c71999491e3afac") + XMP_PACKET)
+    head = _box(b"ftyp", b"isom\x00\x00\x00\x00isommp41") + _box(b"moov", mvhd + trak + udta) + xmp_uuid
+    return head, _box(b"mdat", b"".join(MP4_CHUNKS))
+
+def _mp4_with_private_metadata(tmp_path, co64=False, fragmented=False):
+    mutagen_mp4 = pytest.importorskip("mutagen.mp4")
+    head, _ = _mp4_parts([0, 0], co64)
+    first = len(head) + 8
+    head, mdat = _mp4_parts([first, first + len(MP4_CHUNKS[0])], co64)
+    path = tmp_path / "source.mp4"
+    path.write_bytes(head + mdat + (_box(b"moof", _full_box(b"mfhd", struct.pack(">I", 1))) if fragmented else b""))
+    # Теги iTunes (moov/udta/meta/ilst) дописывает mutagen, он же сам сдвигает таблицу смещений
+    tagged = mutagen_mp4.MP4(str(path))
+    tagged.add_tags()
+    tagged.tags["\xa9ART"] = [SECRET_NAME.decode()]
+    tagged.tags["\xa9nam"] = ["Holiday"]
+    tagged.save()
+    return path.read_bytes()
+
+def _chunk_offsets(data):
+    stbl = dict(_boxes(_find_box(data, *MP4_STBL_PATH)))
+    table, entry_format = (stbl[b"co64"], ">Q") if b"co64" in stbl else (stbl[b"stco"], ">I")
+    count = struct.unpack_from(">I", table, 4)[0]
+    return [struct.unpack_from(entry_format, table, 8 + index * struct.calcsize(entry_format))[0] for index in range(count)]
+
+def _chunks_at_offsets(data):
+    return tuple(data[offset:offset + len(chunk)] for offset, chunk in zip(_chunk_offsets(data), MP4_CHUNKS))
+
+@pytest.mark.parametrize("co64", [False, True])
+def test_mp4_metadata_removed_and_chunk_offsets_fixed(tmp_path, co64):
+    from mutagen.mp4 import MP4
+    data = _mp4_with_private_metadata(tmp_path, co64)
+    assert _chunks_at_offsets(data) == MP4_CHUNKS
+    cleaned = _clean(tmp_path, data, ".mp4", "profile_standard")
+    for secret in (SECRET_NAME, SECRET_GPS, b"+55.7512", b"Holiday", MP4_TIME):
+        assert secret not in cleaned
+    assert len(cleaned) < len(data)
+    assert [box_type for box_type, _ in _boxes(cleaned)] == [b"ftyp", b"moov", b"mdat"]
+    assert b"udta" not in dict(_boxes(_find_box(cleaned, b"moov")))
+    # mdat сдвинулся назад, смещения чанков в stco/co64 указывают на те же байты
+    assert _chunk_offsets(cleaned) != _chunk_offsets(data)
+    assert _chunks_at_offsets(cleaned) == MP4_CHUNKS
+    reread = MP4(str(tmp_path / "cleaned.mp4"))
+    assert not reread.tags
+    assert reread.info.length == 2.0
+
+def test_fragmented_mp4_keeps_atom_sizes(tmp_path):
+    data = _mp4_with_private_metadata(tmp_path, fragmented=True)
+    cleaned = _clean(tmp_path, data, ".mp4", "profile_standard")
+    for secret in (SECRET_NAME, b"+55.7512", MP4_TIME):
+        assert secret not in cleaned
+    # Рядом с moof смещения не пересчитываются: удаленные атомы заменены на free того же размера
+    assert len(cleaned) == len(data)
+    assert [box_type for box_type, _ in _boxes(cleaned)] == [b"ftyp", b"moov", b"free", b"mdat", b"moof"]
+    assert _chunk_offsets(cleaned) == _chunk_offsets(data)
+    assert _chunks_at_offsets(cleaned) == MP4_CHUNKS
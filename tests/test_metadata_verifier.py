@@ -0,0 +1,97 @@
+# StealthShare v0.1 pre1
+# Copyright (c) 2025 IQUXAe
+# Released under the MIT License. See LICENSE file for details.
+
+import io
+
+import pytest
+
+from metadata_cleaner import clean_metadata
+from metadata_verifier import scan_metadata_classes, verify_cleaned_file
+from utils import get_profile_cleaning_options
+from metadata_fixtures import XMP_PACKET, iptc_block, jpeg_with_private_metadata, jxl_with_private_metadata
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def _write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+def _tiff_with_private_metadata():
+    buffer = io.BytesIO()
+    Image.new("RGB", (32, 24), (10, 200, 30)).save(buffer, "TIFF", tiffinfo={700: XMP_PACKET, 33723: iptc_block()})
+    return buffer.getvalue()
+
+def _png_with_private_xmp():
+    from PIL import PngImagePlugin
+    info = PngImagePlugin.PngInfo()
+    info.add_itxt("XML:com.adobe.xmp", XMP_PACKET.decode("utf-8"), zip=True)
+    buffer = io.BytesIO()
+    Image.new("RGB", (32, 24), (10, 200, 30)).save(buffer, "PNG", pnginfo=info)
+    return buffer.getvalue()
+
+def test_xmp_and_iptc_copies_are_classified(tmp_path):
+    source = _write(tmp_path, "source.jpg", jpeg_with_private_metadata())
+    assert {"exif", "gps", "xmp", "iptc", "author"} <= scan_metadata_classes(source, ".jpg")
+    assert {"gps", "xmp", "iptc", "author"} <= scan_metadata_classes(_write(tmp_path, "source.tif", _tiff_with_private_metadata()), ".tif")
+    png_classes = scan_metadata_classes(_write(tmp_path, "source.png", _png_with_private_xmp()), ".png")
+    assert {"gps", "xmp", "author"} <= png_classes and "exif" not in png_classes
+    assert {"exif", "gps", "xmp", "author"} <= scan_metadata_classes(_write(tmp_path, "source.jxl", jxl_with_private_metadata()), ".jxl")
+
+@pytest.mark.parametrize("ext, build", [(".jpg", jpeg_with_private_metadata), (".tif", _tiff_with_private_metadata),
+                                        (".png", _png_with_private_xmp), (".jxl", jxl_with_private_metadata)])
+@pytest.mark.parametrize("profile_key", ["profile_standard", "profile_exif_only"])
+def test_filtering_profiles_verify_xmp_gps_and_author(tmp_path, ext, build, profile_key):
+    options = get_profile_cleaning_options(profile_key)
+    source = _write(tmp_path, "source" + ext, build())
+    remaining = verify_cleaned_file(source, ext, options)
+    assert "gps" in remaining and "author" in remaining
+    output = str(tmp_path / ("cleaned" + ext))
+    assert clean_metadata(source, output, ext, options)
+    assert verify_cleaned_file(output, ext, options) == []
+
+def test_profile_keeping_xmp_does_not_forbid_xmp_gps(tmp_path):
+    options = get_profile_cleaning_options("profile_standard")
+    options["images"] = dict(options["images"], xmp_remove_namespaces=[], xmp_remove_properties=[], iptc=False)
+    source = _write(tmp_path, "source.jpg", jpeg_with_private_metadata())
+    output = str(tmp_path / "cleaned.jpg")
+    assert clean_metadata(source, output, ".jpg", options)
+    assert {"gps", "author"} <= scan_metadata_classes(output, ".jpg")
+    assert verify_cleaned_file(output, ".jpg", options) == []
+
+def _pdf(tmp_path, name, with_metadata):
+    import zlib
+    pikepdf = pytest.importorskip("pikepdf")
+    pdf = pikepdf.new()
+    pdf.add_blank_page(page_size=(64, 48))
+    # Картинка DCTDecode несет свой пакет XMP в APP1 - это не XMP документа
+    image = pikepdf.Stream(pdf, b"")
+    image.write(jpeg_with_private_metadata(), filter=pikepdf.Name.DCTDecode)
+    image.Type, image.Subtype = pikepdf.Name.XObject, pikepdf.Name.Image
+    image.Width, image.Height, image.BitsPerComponent = 64, 48, 8
+    image.ColorSpace = pikepdf.Name.DeviceRGB
+    pdf.pages[0].Resources = pikepdf.Dictionary(XObject=pikepdf.Dictionary(Im0=image))
+    if with_metadata:
+        metadata = pikepdf.Stream(pdf, b"")
+        metadata.write(zlib.compress(XMP_PACKET), filter=pikepdf.Name.FlateDecode)
+        metadata.Type, metadata.Subtype = pikepdf.Name.Metadata, pikepdf.Name.XML
+        pdf.Root.Metadata = metadata
+        pdf.docinfo["/Author"] = "Jane Secret"
+    path = str(tmp_path / name)
+    pdf.save(path)
+    return path
+
+def test_pdf_scan_reads_catalog_metadata_and_info(tmp_path):
+    source = _pdf(tmp_path, "source.pdf", with_metadata=True)
+    # Открытым текстом пакет есть только в картинке, XMP документа сжат
+    assert open(source, "rb").read().count(XMP_PACKET) == 1
+    assert scan_metadata_classes(source, ".pdf") == {"pdf_info", "pdf_xmp"}
+    assert scan_metadata_classes(_pdf(tmp_path, "images_only.pdf", with_metadata=False), ".pdf") == set()
+
+    options = get_profile_cleaning_options("profile_aggressive")
+    assert verify_cleaned_file(source, ".pdf", options) == ["pdf_info", "pdf_xmp"]
+    output = str(tmp_path / "cleaned.pdf")
+    assert clean_metadata(source, output, ".pdf", options)
+    assert verify_cleaned_file(output, ".pdf", options) == []
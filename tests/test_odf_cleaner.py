@@ -0,0 +1,73 @@
+# StealthShare v0.1 pre1
+# Copyright (c) 2025 IQUXAe
+# Released under the MIT License. See LICENSE file for details.
+
+import zipfile
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from metadata_cleaner import clean_metadata
+from metadata_verifier import verify_cleaned_file
+from utils import get_profile_cleaning_options
+from metadata_fixtures import SECRET_NAME
+
+ODT_MIMETYPE = b"application/vnd.oasis.opendocument.text"
+META_NS = "urn:oasis:names:tc:opendocument:xmlns:meta:1.0"
+DC_NS = "http://purl.org/dc/elements/1.1/"
+CONTENT_XML = (b'<?xml version="1.0" encoding="UTF-8"?><office:document-content '
+               b'xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0" '
+               b'xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0"><office:body><office:text>'
+               + b"<text:p>Body text</text:p>" * 200 + b"</office:text></office:body></office:document-content>")
+META_XML = (b'<?xml version="1.0" encoding="UTF-8"?><office:document-meta '
+            b'xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0" xmlns:meta="' + META_NS.encode()
+            + b'" xmlns:dc="' + DC_NS.encode() + b'" office:version="1.3"><office:meta>'
+            b"<meta:initial-creator>" + SECRET_NAME + b"</meta:initial-creator>"
+            b"<dc:creator>" + SECRET_NAME + b"</dc:creator>"
+            b"<meta:creation-date>2024-01-01T12:00:00</meta:creation-date>"
+            b'<meta:template xlink:href="/home/jane/Templates/letter.ott" xmlns:xlink="http://www.w3.org/1999/xlink"/>'
+            b'<meta:document-statistic meta:page-count="1" meta:word-count="400"/>'
+            b'<meta:user-defined meta:name="Client">Secret Client</meta:user-defined>'
+            b"</office:meta></office:document-meta>")
+MANIFEST_XML = (b'<?xml version="1.0" encoding="UTF-8"?><manifest:manifest '
+                b'xmlns:manifest="urn:oasis:names:tc:opendocument:xmlns:manifest:1.0" manifest:version="1.3">'
+                b'<manifest:file-entry manifest:full-path="/" manifest:media-type="application/vnd.oasis.opendocument.text"/>'
+                b"</manifest:manifest>")
+
+
+def _odt(tmp_path):
+    path = tmp_path / "source.odt"
+    with zipfile.ZipFile(path, "w") as archive:
+        # mimetype - первый член, без сжатия
+        archive.writestr(zipfile.ZipInfo("mimetype", date_time=(2024, 5, 6, 7, 8, 10)), ODT_MIMETYPE, zipfile.ZIP_STORED)
+        for name, data in (("content.xml", CONTENT_XML), ("meta.xml", META_XML), ("META-INF/manifest.xml", MANIFEST_XML)):
+            archive.writestr(zipfile.ZipInfo(name, date_time=(2024, 5, 6, 7, 8, 10)), data, zipfile.ZIP_DEFLATED)
+    return path
+
+@pytest.mark.parametrize("profile_key", ["profile_standard", "profile_aggressive"])
+def test_odf_meta_cleaned_and_members_copied(tmp_path, profile_key):
+    source = _odt(tmp_path)
+    output = tmp_path / "cleaned.odt"
+    options = get_profile_cleaning_options(profile_key)
+    assert verify_cleaned_file(str(source), ".odt", options)
+    assert clean_metadata(str(source), str(output), ".odt", options)
+    assert verify_cleaned_file(str(output), ".odt", options) == []
+
+    with zipfile.ZipFile(source) as original, zipfile.ZipFile(output) as archive:
+        assert archive.testzip() is None
+        infos = archive.infolist()
+        assert [info.filename for info in infos] == ["mimetype", "content.xml", "meta.xml", "META-INF/manifest.xml"]
+        assert infos[0].compress_type == zipfile.ZIP_STORED and archive.read("mimetype") == ODT_MIMETYPE
+        # Члены кроме meta.xml перенесены сжатыми как были
+        for name in ("content.xml", "META-INF/manifest.xml"):
+            assert archive.getinfo(name).compress_size == original.getinfo(name).compress_size
+            assert archive.read(name) == original.read(name)
+        meta = ET.fromstring(archive.read("meta.xml"))
+    assert SECRET_NAME not in output.read_bytes()
+    office_meta = meta[0]
+    for tag in ("initial-creator", "creation-date", "template"):
+        assert office_meta.find(f"{{{META_NS}}}{tag}") is None
+    assert office_meta.find(f"{{{DC_NS}}}creator") is None
+    assert office_meta.find(f"{{{META_NS}}}document-statistic").get(f"{{{META_NS}}}word-count") == "400"
+    user_defined = office_meta.find(f"{{{META_NS}}}user-defined")
+    assert (user_defined is not None) == (profile_key == "profile_standard")
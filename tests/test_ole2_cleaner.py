@@ -0,0 +1,141 @@
+# StealthShare v0.1 pre1
+# Copyright (c) 2025 IQUXAe
+# Released under the MIT License. See LICENSE file for details.
+
+import struct
+
+import pytest
+
+from metadata_cleaner import clean_metadata
+from metadata_verifier import verify_cleaned_file
+from ole2_cleaner import FMTID_SUMMARY, FMTID_DOC_SUMMARY, FMTID_USER_DEFINED
+from utils import get_profile_cleaning_options
+from metadata_fixtures import SECRET_NAME
+
+olefile = pytest.importorskip("olefile")
+
+SECTOR_SIZE = 512
+MINI_SECTOR_SIZE = 64
+MINI_STREAM_CUTOFF = 4096
+END_OF_CHAIN, FAT_SECTOR, FREE_SECTOR, NO_STREAM = 0xFFFFFFFE, 0xFFFFFFFD, 0xFFFFFFFF, 0xFFFFFFFF
+VT_I2, VT_LPSTR = 2, 0x1E
+WORD_DOCUMENT = bytes(range(256)) * 20
+CODEPAGE = 1252
+
+
+def _property_value(value):
+    if isinstance(value, int):
+        return struct.pack("<IH", VT_I2, value) + b"\x00\x00"
+    data = value.encode("cp1252") + b"\x00"
+    return struct.pack("<II", VT_LPSTR, len(data)) + data + b"\x00" * (-len(data) % 4)
+
+def _property_section(properties):
+    table, values = b"", b""
+    values_start = 8 + len(properties) * 8
+    for property_id, value in properties:
+        table += struct.pack("<II", property_id, values_start + len(values))
+        values += _property_value(value)
+    return struct.pack("<II", values_start + len(values), len(properties)) + table + values
+
+def _property_set(sections):
+    header = b"\xfe\xff\x00\x00" + struct.pack("<I", 0x00020006) + bytes(16) + struct.pack("<I", len(sections))
+    offset = len(header) + len(sections) * 20
+    for fmtid, section in sections:
+        header += fmtid + struct.pack("<I", offset)
+        offset += len(section)
+    return header + b"".join(section for _, section in sections)
+
+def _summary_information():
+    # Поток меньше 4096 байт - лежит в мини-потоке
+    return _property_set([(FMTID_SUMMARY, _property_section([
+        (1, CODEPAGE), (2, "Secret plans"), (4, SECRET_NAME.decode()), (8, SECRET_NAME.decode()), (18, "Microsoft Word 8.0"),
+    ]))])
+
+def _document_summary_information():
+    # Пользовательское свойство на 5000 байт выносит поток в обычные секторы
+    return _property_set([
+        (FMTID_DOC_SUMMARY, _property_section([(1, CODEPAGE), (14, SECRET_NAME.decode()), (15, "Secret Corp")])),
+        (FMTID_USER_DEFINED, _property_section([(1, CODEPAGE), (2, "C" * 5000)])),
+    ])
+
+def _compound_file(streams):
+    # Минимальный составной файл v3: сектор 0 - FAT, дальше MiniFAT, мини-поток, каталог и большие потоки
+    sectors, fat = [b""], {0: FAT_SECTOR}
+
+    def _add_chain(data):
+        start = len(sectors)
+        count = max(1, -(-len(data) // SECTOR_SIZE))
+        for index in range(count):
+            sectors.append(data[index * SECTOR_SIZE:(index + 1) * SECTOR_SIZE].ljust(SECTOR_SIZE, b"\x00"))
+            fat[start + index] = start + index + 1 if index < count - 1 else END_OF_CHAIN
+        return start
+
+    mini_stream, minifat, entries = b"", [], []
+    for name, data in streams:
+        if len(data) < MINI_STREAM_CUTOFF:
+            start = len(mini_stream) // MINI_SECTOR_SIZE
+            count = -(-len(data) // MINI_SECTOR_SIZE)
+            minifat += [start + index + 1 for index in range(count - 1)] + [END_OF_CHAIN]
+            mini_stream += data.ljust(count * MINI_SECTOR_SIZE, b"\x00")
+        else:
+            start = _add_chain(data)
+        entries.append((name, 2, start, len(data)))
+    minifat_start = _add_chain(b"".join(struct.pack("<I", value) for value in minifat))
+    entries.insert(0, ("Root Entry", 5, _add_chain(mini_stream), len(mini_stream)))
+
+    directory = b""
+    for index, (name, entry_type, start, size) in enumerate(entries):
+        encoded = (name + "\x00").encode("utf-16-le")
+        child = 1 if index == 0 else NO_STREAM
+        right = index + 1 if 0 < index < len(entries) - 1 else NO_STREAM
+        directory += (encoded.ljust(64, b"\x00") + struct.pack("<HBBIII", len(encoded), entry_type, 1, NO_STREAM, right, child)
+                      + bytes(36) + struct.pack("<IQ", start, size))
+    unused = b"\x00" * 68 + struct.pack("<III", NO_STREAM, NO_STREAM, NO_STREAM) + bytes(48)
+    directory += unused * (-len(entries) % (SECTOR_SIZE // 128))
+    directory_start = _add_chain(directory)
+
+    sectors[0] = b"".join(struct.pack("<I", fat.get(index, FREE_SECTOR)) for index in range(SECTOR_SIZE // 4))
+    header = (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1" + bytes(16) + struct.pack("<HHHHH", 0x3E, 3, 0xFFFE, 9, 6) + bytes(6)
+              + struct.pack("<IIIIIIIII", 0, 1, directory_start, 0, MINI_STREAM_CUTOFF, minifat_start, 1, END_OF_CHAIN, 0)
+              + struct.pack("<I", 0) + struct.pack("<I", FREE_SECTOR) * 108)
+    return header + b"".join(sectors)
+
+def _doc_with_properties(tmp_path):
+    data = _compound_file([
+        ("WordDocument", WORD_DOCUMENT),
+        ("\x05SummaryInformation", _summary_information()),
+        ("\x05DocumentSummaryInformation", _document_summary_information()),
+    ])
+    path = tmp_path / "source.doc"
+    path.write_bytes(data)
+    return path
+
+def test_fixture_is_read_by_olefile(tmp_path):
+    with olefile.OleFileIO(str(_doc_with_properties(tmp_path))) as ole:
+        metadata = ole.get_metadata()
+        assert metadata.author == SECRET_NAME and metadata.company == b"Secret Corp"
+        assert ole.get_size("\x05DocumentSummaryInformation") >= 4096 > ole.get_size("\x05SummaryInformation")
+
+@pytest.mark.parametrize("profile_key", ["profile_standard", "profile_aggressive"])
+def test_ole2_property_streams_rewritten_in_place(tmp_path, profile_key):
+    source = _doc_with_properties(tmp_path)
+    output = tmp_path / "cleaned.doc"
+    options = get_profile_cleaning_options(profile_key)
+    assert verify_cleaned_file(str(source), ".doc", options)
+    assert clean_metadata(str(source), str(output), ".doc", options)
+    assert verify_cleaned_file(str(output), ".doc", options) == []
+    cleaned = output.read_bytes()
+    assert SECRET_NAME not in cleaned and b"Secret Corp" not in cleaned and b"Secret plans" not in cleaned
+    # Потоки переписаны поверх своих секторов: размер файла, FAT и каталог те же
+    assert len(cleaned) == source.stat().st_size
+    with olefile.OleFileIO(str(output)) as ole:
+        assert sorted(ole.listdir()) == sorted([["WordDocument"], ["\x05SummaryInformation"], ["\x05DocumentSummaryInformation"]])
+        assert ole.openstream("WordDocument").read() == WORD_DOCUMENT
+        metadata = ole.get_metadata()
+        assert metadata.author is None and metadata.last_saved_by is None and metadata.title is None
+        assert metadata.company is None
+        assert metadata.codepage == CODEPAGE
+        properties = ole.getproperties("\x05DocumentSummaryInformation")
+        assert properties[1] == CODEPAGE
+        custom_kept = b"C" * 5000 in ole.openstream("\x05DocumentSummaryInformation").read()
+        assert custom_kept == (profile_key == "profile_standard")
@@ -0,0 +1,87 @@
+# StealthShare v0.1 pre1
+# Copyright (c) 2025 IQUXAe
+# Released under the MIT License. See LICENSE file for details.
+
+import io
+import os
+import struct
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from zip_stream import rewrite_zip
+
+ORIGINAL_DATE = (2024, 5, 6, 7, 8, 10)
+TEXT = b"metadata-free text " * 500
+NOISE = os.urandom(4096)
+
+
+class _NonSeekable(io.RawIOBase):
+    # Запись в поток без seek: zipfile ставит флаг 0x08 и пишет дескриптор данных после члена
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+
+def _source_zip():
+    stream = _NonSeekable()
+    with zipfile.ZipFile(stream, "w") as archive:
+        archive.writestr(zipfile.ZipInfo("mimetype", ORIGINAL_DATE), b"application/test", zipfile.ZIP_STORED)
+        archive.writestr(zipfile.ZipInfo("docs/", ORIGINAL_DATE), b"")
+        archive.writestr(zipfile.ZipInfo("docs/text.txt", ORIGINAL_DATE), TEXT, zipfile.ZIP_DEFLATED)
+        archive.writestr(zipfile.ZipInfo("docs/replace.txt", ORIGINAL_DATE), b"secret " * 300, zipfile.ZIP_DEFLATED)
+        archive.writestr(zipfile.ZipInfo("media/noise.bin", ORIGINAL_DATE), NOISE, zipfile.ZIP_DEFLATED)
+        archive.writestr(zipfile.ZipInfo("média/ünïcode.txt", ORIGINAL_DATE), b"utf-8 name", zipfile.ZIP_DEFLATED)
+    return bytes(stream.buffer)
+
+def _raw_member(data, info):
+    name_length, extra_length = struct.unpack_from("<HH", data, info.header_offset + 26)
+    start = info.header_offset + 30 + name_length + extra_length
+    return data[start:start + info.compress_size]
+
+def _transform(info):
+    if info.filename == "docs/replace.txt":
+        return lambda data: data.replace(b"secret", b"public")
+    if info.filename == "media/noise.bin":
+        # Несжимаемые данные после замены пишутся без сжатия
+        return lambda data: data[::-1]
+    if info.filename == "docs/text.txt":
+        # None от функции - член остается как был
+        return lambda data: None
+    return None
+
+@pytest.mark.parametrize("threads", [0, 4])
+@pytest.mark.parametrize("scrub_dates", [False, True])
+def test_rewrite_zip_copies_members_raw(threads, scrub_dates):
+    data = _source_zip()
+    target = io.BytesIO()
+    if threads:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            rewrite_zip(io.BytesIO(data), target, _transform, scrub_dates=scrub_dates, executor=executor)
+    else:
+        rewrite_zip(io.BytesIO(data), target, _transform, scrub_dates=scrub_dates)
+    cleaned = target.getvalue()
+
+    with zipfile.ZipFile(io.BytesIO(data)) as original, zipfile.ZipFile(io.BytesIO(cleaned)) as archive:
+        assert all(info.flag_bits & 0x08 for info in original.infolist() if not info.is_dir())
+        assert archive.testzip() is None
+        assert archive.namelist() == original.namelist()
+        assert archive.read("docs/replace.txt") == b"public " * 300
+        assert archive.read("media/noise.bin") == NOISE[::-1]
+        assert archive.getinfo("media/noise.bin").compress_type == zipfile.ZIP_STORED
+        assert archive.read("média/ünïcode.txt") == b"utf-8 name"
+        for info in archive.infolist():
+            # Дескрипторы данных не нужны: размеры и CRC записаны в локальный заголовок
+            assert not info.flag_bits & 0x08
+            assert info.date_time == ((1980, 1, 1, 0, 0, 0) if scrub_dates else ORIGINAL_DATE)
+        for name in ("mimetype", "docs/text.txt", "média/ünïcode.txt"):
+            # Нетронутые члены скопированы в сжатом виде байт в байт
+            assert _raw_member(cleaned, archive.getinfo(name)) == _raw_member(data, original.getinfo(name))
+            assert archive.getinfo(name).CRC == original.getinfo(name).CRC
@@ -9,12 +9,36 @@ import locale
 
 logger = logging.getLogger("StealthShareApp")
 
+
+class LogList:
+    # Аргумент для ленивого %-форматирования: список сортируется и склеивается, только если запись выводится
+    __slots__ = ("items",)
+
+    def __init__(self, items):
+        self.items = items
+
+    def __str__(self):
+        return ",".join(sorted(set(map(str, self.items)))) or "-"
+
 FILE_CATEGORIES = {
-    "Images": ['.jpg', '.jpeg', '.png', '.tiff', '.tif', '.gif', '.webp', '.bmp'],
-    "Documents": ['.docx', '.xlsx', '.pptx'],
-    "PDF": ['.pdf']
+    "Images": ['.jpg', '.jpeg', '.png', '.tiff', '.tif', '.gif', '.webp', '.bmp', '.heic', '.heif', '.avif', '.jxl'],
+    "Documents": ['.docx', '.xlsx', '.pptx', '.odt', '.ods', '.odp', '.doc', '.xls', '.ppt'],
+    "Videos": ['.mp4', '.mov', '.m4v'],
+    "Audio": ['.mp3', '.flac', '.ogg', '.oga', '.opus', '.m4a'],
+    "PDF": ['.pdf'],
+    "Archives": ['.zip', '.tar', '.tgz', '.tar.gz']
 }
 
+# Составные расширения, которые нельзя разделить по последней точке
+COMPOUND_EXTENSIONS = ['.tar.gz']
+
+def split_extension(filename):
+    lower_name = filename.lower()
+    for compound_ext in COMPOUND_EXTENSIONS:
+        if lower_name.endswith(compound_ext) and len(filename) > len(compound_ext):
+            return filename[:-len(compound_ext)], filename[-len(compound_ext):]
+    return os.path.splitext(filename)
+
 LANGUAGES = {
     "ru": {
         "app_title_suffix": "Очистка метаданных",
@@ -58,7 +82,7 @@ LANGUAGES = {
         "profile_aggressive_name": "Агрессивный",
         "profile_aggressive_desc": "Пытается удалить максимум метаданных, включая XMP, IPTC, все чанки PNG. Может повлиять на некоторые специфические функции файлов.",
         "profile_exif_only_name": "Только EXIF (для фото)",
-        "profile_exif_only_desc": "Удаляет только EXIF-данные из изображений, остальное не трогает.",
+        "profile_exif_only_desc": "Удаляет EXIF-данные из изображений, а также их копии в XMP и IPTC (место съемки, автор), остальное не трогает.",
         "error_browse_files_title": "Ошибка выбора файлов",
         "error_browse_files_message": "Не удалось открыть диалог: {error}",
         "error_browse_output_dir_title": "Ошибка выбора папки",
@@ -75,10 +99,30 @@ LANGUAGES = {
         "batch_start_log": "--- НАЧАЛО ПАКЕТНОЙ ОЧИСТКИ ({count} файлов) ---",
         "file_skipped_not_found_log": "Файл '{filename}' пропущен (не найден).",
         "cleaned_name_error_log": "Не удалось сгенерировать имя для очищенного файла: {filename}",
-        "file_processed_success_log": "Успешно обработан: {filename_in} -> {filename_out}",
         "file_processed_error_log": "Ошибка при обработке: {filename}",
         "file_critical_error_log": "Крит. ошибка при очистке '{filename}': {error}",
-        "batch_finish_log": "--- ПАКЕТНАЯ ОБРАБОТКА ЗАВЕРШЕНА --- {summary}"
+        "batch_finish_log": "--- ПАКЕТНАЯ ОБРАБОТКА ЗАВЕРШЕНА --- {summary}",
+        "file_verification_failed_log": "В '{filename}' остались метаданные: {classes}",
+        "verification_failed_reason": "остались метаданные: {classes}",
+        "duplicate_source_failed_reason": "дубликат файла с ошибкой: {original}",
+        "output_commit_error_log": "Не удалось зафиксировать очищенные файлы на диске: {error}",
+        "output_commit_failed_reason": "ошибка записи на диск ({error})",
+        "file_worker_failed_log": "Очистка '{filename}' прервана: {error}",
+        "worker_timeout_reason": "превышено время очистки",
+        "worker_crashed_reason": "процесс очистки упал",
+        "report_saved_message": "Отчет: {path}",
+        "report_write_error_log": "Не удалось записать отчет о пакете: {error}",
+        "pause_button": "⏸ Пауза",
+        "resume_button": "▶ Продолжить",
+        "cancel_button": "⏹ Отмена",
+        "status_paused": "Обработка приостановлена.",
+        "status_resumed": "Обработка продолжена.",
+        "status_cancelling": "Отмена... текущий файл будет остановлен.",
+        "status_cancelled_summary": "Обработка отменена. Успешно: {success_count} из {total_files}.",
+        "dialog_report_title_cancelled": "Обработка отменена",
+        "batch_cancelled_log": "Пакет отменен: не обработано файлов: {remaining}",
+        "dialog_resume_batch_title": "Незавершенный пакет",
+        "dialog_resume_batch_message": "Прошлая обработка была прервана, осталось файлов: {count} (папка результатов: {folder}).\nДобавить их в список?"
 
     },
     "en": {
@@ -123,7 +167,7 @@ LANGUAGES = {
         "profile_aggressive_name": "Aggressive",
         "profile_aggressive_desc": "Attempts to remove maximum metadata, including XMP, IPTC, all PNG chunks. May affect some specific file functionalities.",
         "profile_exif_only_name": "EXIF Only (for photos)",
-        "profile_exif_only_desc": "Removes only EXIF data from images, leaves other data untouched.",
+        "profile_exif_only_desc": "Removes EXIF data from images, along with its copies in XMP and IPTC (location, author), leaves other data untouched.",
         "error_browse_files_title": "File Selection Error",
         "error_browse_files_message": "Could not open file dialog: {error}",
         "error_browse_output_dir_title": "Folder Selection Error",
@@ -140,10 +184,30 @@ LANGUAGES = {
         "batch_start_log": "--- BATCH CLEANING STARTED ({count} files) ---",
         "file_skipped_not_found_log": "File '{filename}' skipped (not found).",
         "cleaned_name_error_log": "Could not generate cleaned filename for: {filename}",
-        "file_processed_success_log": "Successfully processed: {filename_in} -> {filename_out}",
         "file_processed_error_log": "Error processing: {filename}",
         "file_critical_error_log": "Critical error cleaning '{filename}': {error}",
-        "batch_finish_log": "--- BATCH CLEANING FINISHED --- {summary}"
+        "batch_finish_log": "--- BATCH CLEANING FINISHED --- {summary}",
+        "file_verification_failed_log": "Metadata still present in '{filename}': {classes}",
+        "verification_failed_reason": "metadata remains: {classes}",
+        "duplicate_source_failed_reason": "duplicate of a file that failed: {original}",
+        "output_commit_error_log": "Could not commit cleaned files to disk: {error}",
+        "output_commit_failed_reason": "disk write error ({error})",
+        "file_worker_failed_log": "Cleaning of '{filename}' was stopped: {error}",
+        "worker_timeout_reason": "cleaning timed out",
+        "worker_crashed_reason": "cleaner process crashed",
+        "report_saved_message": "Report: {path}",
+        "report_write_error_log": "Could not write the batch report: {error}",
+        "pause_button": "⏸ Pause",
+        "resume_button": "▶ Resume",
+        "cancel_button": "⏹ Cancel",
+        "status_paused": "Paused.",
+        "status_resumed": "Processing resumed.",
+        "status_cancelling": "Cancelling... the current file will be stopped.",
+        "status_cancelled_summary": "Processing cancelled. Successful: {success_count} of {total_files}.",
+        "dialog_report_title_cancelled": "Processing Cancelled",
+        "batch_cancelled_log": "Batch cancelled: {remaining} file(s) not processed.",
+        "dialog_resume_batch_title": "Unfinished Batch",
+        "dialog_resume_batch_message": "The last batch was interrupted with {count} file(s) left (output folder: {folder}).\nAdd them to the list?"
     }
 }
 
@@ -175,36 +239,76 @@ def determine_initial_language(prompt_if_unknown=False):
     
     return None if prompt_if_unknown else "en"
 
+# Теги, без которых фото отображается неправильно (поворот, цвета, масштаб печати); ничего личного в них нет
+DEFAULT_EXIF_KEEP_TAGS = ['Orientation', 'ColorSpace', 'XResolution', 'YResolution', 'ResolutionUnit']
+
 CLEANING_PROFILES = {
     "profile_standard": { 
         "options": {
-            'images': {'exif': True, 'xmp_iptc': False, 'png_chunks': False}, 
+            'images': {'exif': True, 'exif_keep': DEFAULT_EXIF_KEEP_TAGS, 'xmp_iptc': False, 'png_chunks': False},
             'pdf': {'info_dict': True, 'xmp': False},
-            'office': {'core_properties': True, 'custom_properties': False}
+            'office': {'core_properties': True, 'custom_properties': False},
+            'video': {'metadata': True, 'timestamps': True},
+            'audio': {'tags': True}
         }
     },
     "profile_aggressive": {
         "options": {
-            'images': {'exif': True, 'xmp_iptc': True, 'png_chunks': True},
+            'images': {'exif': True, 'exif_keep': ['Orientation'], 'xmp_iptc': True, 'png_chunks': True},
             'pdf': {'info_dict': True, 'xmp': True},
-            'office': {'core_properties': True, 'custom_properties': True} 
+            'office': {'core_properties': True, 'custom_properties': True},
+            'video': {'metadata': True, 'timestamps': True},
+            'audio': {'tags': True}
         }
     },
     "profile_exif_only": {
         "options": {
-            'images': {'exif': True, 'xmp_iptc': False, 'png_chunks': False},
+            'images': {'exif': True, 'exif_keep': DEFAULT_EXIF_KEEP_TAGS, 'xmp_iptc': False, 'png_chunks': False, 'comments': False},
             'pdf': {'info_dict': False, 'xmp': False}, 
-            'office': {'core_properties': False, 'custom_properties': False}
+            'office': {'core_properties': False, 'custom_properties': False},
+            'video': {'metadata': True, 'timestamps': False},
+            'audio': {'tags': False}
         }
     }
 }
 
+def get_profile_cleaning_options(profile_key, preserve_icc=True):
+    profile_data = CLEANING_PROFILES.get(profile_key)
+    if not profile_data: # Fallback to first profile if key is somehow invalid
+        profile_key = list(CLEANING_PROFILES.keys())[0]
+        profile_data = CLEANING_PROFILES[profile_key]
+
+    profile_options = profile_data['options']
+
+    final_options = {
+        'images': profile_options.get('images', {}).copy(),
+        'pdf': profile_options.get('pdf', {}).copy(),
+        'office': profile_options.get('office', {}).copy(),
+        'video': profile_options.get('video', {}).copy(),
+        'audio': profile_options.get('audio', {}).copy()
+    }
+    if 'images' in final_options: # Глобальная опция ICC перезаписывает профиль
+        final_options['images']['preserve_icc'] = preserve_icc
+
+    return final_options
+
+def _localized_profile_text(value, lang_strings):
+    # Пользовательские профили задают имя строкой или таблицей {код_языка: текст}
+    if not isinstance(value, dict):
+        return value
+    lang_code = next((code for code, strings in LANGUAGES.items() if strings is lang_strings), "en")
+    return value.get(lang_code) or value.get("en") or next(iter(value.values()), "")
+
 def get_profile_display_names(lang_strings):
-    return {
+    names = {
         "profile_standard": lang_strings.get("profile_standard_name", "Standard"),
         "profile_aggressive": lang_strings.get("profile_aggressive_name", "Aggressive"),
         "profile_exif_only": lang_strings.get("profile_exif_only_name", "EXIF Only (Photos)")
     }
+    for profile_key, profile_data in CLEANING_PROFILES.items():
+        if profile_key not in names:
+            names[profile_key] = _localized_profile_text(profile_data.get("name", profile_key), lang_strings)
+    return names
 
 def get_profile_description(profile_key, lang_strings):
     desc_key_map = {
@@ -212,6 +316,10 @@ def get_profile_description(profile_key, lang_strings):
         "profile_aggressive": "profile_aggressive_desc",
         "profile_exif_only": "profile_exif_only_desc"
     }
+    if profile_key not in desc_key_map and profile_key in CLEANING_PROFILES:
+        description = _localized_profile_text(CLEANING_PROFILES[profile_key].get("description", ""), lang_strings)
+        if description:
+            return description
     return lang_strings.get(desc_key_map.get(profile_key, ""), "No description available.")
 
 def get_file_category(file_extension):
@@ -238,7 +346,7 @@ def get_cleaned_filename(original_filepath, output_dir, sort_into_subdirs=False,
 
     try:
         base_name = os.path.basename(original_filepath)
-        name, ext = os.path.splitext(base_name)
+        name, ext = split_extension(base_name)
         cleaned_name = f"{name}_cleaned{ext}"
         return os.path.join(final_output_dir, cleaned_name)
     except Exception as e:
@@ -249,7 +357,7 @@ def get_file_extension(filepath):
     if not filepath or not isinstance(filepath, str):
         return ""
     try:
-        _, ext = os.path.splitext(filepath)
+        _, ext = split_extension(os.path.basename(filepath))
         return ext.lower()
     except Exception as e:
         logger.warning(f"Не удалось получить расширение для файла '{filepath}': {e}")
@@ -0,0 +1,416 @@
+# StealthShare v0.1 pre1
+# Copyright (c) 2025 IQUXAe
+# Released under the MIT License. See LICENSE file for details.
+
+import os
+import sys
+import time
+import struct
+import select
+import signal
+import ctypes
+import ctypes.util
+import argparse
+import threading
+import logging
+
+from utils import (
+    logger,
+    get_cleaned_filename,
+    get_file_extension,
+    get_file_category,
+    get_profile_cleaning_options,
+    CLEANING_PROFILES
+)
+from worker_pool import create_warm_pool, clean_file_task, DEFAULT_TASK_TIMEOUT, DEFAULT_MEMORY_LIMIT
+from profiles import compile_cleaning_plan, load_user_profiles
+from fileops import OutputCommitter, DURABILITY_MODES, DEFAULT_GROUP_FILES, DEFAULT_GROUP_INTERVAL_MS
+from log_setup import configure_logging, get_log_queue, LOG_LEVELS, LOG_FORMATS
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct("iIII")
+
+# Файлы, которые обычно являются недописанными загрузками или служебными
+IGNORED_SUFFIXES = ('.part', '.tmp', '.crdownload', '.download', '.swp', '~')
+
+
+class InotifyWatcher:
+    def __init__(self, directories):
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.watch_dirs = {}
+        for directory in directories:
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                os.close(self.fd)
+                raise OSError(err, os.strerror(err), directory)
+            self.watch_dirs[wd] = directory
+
+    def read_events(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, name_len = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + name_len].rstrip(b"\0")
+            offset += name_len
+
+            if mask & IN_Q_OVERFLOW:
+                # Очередь ядра переполнена - нужно пересканировать папки
+                events.extend((directory, IN_Q_OVERFLOW) for directory in self.watch_dirs.values())
+                continue
+            if mask & (IN_IGNORED | IN_DELETE_SELF):
+                removed_dir = self.watch_dirs.pop(wd, None)
+                if removed_dir:
+                    logger.warning(f"НАБЛЮДЕНИЕ: Папка '{removed_dir}' больше не отслеживается.")
+                continue
+            if mask & IN_ISDIR or wd not in self.watch_dirs or not name:
+                continue
+            events.append((os.path.join(self.watch_dirs[wd], os.fsdecode(name)), mask))
+        return events
+
+    def close(self):
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+
+
+class PollingWatcher:
+    def __init__(self, directories, interval=0.5):
+        self.watch_dirs = list(directories)
+        self.interval = interval
+        self._known = {}
+        self._next_scan = 0.0
+        self._scan()
+
+    def _scan(self):
+        changed = []
+        seen = set()
+        for directory in self.watch_dirs:
+            try:
+                entries = list(os.scandir(directory))
+            except OSError as e:
+                logger.warning(f"НАБЛЮДЕНИЕ: Не удалось прочитать папку '{directory}': {e}")
+                continue
+            for entry in entries:
+                try:
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    stat = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                signature = (stat.st_size, stat.st_mtime_ns)
+                seen.add(entry.path)
+                if self._known.get(entry.path) != signature:
+                    self._known[entry.path] = signature
+                    changed.append((entry.path, IN_MODIFY))
+        for path in list(self._known):
+            if path not in seen:
+                del self._known[path]
+        self._next_scan = time.monotonic() + self.interval
+        return changed
+
+    def read_events(self, timeout):
+        wait = self._next_scan - time.monotonic()
+        if wait > 0:
+            time.sleep(min(wait, timeout))
+            if time.monotonic() < self._next_scan:
+                return []
+        return self._scan()
+
+    def close(self):
+        pass
+
+
+def create_watcher(directories, force_polling=False, poll_interval=0.5):
+    if not force_polling and sys.platform.startswith("linux"):
+        try:
+            watcher = InotifyWatcher(directories)
+            logger.info(f"НАБЛЮДЕНИЕ: Используется inotify для {len(directories)} папок.")
+            return watcher
+        except (OSError, AttributeError) as e:
+            logger.warning(f"НАБЛЮДЕНИЕ: inotify недоступен ({e}), переключаемся на опрос.")
+    logger.info(f"НАБЛЮДЕНИЕ: Используется опрос папок каждые {poll_interval} с.")
+    return PollingWatcher(directories, interval=poll_interval)
+
+
+def _is_same_or_inside(path, directory):
+    try:
+        return os.path.commonpath([os.path.realpath(path), os.path.realpath(directory)]) == os.path.realpath(directory)
+    except ValueError:
+        return False
+
+
+class FolderWatchService:
+    def __init__(self, watch_dirs, output_dir, profile_key, preserve_icc=True, sort_output=False,
+                 workers=None, settle_delay=0.2, force_polling=False, poll_interval=0.5,
+                 process_existing=False, durability="group", group_files=DEFAULT_GROUP_FILES,
+                 group_interval_ms=DEFAULT_GROUP_INTERVAL_MS, task_timeout=DEFAULT_TASK_TIMEOUT,
+                 memory_limit=DEFAULT_MEMORY_LIMIT):
+        self.watch_dirs = [os.path.abspath(d) for d in watch_dirs]
+        self.output_dir = os.path.abspath(output_dir)
+        # Файлы в папке вывода не берутся в работу: если отслеживаемая папка - сама папка вывода
+        # или лежит внутри нее, служба пропускала бы все события и ничего не чистила
+        for directory in self.watch_dirs:
+            if _is_same_or_inside(directory, self.output_dir):
+                raise ValueError(f"папка вывода '{self.output_dir}' совпадает с отслеживаемой папкой '{directory}' или содержит ее")
+        self.profile_key = profile_key
+        self.cleaning_options = compile_cleaning_plan(get_profile_cleaning_options(profile_key, preserve_icc=preserve_icc))
+        self.sort_output = sort_output
+        self.workers = workers
+        self.task_timeout = task_timeout
+        self.memory_limit = memory_limit
+        self.settle_delay = settle_delay
+        self.force_polling = force_polling
+        self.poll_interval = poll_interval
+        self.process_existing = process_existing
+        self.committer = OutputCommitter(durability, group_files=group_files, group_interval_ms=group_interval_ms)
+
+        self._pending = {}
+        self._in_flight = set()
+        self._done_signatures = {}
+        # Файлы, изменившиеся во время очистки: их заново ставит в очередь основной цикл
+        self._requeued = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self.pool = None
+        self.watcher = None
+        self.stats = {'cleaned': 0, 'failed': 0}
+
+    def _is_candidate(self, path):
+        name = os.path.basename(path)
+        if name.startswith('.') or name.lower().endswith(IGNORED_SUFFIXES):
+            return False
+        try:
+            if os.path.commonpath([os.path.abspath(path), self.output_dir]) == self.output_dir:
+                # Результаты самой службы, если папка вывода лежит внутри отслеживаемой
+                logger.debug("watch.skipped file=%r reason=output_dir", name)
+                return False
+        except ValueError:
+            pass
+        return True
+
+    def _note_event(self, path, mask):
+        if mask & IN_Q_OVERFLOW:
+            self._queue_directory(path)
+            return
+        if not self._is_candidate(path):
+            return
+        # Для IN_CLOSE_WRITE/IN_MOVED_TO запись завершена, ждем только короткую паузу
+        delay = self.settle_delay if mask & (IN_CLOSE_WRITE | IN_MOVED_TO) else max(self.settle_delay, self.poll_interval)
+        self._pending[path] = (time.monotonic() + delay, None)
+
+    def _queue_directory(self, directory):
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_file(follow_symlinks=False):
+                        self._note_event(entry.path, IN_CLOSE_WRITE)
+        except OSError as e:
+            logger.warning(f"НАБЛЮДЕНИЕ: Не удалось просканировать '{directory}': {e}")
+
+    def _collect_ready(self):
+        now = time.monotonic()
+        ready = []
+        for path, (deadline, last_signature) in list(self._pending.items()):
+            if now < deadline:
+                continue
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                del self._pending[path]
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if signature != last_signature:
+                # Файл еще меняется (или это первая проверка) - ждем еще один интервал тишины
+                if last_signature is not None or not stat.st_size:
+                    self._pending[path] = (now + self.settle_delay, signature)
+                    continue
+            del self._pending[path]
+            with self._lock:
+                if path in self._in_flight or self._done_signatures.get(path) == signature:
+                    continue
+                self._in_flight.add(path)
+            ready.append((path, signature))
+        return ready
+
+    def _dispatch(self, path, signature):
+        file_ext = get_file_extension(path)
+        file_category = get_file_category(file_ext) if self.sort_output else None
+        cleaned_filepath = get_cleaned_filename(path, self.output_dir,
+                                                sort_into_subdirs=self.sort_output,
+                                                file_category=file_category)
+        if not cleaned_filepath:
+            logger.error(f"НАБЛЮДЕНИЕ: Не удалось сгенерировать имя для '{os.path.basename(path)}'.")
+            with self._lock:
+                self._in_flight.discard(path)
+            return
+
+        queued_at = time.monotonic()
+        # Рабочий процесс пишет во временный файл, а фиксирует результат (fsync, переименование) эта служба
+        temp_filepath = self.committer.reserve(cleaned_filepath)
+        future = self.pool.submit(clean_file_task, path, temp_filepath, file_ext, self.cleaning_options)
+
+        def _on_done(fut):
+            try:
+                success, clean_time, _ = fut.result()
+            except Exception as e:
+                logger.error(f"НАБЛЮДЕНИЕ: Рабочий процесс упал на '{os.path.basename(path)}': {e}")
+                success, clean_time = False, 0.0
+            if success:
+                try:
+                    self.committer.commit(temp_filepath, cleaned_filepath)
+                except OSError as e:
+                    logger.error(f"НАБЛЮДЕНИЕ: Не удалось записать '{os.path.basename(cleaned_filepath)}': {e}")
+                    success = False
+            if not success:
+                self.committer.discard(temp_filepath)
+            latency = time.monotonic() - queued_at
+            with self._lock:
+                self._in_flight.discard(path)
+                if success:
+                    self._done_signatures[path] = signature
+                    self.stats['cleaned'] += 1
+                else:
+                    self.stats['failed'] += 1
+            if success:
+                logger.info("watch.cleaned file=%r output=%r clean_ms=%.0f latency_ms=%.0f",
+                            os.path.basename(path), os.path.basename(cleaned_filepath), clean_time * 1000, latency * 1000)
+            else:
+                logger.error(f"НАБЛЮДЕНИЕ: Очистка не удалась для '{os.path.basename(path)}'.")
+            # События об изменении, пришедшие, пока файл чистился, отброшены - сверяем размер и время изменения
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return
+            if (stat.st_size, stat.st_mtime_ns) != signature:
+                logger.debug("watch.requeued file=%r reason=changed_during_clean", os.path.basename(path))
+                with self._lock:
+                    self._requeued.append(path)
+
+        future.add_done_callback(_on_done)
+
+    def start(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.pool = create_warm_pool(self.workers, task_timeout=self.task_timeout, memory_limit=self.memory_limit)
+        self.watcher = create_watcher(self.watch_dirs, force_polling=self.force_polling,
+                                      poll_interval=self.poll_interval)
+        if self.process_existing:
+            for directory in self.watch_dirs:
+                self._queue_directory(directory)
+
+    def run(self):
+        if self.pool is None:
+            self.start()
+        logger.info(f"НАБЛЮДЕНИЕ: Служба запущена. Папки: {self.watch_dirs}, вывод: '{self.output_dir}', профиль: {self.profile_key}")
+        try:
+            while not self._stop_event.is_set():
+                timeout = 0.05 if self._pending else 0.5
+                for path, mask in self.watcher.read_events(timeout):
+                    self._note_event(path, mask)
+                with self._lock:
+                    requeued, self._requeued = self._requeued, []
+                for path in requeued:
+                    self._note_event(path, IN_MODIFY)
+                for path, signature in self._collect_ready():
+                    self._dispatch(path, signature)
+        finally:
+            self.close()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def close(self):
+        if self.watcher:
+            self.watcher.close()
+            self.watcher = None
+        if self.pool:
+            self.pool.shutdown(wait=True)
+            self.pool = None
+        self.committer.close()
+        logger.info(f"НАБЛЮДЕНИЕ: Служба остановлена. Очищено: {self.stats['cleaned']}, ошибок: {self.stats['failed']}.")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="StealthShare: continuous metadata cleaning of watched folders.")
+    parser.add_argument("watch_dirs", nargs="+", help="Folders to watch for new files")
+    parser.add_argument("-o", "--output", required=True, help="Folder for cleaned files")
+    parser.add_argument("-p", "--profile", default="profile_standard", choices=list(CLEANING_PROFILES.keys()))
+    parser.add_argument("--no-icc", action="store_true", help="Remove ICC color profiles from images")
+    parser.add_argument("--sort", action="store_true", help="Sort output into subfolders by type")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Number of worker processes")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TASK_TIMEOUT, help="Kill a worker that spends longer than this on one file (s)")
+    parser.add_argument("--memory-mb", type=int, default=DEFAULT_MEMORY_LIMIT // (1024 * 1024),
+                        help="Address space limit of each worker process (MB, 0 = no limit)")
+    parser.add_argument("--settle", type=float, default=0.2, help="Quiet period before a file is considered complete (s)")
+    parser.add_argument("--poll", action="store_true", help="Use polling instead of inotify")
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument("--existing", action="store_true", help="Also clean files already present at startup")
+    parser.add_argument("--durability", default="group", choices=DURABILITY_MODES,
+                        help="none: atomic rename only; fsync: fsync every file; group: fsync in batches (default)")
+    parser.add_argument("--group-files", type=int, default=DEFAULT_GROUP_FILES, help="group: commit after this many files")
+    parser.add_argument("--group-ms", type=int, default=DEFAULT_GROUP_INTERVAL_MS, help="group: commit at least this often (ms)")
+    parser.add_argument("--log-level", default="INFO", choices=LOG_LEVELS, help="DEBUG adds per-step events for every file")
+    parser.add_argument("--log-format", default="text", choices=LOG_FORMATS, help="json: one JSON object per line")
+    parser.add_argument("--log-file", default=None, help="Also write the log to this file")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    if not logger.hasHandlers():
+        configure_logging(logging.INFO)
+    # Пользовательские профили нужны до разбора аргументов: -p проверяется по списку профилей
+    load_user_profiles()
+    args = parse_args(argv)
+    if get_log_queue() is not None:
+        # Лог настраивали мы, а не приложение, в которое встроена служба - применяем параметры командной строки
+        configure_logging(args.log_level, log_file=args.log_file, json_lines=args.log_format == "json")
+
+    for directory in args.watch_dirs:
+        if not os.path.isdir(directory):
+            logger.error(f"НАБЛЮДЕНИЕ: Папка '{directory}' не существует.")
+            return 2
+
+    try:
+        service = FolderWatchService(args.watch_dirs, args.output, args.profile,
+                                     preserve_icc=not args.no_icc, sort_output=args.sort,
+                                     workers=args.workers, settle_delay=args.settle,
+                                     force_polling=args.poll, poll_interval=args.poll_interval,
+                                     process_existing=args.existing, durability=args.durability,
+                                     group_files=args.group_files, group_interval_ms=args.group_ms,
+                                     task_timeout=args.timeout, memory_limit=args.memory_mb * 1024 * 1024)
+    except ValueError as e:
+        logger.error(f"НАБЛЮДЕНИЕ: {e}")
+        return 2
+    signal.signal(signal.SIGINT, lambda *_: service.stop())
+    signal.signal(signal.SIGTERM, lambda *_: service.stop())
+    service.run()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
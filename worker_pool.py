@@ -0,0 +1,263 @@
+# StealthShare v0.1 pre1
+# Copyright (c) 2025 IQUXAe
+# Released under the MIT License. See LICENSE file for details.
+
+import os
+import time
+import queue
+import warnings
+import threading
+import multiprocessing
+from concurrent.futures import Future
+
+from utils import logger
+from cancellation import CancelledError, set_current_token
+from log_setup import get_log_queue, install_worker_logging
+
+# Сколько может длиться очистка одного файла, прежде чем рабочий процесс будет убит
+DEFAULT_TASK_TIMEOUT = 600
+# Предел адресного пространства рабочего процесса (RLIMIT_AS): RLIMIT_RSS в Linux не соблюдается
+DEFAULT_MEMORY_LIMIT = 4 * 1024 * 1024 * 1024
+# Изображения больше этого числа пикселей считаются декомпрессионной бомбой и не открываются
+DEFAULT_MAX_IMAGE_PIXELS = 200_000_000
+WORKER_STOP_TIMEOUT = 5
+# После отмены рабочий процесс успевает выйти сам на ближайшей проверке токена, иначе его убивают
+CANCEL_GRACE_PERIOD = 2
+CANCEL_POLL_INTERVAL = 0.1
+
+
+class WorkerTimeoutError(Exception):
+    pass
+
+class WorkerCrashedError(Exception):
+    pass
+
+
+def _warm_up_worker(preload=None):
+    # Загружаем библиотеки очистки один раз при старте процесса,
+    # чтобы первый файл не платил за импорт Pillow/pikepdf/docx
+    from metadata_cleaner import preload_backends
+    preload_backends(preload)
+
+def _ping():
+    return os.getpid()
+
+def get_default_worker_count():
+    return max(1, (os.cpu_count() or 2) - 1)
+
+def merge_pool_stats(*pools):
+    merged = {}
+    for pool in pools:
+        if pool is not None:
+            for key, value in pool.stats.items():
+                merged[key] = merged.get(key, 0) + value
+    return merged
+
+def _limit_worker_resources(memory_limit, max_image_pixels):
+    if memory_limit:
+        try:
+            import resource
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+        except (ImportError, ValueError, OSError) as e:
+            # На Windows модуля resource нет - остается только ограничение по времени
+            logger.warning(f"ПУЛ: Ограничение памяти рабочего процесса не установлено: {e}")
+    if max_image_pixels:
+        try:
+            from PIL import Image
+        except ImportError:
+            return
+        # Pillow по умолчанию только предупреждает о бомбе до двойного предела - превращаем это в ошибку
+        Image.MAX_IMAGE_PIXELS = max_image_pixels
+        warnings.simplefilter("error", Image.DecompressionBombWarning)
+
+def _supervised_worker_main(conn, memory_limit, max_image_pixels, token, log_queue, log_level, preload):
+    # Записи лога уходят в очередь родителя: процесс не блокируется на stderr или файле
+    install_worker_logging(log_queue, log_level)
+    _limit_worker_resources(memory_limit, max_image_pixels)
+    set_current_token(token)
+    _warm_up_worker(preload)
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        fn, args = task
+        try:
+            reply = (True, fn(*args))
+        except BaseException as e:
+            reply = (False, e)
+        try:
+            conn.send(reply)
+        except Exception as e:
+            conn.send((False, RuntimeError(f"результат задачи не передан: {e!r}")))
+
+
+class _WorkerSlot:
+    # Один рабочий процесс и поток, который его сторожит: отправляет задачу, ждет ответ не дольше
+    # таймаута и при зависании или падении убивает процесс и запускает новый
+    def __init__(self, pool, index):
+        self.pool = pool
+        self.index = index
+        self.process = None
+        self.conn = None
+        self._spawn()
+        self.thread = threading.Thread(target=self._run, name=f"stealthshare-worker-{index}", daemon=True)
+        self.thread.start()
+
+    def _spawn(self):
+        parent_conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_supervised_worker_main, daemon=True,
+                                               args=(child_conn, self.pool.memory_limit, self.pool.max_image_pixels,
+                                                     self.pool.token, get_log_queue(), logger.getEffectiveLevel(),
+                                                     self.pool.preload))
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+
+    def _kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def _replace(self, reason):
+        self._kill()
+        with self.pool._lock:
+            self.pool.stats['restarts'] += 1
+        logger.warning(f"ПУЛ: Рабочий процесс {self.index} заменен ({reason}).")
+        self._spawn()
+
+    def _wait_reply(self, timeout):
+        # Время на паузе в таймаут не засчитывается; после отмены ответ ждем не дольше CANCEL_GRACE_PERIOD
+        token = self.pool.token
+        if token is None:
+            return "reply" if self.conn.poll(timeout) else "timeout"
+        remaining, cancel_deadline = timeout, None
+        while True:
+            started = time.monotonic()
+            if self.conn.poll(CANCEL_POLL_INTERVAL):
+                return "reply"
+            if token.cancelled:
+                cancel_deadline = cancel_deadline or started + CANCEL_GRACE_PERIOD
+                if time.monotonic() >= cancel_deadline:
+                    return "cancelled"
+            elif not token.paused:
+                remaining -= time.monotonic() - started
+                if remaining <= 0:
+                    return "timeout"
+
+    def _run(self):
+        while True:
+            item = self.pool._tasks.get()
+            if item is None:
+                break
+            future, fn, args, timeout = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            if self.pool.token is not None:
+                # На паузе новые задачи не отправляются: очистка через Pillow не проверяет токен внутри файла
+                self.pool.token.wait_if_paused()
+            if self.pool.token is not None and self.pool.token.cancelled:
+                future.set_exception(CancelledError("задача отменена до запуска"))
+                continue
+            try:
+                self.conn.send((fn, args))
+                outcome = self._wait_reply(timeout)
+                if outcome == "timeout":
+                    with self.pool._lock:
+                        self.pool.stats['timeouts'] += 1
+                    self._replace(f"задача не завершилась за {timeout} с")
+                    future.set_exception(WorkerTimeoutError(f"очистка не завершилась за {timeout} с"))
+                    continue
+                if outcome == "cancelled":
+                    with self.pool._lock:
+                        self.pool.stats['cancelled'] += 1
+                    self._replace(f"задача не остановилась за {CANCEL_GRACE_PERIOD} с после отмены")
+                    future.set_exception(CancelledError("очистка отменена"))
+                    continue
+                ok, value = self.conn.recv()
+            except (EOFError, OSError) as e:
+                self.process.join(WORKER_STOP_TIMEOUT)
+                exit_code = self.process.exitcode
+                with self.pool._lock:
+                    self.pool.stats['crashes'] += 1
+                self._replace(f"процесс завершился, код {exit_code}")
+                future.set_exception(WorkerCrashedError(f"рабочий процесс завершился (код {exit_code}): {e}"))
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+        try:
+            self.conn.send(None)
+            self.process.join(WORKER_STOP_TIMEOUT)
+        except OSError:
+            pass
+        self._kill()
+
+
+class SupervisedPool:
+    # Замена ProcessPoolExecutor: каждая задача выполняется в отдельном процессе с ограничением
+    # времени и памяти, а упавший или зависший процесс заменяется без остановки очереди
+    # token - CancellationToken, общий с рабочими процессами: пауза и отмена проверяются между блоками данных.
+    # preload - группы библиотек для прогрева процесса (metadata_cleaner.FORMAT_BACKEND_MODULES), None - все
+    def __init__(self, max_workers=None, task_timeout=DEFAULT_TASK_TIMEOUT, memory_limit=DEFAULT_MEMORY_LIMIT,
+                 max_image_pixels=DEFAULT_MAX_IMAGE_PIXELS, token=None, preload=None):
+        self.max_workers = max_workers or get_default_worker_count()
+        self.task_timeout = task_timeout
+        self.memory_limit = memory_limit
+        self.max_image_pixels = max_image_pixels
+        self.token = token
+        self.preload = preload
+        self.stats = {'timeouts': 0, 'crashes': 0, 'restarts': 0, 'cancelled': 0}
+        self._lock = threading.Lock()
+        self._tasks = queue.Queue()
+        self._slots = [_WorkerSlot(self, index) for index in range(self.max_workers)]
+        self._shutdown = False
+
+    def submit(self, fn, *args, timeout=None):
+        if self._shutdown:
+            raise RuntimeError("пул уже остановлен")
+        future = Future()
+        self._tasks.put((future, fn, args, timeout or self.task_timeout))
+        return future
+
+    def shutdown(self, wait=True):
+        if self._shutdown:
+            return
+        self._shutdown = True
+        for _ in self._slots:
+            self._tasks.put(None)
+        if wait:
+            for slot in self._slots:
+                slot.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown(wait=True)
+
+def create_warm_pool(max_workers=None, task_timeout=DEFAULT_TASK_TIMEOUT, memory_limit=DEFAULT_MEMORY_LIMIT):
+    if not max_workers:
+        max_workers = get_default_worker_count()
+    pool = SupervisedPool(max_workers, task_timeout=task_timeout, memory_limit=memory_limit)
+    # Запускаем все процессы сразу, а не по первому запросу
+    worker_pids = {f.result() for f in [pool.submit(_ping) for _ in range(max_workers * 2)]}
+    logger.info(f"ПУЛ: Запущено {len(worker_pids)} рабочих процессов (запрошено {max_workers}), "
+                f"таймаут {task_timeout} с, память {memory_limit // (1024 * 1024) if memory_limit else '-'} МБ.")
+    return pool
+
+def clean_file_task(filepath, output_path, file_extension, cleaning_options):
+    # Возвращает (успех, время очистки, путь очистки для отчета: lossless/re-encode/copy)
+    from metadata_cleaner import clean_metadata, get_last_cleaner_path
+    start_time = time.perf_counter()
+    try:
+        # output_path - временный файл вызывающего, второй временный файл рядом не нужен
+        success = clean_metadata(filepath, output_path, file_extension, cleaning_options, atomic=False)
+    except Exception as e:
+        logger.error(f"ПУЛ: Ошибка очистки '{os.path.basename(filepath)}': {e}", exc_info=True)
+        success = False
+    return success, time.perf_counter() - start_time, get_last_cleaner_path()
@@ -0,0 +1,147 @@
+# StealthShare v0.1 pre1
+# Copyright (c) 2025 IQUXAe
+# Released under the MIT License. See LICENSE file for details.
+
+import zlib
+import struct
+import zipfile
+from collections import deque
+
+from cancellation import check_cancelled
+
+COPY_CHUNK_SIZE = 1024 * 1024
+# Дата 1980-01-01 00:00 в формате DOS
+SCRUBBED_DOS_TIME, SCRUBBED_DOS_DATE = 0, (1 << 5) | 1
+ZIP_LIMIT = 0xFFFFFFFF
+ZIP_FLAG_ENCRYPTED = 0x01
+ZIP_FLAG_DATA_DESCRIPTOR = 0x08
+ZIP_FLAG_UTF8 = 0x800
+# Сколько распакованных данных одновременно может ждать обработки в потоках
+MAX_IN_FLIGHT_BYTES = 128 * 1024 * 1024
+# Если deflate сэкономил меньше этой доли (JPEG, PNG), замененный член пишется без сжатия:
+# повторное сжатие уже сжатых данных занимает в десятки раз больше времени, чем сама очистка
+MIN_DEFLATE_SAVING = 0.03
+
+
+def _dos_date_time(info, scrub):
+    if scrub:
+        return SCRUBBED_DOS_TIME, SCRUBBED_DOS_DATE
+    year, month, day, hour, minute, second = info.date_time
+    return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
+
+def _deflate(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _output_method(info):
+    if info.compress_type == zipfile.ZIP_STORED or info.compress_size > info.file_size * (1 - MIN_DEFLATE_SAVING):
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+def _prepare_member(cleaner, data, method):
+    # Сжатие и CRC считаются здесь же, в рабочем потоке: zlib отпускает GIL
+    cleaned = cleaner(data)
+    if cleaned is None:
+        return None
+    payload = cleaned if method == zipfile.ZIP_STORED else _deflate(cleaned)
+    return method, zlib.crc32(cleaned), payload, len(cleaned)
+
+
+class _RawZipWriter:
+    # Пишет ZIP без перепаковки: члены копируются в сжатом виде, заново сжимаются только замененные
+    def __init__(self, source, target, scrub_dates):
+        self.source = source
+        self.target = target
+        self.scrub_dates = scrub_dates
+        self.central = []
+        self.position = 0
+
+    def _write_headers(self, info, method, version, crc, compress_size, file_size):
+        if file_size >= ZIP_LIMIT or compress_size >= ZIP_LIMIT or self.position >= ZIP_LIMIT:
+            raise ValueError("ZIP64 не поддерживается")
+        flags = info.flag_bits & ~ZIP_FLAG_DATA_DESCRIPTOR
+        name = info.filename.encode("utf-8")
+        if not name.isascii():
+            flags |= ZIP_FLAG_UTF8
+        dos_time, dos_date = _dos_date_time(info, self.scrub_dates)
+        self.target.write(struct.pack("<4sHHHHHIIIHH", b"PK\x03\x04", version, flags, method, dos_time, dos_date,
+                                      crc, compress_size, file_size, len(name), 0) + name)
+        self.central.append(struct.pack("<4sHHHHHHIIIHHHHHII", b"PK\x01\x02",
+                                        info.create_version | (info.create_system << 8), version, flags, method,
+                                        dos_time, dos_date, crc, compress_size, file_size, len(name), 0, 0, 0,
+                                        info.internal_attr, info.external_attr, self.position) + name)
+        self.position += 30 + len(name) + compress_size
+
+    def copy_raw(self, info):
+        self.source.seek(info.header_offset)
+        header = self.source.read(30)
+        if len(header) != 30 or header[:4] != b"PK\x03\x04":
+            raise ValueError(f"поврежден локальный заголовок '{info.filename}'")
+        name_length, extra_length = struct.unpack_from("<HH", header, 26)
+        self._write_headers(info, info.compress_type, info.extract_version, info.CRC, info.compress_size, info.file_size)
+        self.source.seek(info.header_offset + 30 + name_length + extra_length)
+        remaining = info.compress_size
+        while remaining > 0:
+            check_cancelled()
+            piece = self.source.read(min(remaining, COPY_CHUNK_SIZE))
+            if not piece:
+                raise ValueError(f"архив обрывается внутри '{info.filename}'")
+            self.target.write(piece)
+            remaining -= len(piece)
+
+    def write_prepared(self, info, prepared):
+        method, crc, payload, file_size = prepared
+        version = max(info.extract_version, 20) if method == zipfile.ZIP_DEFLATED else info.extract_version
+        self._write_headers(info, method, version, crc, len(payload), file_size)
+        self.target.write(payload)
+
+    def close(self):
+        directory = b"".join(self.central)
+        if self.position + len(directory) >= ZIP_LIMIT or len(self.central) >= 0xFFFF:
+            raise ValueError("ZIP64 не поддерживается")
+        self.target.write(directory)
+        self.target.write(struct.pack("<4sHHHHIIH", b"PK\x05\x06", 0, 0, len(self.central), len(self.central),
+                                      len(directory), self.position, 0))
+
+
+def rewrite_zip(source, target, transform, scrub_dates=False, executor=None):
+    # transform(info) возвращает функцию bytes -> bytes (None - оставить член как был) или None,
+    # если член нужно скопировать без распаковки. С executor члены обрабатываются параллельно,
+    # а в архив попадают в исходном порядке
+    writer = _RawZipWriter(source, target, scrub_dates)
+    pending = deque()
+    in_flight = [0]
+
+    def _write_next():
+        info, result, size = pending.popleft()
+        in_flight[0] -= size
+        prepared = result.result() if executor else result
+        if prepared is None:
+            writer.copy_raw(info)
+        else:
+            writer.write_prepared(info, prepared)
+
+    with zipfile.ZipFile(source) as archive:
+        for info in archive.infolist():
+            check_cancelled()
+            cleaner = transform(info) if not info.is_dir() and not info.flag_bits & ZIP_FLAG_ENCRYPTED else None
+            if cleaner is None:
+                while pending:
+                    _write_next()
+                writer.copy_raw(info)
+                continue
+            data = archive.read(info)
+            while pending and in_flight[0] + len(data) > MAX_IN_FLIGHT_BYTES:
+                _write_next()
+            if executor:
+                result = executor.submit(_prepare_member, cleaner, data, _output_method(info))
+            else:
+                result = _prepare_member(cleaner, data, _output_method(info))
+            pending.append((info, result, len(data)))
+            in_flight[0] += len(data)
+            if executor is None:
+                _write_next()
+        while pending:
+            _write_next()
+    writer.close()